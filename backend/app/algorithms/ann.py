@@ -0,0 +1,310 @@
+"""
+Nearest neighbour indexes for embedding-based retrieval
+
+Every index stores vectors under string ids and returns the top-k ids for a
+query vector by similarity ('cosine' or 'dot'):
+
+    index = create_index('ivf', dim=64)
+    index.add(movie_ids, vectors)
+    index.search(query, k=10)        # [(movie_id, score), ...]
+    index.save('movies.ann.npz')
+    index = load_index('movies.ann.npz')
+
+BruteForceIndex scores every vector and is exact. IVFIndex (inverted file)
+clusters the vectors with k-means and only scores the n_probe clusters
+closest to the query, trading a little recall for far fewer dot products.
+Adding an id that is already indexed replaces its vector.
+"""
+import math
+import os
+
+import numpy as np
+
+METRICS = ('cosine', 'dot')
+
+
+def _prepare(vectors, dim, metric):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[np.newaxis, :]
+    if vectors.shape[1] != dim:
+        raise ValueError(f"Expected vectors of dimension {dim}, got {vectors.shape[1]}")
+    if metric == 'cosine':
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1)
+    return np.ascontiguousarray(vectors)
+
+
+def _top(scores, k):
+    """Positions of the k highest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def _atomic_savez(path, **arrays):
+    # np.savez adds .npz to names without it; write next to the target and rename
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+class BruteForceIndex:
+    """Exact search over every vector"""
+
+    kind = 'brute'
+
+    def __init__(self, dim, metric='cosine'):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric}")
+        self.dim = dim
+        self.metric = metric
+        self._ids = []
+        self._positions = {}
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, ids, vectors):
+        vectors = _prepare(vectors, self.dim, self.metric)
+        ids = [str(id_) for id_ in ids]
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length")
+
+        new = [i for i, id_ in enumerate(ids) if id_ not in self._positions]
+        if self._size + len(new) > len(self._vectors):
+            capacity = max(self._size + len(new), 2 * len(self._vectors), 16)
+            grown = np.empty((capacity, self.dim), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+
+        for id_, vector in zip(ids, vectors):
+            position = self._positions.get(id_)
+            if position is None:
+                position = self._positions[id_] = self._size
+                self._ids.append(id_)
+                self._size += 1
+            self._vectors[position] = vector
+
+    def search(self, query, k=10):
+        query = _prepare(query, self.dim, self.metric)[0]
+        scores = self._vectors[:self._size] @ query
+        return [(self._ids[i], float(scores[i])) for i in _top(scores, k)]
+
+    def save(self, path):
+        _atomic_savez(path, kind=self.kind, metric=self.metric, dim=self.dim,
+                      ids=np.array(self._ids, dtype=str), vectors=self._vectors[:self._size])
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls(int(arrays['dim']), metric=str(arrays['metric']))
+        # Saved vectors are already normalized
+        index._ids = arrays['ids'].tolist()
+        index._positions = {id_: position for position, id_ in enumerate(index._ids)}
+        index._vectors = arrays['vectors'].astype(np.float32)
+        index._size = len(index._ids)
+        return index
+
+
+class IVFIndex:
+    """
+    Inverted file index: vectors are grouped by their nearest k-means
+    centroid, and a query scans only the n_probe nearest groups
+
+    The centroids are trained on the first add() (or an explicit train());
+    later additions are assigned to the existing centroids. Retrain after the
+    catalog has changed a lot.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, dim, n_lists=None, n_probe=8, metric='cosine', seed=0):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric}")
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.metric = metric
+        self.seed = seed
+        self.centroids = None
+        self._ids = []
+        self._positions = {}
+        self._where = []  # internal id -> (list, slot)
+        self._lists = []  # per list: [vectors (capacity x dim), internal ids, size]
+
+    def __len__(self):
+        return len(self._positions)
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def train(self, vectors, iterations=20, sample_size=100_000):
+        """k-means over (a sample of) vectors; n_lists defaults to about sqrt(len(vectors))"""
+        vectors = _prepare(vectors, self.dim, self.metric)
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > sample_size:
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        n_lists = self.n_lists or max(1, int(math.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = self._nearest_centroids(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            counts = np.bincount(assignment, minlength=n_lists)
+            empty = counts == 0
+            centroids = np.where(empty[:, np.newaxis], centroids, sums / np.maximum(counts, 1)[:, np.newaxis])
+            if empty.any():
+                # Restart empty clusters on random vectors
+                centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+            if self.metric == 'cosine':
+                centroids = _prepare(centroids, self.dim, 'cosine')
+
+        self.n_lists = n_lists
+        self.centroids = centroids.astype(np.float32)
+        existing = [(self._ids[i], self._lists[c][0][slot]) for i, (c, slot) in enumerate(self._where)] \
+            if self._lists else []
+        self._lists = [[np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.int64), 0]
+                       for _ in range(n_lists)]
+        self._where = [None] * len(self._ids)
+        for internal, (_, vector) in enumerate(existing):
+            self._insert(internal, vector)
+
+    @staticmethod
+    def _nearest_centroids(vectors, centroids, chunk_size=16_384):
+        # Nearest by dot product; for cosine both sides are unit length
+        # For 'dot', the nearest centroid by distance maximizes v.c - |c|^2 / 2
+        bias = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            scores = vectors[start:start + chunk_size] @ centroids.T - bias
+            assignment[start:start + chunk_size] = scores.argmax(axis=1)
+        return assignment
+
+    def _insert(self, internal, vector, list_index=None):
+        if list_index is None:
+            list_index = int(self._nearest_centroids(vector[np.newaxis, :], self.centroids)[0])
+        entry = self._lists[list_index]
+        vectors, ids, size = entry
+        if size == len(vectors):
+            capacity = max(2 * size, 8)
+            grown_vectors = np.empty((capacity, self.dim), dtype=np.float32)
+            grown_vectors[:size] = vectors[:size]
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_ids[:size] = ids[:size]
+            entry[0], entry[1] = vectors, ids = grown_vectors, grown_ids
+        vectors[size] = vector
+        ids[size] = internal
+        entry[2] = size + 1
+        self._where[internal] = (list_index, size)
+
+    def _remove(self, internal):
+        """Swap-delete an internal id from its list"""
+        list_index, slot = self._where[internal]
+        entry = self._lists[list_index]
+        vectors, ids, size = entry
+        last = size - 1
+        if slot != last:
+            vectors[slot] = vectors[last]
+            ids[slot] = ids[last]
+            self._where[ids[slot]] = (list_index, slot)
+        entry[2] = last
+        self._where[internal] = None
+
+    def add(self, ids, vectors):
+        vectors = _prepare(vectors, self.dim, self.metric)
+        ids = [str(id_) for id_ in ids]
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length")
+        if not self.trained:
+            self.train(vectors)
+
+        assignment = self._nearest_centroids(vectors, self.centroids)
+        for id_, vector, list_index in zip(ids, vectors, assignment):
+            internal = self._positions.get(id_)
+            if internal is None:
+                internal = self._positions[id_] = len(self._ids)
+                self._ids.append(id_)
+                self._where.append(None)
+            else:
+                self._remove(internal)
+            self._insert(internal, vector, int(list_index))
+
+    def search(self, query, k=10, n_probe=None):
+        if not self.trained:
+            return []
+        query = _prepare(query, self.dim, self.metric)[0]
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+
+        bias = 0.5 * np.einsum('ij,ij->i', self.centroids, self.centroids)
+        probes = _top(self.centroids @ query - bias, n_probe)
+
+        candidate_scores, candidate_ids = [], []
+        for list_index in probes:
+            vectors, ids, size = self._lists[list_index]
+            if size:
+                candidate_scores.append(vectors[:size] @ query)
+                candidate_ids.append(ids[:size])
+        if not candidate_scores:
+            return []
+        scores = np.concatenate(candidate_scores)
+        internal_ids = np.concatenate(candidate_ids)
+        return [(self._ids[internal_ids[i]], float(scores[i])) for i in _top(scores, k)]
+
+    def save(self, path):
+        """Snapshot as one .npz: centroids, then every list's vectors and ids back to back"""
+        sizes = np.array([size for _, _, size in self._lists], dtype=np.int64)
+        vectors = np.concatenate([vectors[:size] for vectors, _, size in self._lists]) \
+            if self._lists else np.empty((0, self.dim), dtype=np.float32)
+        internal_ids = np.concatenate([ids[:size] for _, ids, size in self._lists]) \
+            if self._lists else np.empty(0, dtype=np.int64)
+        _atomic_savez(
+            path, kind=self.kind, metric=self.metric, dim=self.dim, n_probe=self.n_probe, seed=self.seed,
+            centroids=self.centroids if self.trained else np.empty((0, self.dim), dtype=np.float32),
+            list_sizes=sizes, vectors=vectors, ids=np.array([self._ids[i] for i in internal_ids], dtype=str),
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls(int(arrays['dim']), n_probe=int(arrays['n_probe']), metric=str(arrays['metric']),
+                    seed=int(arrays['seed']))
+        if len(arrays['centroids']):
+            index.centroids = arrays['centroids'].astype(np.float32)
+            index.n_lists = len(index.centroids)
+            # Lists were saved back to back, so internal ids follow the saved order
+            index._ids = arrays['ids'].tolist()
+            index._positions = {id_: internal for internal, id_ in enumerate(index._ids)}
+            index._where = [None] * len(index._ids)
+            vectors = arrays['vectors']
+            start = 0
+            for list_index, size in enumerate(arrays['list_sizes'].tolist()):
+                index._lists.append([
+                    vectors[start:start + size].astype(np.float32), np.arange(start, start + size, dtype=np.int64), size
+                ])
+                for slot in range(size):
+                    index._where[start + slot] = (list_index, slot)
+                start += size
+        return index
+
+
+INDEXES = {cls.kind: cls for cls in (BruteForceIndex, IVFIndex)}
+
+
+def create_index(kind, dim, **options):
+    """New empty index of the given kind ('brute' or 'ivf')"""
+    if kind not in INDEXES:
+        raise ValueError(f"Unknown index kind {kind}")
+    return INDEXES[kind](dim, **options)
+
+
+def load_index(path):
+    """Index saved with index.save(path)"""
+    with np.load(path, allow_pickle=False) as arrays:
+        return INDEXES[str(arrays['kind'])].from_arrays(arrays)
@@ -0,0 +1,182 @@
+"""
+Staged recommendation pipeline
+
+    generate  candidate generators run in parallel, each returning up to
+              `limit` (movie_id, score) pairs; generators that miss the
+              generation budget are left out of the result
+    merge     candidates are deduplicated into one matrix of scores
+              (candidates x generators), each generator's column scaled to 0..1
+    filter    excluded ids (already rated, already in the watchlist) are
+              dropped with a single np.isin
+    hydrate   the remaining candidates' documents are fetched in one query
+    rank      a vectorized scorer turns the score matrix and the documents
+              into final scores; the top `count` are returned
+
+Every stage is timed and compared with its budget; the timings are returned
+with the result and added to the request's Server-Timing header.
+
+The generators of every request share one pool with a thread per generator
+for `concurrency` requests. A generator that misses the budget keeps its
+thread until it returns, so the pool cannot grow without bound; when every
+thread is taken, the generators that find none are skipped rather than queued
+behind the others.
+
+numpy is imported on the first recommendation rather than with the routes.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from app.instrumentation import record_timing
+
+
+class CandidateGenerator:
+    """A named source of candidates: generate(context, limit) -> [(movie_id, score), ...]"""
+
+    def __init__(self, name, generate, weight=1.0, limit=200):
+        self.name = name
+        self.generate = generate
+        self.weight = weight
+        self.limit = limit
+
+
+class PipelineResult:
+    def __init__(self, movies, scores, sources, timings, timed_out, over_budget, skipped=()):
+        self.movies = movies
+        self.scores = scores
+        self.sources = sources
+        self.timings = timings
+        self.timed_out = timed_out
+        self.over_budget = over_budget
+        self.skipped = skipped
+
+
+def scale_columns(matrix):
+    """Scale each column to 0..1 by its maximum; columns without positive scores stay 0"""
+    import numpy as np
+
+    maxima = matrix.max(axis=0) if len(matrix) else np.zeros(matrix.shape[1])
+    return np.divide(matrix, maxima, out=np.zeros_like(matrix), where=maxima > 0)
+
+
+class RecommendationPipeline:
+    """
+    generators: CandidateGenerator list
+    hydrate(ids): documents for the candidate ids (missing ids are skipped)
+    rank(ids, scores, movies, weights, context): final score per candidate,
+        where scores is the scaled candidates x generators matrix
+    budgets: stage name -> seconds
+    concurrency: requests whose generators can all run at once
+    """
+
+    def __init__(self, generators, hydrate, rank, budgets, concurrency=16):
+        self.generators = generators
+        self.hydrate = hydrate
+        self.rank = rank
+        self.budgets = budgets
+        workers = len(generators) * concurrency
+        # One slot per thread, so a submitted generator never waits for a thread
+        self._slots = threading.BoundedSemaphore(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recommendation-pipeline')
+
+    def _submit(self, generator, context):
+        """The generator's future, or None when every thread is taken"""
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            # Run in a copy of the request context, so its database time is charged to the request
+            future = self._executor.submit(contextvars.copy_context().run, generator.generate, context, generator.limit)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _generate(self, context):
+        futures, skipped = {}, []
+        for generator in self.generators:
+            future = self._submit(generator, context)
+            if future is None:
+                skipped.append(generator.name)
+            else:
+                futures[future] = generator
+        done, pending = wait(futures, timeout=self.budgets.get('generate')) if futures else (set(), set())
+        # Generators that already started finish in the background and hold their thread
+        # until then; their results are ignored
+        for future in pending:
+            future.cancel()
+
+        results, timed_out = {}, []
+        for future, generator in futures.items():
+            if future in pending:
+                timed_out.append(generator.name)
+                continue
+            try:
+                results[generator.name] = future.result()
+            except Exception as e:
+                print(f"Error in {generator.name} candidate generator: {str(e)}")
+        return results, timed_out, skipped
+
+    def recommend(self, context, count=10, exclude=()):
+        import numpy as np
+
+        timings = {}
+        over_budget = []
+        clock = time.perf_counter()
+
+        def stage(name):
+            nonlocal clock
+            now = time.perf_counter()
+            timings[name] = now - clock
+            record_timing(f'rec-{name}', timings[name])
+            budget = self.budgets.get(name)
+            if budget is not None and timings[name] > budget:
+                over_budget.append(name)
+            clock = now
+
+        generated, timed_out, skipped = self._generate(context)
+        stage('generate')
+
+        # Merge: one row per distinct movie, one column per generator
+        names = [generator.name for generator in self.generators]
+        index = {}
+        rows, cols, values = [], [], []
+        for col, name in enumerate(names):
+            for movie_id, score in generated.get(name, ()):
+                rows.append(index.setdefault(str(movie_id), len(index)))
+                cols.append(col)
+                values.append(score)
+        ids = np.array(list(index), dtype=object)
+        matrix = np.zeros((len(ids), len(names)))
+        # A generator listing a movie twice keeps its best score
+        np.maximum.at(matrix, (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)), values)
+        matrix = scale_columns(matrix)
+        stage('merge')
+
+        keep = ~np.isin(ids, np.array(list(exclude), dtype=object)) if len(exclude) else np.ones(len(ids), bool)
+        ids, matrix = ids[keep], matrix[keep]
+        stage('filter')
+
+        documents = {str(movie['_id']): movie for movie in self.hydrate(list(ids))} if len(ids) else {}
+        found = np.array([movie_id in documents for movie_id in ids], dtype=bool)
+        ids, matrix = ids[found], matrix[found]
+        movies = [documents[movie_id] for movie_id in ids]
+        stage('hydrate')
+
+        weights = np.array([generator.weight for generator in self.generators])
+        scores = np.asarray(self.rank(ids, matrix, movies, weights, context), dtype=float) if len(ids) else np.empty(0)
+        count = min(count, len(scores))
+        top = np.argpartition(-scores, count - 1)[:count] if count else np.empty(0, dtype=np.int64)
+        top = top[np.argsort(-scores[top], kind='stable')]
+        stage('rank')
+
+        return PipelineResult(
+            movies=[movies[i] for i in top],
+            scores=[float(scores[i]) for i in top],
+            sources=[[names[col] for col in np.flatnonzero(matrix[i])] for i in top],
+            timings=timings,
+            timed_out=timed_out,
+            over_budget=over_budget,
+            skipped=skipped,
+        )
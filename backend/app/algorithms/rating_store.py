@@ -0,0 +1,262 @@
+"""
+Compact in-memory rating store
+
+Ratings are kept as three parallel NumPy columns instead of one dict (or
+DataFrame row) each:
+
+    users    int32    index of the user id
+    movies   int32    index of the movie id
+    ratings  float16  the rating (exact for whole and half stars)
+
+User and movie ids are interned: each id string is stored once, and the
+columns hold its index. That is 10 bytes per rating in the columns, plus the
+ids themselves; memory_usage() reports both, and the spare capacity the
+columns have reserved for later appends separately.
+
+    store = RatingStore.from_cursor(ratings_collection.find({}, RatingStore.PROJECTION))
+    store.upsert(user_id, movie_id, 4.5)
+    store.delete(user_id, movie_id)
+    matrix = store.csr()             # users x movies, float32
+
+append() and extend() trust that (user, movie) is not stored yet, which the
+unique ratings index guarantees for data loaded from MongoDB. get(),
+update() and delete() scan the columns with NumPy, a few milliseconds per
+million ratings. columns() is a view, but the CSR/CSC matrices are copies:
+the rows are stored in write order, and a compressed matrix needs them
+sorted by user (movie) with float32 ratings, 8 bytes per rating plus the
+pointers. Each is built with one sort of the columns, once per version of
+the store, and shared until the next write.
+"""
+import sys
+
+import numpy as np
+from scipy.sparse import coo_matrix, csc_matrix, csr_matrix
+
+LOAD_BATCH_SIZE = 50_000
+
+INDEX_DTYPE = np.int32
+RATING_DTYPE = np.float16
+
+
+class RatingStore:
+    """Ratings as parallel int32/int32/float16 columns with interned ids"""
+
+    PROJECTION = {'_id': 0, 'user_id': 1, 'movie_id': 1, 'rating': 1}
+
+    def __init__(self, capacity=0):
+        self._user_index = {}
+        self._movie_index = {}
+        self._user_ids = []
+        self._movie_ids = []
+        self._users = np.empty(capacity, dtype=INDEX_DTYPE)
+        self._movies = np.empty(capacity, dtype=INDEX_DTYPE)
+        self._ratings = np.empty(capacity, dtype=RATING_DTYPE)
+        self._size = 0
+        self._version = 0
+        self._matrices = {}
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def user_ids(self):
+        return self._user_ids
+
+    @property
+    def movie_ids(self):
+        return self._movie_ids
+
+    def user_index(self, user_id, add=False):
+        """Row of a user id, None if unknown (or a new row with add=True)"""
+        return self._intern(self._user_index, self._user_ids, str(user_id), add)
+
+    def movie_index(self, movie_id, add=False):
+        """Column of a movie id, None if unknown (or a new column with add=True)"""
+        return self._intern(self._movie_index, self._movie_ids, str(movie_id), add)
+
+    @staticmethod
+    def _intern(index, ids, id_, add):
+        position = index.get(id_)
+        if position is None and add:
+            position = index[id_] = len(ids)
+            ids.append(id_)
+        return position
+
+    def columns(self):
+        """Read-only (users, movies, ratings) views of the stored rows, without copying"""
+        views = (self._users[:self._size], self._movies[:self._size], self._ratings[:self._size])
+        for view in views:
+            view.flags.writeable = False
+        return views
+
+    def _reserve(self, extra):
+        if self._size + extra <= len(self._users):
+            return
+        capacity = max(self._size + extra, 2 * len(self._users), 1024)
+        for name in ('_users', '_movies', '_ratings'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            setattr(self, name, grown)
+
+    def _changed(self):
+        self._version += 1
+        self._matrices.clear()
+
+    def append(self, user_id, movie_id, rating):
+        self._reserve(1)
+        self._users[self._size] = self.user_index(user_id, add=True)
+        self._movies[self._size] = self.movie_index(movie_id, add=True)
+        self._ratings[self._size] = rating
+        self._size += 1
+        self._changed()
+
+    def extend(self, users, movies, ratings):
+        """Append rows given as user/movie indexes (see user_index/movie_index) and ratings"""
+        users = np.asarray(users, dtype=INDEX_DTYPE)
+        count = len(users)
+        self._reserve(count)
+        end = self._size + count
+        self._users[self._size:end] = users
+        self._movies[self._size:end] = np.asarray(movies, dtype=INDEX_DTYPE)
+        self._ratings[self._size:end] = np.asarray(ratings, dtype=RATING_DTYPE)
+        self._size = end
+        self._changed()
+
+    def _position(self, user_id, movie_id):
+        user, movie = self.user_index(user_id), self.movie_index(movie_id)
+        if user is None or movie is None:
+            return None
+        users, movies, _ = self.columns()
+        positions = np.flatnonzero((users == user) & (movies == movie))
+        return int(positions[0]) if len(positions) else None
+
+    def get(self, user_id, movie_id):
+        """The rating, or None"""
+        position = self._position(user_id, movie_id)
+        return None if position is None else float(self._ratings[position])
+
+    def update(self, user_id, movie_id, rating):
+        """Change a stored rating; returns whether it existed"""
+        position = self._position(user_id, movie_id)
+        if position is None:
+            return False
+        self._ratings[position] = rating
+        self._changed()
+        return True
+
+    def upsert(self, user_id, movie_id, rating):
+        if not self.update(user_id, movie_id, rating):
+            self.append(user_id, movie_id, rating)
+
+    def delete(self, user_id, movie_id):
+        """Remove a rating; returns whether it existed. The last row moves into its place"""
+        position = self._position(user_id, movie_id)
+        if position is None:
+            return False
+        last = self._size - 1
+        for column in (self._users, self._movies, self._ratings):
+            column[position] = column[last]
+        self._size = last
+        self._changed()
+        return True
+
+    def coo(self):
+        """users x movies COO matrix (float32) over the index columns"""
+        users, movies, ratings = self.columns()
+        return coo_matrix(
+            (ratings.astype(np.float32), (users, movies)),
+            shape=(len(self._user_ids), len(self._movie_ids))
+        )
+
+    def _compressed(self, major, minor, major_count, matrix_class, shape):
+        """A CSR/CSC copy of the columns, compressed along major (sorted by major, then minor)"""
+        order = np.lexsort((minor, major))
+        data = np.empty(len(order), dtype=np.float32)
+        data[:] = self._ratings[:self._size][order]
+        indptr = np.zeros(major_count + 1, dtype=np.int64 if len(order) > np.iinfo(INDEX_DTYPE).max else INDEX_DTYPE)
+        np.cumsum(np.bincount(major, minlength=major_count), out=indptr[1:])
+        matrix = matrix_class((data, minor[order].astype(indptr.dtype, copy=False), indptr), shape=shape)
+        matrix.has_sorted_indices = True
+        return matrix
+
+    def csr(self):
+        """users x movies CSR matrix (float32), a copy shared until the next write"""
+        if 'csr' not in self._matrices:
+            users, movies, _ = self.columns()
+            self._matrices['csr'] = self._compressed(
+                users, movies, len(self._user_ids), csr_matrix, (len(self._user_ids), len(self._movie_ids))
+            )
+        return self._matrices['csr']
+
+    def csc(self):
+        """users x movies CSC matrix (float32), a copy shared until the next write"""
+        if 'csc' not in self._matrices:
+            users, movies, _ = self.columns()
+            self._matrices['csc'] = self._compressed(
+                movies, users, len(self._movie_ids), csc_matrix, (len(self._user_ids), len(self._movie_ids))
+            )
+        return self._matrices['csc']
+
+    def memory_usage(self):
+        """
+        Bytes used by the stored rows, reserved by the columns for later
+        appends, held by the cached matrices and by the interned ids, and
+        used per stored rating
+        """
+        row_bytes = self._users.itemsize + self._movies.itemsize + self._ratings.itemsize
+        column_bytes = self._size * row_bytes
+        reserved_bytes = (len(self._users) - self._size) * row_bytes
+        matrix_bytes = sum(
+            matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes for matrix in self._matrices.values()
+        )
+        id_bytes = sum(
+            sys.getsizeof(index) + sys.getsizeof(ids) + sum(sys.getsizeof(id_) for id_ in ids)
+            for index, ids in ((self._user_index, self._user_ids), (self._movie_index, self._movie_ids))
+        )
+        return {
+            'ratings': self._size,
+            'users': len(self._user_ids),
+            'movies': len(self._movie_ids),
+            'column_bytes': column_bytes,
+            'reserved_bytes': reserved_bytes,
+            'matrix_bytes': matrix_bytes,
+            'id_bytes': id_bytes,
+            'bytes_per_rating': round((column_bytes + id_bytes) / max(self._size, 1), 1),
+        }
+
+    def load(self, cursor, batch_size=LOAD_BATCH_SIZE, fixed_movies=False):
+        """
+        Append the ratings a cursor (or any iterable of rating documents)
+        yields, batch_size at a time so no document is kept. With
+        fixed_movies, ratings of movies not interned yet are skipped.
+        Returns the number of ratings appended.
+        """
+        users, movies, ratings = [], [], []
+        loaded = 0
+        for rating in cursor:
+            movie = self.movie_index(rating['movie_id'], add=not fixed_movies)
+            if movie is None:
+                continue
+            users.append(self.user_index(rating['user_id'], add=True))
+            movies.append(movie)
+            ratings.append(rating['rating'])
+            if len(users) >= batch_size:
+                self.extend(users, movies, ratings)
+                loaded += len(users)
+                users, movies, ratings = [], [], []
+        self.extend(users, movies, ratings)
+        return loaded + len(users)
+
+    @classmethod
+    def from_cursor(cls, cursor, batch_size=LOAD_BATCH_SIZE, movie_ids=None):
+        """
+        Store of the ratings a cursor yields (see load). With movie_ids the
+        columns are those movies, in order, and ratings of other movies are
+        skipped.
+        """
+        store = cls()
+        for movie_id in movie_ids or ():
+            store.movie_index(movie_id, add=True)
+        store.load(cursor, batch_size, fixed_movies=movie_ids is not None)
+        return store
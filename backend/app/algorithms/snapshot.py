@@ -0,0 +1,151 @@
+"""
+Columnar snapshots of the ratings and movie features
+
+Written by app.workers.export_snapshot; the training jobs read them instead
+of streaming every rating out of MongoDB. A snapshot is a directory of .npy
+files that are opened memory-mapped:
+
+    manifest.json                      current shards and export, export watermark
+    ratings-000000/users.npy           int32 user index    \
+    ratings-000000/movies.npy          int32 movie index    > one shard
+    ratings-000000/ratings.npy         float16 rating      /
+    export-000001/user_ids.npy         interned ids (the id of each index)
+    export-000001/movie_ids.npy
+    export-000001/features_*.npy       movies x content features CSR matrix
+                                       (rows in movie_ids order) and feature names
+
+The first shard has one row per (user, movie). Each incremental export
+appends a shard with the ratings written since the previous one, so a
+rating changed since the first shard appears again; the latest row wins.
+A deleted rating is a row whose rating is NaN (a tombstone): it replaces
+the earlier rows and is itself skipped.
+
+    snapshot = open_snapshot('snapshots')
+    user_ids, movie_ids, matrix = snapshot.load_ratings()
+"""
+import json
+import os
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+
+MANIFEST = 'manifest.json'
+COLUMNS = ('users', 'movies', 'ratings')
+FEATURE_ARRAYS = ('data', 'indices', 'indptr', 'shape')
+# Rows read at a time by live_chunks
+CHUNK_ROWS = 1_000_000
+
+
+def read_manifest(directory):
+    """The snapshot's manifest, or None if there is no snapshot in directory"""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def rating_keys(users, movies):
+    """One int64 per (user, movie)"""
+    return (np.asarray(users, dtype=np.int64) << 32) | np.asarray(movies, dtype=np.int64)
+
+
+class RatingSnapshot:
+    """Read side of a snapshot directory; arrays are memory-mapped"""
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.manifest = manifest
+        self.user_ids = self._load(manifest['export'], 'user_ids.npy').tolist()
+        self.movie_ids = self._load(manifest['export'], 'movie_ids.npy').tolist()
+
+    def _load(self, *path):
+        return np.load(os.path.join(self.directory, *path), mmap_mode='r')
+
+    def __len__(self):
+        return self.manifest['ratings']
+
+    def shard_columns(self):
+        """(users, movies, ratings) of every shard, in export order"""
+        return [tuple(self._load(shard['name'], f'{name}.npy') for name in COLUMNS)
+                for shard in self.manifest['shards']]
+
+    def columns(self):
+        """(users, movies, ratings) with one row per rating; memory-mapped when there is a single shard"""
+        shards = self.shard_columns()
+        if len(shards) == 1:
+            return shards[0]
+        chunks = list(self.live_chunks())
+        return tuple(np.concatenate(column) for column in zip(*chunks))
+
+    def live_chunks(self, chunk_rows=CHUNK_ROWS):
+        """
+        (users, movies, ratings) chunks of the rows no later shard replaces,
+        oldest shard first. The shards are read chunk_rows at a time from the
+        memory map; only the keys of the shards after the first are held, and
+        those hold just the ratings written since the first shard. Tombstones
+        are left out.
+        """
+        shards = self.shard_columns()
+        replaced = [None] * len(shards)
+        keys = np.empty(0, dtype=np.int64)
+        for index in range(len(shards) - 1, -1, -1):
+            replaced[index] = keys
+            if index:
+                keys = np.union1d(keys, rating_keys(shards[index][0], shards[index][1]))
+
+        for (users, movies, ratings), later_keys in zip(shards, replaced):
+            for start in range(0, len(users), chunk_rows):
+                chunk = tuple(np.asarray(column[start:start + chunk_rows]) for column in (users, movies, ratings))
+                kept = ~np.isnan(chunk[2])
+                if len(later_keys):
+                    kept &= ~np.isin(rating_keys(chunk[0], chunk[1]), later_keys, assume_unique=True)
+                yield tuple(column[kept] for column in chunk)
+
+    def load_ratings(self, movie_ids=None):
+        """
+        Same as app.workers.precompute.load_ratings: user ids, movie ids and the
+        users x movies rating matrix (CSR, float32). With movie_ids the columns
+        are those movies, in order, and ratings of other movies are skipped.
+        The live rows are copied chunk by chunk into the matrix's arrays.
+        """
+        columns = None
+        if movie_ids is not None:
+            positions = {movie_id: column for column, movie_id in enumerate(movie_ids)}
+            columns = np.array([positions.get(movie_id, -1) for movie_id in self.movie_ids], dtype=np.int32)
+        else:
+            movie_ids = self.movie_ids
+
+        rows = len(self)
+        users = np.empty(rows, dtype=np.int32)
+        movies = np.empty(rows, dtype=np.int32)
+        ratings = np.empty(rows, dtype=np.float32)
+        end = 0
+        for chunk_users, chunk_movies, chunk_ratings in self.live_chunks():
+            if columns is not None:
+                chunk_movies = columns[chunk_movies]
+                kept = chunk_movies >= 0
+                chunk_users, chunk_movies, chunk_ratings = chunk_users[kept], chunk_movies[kept], chunk_ratings[kept]
+            start, end = end, end + len(chunk_users)
+            users[start:end], movies[start:end], ratings[start:end] = chunk_users, chunk_movies, chunk_ratings
+
+        matrix = coo_matrix(
+            (ratings[:end], (users[:end], movies[:end])),
+            shape=(len(self.user_ids), len(movie_ids))
+        ).tocsr()
+        return self.user_ids, list(movie_ids), matrix
+
+    def movie_features(self):
+        """Feature names and the movies x features matrix (CSR), rows in movie_ids order"""
+        arrays = {name: self._load(self.manifest['export'], f'features_{name}.npy') for name in FEATURE_ARRAYS}
+        names = self._load(self.manifest['export'], 'features_names.npy').tolist()
+        matrix = csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                            shape=tuple(arrays['shape']), copy=False)
+        return names, matrix
+
+
+def open_snapshot(directory):
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"No snapshot in {directory}")
+    return RatingSnapshot(directory, manifest)
@@ -0,0 +1,483 @@
+"""
+ASGI serving mode
+
+The I/O-bound read endpoints are served natively with the async MongoDB
+driver so a worker can wait on many queries at once. Every other route is
+handed to the regular Flask app through a WSGI adapter, so both modes serve
+the same API. The native routes record the same metrics and Server-Timing
+header (app.instrumentation), share the response cache and ETags
+(app.caching) with the Flask routes, caching the same endpoints, and load
+the token's user through the same cache (app.users), so a deleted user's
+token gets a 401 in both modes.
+
+Run with: uvicorn main:create_asgi_app --factory
+"""
+import asyncio
+import contextvars
+import io
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, parse_qsl
+
+from bson import ObjectId
+from flask_jwt_extended import decode_token
+from pymongo import AsyncMongoClient
+from werkzeug.http import parse_etags
+
+from app.caching import response_cache, response_cache_key
+from app.instrumentation import (
+    mongo_listener,
+    observe_request,
+    server_timing,
+    start_request_stats,
+    stop_request_stats,
+)
+
+from app.routes.theaters import (
+    MOVIE_DETAILS_PROJECTION,
+    calculate_distance,
+    format_movie_details,
+    theater_index,
+)
+from app.config import APP_DB_NAME, APP_MONGO_URI, RATINGS_PAGE_SIZE, RATINGS_MAX_PAGE_SIZE, RESPONSE_CACHE_MAX_AGE
+from app.routes.ratings import (
+    MOVIE_RATING_PROJECTION,
+    MOVIE_RATINGS_SORT,
+    RATED_MOVIE_PROJECTION,
+    format_movie_rating,
+    format_user_rating,
+    missing_usernames,
+    movie_ratings_page_query,
+)
+from app.models.user import WATCHLIST_SORT
+from app.routes.watchlist import (
+    WATCHLIST_MOVIE_PROJECTION,
+    format_watchlist_movie,
+    page_size,
+    split_page,
+    watchlist_page_query,
+)
+from app.routes.recommendation import recommend_for_user
+from app.users import user_cache
+from app.utils import clamp_page_size, split_keyset_page
+
+# Size of each $in batch; batches are fetched concurrently
+LOOKUP_BATCH_SIZE = 100
+
+# Threads running the sync Flask routes
+WSGI_THREADS = 32
+
+
+class AuthError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncRequest:
+    def __init__(self, scope, params):
+        self.scope = scope
+        self.params = params
+        self.headers = {
+            key.decode('latin-1').lower(): value.decode('latin-1')
+            for key, value in scope.get('headers', [])
+        }
+        query_string = scope.get('query_string', b'').decode('latin-1')
+        query = parse_qs(query_string)
+        self.args = {key: values[0] for key, values in query.items()}
+        # Every (name, value) pair, like Flask's request.args.items(multi=True)
+        self.query_pairs = parse_qsl(query_string, keep_blank_values=True)
+
+    def arg(self, name, default=None, type=str):
+        # Same behaviour as Flask's request.args.get(name, default, type)
+        if name not in self.args:
+            return default
+        try:
+            return type(self.args[name])
+        except ValueError:
+            return default
+
+
+class AsyncAPI:
+    """ASGI application serving the I/O-bound endpoints with the async driver"""
+
+    def __init__(self, flask_app, mongo_uri=APP_MONGO_URI, db_name=APP_DB_NAME):
+        self.flask_app = flask_app
+        self.wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+        self.mongo_uri = mongo_uri
+        self.db_name = db_name
+        self._client = None
+        # (method, path, handler, the Flask rule it mirrors, collections of a cached response like @cached_response)
+        self.routes = [
+            ('GET', re.compile(r'^/api/theaters$'), self.get_theaters, '/api/theaters', ('theaters', 'movies')),
+            ('GET', re.compile(r'^/api/recommendations$'), self.get_recommendations, '/api/recommendations', None),
+            ('GET', re.compile(r'^/api/users/watchlist$'), self.get_user_watchlist, '/api/users/watchlist', None),
+            ('GET', re.compile(r'^/api/users/ratings$'), self.get_user_ratings, '/api/users/ratings', None),
+            ('GET', re.compile(r'^/api/movies/(?P<movie_id>[^/]+)/ratings$'), self.get_movie_ratings,
+             '/api/movies/<movie_id>/ratings', None),
+        ]
+
+    @property
+    def db(self):
+        if self._client is None:
+            self._client = AsyncMongoClient(self.mongo_uri, event_listeners=[mongo_listener])
+        return self._client[self.db_name]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http':
+            for method, pattern, handler, rule, cached in self.routes:
+                match = pattern.match(scope['path'])
+                if match and scope['method'] == method:
+                    request = AsyncRequest(scope, match.groupdict())
+                    await self._serve(send, request, handler, rule, cached)
+                    return
+
+        # Everything else is served by the Flask app
+        await self._call_wsgi(scope, receive, send)
+
+    async def _serve(self, send, request, handler, rule, cached):
+        """Run a native route, recording its metrics like init_instrumentation does for the Flask routes"""
+        stats = token = None
+        if self.flask_app.config.get('METRICS_ENABLED'):
+            stats, token = start_request_stats()
+        try:
+            if cached:
+                status, body, headers = await self._cached(request, handler, cached)
+            else:
+                payload, status, *extra_headers = await handler(request)
+                body, headers = self._encode(payload), dict(*extra_headers)
+            if stats is not None:
+                elapsed = time.perf_counter() - stats.started
+                observe_request(stats, request.scope['method'], rule, status, elapsed)
+                headers['Server-Timing'] = server_timing(stats, elapsed)
+        finally:
+            if token is not None:
+                stop_request_stats(token)
+        await self._respond(send, request, status, body, headers)
+
+    async def _cached(self, request, handler, collections):
+        """Serve from the response cache shared with @cached_response; returns (status, body, headers)"""
+        # The collection versions are re-read from MongoDB now and then, with the blocking driver
+        key = await self._run_blocking(response_cache_key, request.scope['path'], request.query_pairs, collections)
+        entry = response_cache.get(key)
+        if entry is None:
+            payload, status, *extra_headers = await handler(request)
+            if status != 200:
+                return status, self._encode(payload), dict(*extra_headers)
+            entry = response_cache.set(key, self._encode(payload), 'application/json')
+
+        headers = {'ETag': f'"{entry["etag"]}"', 'Cache-Control': f'public, max-age={RESPONSE_CACHE_MAX_AGE}'}
+        if parse_etags(request.headers.get('if-none-match')).contains(entry['etag']):
+            return 304, b'', headers
+        return 200, entry['body'], headers
+
+    async def _run_blocking(self, func, *args):
+        """Run a blocking call on the thread pool, in this request's context so its commands are counted"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.wsgi_executor, context.run, func, *args)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._client is not None:
+                    await self._client.close()
+                    self._client = None
+                self.wsgi_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _call_wsgi(self, scope, receive, send):
+        """Run the Flask app in the thread pool and send back its response"""
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        environ = self._wsgi_environ(scope, body)
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ]
+
+        def run():
+            result = self.flask_app(environ, start_response)
+            try:
+                return b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        loop = asyncio.get_running_loop()
+        content = await loop.run_in_executor(self.wsgi_executor, run)
+        await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def _wsgi_environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for raw_name, raw_value in scope.get('headers', []):
+            name = raw_name.decode('latin-1').upper().replace('-', '_')
+            value = raw_value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name == 'CONTENT_LENGTH':
+                environ['CONTENT_LENGTH'] = value
+            else:
+                key = f'HTTP_{name}'
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _encode(self, payload):
+        """JSON body, as jsonify writes it"""
+        return (self.flask_app.json.dumps(payload) + '\n').encode('utf-8')
+
+    async def _respond(self, send, request, status, body, extra_headers):
+        headers = [(b'content-length', str(len(body)).encode('latin-1'))]
+        if status != 304:
+            headers.insert(0, (b'content-type', b'application/json'))
+        headers += [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in extra_headers.items()
+        ]
+        # Match the CORS headers Flask-CORS adds to the sync responses
+        origin = request.headers.get('origin')
+        if origin:
+            headers += [
+                (b'access-control-allow-origin', origin.encode('latin-1')),
+                (b'access-control-allow-credentials', b'true'),
+                (b'access-control-expose-headers', b'X-Next-Cursor'),
+                (b'vary', b'Origin'),
+            ]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _current_user(self, request):
+        """
+        (user id, user) of the Bearer token, validated like @jwt_required()
+        and loaded like current_user (app.users.load_jwt_user)
+        """
+        auth_header = request.headers.get('authorization', '')
+        if not auth_header:
+            raise AuthError('Missing Authorization Header', 401)
+        parts = auth_header.split()
+        if len(parts) != 2 or parts[0] != 'Bearer':
+            raise AuthError("Bad Authorization header. Expected 'Authorization: Bearer <JWT>'", 422)
+        try:
+            with self.flask_app.app_context():
+                claims = decode_token(parts[1])
+        except Exception as e:
+            raise AuthError(str(e), 422)
+        user_id = claims[self.flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub')]
+        # A cache miss is a blocking read
+        user = await self._run_blocking(user_cache.get, user_id)
+        if user is None:
+            # The user was deleted after the token was issued
+            raise AuthError(f'Error loading the user {user_id}', 401)
+        return user_id, user
+
+    async def _find_by_ids(self, collection, ids, projection=None):
+        """Fetch documents by string ids, issuing the $in batches concurrently"""
+        object_ids = []
+        for value in ids:
+            try:
+                object_ids.append(ObjectId(value))
+            except Exception:
+                # If unable to convert to ObjectId, skip this id
+                pass
+
+        batches = [
+            object_ids[start:start + LOOKUP_BATCH_SIZE]
+            for start in range(0, len(object_ids), LOOKUP_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*[
+            collection.find({'_id': {'$in': batch}}, projection).to_list(None)
+            for batch in batches
+        ])
+        return {str(doc['_id']): doc for docs in results for doc in docs}
+
+    async def get_theaters(self, request):
+        """Get all theaters or theaters near a location"""
+        try:
+            lat = request.arg('lat', type=float)
+            lng = request.arg('lng', type=float)
+
+            matches = None
+            if lat and lng:
+                max_distance = request.arg('distance', default=20, type=int)
+                limit = request.arg('limit', type=int)
+                # A stale index is rebuilt with blocking reads, so query it off the event loop
+                matches = await self._run_blocking(theater_index.query, lat, lng, max_distance, limit)
+
+            if matches is not None:
+                theaters = []
+                for theater, distance in matches:
+                    theater['distance'] = round(distance, 1)
+                    theaters.append(theater)
+            elif lat and lng:
+                # No index available, so fall back to a geospatial query
+                query = {
+                    "location": {
+                        "$near": {
+                            "$geometry": {
+                                "type": "Point",
+                                "coordinates": [lng, lat]
+                            },
+                            "$maxDistance": max_distance * 1000  # Convert km to meters
+                        }
+                    }
+                }
+                cursor = self.db.theaters.find(query)
+                if limit:
+                    cursor = cursor.limit(limit)
+                theaters = await cursor.to_list(None)
+                for theater in theaters:
+                    theater_coords = theater['location']['coordinates']
+                    distance = calculate_distance(lat, lng, theater_coords[1], theater_coords[0])
+                    theater['distance'] = round(distance, 1)
+            else:
+                theaters = await self.db.theaters.find({}).to_list(None)
+
+            movie_ids = {
+                movie_item['movie_id']
+                for theater in theaters
+                for movie_item in theater.get('current_movies', [])
+            }
+            movies = await self._find_by_ids(self.db.movies, movie_ids, MOVIE_DETAILS_PROJECTION)
+
+            for theater in theaters:
+                for movie_item in theater.get('current_movies', []):
+                    movie = movies.get(movie_item['movie_id'])
+                    if movie:
+                        movie_item['movie_details'] = format_movie_details(movie)
+
+            return theaters, 200
+
+        except Exception as e:
+            print(f"Error getting theaters: {str(e)}")
+            return {'error': f'Failed to get theaters: {str(e)}'}, 500
+
+    async def get_recommendations(self, request):
+        """Get personalized movie recommendations for the current user"""
+        try:
+            user_id, user = await self._current_user(request)
+        except AuthError as e:
+            return {'msg': str(e)}, e.status
+
+        try:
+            # The pipeline runs its generators on its own threads; keep the blocking parts off the event loop
+            result, _ = await self._run_blocking(lambda: recommend_for_user(user_id, user=user))
+            return result, 200
+
+        except Exception as e:
+            print(f"Error generating recommendations: {str(e)}")
+            return {'error': f'Failed to generate recommendations: {str(e)}'}, 500
+
+    async def get_user_watchlist(self, request):
+        """Get a page of the current user's watchlist"""
+        try:
+            user_id, _ = await self._current_user(request)
+        except AuthError as e:
+            return {'msg': str(e)}, e.status
+
+        try:
+            limit = page_size(request.arg('limit', type=int))
+            try:
+                query = watchlist_page_query(user_id, request.arg('cursor'))
+            except ValueError as e:
+                return {'error': str(e)}, 400
+
+            entries = await self.db.watchlist.find(
+                query, {'_id': 0, 'movie_id': 1, 'added_at': 1}
+            ).sort(WATCHLIST_SORT).limit(limit + 1).to_list(None)
+            entries, next_cursor = split_page(entries, limit)
+
+            watchlist_ids = [entry['movie_id'] for entry in entries]
+            movies = await self._find_by_ids(self.db.movies, watchlist_ids, WATCHLIST_MOVIE_PROJECTION)
+
+            result = [
+                format_watchlist_movie(movie_id, movies[movie_id])
+                for movie_id in watchlist_ids
+                if movie_id in movies
+            ]
+            return result, 200, {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
+        except Exception as e:
+            print(f"Error getting watchlist: {str(e)}")
+            return {'error': f'Failed to get watchlist: {str(e)}'}, 500
+
+    async def get_user_ratings(self, request):
+        """Get all ratings by the current user"""
+        try:
+            user_id, _ = await self._current_user(request)
+        except AuthError as e:
+            return {'msg': str(e)}, e.status
+
+        try:
+            user_ratings = await self.db.ratings.find({'user_id': user_id}).to_list(None)
+            movies = await self._find_by_ids(
+                self.db.movies, {rating['movie_id'] for rating in user_ratings}, RATED_MOVIE_PROJECTION
+            )
+
+            result = [
+                format_user_rating(rating, movies[rating['movie_id']])
+                for rating in user_ratings
+                if rating['movie_id'] in movies
+            ]
+            return result, 200
+
+        except Exception as e:
+            print(f"Error getting user ratings: {str(e)}")
+            return {'error': f'Failed to get user ratings: {str(e)}'}, 500
+
+    async def get_movie_ratings(self, request):
+        """Get a page of the ratings for a specific movie, newest first"""
+        try:
+            movie_id = request.params['movie_id']
+            limit = clamp_page_size(request.arg('limit', type=int), RATINGS_PAGE_SIZE, RATINGS_MAX_PAGE_SIZE)
+            try:
+                query = movie_ratings_page_query(movie_id, request.arg('cursor'))
+            except ValueError as e:
+                return {'error': str(e)}, 400
+
+            ratings = await self.db.ratings.find(
+                query, MOVIE_RATING_PROJECTION
+            ).sort(MOVIE_RATINGS_SORT).limit(limit + 1).to_list(None)
+            ratings, next_cursor = split_keyset_page(ratings, limit, MOVIE_RATINGS_SORT)
+            users = await self._find_by_ids(self.db.users, set(missing_usernames(ratings)), {'username': 1})
+
+            result = [format_movie_rating(rating, users) for rating in ratings]
+            return result, 200, {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
+        except Exception as e:
+            print(f"Error getting movie ratings: {str(e)}")
+            return {'error': f'Failed to get movie ratings: {str(e)}'}, 500
@@ -0,0 +1,385 @@
+"""
+Streaming importer for movie catalogs and ratings
+
+Records are parsed one at a time, validated, and written in fixed-size
+unordered batches of upserts, so memory stays flat whatever the file size.
+Progress is checkpointed after every batch; re-running with --resume skips
+the rows that were already written.
+
+Supported formats: csv, jsonl, json (array), movielens (movies.csv / ratings.csv)
+
+    python -m app.bulk_import movies data/movies.csv --format movielens
+    python -m app.bulk_import ratings data/ratings.csv --format movielens --resume
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import resource
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.models.movie import validate_movie
+from app.models.ratings import validate_rating
+from app.workers.rating_summaries import rebuild_rating_summaries
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Read size for the incremental JSON array parser
+JSON_READ_SIZE = 64 * 1024
+
+MOVIELENS_TITLE = re.compile(r'^(?P<title>.*?)\s*\((?P<year>\d{4})\)\s*$')
+
+
+# Parsers, each yielding one dict per record
+
+def iter_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def iter_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_json_array(path):
+    """Yield the items of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = f.read(JSON_READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} does not contain a JSON array")
+        buffer = buffer[1:]
+        eof = False
+
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+                # A value ending exactly at the buffer end may continue in the next chunk
+                complete = eof or end < len(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                chunk = f.read(JSON_READ_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if extension == '.json':
+        return 'json'
+    if extension == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            header = next(csv.reader(f), [])
+        return 'movielens' if 'movieId' in header else 'csv'
+    raise ValueError(f"Cannot detect the format of {path}")
+
+
+def iter_records(path, fmt):
+    if fmt in ('csv', 'movielens'):
+        return iter_csv(path)
+    if fmt == 'jsonl':
+        return iter_jsonl(path)
+    if fmt == 'json':
+        return iter_json_array(path)
+    raise ValueError(f"Unknown format: {fmt}")
+
+
+# Record conversion
+
+def movielens_object_id(kind, movielens_id):
+    """Stable ObjectId for a MovieLens user or movie, so ratings need no id lookups"""
+    digest = hashlib.md5(f"movielens:{kind}:{movielens_id}".encode()).digest()
+    return ObjectId(digest[:12])
+
+
+def _split_list(value, separator='|'):
+    if isinstance(value, list):
+        return value
+    if not value:
+        return []
+    return [item.strip() for item in value.split(separator) if item.strip()]
+
+
+def movie_from_record(record, fmt):
+    """Movie document from a parsed record"""
+    if fmt == 'movielens':
+        movie = {
+            '_id': movielens_object_id('movie', record['movieId']),
+            'movielens_id': int(record['movieId']),
+            'genres': [genre for genre in _split_list(record.get('genres'))
+                       if genre != '(no genres listed)'],
+        }
+        match = MOVIELENS_TITLE.match(record.get('title', ''))
+        if match:
+            movie['title'] = match.group('title')
+            movie['year'] = int(match.group('year'))
+        else:
+            movie['title'] = record.get('title', '')
+        return movie
+
+    movie = {key: value for key, value in record.items() if value not in (None, '')}
+    if 'genres' in movie:
+        movie['genres'] = _split_list(movie['genres'])
+    if 'cast' in movie:
+        movie['cast'] = _split_list(movie['cast'])
+    if isinstance(movie.get('year'), str) and movie['year'].isdigit():
+        movie['year'] = int(movie['year'])
+    if 'average_rating' in movie:
+        movie['average_rating'] = float(movie['average_rating'])
+    if '_id' in movie:
+        movie['_id'] = ObjectId(movie['_id'])
+    return movie
+
+
+def rating_from_record(record, fmt):
+    """Rating document from a parsed record"""
+    if fmt == 'movielens':
+        rating = {
+            'user_id': str(movielens_object_id('user', record['userId'])),
+            'movie_id': str(movielens_object_id('movie', record['movieId'])),
+            'rating': float(record['rating']),
+        }
+        if record.get('timestamp'):
+            created = datetime.fromtimestamp(int(record['timestamp']), tz=timezone.utc)
+            rating['created_at'] = rating['updated_at'] = created.isoformat()
+        return rating
+
+    rating = {key: value for key, value in record.items() if value not in (None, '')}
+    if 'rating' in rating:
+        rating['rating'] = float(rating['rating'])
+    for field in ('user_id', 'movie_id'):
+        if field in rating:
+            rating[field] = str(rating[field])
+    return rating
+
+
+def movie_operation(movie):
+    """Upsert keyed on _id when known, otherwise on title and year"""
+    fields = {key: value for key, value in movie.items() if key != '_id'}
+    if '_id' in movie:
+        key = {'_id': movie['_id']}
+    else:
+        key = {'title': movie['title'], 'year': movie['year']}
+    return UpdateOne(key, {'$set': fields}, upsert=True)
+
+
+def rating_operation(rating):
+    """Upsert keyed on (user_id, movie_id), matching the unique ratings index"""
+    key = {'user_id': rating['user_id'], 'movie_id': rating['movie_id']}
+    fields = {field: value for field, value in rating.items() if field not in key}
+    return UpdateOne(key, {'$set': fields}, upsert=True)
+
+
+# Import loop
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.written = 0
+        self.invalid = 0
+        self.skipped = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return (self.read - self.skipped) / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'read': self.read,
+            'written': self.written,
+            'invalid': self.invalid,
+            'skipped': self.skipped,
+            'batches': self.batches,
+            'seconds': round(self.elapsed, 2),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_checkpoint(checkpoint_path):
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            return json.load(f)
+    return None
+
+
+def save_checkpoint(checkpoint_path, data):
+    # Write then rename so a crash never leaves a half-written checkpoint
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def run_import(records, convert, validate, make_operation, collection, batch_size=DEFAULT_BATCH_SIZE,
+               checkpoint_path=None, resume=False, on_batch=None, progress_every=100):
+    """
+    Stream records into collection in unordered batches
+
+    convert(record) -> document, validate(document) -> (ok, message),
+    make_operation(document) -> write operation. on_batch(documents) is
+    called after each batch is written.
+    """
+    stats = ImportStats()
+    start_row = 0
+    if resume:
+        checkpoint = load_checkpoint(checkpoint_path)
+        if checkpoint:
+            start_row = checkpoint['rows']
+            print(f"Resuming after row {start_row}")
+
+    batch = []
+    documents = []
+
+    def flush():
+        collection.bulk_write(batch, ordered=False)
+        stats.written += len(batch)
+        stats.batches += 1
+        if on_batch:
+            on_batch(documents)
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, {'rows': stats.read, 'written': stats.written})
+        if progress_every and stats.batches % progress_every == 0:
+            print(f"{stats.read} rows read, {stats.written} written, {stats.rows_per_second:.0f} rows/s")
+        batch.clear()
+        documents.clear()
+
+    for record in records:
+        stats.read += 1
+        if stats.read <= start_row:
+            stats.skipped += 1
+            continue
+
+        try:
+            document = convert(record)
+        except (KeyError, ValueError, TypeError):
+            stats.invalid += 1
+            continue
+
+        valid, message = validate(document)
+        if not valid:
+            stats.invalid += 1
+            continue
+
+        batch.append(make_operation(document))
+        documents.append(document)
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    elif checkpoint_path:
+        save_checkpoint(checkpoint_path, {'rows': stats.read, 'written': stats.written})
+
+    return stats
+
+
+def import_movies(path, movies_collection, fmt=None, **options):
+    fmt = fmt or detect_format(path)
+    return run_import(
+        iter_records(path, fmt),
+        lambda record: movie_from_record(record, fmt),
+        validate_movie,
+        movie_operation,
+        movies_collection,
+        **options
+    )
+
+
+def import_ratings(path, ratings_collection, fmt=None, rating_events=None, rating_summaries=None, **options):
+    """
+    Import ratings; rating_events (a RatingEventQueue) is used to refresh the
+    averages of the rated movies once the import is done, and the star counts
+    of those movies are rebuilt in rating_summaries
+    """
+    fmt = fmt or detect_format(path)
+    rated_movie_ids = set()
+
+    def track(documents):
+        rated_movie_ids.update(document['movie_id'] for document in documents)
+
+    stats = run_import(
+        iter_records(path, fmt),
+        lambda record: rating_from_record(record, fmt),
+        validate_rating,
+        rating_operation,
+        ratings_collection,
+        on_batch=track,
+        **options
+    )
+
+    if rating_events is not None and rated_movie_ids:
+        rating_events.apply(rated_movie_ids, set())
+    if rating_summaries is not None and rated_movie_ids:
+        rebuild_rating_summaries({'ratings': ratings_collection, 'rating_summaries': rating_summaries},
+                                 movie_ids=rated_movie_ids)
+    return stats
+
+
+if __name__ == '__main__':
+    from app.caching import collection_versions
+    from app.database import get_app_database
+    from app.workers.rating_events import RatingEventQueue
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('kind', choices=['movies', 'ratings'])
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'json', 'movielens'])
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint.json)')
+    parser.add_argument('--resume', action='store_true', help='Skip rows written by a previous run')
+    args = parser.parse_args()
+
+    db = get_app_database()
+    options = {
+        'batch_size': args.batch_size,
+        'checkpoint_path': args.checkpoint or f"{args.path}.checkpoint.json",
+        'resume': args.resume,
+    }
+
+    if args.kind == 'movies':
+        stats = import_movies(args.path, db["movies"], fmt=args.format, **options)
+    else:
+        events = RatingEventQueue(
+            collections={'movies': db["movies"], 'ratings': db["ratings"], 'users': db["users"]},
+            mode='inline'
+        )
+        stats = import_ratings(args.path, db["ratings"], fmt=args.format, rating_events=events,
+                               rating_summaries=db["rating_summaries"], **options)
+
+    # Drop cached API responses built from the old data
+    collection_versions.bump('movies', 'ratings')
+    print(json.dumps(stats.as_dict()))
@@ -0,0 +1,171 @@
+"""
+HTTP response caching for read-mostly endpoints
+
+Responses are cached in memory, keyed by path, query string and the version
+of every collection the endpoint reads. Writers bump a collection's version,
+so stale entries are never served again and fall out of the LRU. Versions
+live in MongoDB so every worker process sees a bump within
+CACHE_VERSION_REFRESH_SECONDS.
+
+Cached responses carry a strong ETag and Cache-Control, and a matching
+If-None-Match is answered with 304 without touching the database.
+"""
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, make_response, request
+from pymongo import ReturnDocument
+
+from app.config import (
+    RESPONSE_CACHE_MAX_AGE,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    CACHE_VERSION_REFRESH_SECONDS,
+)
+from app.workers.rating_events import rating_events
+
+
+def default_versions_collection():
+    from app.database import get_app_database
+
+    return get_app_database()["cache_versions"]
+
+
+class CollectionVersions:
+    """Version counters for collections, shared between processes through MongoDB"""
+
+    def __init__(self, collection=None, refresh_interval=CACHE_VERSION_REFRESH_SECONDS):
+        self._collection = collection
+        self.refresh_interval = refresh_interval
+        self._versions = {}
+        self._refreshed = None
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = default_versions_collection()
+        return self._collection
+
+    def _refresh(self):
+        try:
+            versions = {doc['_id']: doc['version'] for doc in self.collection.find()}
+        except Exception as e:
+            # Keep serving with the versions we know about
+            print(f"Error reading cache versions: {str(e)}")
+            return
+        with self._lock:
+            for name, version in versions.items():
+                self._versions[name] = max(version, self._versions.get(name, 0))
+
+    def get(self, names):
+        """Current versions of names, re-read from MongoDB at most once per refresh interval"""
+        now = time.monotonic()
+        if self._refreshed is None or now - self._refreshed >= self.refresh_interval:
+            self._refreshed = now
+            self._refresh()
+        with self._lock:
+            return tuple(self._versions.get(name, 0) for name in names)
+
+    def bump(self, *names):
+        """Mark collections as changed, invalidating every cached response that read them"""
+        for name in names:
+            try:
+                doc = self.collection.find_one_and_update(
+                    {'_id': name}, {'$inc': {'version': 1}},
+                    upsert=True, return_document=ReturnDocument.AFTER
+                )
+                version = doc['version']
+            except Exception as e:
+                print(f"Error bumping cache version of {name}: {str(e)}")
+                version = None
+            with self._lock:
+                current = self._versions.get(name, 0)
+                self._versions[name] = max(version or 0, current + 1)
+
+
+class ResponseCache:
+    """Thread-safe LRU of encoded responses with a TTL"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires'] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body, mimetype):
+        entry = {
+            'body': body,
+            'mimetype': mimetype,
+            'etag': hashlib.sha1(body).hexdigest(),
+            'expires': time.monotonic() + self.ttl,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+collection_versions = CollectionVersions()
+response_cache = ResponseCache()
+
+
+def response_cache_key(path, args, collections):
+    """Key of a cached response: the path, its (name, value) query pairs and the versions of collections"""
+    return (path, tuple(sorted(args)), collection_versions.get(collections))
+
+
+def cached_response(*collections, max_age=RESPONSE_CACHE_MAX_AGE):
+    """
+    Cache a GET view's 200 responses until one of `collections` changes
+    Only for views whose output does not depend on the user
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = response_cache_key(request.path, request.args.items(multi=True), collections)
+            entry = response_cache.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.set(key, response.get_data(), response.mimetype)
+
+            if request.if_none_match.contains(entry['etag']):
+                response = Response(status=304)
+            else:
+                response = Response(entry['body'], mimetype=entry['mimetype'])
+            response.set_etag(entry['etag'])
+            response.headers['Cache-Control'] = f'public, max-age={max_age}'
+            return response
+        return wrapper
+    return decorator
+
+
+def invalidate_rated_movies(movie_ids, user_ids):
+    """Rating events hook: new averages change the movies and the rating aggregates"""
+    if movie_ids:
+        collection_versions.bump('movies', 'ratings')
+
+
+rating_events.add_flush_hook(invalidate_rated_movies)
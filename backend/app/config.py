@@ -12,11 +12,41 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'default-dev-key-change-in-production')
 
 # MongoDB connection
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/movie_recommendation_db')
+# Database of the routes, workers and command line tools
+APP_MONGO_URI = os.getenv('APP_MONGO_URI', 'mongodb://localhost:27017/')
+APP_DB_NAME = os.getenv('APP_DB_NAME', 'film_recommendation')
 
 # API keys for external services
 GOOGLE_PLACES_API_KEY = os.getenv('GOOGLE_PLACES_API_KEY')
 TMDB_API_KEY = os.getenv('TMDB_API_KEY')
 
+# External API client settings
+API_CACHE_DIR = os.getenv('API_CACHE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), '.cache'))
+API_CACHE_MAX_ENTRIES = int(os.getenv('API_CACHE_MAX_ENTRIES', 10_000))  # per cache, kept in memory
+GOOGLE_PLACES_TIMEOUT = float(os.getenv('GOOGLE_PLACES_TIMEOUT', 5))  # seconds
+GOOGLE_PLACES_CACHE_TTL = int(os.getenv('GOOGLE_PLACES_CACHE_TTL', 7 * 24 * 3600))  # 1 week in seconds
+GOOGLE_PLACES_MAX_WORKERS = int(os.getenv('GOOGLE_PLACES_MAX_WORKERS', 8))
+TMDB_API_URL = os.getenv('TMDB_API_URL', 'https://api.themoviedb.org/3')
+TMDB_IMAGE_BASE_URL = os.getenv('TMDB_IMAGE_BASE_URL', 'https://image.tmdb.org/t/p/w500')
+TMDB_TIMEOUT = float(os.getenv('TMDB_TIMEOUT', 10))  # seconds
+TMDB_CACHE_TTL = int(os.getenv('TMDB_CACHE_TTL', 24 * 3600))  # 1 day in seconds
+TMDB_MAX_WORKERS = int(os.getenv('TMDB_MAX_WORKERS', 8))
+TMDB_REQUESTS_PER_SECOND = float(os.getenv('TMDB_REQUESTS_PER_SECOND', 40))
+
+# Password hashing (app/passwords.py). The method is werkzeug's, e.g. 'scrypt:32768:8:1' or
+# 'pbkdf2:sha256:600000'; hashes made with other parameters are upgraded on the next login
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 64))  # queued + running; beyond it logins get 503
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))  # seconds a request waits for its hash
+
+# Login and registration rate limits (token buckets: sustained attempts per minute, burst size)
+LOGIN_RATE_PER_EMAIL = float(os.getenv('LOGIN_RATE_PER_EMAIL', 5))
+LOGIN_BURST_PER_EMAIL = int(os.getenv('LOGIN_BURST_PER_EMAIL', 10))
+LOGIN_RATE_PER_IP = float(os.getenv('LOGIN_RATE_PER_IP', 30))
+LOGIN_BURST_PER_IP = int(os.getenv('LOGIN_BURST_PER_IP', 30))
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100_000))  # buckets kept per limiter
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'http://localhost:3000').split(',')
 
@@ -28,15 +58,96 @@ JWT_ACCESS_TOKEN_EXPIRES = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 3600))  # 1
 RECOMMENDATION_MIN_RATINGS = int(os.getenv('RECOMMENDATION_MIN_RATINGS', 5))
 RECOMMENDATION_SIMILARITY_THRESHOLD = float(os.getenv('RECOMMENDATION_SIMILARITY_THRESHOLD', 0.3))
 
+# Recommendation pipeline (app/algorithms/pipeline.py): candidates per generator and stage budgets
+RECOMMENDATION_CANDIDATES = int(os.getenv('RECOMMENDATION_CANDIDATES', 200))
+RECOMMENDATION_GENERATE_BUDGET_MS = int(os.getenv('RECOMMENDATION_GENERATE_BUDGET_MS', 150))  # slower generators are skipped
+RECOMMENDATION_GENERATE_CONCURRENCY = int(os.getenv('RECOMMENDATION_GENERATE_CONCURRENCY', 16))  # requests the generator pool serves at once
+RECOMMENDATION_MERGE_BUDGET_MS = int(os.getenv('RECOMMENDATION_MERGE_BUDGET_MS', 10))
+RECOMMENDATION_FILTER_BUDGET_MS = int(os.getenv('RECOMMENDATION_FILTER_BUDGET_MS', 5))
+RECOMMENDATION_HYDRATE_BUDGET_MS = int(os.getenv('RECOMMENDATION_HYDRATE_BUDGET_MS', 100))  # also the query's maxTimeMS
+RECOMMENDATION_RANK_BUDGET_MS = int(os.getenv('RECOMMENDATION_RANK_BUDGET_MS', 20))
+
+# Nightly precompute job (python -m app.workers.precompute)
+RECOMMENDATION_PRECOMPUTE_WORKERS = int(os.getenv('RECOMMENDATION_PRECOMPUTE_WORKERS', os.cpu_count() or 1))
+RECOMMENDATION_PRECOMPUTE_BLOCK_SIZE = int(os.getenv('RECOMMENDATION_PRECOMPUTE_BLOCK_SIZE', 256))  # users per matrix product
+RECOMMENDATION_PRECOMPUTE_COUNT = int(os.getenv('RECOMMENDATION_PRECOMPUTE_COUNT', 50))  # stored per user
+
+# Similar movies table (python -m app.workers.neighbours)
+MOVIE_NEIGHBOURS_COUNT = int(os.getenv('MOVIE_NEIGHBOURS_COUNT', 20))  # stored per movie
+MOVIE_NEIGHBOURS_CONTENT_WEIGHT = float(os.getenv('MOVIE_NEIGHBOURS_CONTENT_WEIGHT', 0.5))  # the rest is co-rating
+MOVIE_NEIGHBOURS_BLOCK_SIZE = int(os.getenv('MOVIE_NEIGHBOURS_BLOCK_SIZE', 512))
+
+# Columnar ratings snapshot read by the training jobs (python -m app.workers.export_snapshot)
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'snapshots'))
+SNAPSHOT_MAX_SHARDS = int(os.getenv('SNAPSHOT_MAX_SHARDS', 16))  # incremental shards kept before they are merged
+# Deleted ratings are recorded in rating_deletions for this long (seconds); an older snapshot is re-exported in full
+RATING_DELETIONS_TTL = int(os.getenv('RATING_DELETIONS_TTL', 30 * 24 * 3600))
+
+# GET /api/users/watchlist pages (?limit= is capped at the maximum)
+WATCHLIST_PAGE_SIZE = int(os.getenv('WATCHLIST_PAGE_SIZE', 50))
+WATCHLIST_MAX_PAGE_SIZE = int(os.getenv('WATCHLIST_MAX_PAGE_SIZE', 200))
+
+# GET /api/movies/<id>/reviews pages (?limit= is capped at the maximum)
+REVIEWS_PAGE_SIZE = int(os.getenv('REVIEWS_PAGE_SIZE', 20))
+REVIEWS_MAX_PAGE_SIZE = int(os.getenv('REVIEWS_MAX_PAGE_SIZE', 100))
+
+# GET /api/movies/<id>/ratings pages (?limit= is capped at the maximum)
+RATINGS_PAGE_SIZE = int(os.getenv('RATINGS_PAGE_SIZE', 50))
+RATINGS_MAX_PAGE_SIZE = int(os.getenv('RATINGS_MAX_PAGE_SIZE', 200))
+
+# Rating side effects (movie averages, user preferences)
+# 'thread' = in-process write-behind queue, 'external' = events are stored for
+# the worker process (python -m app.workers.rating_events), 'inline' = apply immediately
+RATING_EVENTS_MODE = os.getenv('RATING_EVENTS_MODE', 'thread')
+RATING_EVENTS_WINDOW_SECONDS = float(os.getenv('RATING_EVENTS_WINDOW_SECONDS', 0.5))
+RATING_EVENTS_BATCH_SIZE = int(os.getenv('RATING_EVENTS_BATCH_SIZE', 500))
+
 # Email config
 
 EMAIL_USER = os.getenv('EMAIL_USER')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
 EMAIL_SERVER = os.getenv('EMAIL_SERVER')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
+EMAIL_TIMEOUT = float(os.getenv('EMAIL_TIMEOUT', 10))  # seconds
+
+# Outbound mail queue (app/workers/mail.py)
+# 'thread' = in-process queue, 'external' = stored in mail_outbox for the worker
+# process (python -m app.workers.mail), 'inline' = sent before the request returns
+MAIL_QUEUE_MODE = os.getenv('MAIL_QUEUE_MODE', 'thread')
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', 50))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+MAIL_RETRY_BASE_SECONDS = float(os.getenv('MAIL_RETRY_BASE_SECONDS', 2))  # doubled after every failed attempt
+MAIL_IDLE_TIMEOUT = float(os.getenv('MAIL_IDLE_TIMEOUT', 60))  # seconds before the SMTP connection is closed
 
 # Logging configuration
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
+# HTTP response cache for catalog and theater endpoints
+RESPONSE_CACHE_MAX_AGE = int(os.getenv('RESPONSE_CACHE_MAX_AGE', 60))  # Cache-Control max-age in seconds
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 600))  # also bounds staleness after out-of-band writes
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+CACHE_VERSION_REFRESH_SECONDS = float(os.getenv('CACHE_VERSION_REFRESH_SECONDS', 1))
+
+# Current user cache for JWT-protected routes (app/users.py)
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 30))  # seconds; bounds staleness after writes by other processes
+USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 10_000))
+
+# In-memory theater spatial index (app/geo.py); larger theater sets are queried in MongoDB
+THEATER_INDEX_TTL = int(os.getenv('THEATER_INDEX_TTL', 600))  # rebuild at least this often, in seconds
+THEATER_INDEX_MAX_SIZE = int(os.getenv('THEATER_INDEX_MAX_SIZE', 100_000))
+
+# Request instrumentation: histograms on /metrics, and ?profile=1 returns a cProfile breakdown
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+
+# Warm-up before /health/ready reports ready (app/warmup.py)
+# 'background' = warm up in a thread after create_app(), 'blocking' = create_app() waits, 'off' = ready at once
+WARMUP_MODE = os.getenv('WARMUP_MODE', 'background')
+WARMUP_PATHS = [path for path in os.getenv('WARMUP_PATHS', '/api/movies,/api/theaters').split(',') if path]  # requested to prime caches and query plans
+WARMUP_RETRY_SECONDS = float(os.getenv('WARMUP_RETRY_SECONDS', 5))  # wait before retrying a failed warm-up
+WARMUP_BLOCKING_ATTEMPTS = int(os.getenv('WARMUP_BLOCKING_ATTEMPTS', 3))  # 'blocking' mode: create_app() raises after this many failures
+
 # Other application settings
 ITEMS_PER_PAGE = int(os.getenv('ITEMS_PER_PAGE', 20))
 MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB max upload
@@ -1,10 +1,38 @@
 from pymongo import MongoClient  #libraries 
-from app.config import MONGO_URI  
+from app.config import APP_DB_NAME, APP_MONGO_URI, MONGO_URI
+from app.instrumentation import mongo_listener
+
+
+# One client (and connection pool) per process; MongoClient is thread-safe.
+# connect=False: the client connects on its first operation, so importing a
+# module that creates one does no I/O and starts no threads.
+# The request metrics' listener is passed to the clients rather than
+# registered globally, so it sees them whichever module creates them first
+_client = None
+_app_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = MongoClient(MONGO_URI, connect=False, event_listeners=[mongo_listener])
+    return _client
+
+
+def get_app_client():
+    """Client shared by the route modules"""
+    global _app_client
+    if _app_client is None:
+        _app_client = MongoClient(APP_MONGO_URI, connect=False, event_listeners=[mongo_listener])
+    return _app_client
+
+
+def get_app_database():
+    return get_app_client()[APP_DB_NAME]
 
 
 def get_database(): #function 
-    client = MongoClient(MONGO_URI)
-    return client.movie_recommendation_db
+    return get_client().movie_recommendation_db
 
 # function accessing the collections 
 def get_collections():
@@ -14,5 +42,6 @@ def get_collections():
         'movies': db.movies,
         'ratings': db.ratings,
         'theaters': db.theaters,
+        'watchlist': db.watchlist,
         'reviews': db.ratings  
     } 
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+In-memory spatial index for theaters
+
+The theater set is small and rarely changes, so radius and k-nearest
+queries are answered from a k-d tree over the theaters' positions on the
+unit sphere instead of a $near query per request. The tree is rebuilt when
+the theaters collection version changes (see app.caching) or after
+THEATER_INDEX_TTL. Queries return None when no index is available, and
+callers fall back to MongoDB.
+
+numpy and scipy are imported when the first index is built, not when the
+theaters routes are imported.
+"""
+import math
+import threading
+import time
+
+from app import caching
+from app.config import THEATER_INDEX_TTL, THEATER_INDEX_MAX_SIZE
+
+EARTH_RADIUS_KM = 6371
+
+
+def to_unit_vectors(lat, lng):
+    """Points on the unit sphere for latitudes and longitudes in degrees"""
+    import numpy as np
+
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lng = np.radians(np.asarray(lng, dtype=float))
+    return np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def chord_for_distance(distance_km):
+    """Straight-line distance between unit vectors that are distance_km apart on the surface"""
+    angle = min(distance_km / EARTH_RADIUS_KM, math.pi)
+    return 2 * math.sin(angle / 2)
+
+
+def distance_for_chord(chord):
+    """Great-circle distance in km, the same as the haversine formula"""
+    import numpy as np
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+class TheaterIndex:
+    """
+    k-d tree over theater locations
+
+    load() returns the theater documents; it is called again whenever the
+    index is stale. versions defaults to app.caching.collection_versions.
+    """
+
+    def __init__(self, load, ttl=THEATER_INDEX_TTL, max_size=THEATER_INDEX_MAX_SIZE, versions=None):
+        self.load = load
+        self.versions = versions
+        self.ttl = ttl
+        self.max_size = max_size
+        self._state = None
+        self._lock = threading.Lock()
+
+    def _build(self, version):
+        import numpy as np
+        from scipy.spatial import cKDTree
+
+        theaters = []
+        for theater in self.load():
+            coordinates = theater.get('location', {}).get('coordinates')
+            if coordinates and len(coordinates) == 2:
+                theaters.append(theater)
+            if len(theaters) > self.max_size:
+                # Too many theaters to keep in memory; MongoDB answers instead
+                return {'version': version, 'built': time.monotonic(), 'tree': None, 'theaters': None}
+
+        tree = None
+        if theaters:
+            lng, lat = np.array([theater['location']['coordinates'] for theater in theaters], dtype=float).T
+            tree = cKDTree(to_unit_vectors(lat, lng))
+        return {'version': version, 'built': time.monotonic(), 'tree': tree, 'theaters': theaters}
+
+    def _current(self):
+        version = (self.versions or caching.collection_versions).get(('theaters',))
+        state = self._state
+        if state is not None and state['version'] == version and time.monotonic() - state['built'] < self.ttl:
+            return state
+
+        with self._lock:
+            state = self._state
+            if state is None or state['version'] != version or time.monotonic() - state['built'] >= self.ttl:
+                try:
+                    state = self._build(version)
+                except Exception as e:
+                    print(f"Error building theater index: {str(e)}")
+                    return None
+                self._state = state
+        return state
+
+    def invalidate(self):
+        self._state = None
+
+    def query(self, lat, lng, max_distance_km=None, limit=None):
+        """
+        Theaters within max_distance_km of (lat, lng), nearest first, as
+        (theater, distance_km) pairs; at most `limit` of them when given
+        Returns None when the index is unavailable
+        """
+        import numpy as np
+
+        state = self._current()
+        if state is None or state['theaters'] is None:
+            return None
+        if state['tree'] is None:
+            return []
+
+        tree = state['tree']
+        point = to_unit_vectors(lat, lng)
+        bound = chord_for_distance(max_distance_km) if max_distance_km is not None else np.inf
+
+        if limit is not None:
+            k = min(limit, tree.n)
+            if k <= 0:
+                return []
+            # Returns infinite distances for fewer than k matches within the bound
+            chords, indexes = tree.query(point, k=k, distance_upper_bound=bound * (1 + 1e-12))
+            chords, indexes = np.atleast_1d(chords), np.atleast_1d(indexes)
+            found = np.isfinite(chords)
+            chords, indexes = chords[found], indexes[found]
+        else:
+            indexes = np.array(tree.query_ball_point(point, bound * (1 + 1e-12)), dtype=int)
+            chords = np.linalg.norm(tree.data[indexes] - point, axis=1) if len(indexes) else np.empty(0)
+            order = np.argsort(chords, kind='stable')
+            chords, indexes = chords[order], indexes[order]
+
+        distances = distance_for_chord(chords)
+        return [
+            (_copy_theater(state['theaters'][index]), float(distance))
+            for index, distance in zip(indexes, distances)
+        ]
+
+
+def _copy_theater(theater):
+    """
+    Copy of the parts of a cached theater that routes modify (the document
+    and its current_movies items); a deepcopy costs more than the query
+    """
+    theater = dict(theater)
+    if 'current_movies' in theater:
+        theater['current_movies'] = [dict(item) for item in theater['current_movies']]
+    return theater
@@ -0,0 +1,297 @@
+"""
+Per-request instrumentation
+
+Every request records its latency, the number and total duration of the
+MongoDB commands it issued (through a PyMongo CommandListener) and the time
+spent in outbound HTTP calls. Samples go to histograms labelled by route,
+served in the Prometheus text format on /metrics. Each response also gets
+a Server-Timing header with the same breakdown.
+
+With PROFILING_ENABLED set, adding ?profile=1 to any request returns its
+cProfile breakdown instead of the normal response.
+
+requests is not imported here: HTTP timing is added to requests'
+HTTPAdapter by instrument_http(), which the integrations call when they are
+imported, so apps that never make outbound calls do not load requests.
+"""
+import bisect
+import io
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import Response, g, request
+from pymongo import monitoring
+
+from app.config import METRICS_ENABLED, PROFILING_ENABLED
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+# Lines of cProfile output returned for ?profile=1
+PROFILE_LINES = 40
+
+
+class Histogram:
+    """Thread-safe histogram with fixed buckets, one series per label combination"""
+
+    def __init__(self, name, description, labels, buckets):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then sum and count
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in sorted(self._series.items())}
+
+        for key, values in series.items():
+            label_text = ','.join(f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key))
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f'{{{label_text}}}' if label_text else ''
+            lines.append(f"{self.name}_sum{suffix} {values[-2]}")
+            lines.append(f"{self.name}_count{suffix} {values[-1]}")
+        return lines
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency', ('method', 'route', 'status'), LATENCY_BUCKETS
+)
+MONGO_COMMANDS = Histogram(
+    'mongo_commands_per_request', 'MongoDB commands issued per request', ('route',), COUNT_BUCKETS
+)
+MONGO_TIME = Histogram(
+    'mongo_request_duration_seconds', 'Time spent in MongoDB commands per request', ('route',), LATENCY_BUCKETS
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    'mongo_command_duration_seconds', 'Latency of individual MongoDB commands', ('command',), LATENCY_BUCKETS
+)
+OUTBOUND_HTTP_TIME = Histogram(
+    'outbound_http_duration_seconds', 'Time spent in outbound HTTP calls per request', ('route',), LATENCY_BUCKETS
+)
+
+HISTOGRAMS = [REQUEST_LATENCY, MONGO_COMMANDS, MONGO_TIME, MONGO_COMMAND_LATENCY, OUTBOUND_HTTP_TIME]
+
+
+class RequestStats:
+    """Counters for the request running in the current context"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self.http_calls = 0
+        self.http_seconds = 0.0
+        self.timings = []
+
+
+_current_stats = ContextVar('request_stats', default=None)
+
+
+def current_stats():
+    return _current_stats.get()
+
+
+def record_timing(name, seconds, description=None):
+    """Add a named duration to the current request's Server-Timing header"""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.timings.append((name, seconds, description))
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every MongoDB command and charges it to the current request"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        if not _installed:
+            return
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMAND_LATENCY.observe(seconds, command=event.command_name)
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.mongo_commands += 1
+            stats.mongo_seconds += seconds
+
+
+mongo_listener = MongoCommandListener()
+_installed = False
+_http_timing_installed = False
+_install_lock = threading.Lock()
+
+
+def _install_http_timing():
+    # requests has no global hook, so time HTTPAdapter.send for every session
+    from requests.adapters import HTTPAdapter
+
+    send = HTTPAdapter.send
+
+    def timed_send(self, *args, **kwargs):
+        stats = _current_stats.get()
+        if stats is None:
+            return send(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return send(self, *args, **kwargs)
+        finally:
+            stats.http_calls += 1
+            stats.http_seconds += time.perf_counter() - start
+
+    HTTPAdapter.send = timed_send
+
+
+def instrument_http():
+    """Time outbound requests calls once instrumentation is installed; called by the modules that use requests"""
+    global _http_timing_installed
+    with _install_lock:
+        if _installed and not _http_timing_installed:
+            _install_http_timing()
+            _http_timing_installed = True
+
+
+def install():
+    """
+    Start recording MongoDB commands, and HTTP timing if requests is in use
+    The shared clients (app.database) are created with mongo_listener, so
+    this works whether they were created before or after
+    """
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        _installed = True
+    if 'requests' in sys.modules:
+        instrument_http()
+
+
+def start_request_stats():
+    """Start counting for the request running in the current context; returns (stats, token)"""
+    stats = RequestStats()
+    return stats, _current_stats.set(stats)
+
+
+def stop_request_stats(token):
+    _current_stats.reset(token)
+
+
+def observe_request(stats, method, route, status, elapsed):
+    REQUEST_LATENCY.observe(elapsed, method=method, route=route, status=status)
+    MONGO_COMMANDS.observe(stats.mongo_commands, route=route)
+    MONGO_TIME.observe(stats.mongo_seconds, route=route)
+    OUTBOUND_HTTP_TIME.observe(stats.http_seconds, route=route)
+
+
+def server_timing(stats, elapsed):
+    """Server-Timing header value for a request's stats"""
+    value = (
+        f'app;dur={elapsed * 1000:.1f}, '
+        f'db;dur={stats.mongo_seconds * 1000:.1f};desc="{stats.mongo_commands} commands", '
+        f'http;dur={stats.http_seconds * 1000:.1f};desc="{stats.http_calls} calls"'
+    )
+    for name, seconds, description in stats.timings:
+        entry = f'{name};dur={seconds * 1000:.1f}'
+        if description:
+            entry += f';desc="{description}"'
+        value += f', {entry}'
+    return value
+
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _route_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _profile_response(profiler):
+    import pstats
+
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats('cumulative').print_stats(PROFILE_LINES)
+    return Response(output.getvalue(), mimetype='text/plain')
+
+
+def init_instrumentation(app):
+    """Add the metrics hooks, /metrics and ?profile=1 to app"""
+    app.config.setdefault('METRICS_ENABLED', METRICS_ENABLED)
+    app.config.setdefault('PROFILING_ENABLED', PROFILING_ENABLED)
+    if not app.config['METRICS_ENABLED']:
+        return
+    install()
+
+    @app.before_request
+    def start_flask_request_stats():
+        g.request_stats, g.request_stats_token = start_request_stats()
+        if app.config['PROFILING_ENABLED'] and request.args.get('profile') == '1':
+            import cProfile
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_request_stats(response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+
+        elapsed = time.perf_counter() - stats.started
+        if request.endpoint != 'metrics':
+            observe_request(stats, request.method, _route_label(), response.status_code, elapsed)
+        response.headers['Server-Timing'] = server_timing(stats, elapsed)
+
+        if profiler is not None:
+            return _profile_response(profiler)
+        return response
+
+    @app.teardown_request
+    def reset_request_stats(error=None):
+        token = g.pop('request_stats_token', None)
+        if token is not None:
+            stop_request_stats(token)
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
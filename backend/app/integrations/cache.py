@@ -0,0 +1,101 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import API_CACHE_MAX_ENTRIES
+
+
+class TTLCache:
+    """
+    Persistent key/value cache with expiry for external API responses
+
+    Values are written through to a SQLite file, so they survive restarts,
+    and the max_entries most recently used live ones are also kept in memory.
+    Values must be JSON serializable (None is a valid value).
+    """
+
+    def __init__(self, path, ttl, max_entries=API_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, meta TEXT)'
+        )
+        self._conn.commit()
+
+    def _remember(self, key, entry):
+        """Keep entry in memory, dropping the least recently used ones beyond max_entries; call with the lock held"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_entry(self, key):
+        """Return (value, meta, expired) or None if the key was never stored"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._conn.execute(
+                    'SELECT value, expires_at, meta FROM cache WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = (json.loads(row[0]), row[1], json.loads(row[2]) if row[2] else None)
+            if entry[1] < now:
+                # Expired entries are only read for stale answers and revalidation; they stay on disk
+                self._memory.pop(key, None)
+            else:
+                self._remember(key, entry)
+
+        value, expires_at, meta = entry
+        return value, meta, expires_at < now
+
+    def get(self, key, default=None):
+        """Value for key, or default if missing or expired"""
+        entry = self.get_entry(key)
+        if entry is None or entry[2]:
+            return default
+        return entry[0]
+
+    def contains(self, key):
+        entry = self.get_entry(key)
+        return entry is not None and not entry[2]
+
+    def set(self, key, value, ttl=None, meta=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, (value, expires_at, meta))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at, meta) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), expires_at, json.dumps(meta) if meta is not None else None)
+            )
+            self._conn.commit()
+
+    def touch(self, key, ttl=None):
+        """Extend the expiry of an existing entry"""
+        entry = self.get_entry(key)
+        if entry is not None:
+            self.set(key, entry[0], ttl=ttl, meta=entry[1])
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            self._memory = OrderedDict((k, v) for k, v in self._memory.items() if v[1] >= now)
+            self._conn.execute('DELETE FROM cache WHERE expires_at < ?', (now,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,30 +1,147 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from app.config import GOOGLE_PLACES_API_KEY 
+from requests.adapters import HTTPAdapter
 
-def get_additional_theater_info(theater_name, location):
+from app.config import (
+    GOOGLE_PLACES_API_KEY,
+    GOOGLE_PLACES_TIMEOUT,
+    GOOGLE_PLACES_CACHE_TTL,
+    GOOGLE_PLACES_MAX_WORKERS,
+    API_CACHE_DIR,
+)
+from app.integrations.cache import TTLCache
+from app.instrumentation import instrument_http
+
+PLACES_TEXT_SEARCH_URL = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+
+# Answers that hold for the query; the other statuses (OVER_QUERY_LIMIT,
+# REQUEST_DENIED, INVALID_REQUEST, UNKNOWN_ERROR) are about the request
+CACHEABLE_STATUSES = ('OK', 'ZERO_RESULTS')
+
+logger = logging.getLogger(__name__)
+
+# Time the calls in the request's Server-Timing header
+instrument_http()
+
+
+class GooglePlacesClient:
     """
-    Fetch additional theater information from Google Places API
+    Google Places text search client for theater details
+
+    Uses one pooled keep-alive session with explicit timeouts, and caches
+    results (including "not found") per (theater name, city) on disk
     """
-    base_url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-    query = f"{theater_name} cinema {location['city']}"
-    
-    params = {
-        'query': query,
-        'key': GOOGLE_PLACES_API_KEY
-    }
-    
-    response = requests.get(base_url, params=params)
-    
-    if response.status_code == 200:
-        results = response.json().get('results', [])
+
+    def __init__(self, api_key=GOOGLE_PLACES_API_KEY, base_url=PLACES_TEXT_SEARCH_URL,
+                 timeout=GOOGLE_PLACES_TIMEOUT, cache=None, max_workers=GOOGLE_PLACES_MAX_WORKERS):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.cache = cache if cache is not None else TTLCache(
+            os.path.join(API_CACHE_DIR, 'google_places.sqlite3'), GOOGLE_PLACES_CACHE_TTL
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=1)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @staticmethod
+    def cache_key(theater_name, city):
+        return f"{theater_name.strip().lower()}|{(city or '').strip().lower()}"
+
+    def lookup(self, theater_name, city):
+        """Place details for a theater, or None if not found"""
+        key = self.cache_key(theater_name, city)
+        entry = self.cache.get_entry(key)
+        if entry is not None and not entry[2]:
+            return entry[0]
+
+        params = {
+            'query': f"{theater_name} cinema {city}",
+            'key': self.api_key
+        }
+
+        # Serve a stale result rather than nothing when the lookup fails
+        stale = entry[0] if entry is not None else None
+        try:
+            response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.warning("Error fetching place details for %s: %s", theater_name, e)
+            return stale
+
+        if response.status_code != 200:
+            return stale
+
+        try:
+            data = response.json()
+        except ValueError as e:
+            logger.warning("Invalid place details for %s: %s", theater_name, e)
+            return stale
+
+        status = data.get('status')
+        if status not in CACHEABLE_STATUSES:
+            logger.warning("Places lookup for %s returned %s: %s",
+                           theater_name, status, data.get('error_message', ''))
+            return stale
+
+        place_info = None
+        results = data.get('results', [])
         if results:
             place = results[0]
-            return {
+            place_info = {
                 'place_id': place.get('place_id'),
                 'rating': place.get('rating'),
                 'user_ratings_total': place.get('user_ratings_total'),
                 'photos': place.get('photos', []),
                 'formatted_address': place.get('formatted_address')
             }
-    
-    return None
\ No newline at end of file
+
+        self.cache.set(key, place_info)
+        return place_info
+
+    def lookup_many(self, theaters):
+        """
+        Place details for several (theater name, city) pairs
+        Cached pairs are answered locally; the rest are fetched with bounded concurrency
+        """
+        pairs = list(theaters)
+        results = {}
+        to_fetch = []
+        for name, city in dict.fromkeys(pairs):
+            key = self.cache_key(name, city)
+            if self.cache.contains(key):
+                results[(name, city)] = self.cache.get(key)
+            else:
+                to_fetch.append((name, city))
+
+        if to_fetch:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(to_fetch))) as executor:
+                fetched = executor.map(lambda pair: self.lookup(*pair), to_fetch)
+                results.update(zip(to_fetch, fetched))
+
+        return [results[pair] for pair in pairs]
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+
+
+def get_places_client():
+    global _default_client
+    if _default_client is None:
+        _default_client = GooglePlacesClient()
+    return _default_client
+
+
+def get_additional_theater_info(theater_name, location):
+    """
+    Fetch additional theater information from Google Places API
+    """
+    return get_places_client().lookup(theater_name, location['city'])
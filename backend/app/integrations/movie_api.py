@@ -0,0 +1,266 @@
+"""
+TMDB movie metadata client and catalog sync
+
+Refresh the catalog with popular titles, then fill in missing details:
+    python -m app.integrations.movie_api --pages 5 --enrich
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from pymongo import UpdateOne
+
+from app.config import (
+    TMDB_API_KEY,
+    TMDB_API_URL,
+    TMDB_IMAGE_BASE_URL,
+    TMDB_TIMEOUT,
+    TMDB_CACHE_TTL,
+    TMDB_MAX_WORKERS,
+    TMDB_REQUESTS_PER_SECOND,
+    API_CACHE_DIR,
+)
+from app.integrations.cache import TTLCache
+from app.instrumentation import instrument_http
+from app.ratelimit import TokenBucket
+
+# Retries after a 429 response
+MAX_RATE_LIMIT_RETRIES = 3
+
+# Time the calls in the request's Server-Timing header
+instrument_http()
+
+
+class TMDBError(Exception):
+    pass
+
+
+def retry_after_seconds(value, default=1.0):
+    """Seconds to wait from a Retry-After header: delay-seconds or an HTTP-date"""
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class TMDBClient:
+    """
+    Client for TMDB-shaped movie APIs
+
+    Responses are cached on disk with their ETag. Fresh entries are served
+    without any request; stale ones are revalidated with If-None-Match, so
+    unchanged titles only cost a 304. Requests share a token bucket and run
+    on a bounded thread pool.
+    """
+
+    def __init__(self, api_key=TMDB_API_KEY, base_url=TMDB_API_URL, timeout=TMDB_TIMEOUT,
+                 cache=None, max_workers=TMDB_MAX_WORKERS, requests_per_second=TMDB_REQUESTS_PER_SECOND):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.cache = cache if cache is not None else TTLCache(
+            os.path.join(API_CACHE_DIR, 'tmdb.sqlite3'), TMDB_CACHE_TTL
+        )
+        self.stats = {'requests': 0, 'not_modified': 0, 'cache_hits': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, path, **params):
+        """GET a JSON resource, using the disk cache and conditional requests"""
+        key = path + ('?' + urlencode(sorted(params.items())) if params else '')
+        entry = self.cache.get_entry(key)
+        if entry is not None and not entry[2]:
+            self._count('cache_hits')
+            return entry[0]
+
+        headers = {}
+        if entry is not None and entry[1] and entry[1].get('etag'):
+            headers['If-None-Match'] = entry[1]['etag']
+
+        query = dict(params, api_key=self.api_key) if self.api_key else params
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self.rate_limiter.acquire()
+            self._count('requests')
+            response = self.session.get(
+                f"{self.base_url}{path}", params=query, headers=headers, timeout=self.timeout
+            )
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                break
+            time.sleep(retry_after_seconds(response.headers.get('Retry-After')))
+
+        if response.status_code == 304 and entry is not None:
+            self._count('not_modified')
+            self.cache.touch(key)
+            return entry[0]
+
+        if response.status_code != 200:
+            raise TMDBError(f"GET {path} failed with status {response.status_code}")
+
+        data = response.json()
+        etag = response.headers.get('ETag')
+        self.cache.set(key, data, meta={'etag': etag} if etag else None)
+        return data
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def map_concurrently(self, func, items):
+        """
+        Run func over items on the bounded thread pool, keeping order; an item
+        whose request fails gives None (counted in stats['errors']) instead of
+        failing the others
+        """
+        items = list(items)
+        if not items:
+            return []
+
+        def call(item):
+            try:
+                return func(item)
+            except (TMDBError, requests.RequestException) as e:
+                print(f"Error fetching {item!r} from TMDB: {str(e)}")
+                self._count('errors')
+                return None
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(call, items))
+
+    def genres(self):
+        """Genre id -> name"""
+        data = self.get('/genre/movie/list')
+        return {genre['id']: genre['name'] for genre in data.get('genres', [])}
+
+    def popular(self, pages=1):
+        """Popular movies from the first `pages` pages, fetched concurrently"""
+        results = self.map_concurrently(lambda page: self.get('/movie/popular', page=page),
+                                        range(1, pages + 1))
+        return [movie for page in results if page is not None for movie in page.get('results', [])]
+
+    def movie_details(self, tmdb_id):
+        return self.get(f'/movie/{tmdb_id}', append_to_response='credits')
+
+    def movie_details_many(self, tmdb_ids):
+        """Details of each id, None for the ones that failed"""
+        return self.map_concurrently(self.movie_details, tmdb_ids)
+
+    def search(self, title, year=None):
+        """Best match for a title, or None"""
+        params = {'query': title}
+        if year:
+            params['year'] = year
+        results = self.get('/search/movie', **params).get('results', [])
+        return results[0] if results else None
+
+    def close(self):
+        self.session.close()
+
+
+def to_movie_document(details):
+    """Convert TMDB movie details to our movie schema"""
+    credits = details.get('credits', {})
+    director = next(
+        (member['name'] for member in credits.get('crew', []) if member.get('job') == 'Director'),
+        ''
+    )
+    release_date = details.get('release_date') or ''
+    poster_path = details.get('poster_path')
+
+    movie = {
+        'tmdb_id': details['id'],
+        'title': details.get('title', ''),
+        'description': details.get('overview', ''),
+        'genres': [genre['name'] for genre in details.get('genres', [])],
+        'director': director,
+        'cast': [member['name'] for member in credits.get('cast', [])[:10]],
+        'image_url': f"{TMDB_IMAGE_BASE_URL}{poster_path}" if poster_path else '',
+    }
+    if release_date[:4].isdigit():
+        movie['year'] = int(release_date[:4])
+    return movie
+
+
+def refresh_catalog(movies_collection, client, pages=1):
+    """Upsert the popular movies from TMDB into the catalog, keyed by tmdb_id"""
+    tmdb_ids = list(dict.fromkeys(movie['id'] for movie in client.popular(pages)))
+    details = client.movie_details_many(tmdb_ids)
+
+    updates = [
+        UpdateOne({'tmdb_id': item['id']}, {'$set': to_movie_document(item)}, upsert=True)
+        for item in details
+        if item is not None
+    ]
+    if updates:
+        movies_collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def enrich_catalog(movies_collection, client):
+    """Fill in missing details of catalog movies that have no tmdb_id yet"""
+    movies = list(movies_collection.find(
+        {'tmdb_id': {'$exists': False}}, {'title': 1, 'year': 1}
+    ))
+    matches = client.map_concurrently(
+        lambda movie: client.search(movie['title'], movie.get('year')), movies
+    )
+
+    matched = [(movie, match) for movie, match in zip(movies, matches) if match]
+    details = client.movie_details_many([match['id'] for _, match in matched])
+
+    updates = []
+    for (movie, _), item in zip(matched, details):
+        if item is None:
+            continue
+        document = to_movie_document(item)
+        # Keep the catalog's own title and year; other fields are refreshed from TMDB
+        document.pop('title', None)
+        document.pop('year', None)
+        document = {field: value for field, value in document.items() if value not in ('', [])}
+        updates.append(UpdateOne({'_id': movie['_id']}, {'$set': document}))
+
+    if updates:
+        movies_collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+if __name__ == '__main__':
+    from app.caching import collection_versions
+    from app.database import get_app_database
+
+    parser = argparse.ArgumentParser(description='Sync the movie catalog with TMDB')
+    parser.add_argument('--pages', type=int, default=1, help='Pages of popular movies to import')
+    parser.add_argument('--enrich', action='store_true', help='Fill in details of existing movies')
+    args = parser.parse_args()
+
+    movies_collection = get_app_database()["movies"]
+    tmdb = TMDBClient()
+
+    start = time.time()
+    if args.pages:
+        print(f"Imported {refresh_catalog(movies_collection, tmdb, args.pages)} popular movies")
+    if args.enrich:
+        print(f"Enriched {enrich_catalog(movies_collection, tmdb)} existing movies")
+    collection_versions.bump('movies')
+    print(f"Done in {time.time() - start:.1f}s, {tmdb.stats}")
@@ -9,6 +9,23 @@ rating_schema = {
     "tags": list           
 }
 
+# Orders of the reviews feed; _id breaks ties so every review has one position
+REVIEW_SORTS = {
+    'newest': [('created_at', -1), ('_id', -1)],
+    'helpful': [('helpful_votes', -1), ('_id', -1)],
+}
+
+# Only ratings with a review text are in the review indexes; queries have to
+# repeat this filter (with $gt, not $ne) for MongoDB to use them
+HAS_REVIEW = {'review': {'$gt': ''}}
+
+def create_review_indexes(collection):
+    """Partial indexes the reviews feed walks, one per order"""
+    for name, sort in REVIEW_SORTS.items():
+        collection.create_index(
+            [('movie_id', 1)] + sort, name=f'reviews_{name}', partialFilterExpression=HAS_REVIEW
+        )
+
 def validate_rating(rating):
     # Validation function to check fields for a rating 
     required_fields = ["user_id", "movie_id", "rating"]
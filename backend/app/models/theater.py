@@ -1,4 +1,7 @@
-from app.database import get_collections
+from app.config import RATING_DELETIONS_TTL
+from app.database import get_app_database
+from app.models.ratings import create_review_indexes
+from app.models.user import create_watchlist_indexes
 from bson import ObjectId
 
 
@@ -49,7 +52,8 @@ def validate_theater(theater):
     return True, "Valid theater data"
 
 def create_indexes():
-    collections = get_collections()
+    # The collections the routes use (app.database.get_app_database)
+    collections = get_app_database()
     
     # Create geospatial index for theaters collection
     collections['theaters'].create_index([("location", "2dsphere")])
@@ -57,7 +61,15 @@ def create_indexes():
 
     # Create indexes for faster queries
     collections['ratings'].create_index([("user_id", 1), ("movie_id", 1)], unique=True)
+    # Pages of a movie's ratings, newest first
+    collections['ratings'].create_index([("movie_id", 1), ("created_at", -1), ("_id", -1)])
     collections['movies'].create_index([("title", 1)])
+    # Popular candidates for the recommendation pipeline
+    collections['movies'].create_index([("average_rating", -1)])
+    create_watchlist_indexes(collections['watchlist'])
+    create_review_indexes(collections['ratings'])
+    # Tombstones of deleted ratings expire once no snapshot export needs them
+    collections['rating_deletions'].create_index([("deleted_at", 1)], expireAfterSeconds=RATING_DELETIONS_TTL)
     print("Created additional indexes for performance") 
 
 
@@ -66,7 +78,7 @@ def get_theaters_near_location(longitude, latitude, max_distance=20000):
     Find theaters within a radius (in meters) of a given location
     Default is 20km 
     """
-    theaters = get_collections()['theaters']
+    theaters = get_app_database()['theaters']
     
     # MongoDB geospatial query
     query = {
@@ -88,7 +100,7 @@ def get_theaters_showing_movie(movie_id, longitude=None, latitude=None, max_dist
     Find theaters showing a specific movie
     Filter by location if coordinates are provided
     """
-    theaters = get_collections()['theaters']
+    theaters = get_app_database()['theaters']
     
     # Base query to find theaters showing the movie
     query = {
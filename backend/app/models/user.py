@@ -1,3 +1,5 @@
+from datetime import datetime
+
 #users collection
 user_schema = {
     "username": str,
@@ -12,6 +14,21 @@ user_schema = {
     "created_at": str  # Date when user account was created 
 }
 
+#watchlist collection, one document per entry (see app/routes/watchlist.py)
+watchlist_schema = {
+    "user_id": str,
+    "movie_id": str,
+    "added_at": datetime
+}
+
+# Oldest first, like the embedded array was; movie_id breaks ties between entries added in the same millisecond
+WATCHLIST_SORT = [('added_at', 1), ('movie_id', 1)]
+
+def create_watchlist_indexes(collection):
+    """One entry per (user, movie), and the index the paginated reads walk"""
+    collection.create_index([('user_id', 1), ('movie_id', 1)], unique=True)
+    collection.create_index([('user_id', 1), ('added_at', 1), ('movie_id', 1)])
+
 def validate_user(user):
     # Validation function to check user has the required fields 
     required_fields = ["username", "email", "password_hash"]
@@ -0,0 +1,106 @@
+"""
+Password hashing off the request threads
+
+Hashing is deliberately expensive, so it runs on a small pool of threads
+(hashlib's scrypt and pbkdf2 release the GIL while they work). A request
+waits for its own hash, but at most PASSWORD_HASH_WORKERS hashes use the
+CPU at once, and once PASSWORD_HASH_MAX_PENDING are queued or running new
+ones fail fast with PasswordHasherBusy instead of piling up behind a login
+storm.
+
+The hash method and its parameters come from PASSWORD_HASH_METHOD. Stored
+hashes made with other parameters still verify, and verify_and_upgrade()
+re-hashes them in the background after a successful login.
+"""
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app.config import (
+    PASSWORD_HASH_METHOD,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_MAX_PENDING,
+    PASSWORD_HASH_TIMEOUT,
+)
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashes are queued; the caller should ask the client to retry"""
+
+
+class PasswordHasher:
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS,
+                 max_pending=PASSWORD_HASH_MAX_PENDING, timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+    @functools.cached_property
+    def prefix(self):
+        """Method with every parameter spelled out, as stored before the first '$' of a hash"""
+        # werkzeug fills in defaults ('scrypt' -> 'scrypt:32768:8:1'), so ask it once
+        return self._wait(self._submit(generate_password_hash, '', self.method)).split('$', 1)[0]
+
+    def _submit(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy('Password hashing is overloaded')
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # The hash finishes in the background and frees its slot then
+            raise PasswordHasherBusy('Password hashing timed out')
+
+    def hash(self, password):
+        """New hash of password with the configured method"""
+        return self._wait(self._submit(generate_password_hash, password, self.method))
+
+    def verify(self, password_hash, password):
+        return self._wait(self._submit(check_password_hash, password_hash, password))
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.prefix
+
+    def verify_and_upgrade(self, password_hash, password, save):
+        """
+        Check password; if it matches a hash made with other parameters,
+        hash it again in the background and pass the new hash to save()
+
+        Returns whether the password matched, and the upgrade's future (or None).
+        """
+        if not self.verify(password_hash, password):
+            return False, None
+        try:
+            if not self.needs_rehash(password_hash):
+                return True, None
+            future = self._submit(generate_password_hash, password, self.method)
+        except PasswordHasherBusy:
+            # Upgraded on a later login
+            return True, None
+
+        def upgraded(future):
+            try:
+                save(future.result())
+            except Exception as e:
+                print(f"Error upgrading password hash: {str(e)}")
+
+        future.add_done_callback(upgraded)
+        return True, future
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter
+
+    Holds up to `capacity` tokens and refills at `rate` tokens per second.
+    Safe to share between threads.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available, without waiting"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """Take tokens, sleeping until enough have been refilled"""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class KeyedTokenBucket:
+    """
+    One token bucket per key (an email address, a client IP, ...)
+
+    Buckets are created full on first use. At most `max_keys` are kept: the
+    least recently used is dropped first, which at worst hands an idle key a
+    full bucket again. Safe to share between threads.
+    """
+
+    def __init__(self, rate, capacity=None, max_keys=100_000):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def _tokens(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def try_acquire(self, key, tokens=1):
+        """Take tokens from key's bucket if available, without waiting"""
+        now = time.monotonic()
+        with self._lock:
+            available = self._tokens(key, now)
+            allowed = available >= tokens
+            if allowed:
+                available -= tokens
+            self._buckets[key] = (available, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def retry_after(self, key, tokens=1):
+        """Seconds until key's bucket holds enough tokens"""
+        with self._lock:
+            available = self._tokens(key, time.monotonic())
+        return max(0.0, (tokens - available) / self.rate)
+
+    def __len__(self):
+        return len(self._buckets)
@@ -5,4 +5,17 @@
 
 # You can add package-level variables or functions if needed
 # For example:
-API_VERSION = 'v1'
\ No newline at end of file
+API_VERSION = 'v1'
+
+# Route module -> its module-level <name>_collection attributes, for tests and
+# benchmarks that point the routes at another database
+ROUTE_COLLECTIONS = {
+    'app.routes.auth': ['users', 'ratings', 'movies'],
+    'app.routes.movies': ['movies', 'movie_neighbours'],
+    'app.routes.ratings': ['ratings', 'movies', 'users', 'rating_summaries', 'rating_deletions'],
+    'app.routes.recommendation': ['movies', 'ratings', 'recommendations', 'movie_neighbours'],
+    'app.routes.reviews': ['ratings', 'users'],
+    'app.routes.theaters': ['theaters', 'movies'],
+    'app.routes.watchlist': ['movies', 'watchlist'],
+    'app.users': ['users'],
+}
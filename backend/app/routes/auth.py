@@ -1,22 +1,48 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, current_user, jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
-import pymongo
+import math
+from app.database import get_app_database
 from bson import ObjectId
+from app.config import (
+    LOGIN_RATE_PER_EMAIL,
+    LOGIN_BURST_PER_EMAIL,
+    LOGIN_RATE_PER_IP,
+    LOGIN_BURST_PER_IP,
+    RATE_LIMIT_MAX_KEYS,
+)
+from app.passwords import PasswordHasherBusy, password_hasher
+from app.ratelimit import KeyedTokenBucket
+from app.users import user_cache
 from app.utils import generate_reset_token, send_reset_email
+from app.workers.rating_events import rating_events
 
 
 # Create blueprint
 auth_bp = Blueprint('auth', __name__)
 
 # Connect to MongoDB directly
-client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = client["film_recommendation"]
+db = get_app_database()
 users_collection = db["users"]
 ratings_collection = db["ratings"]
 movies_collection = db["movies"]
 
+# Attempts are limited before any hashing happens; rates are per minute
+login_email_limiter = KeyedTokenBucket(LOGIN_RATE_PER_EMAIL / 60, LOGIN_BURST_PER_EMAIL, RATE_LIMIT_MAX_KEYS)
+login_ip_limiter = KeyedTokenBucket(LOGIN_RATE_PER_IP / 60, LOGIN_BURST_PER_IP, RATE_LIMIT_MAX_KEYS)
+
+def rate_limited(*checks):
+    """429 response if any (limiter, key) is out of tokens, else None"""
+    for limiter, key in checks:
+        if not limiter.try_acquire(key):
+            retry_after = max(1, math.ceil(limiter.retry_after(key)))
+            return jsonify({'error': 'Too many attempts, please try again later'}), 429, {'Retry-After': str(retry_after)}
+    return None
+
+def hashing_busy():
+    """503 response when the password hashing pool is saturated"""
+    return jsonify({'error': 'Server busy, please try again'}), 503, {'Retry-After': '1'}
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
@@ -27,6 +53,10 @@ def register():
         # Validate required fields
         if not all(key in data for key in ['username', 'email', 'password']):
             return jsonify({'error': 'Missing required fields'}), 400
+
+        limited = rate_limited((login_ip_limiter, request.remote_addr or 'unknown'))
+        if limited:
+            return limited
             
         # Check if user exists
         if users_collection.find_one({'email': data['email']}):
@@ -36,7 +66,7 @@ def register():
         user_data = {
             'username': data['username'],
             'email': data['email'],
-            'password_hash': generate_password_hash(data['password']),
+            'password_hash': password_hasher.hash(data['password']),
             'preferences': {
                 'genres': [],
                 'directors': [],
@@ -69,6 +99,8 @@ def register():
             'user': user_response
         }), 201
         
+    except PasswordHasherBusy:
+        return hashing_busy()
     except Exception as e:
         print(f"Error during registration: {str(e)}")
         return jsonify({'error': f'Registration failed: {str(e)}'}), 500
@@ -83,14 +115,29 @@ def login():
         # Validate required fields
         if not all(key in data for key in ['email', 'password']):
             return jsonify({'error': 'Missing email or password'}), 400
+
+        # Shed repeated attempts before paying for a lookup and a hash
+        limited = rate_limited(
+            (login_ip_limiter, request.remote_addr or 'unknown'),
+            (login_email_limiter, str(data['email']).lower()),
+        )
+        if limited:
+            return limited
             
         # Find user by email
         user = users_collection.find_one({'email': data['email']})
         if not user:
             return jsonify({'error': 'Invalid email or password'}), 401
             
-        # Check password
-        if not check_password_hash(user['password_hash'], data['password']):
+        # Check password; hashes made with older parameters are replaced in the background
+        def save_hash(new_hash):
+            users_collection.update_one(
+                {'_id': user['_id'], 'password_hash': user['password_hash']},
+                {'$set': {'password_hash': new_hash}}
+            )
+
+        matched, _ = password_hasher.verify_and_upgrade(user['password_hash'], data['password'], save_hash)
+        if not matched:
             return jsonify({'error': 'Invalid email or password'}), 401
             
         # Create JWT token
@@ -112,6 +159,8 @@ def login():
             'user': user_response
         }), 200
         
+    except PasswordHasherBusy:
+        return hashing_busy()
     except Exception as e:
         print(f"Error during login: {str(e)}")
         return jsonify({'error': f'Login failed: {str(e)}'}), 500
@@ -124,86 +173,30 @@ def get_current_user():
     try:
         user_id = get_jwt_identity()
         
-        # Find user by ID
-        user = users_collection.find_one({'_id': ObjectId(user_id)})
+        # Loaded (or taken from the user cache) when the token was checked
+        user = current_user
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get user's ratings to derive preferences
-        ratings = list(ratings_collection.find({'user_id': user_id}))
-        
-        # Initialize preferences if not exists
-        if 'preferences' not in user:
-            user['preferences'] = {
-                'genres': [],
-                'directors': [],
-                'actors': []
-            }
+        # Default preferences if not set; the cached user is shared, so it is not modified
+        preferences = user.get('preferences') or {
+            'genres': [],
+            'directors': [],
+            'actors': []
+        }
         
-        # Derive preferences from ratings if user has rated movies
-        if ratings:
-            # Track counts for each preference
-            genre_counts = {}
-            director_counts = {}
-            actor_counts = {}
-            
-            # Get movies user has rated highly (4+ stars)
-            high_ratings = [r for r in ratings if r['rating'] >= 4]
-            for rating in high_ratings:
-                try:
-                    movie = movies_collection.find_one({'_id': ObjectId(rating['movie_id'])})
-                    if movie:
-                        # Count genres
-                        for genre in movie.get('genres', []):
-                            if genre in genre_counts:
-                                genre_counts[genre] += 1
-                            else:
-                                genre_counts[genre] = 1
-                        
-                        # Count directors
-                        director = movie.get('director')
-                        if director:
-                            if director in director_counts:
-                                director_counts[director] += 1
-                            else:
-                                director_counts[director] = 1
-                        
-                        # Count actors
-                        for actor in movie.get('cast', [])[:3]:  # Use top 3 actors from each movie
-                            if actor in actor_counts:
-                                actor_counts[actor] += 1
-                            else:
-                                actor_counts[actor] = 1
-                except Exception as e:
-                    print(f"Error processing movie {rating['movie_id']}: {str(e)}")
-            
-            # Sort preferences by count and take top items
-            sorted_genres = sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)
-            sorted_directors = sorted(director_counts.items(), key=lambda x: x[1], reverse=True)
-            sorted_actors = sorted(actor_counts.items(), key=lambda x: x[1], reverse=True)
-            
-            # Store preference counts
-            user['preferences']['genre_counts'] = genre_counts
-            user['preferences']['director_counts'] = director_counts
-            user['preferences']['actor_counts'] = actor_counts
-            
-            # Get top preferences (limiting to top 5 of each)
-            user['preferences']['genres'] = [genre for genre, _ in sorted_genres[:5]]
-            user['preferences']['directors'] = [director for director, _ in sorted_directors[:5]]
-            user['preferences']['actors'] = [actor for actor, _ in sorted_actors[:5]]
-            
-            # Update user preferences in database
-            users_collection.update_one(
-                {'_id': ObjectId(user_id)},
-                {'$set': {'preferences': user['preferences']}}
-            )
+        # Preferences are derived from ratings by the rating events queue.
+        # Users who rated before that existed get theirs computed in the background.
+        if 'preferences_updated_at' not in user:
+            if ratings_collection.find_one({'user_id': user_id}, {'_id': 1}):
+                rating_events.publish(user_id=user_id)
         
         # Format user data for response
         user_data = {
             'id': str(user['_id']),
             'username': user['username'],
             'email': user['email'],
-            'preferences': user['preferences'],
+            'preferences': preferences,
             'created_at': user.get('created_at', '')
         }
         
@@ -248,16 +241,17 @@ def update_profile():
                 'updated_at': datetime.now()
             }}
         )
+        if username != current_user.get('username'):
+            # Keep the name stored with the user's reviews in step
+            ratings_collection.update_many({'user_id': user_id}, {'$set': {'username': username}})
+        user_cache.invalidate(user_id)
 
-        updated_user = users_collection.find_one({'_id': ObjectId(user_id)})
+        updated_user = users_collection.find_one(
+            {'_id': ObjectId(user_id)}, {'password': 0, 'password_hash': 0}
+        )
         if not updated_user:
             return jsonify({'error': 'User not found'}), 404
 
-        if 'password' in updated_user:
-            updated_user.pop('password')
-
-        updated_user['_id'] = str(updated_user['_id'])
-
         return jsonify(updated_user)
     except Exception as e:
         print(f"Error updating profile: {e}")
@@ -284,10 +278,11 @@ def reset_password_request():
             {'_id': user['_id']},
             {'$set': {
                 'reset_token': reset_token,
-                'reset_token_expiry': datetime.datetime.now() + datetime.timedelta(hours=1)
+                'reset_token_expiry': datetime.now() + timedelta(hours=1)
             }}
         )
 
+        # Queued; the response does not wait for the mail server
         send_reset_email(email, reset_token)
 
         return jsonify({'message': 'If an account with that email exists, a password reset link has been sent'}), 200
@@ -1,24 +1,22 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from bson import ObjectId
-import pymongo
+from app.database import get_app_database
+from app.caching import cached_response
 
 # Create blueprint
 movies_bp = Blueprint('movies', __name__)
 
 # Connect to MongoDB directly
-client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = client["film_recommendation"]
+db = get_app_database()
 movies_collection = db["movies"]
+movie_neighbours_collection = db["movie_neighbours"]
 
 @movies_bp.route('/movies', methods=['GET'])
+@cached_response('movies')
 def get_movies():
     try:
-        # Get all movies from database
+        # Get all movies from database; the JSON provider encodes ObjectId
         movies = list(movies_collection.find({}))
-        
-        # Convert ObjectId to string for JSON serialization
-        for movie in movies:
-            movie['_id'] = str(movie['_id'])
             
         return jsonify(movies), 200
         
@@ -27,6 +25,7 @@ def get_movies():
         return jsonify({'error': 'Failed to get movies'}), 500
 
 @movies_bp.route('/movies/<movie_id>', methods=['GET'])
+@cached_response('movies')
 def get_movie(movie_id):
     try:
         # Get movie by ID
@@ -34,11 +33,25 @@ def get_movie(movie_id):
         if not movie:
             return jsonify({'error': 'Movie not found'}), 404
             
-        # Convert ObjectId to string 
-        movie['_id'] = str(movie['_id'])
-            
         return jsonify(movie), 200
         
     except Exception as e:
         print(f"Error getting movie: {str(e)}")
-        return jsonify({'error': 'Failed to get movie'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to get movie'}), 500
+
+@movies_bp.route('/movies/<movie_id>/similar', methods=['GET'])
+@cached_response('movie_neighbours')
+def get_similar_movies(movie_id):
+    """Movies most like this one, from the table built by app.workers.neighbours"""
+    try:
+        limit = request.args.get('limit', default=10, type=int)
+        entry = movie_neighbours_collection.find_one(
+            {'movie_id': movie_id}, {'_id': 0, 'neighbours': {'$slice': max(limit, 0)}}
+        )
+        
+        # Movies that are not in the table yet have no neighbours
+        return jsonify(entry['neighbours'] if entry else []), 200
+        
+    except Exception as e:
+        print(f"Error getting similar movies: {str(e)}")
+        return jsonify({'error': 'Failed to get similar movies'}), 500
@@ -1,17 +1,85 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from pymongo import MongoClient
+from flask_jwt_extended import current_user, jwt_required, get_jwt_identity
+from app.database import get_app_database
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
+from app.config import RATINGS_PAGE_SIZE, RATINGS_MAX_PAGE_SIZE
+from app.utils import clamp_page_size, find_by_ids, keyset_filter, split_keyset_page
+from app.workers.rating_events import rating_events
 
 ratings_bp = Blueprint('ratings', __name__)
 
 # Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["film_recommendation"]
+db = get_app_database()
 ratings_collection = db["ratings"]
 movies_collection = db["movies"]
 users_collection = db["users"]
+# Per-movie star counts: {_id: movie_id, counts: {'1': n, ..., '5': n}, count, total}
+rating_summaries_collection = db["rating_summaries"]
+# Tombstones of deleted ratings, {user_id, movie_id, deleted_at}, read by app.workers.export_snapshot
+rating_deletions_collection = db["rating_deletions"]
+
+RATING_BUCKETS = ('1', '2', '3', '4', '5')
+
+def rating_bucket(rating):
+    """Star bucket of a rating; half stars round up"""
+    return str(min(5, max(1, int(rating + 0.5))))
+
+def summary_increments(old_rating=None, new_rating=None):
+    """$inc for a movie's summary when one of its ratings goes from old_rating to new_rating"""
+    increments = {}
+    for rating, sign in ((old_rating, -1), (new_rating, 1)):
+        if rating is None:
+            continue
+        key = f'counts.{rating_bucket(rating)}'
+        increments[key] = increments.get(key, 0) + sign
+        increments['count'] = increments.get('count', 0) + sign
+        increments['total'] = increments.get('total', 0) + sign * rating
+    return {key: value for key, value in increments.items() if value}
+
+def update_rating_summary(movie_id, old_rating=None, new_rating=None):
+    """
+    Apply a rating write (old_rating None) or delete (new_rating None) to the
+    movie's summary; returns the summary after the change
+    """
+    increments = summary_increments(old_rating, new_rating)
+    if not increments:
+        return rating_summaries_collection.find_one({'_id': movie_id})
+    return rating_summaries_collection.find_one_and_update(
+        {'_id': movie_id}, {'$inc': increments}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+
+def format_rating_summary(movie_id, summary):
+    """Star distribution and average of a movie from its summary document"""
+    summary = summary or {}
+    counts = {bucket: summary.get('counts', {}).get(bucket, 0) for bucket in RATING_BUCKETS}
+    count = sum(counts.values())
+    return {
+        'movie_id': movie_id,
+        'counts': counts,
+        'count': count,
+        'average_rating': round(summary.get('total', 0) / count, 2) if count else 0,
+    }
+
+def upsert_rating(user_id, movie_id, changes, now):
+    """Write the user's rating of the movie; returns the rating it replaced, None if it is new"""
+    update = {'$set': changes, '$setOnInsert': {'helpful_votes': 0, 'created_at': now}}
+    try:
+        return ratings_collection.find_one_and_update(
+            {'user_id': user_id, 'movie_id': movie_id}, update,
+            projection={'rating': 1}, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # A concurrent request inserted it first (unique index); now it is an update
+        return ratings_collection.find_one_and_update(
+            {'user_id': user_id, 'movie_id': movie_id}, update,
+            projection={'rating': 1}, return_document=ReturnDocument.BEFORE
+        )
+
+# Newest first; _id breaks ties so every rating has one position
+MOVIE_RATINGS_SORT = [('created_at', -1), ('_id', -1)]
 
 @ratings_bp.route('/movies/<movie_id>/rate', methods=['POST'])
 @jwt_required()
@@ -29,80 +97,84 @@ def rate_movie(movie_id):
         rating = float(data['rating'])
         if rating < 1 or rating > 5:
             return jsonify({'error': 'Rating must be between 1 and 5'}), 400
+        review = data.get('review')
+        if review is not None and not isinstance(review, str):
+            return jsonify({'error': 'Review must be text'}), 400
         
         # Check if movie exists
-        movie = movies_collection.find_one({'_id': ObjectId(movie_id)})
+        movie = movies_collection.find_one({'_id': ObjectId(movie_id)}, {'_id': 1})
         if not movie:
             return jsonify({'error': 'Movie not found'}), 404
             
-        # Check if user exists
-        user = users_collection.find_one({'_id': ObjectId(user_id)})
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-            
-        # Check if user has already rated this movie
-        existing_rating = ratings_collection.find_one({
-            'user_id': user_id,
-            'movie_id': movie_id
-        })
+        # The user's existence was checked with the token (app.users)
         
         now = datetime.now().isoformat()
-        
-        if existing_rating:
-            # Update existing rating
-            ratings_collection.update_one(
-                {'_id': existing_rating['_id']},
-                {'$set': {
-                    'rating': rating,
-                    'updated_at': now
-                }}
-            )
-        else:
-            # Create new rating
-            rating_data = {
-                'user_id': user_id,
-                'movie_id': movie_id,
-                'rating': rating,
-                'created_at': now,
-                'updated_at': now
-            }
-            ratings_collection.insert_one(rating_data)
+        # The author's name is stored with the rating, so the reviews feed needs no user lookups
+        changes = {'rating': rating, 'username': current_user.get('username', ''), 'updated_at': now}
+        if review is not None:
+            changes['review'] = review.strip()
+
+        # Write the rating and read the one it replaced in one operation, so concurrent
+        # re-rates each see the previous value and the summary counts every rating once
+        previous = upsert_rating(user_id, movie_id, changes, now)
+        summary = update_rating_summary(movie_id, previous['rating'] if previous else None, rating)
             
-        # Update movie's average rating
-        update_movie_average_rating(movie_id)
-        
-        # Get updated movie to return new average rating
-        updated_movie = movies_collection.find_one({'_id': ObjectId(movie_id)})
-        new_average_rating = updated_movie.get('average_rating', 0)
+        # Movie average and user preferences are updated by the rating events queue
+        rating_events.publish(user_id=user_id, movie_id=movie_id)
         
         return jsonify({
             'message': 'Rating submitted successfully',
             'movie_id': movie_id,
             'rating': rating,
-            'new_average_rating': new_average_rating
+            # From the summary, so it includes this rating; the movie's average_rating follows via the queue
+            'new_average_rating': format_rating_summary(movie_id, summary)['average_rating']
         }), 200
         
     except Exception as e:
         print(f"Error rating movie: {str(e)}")
         return jsonify({'error': f'Failed to rate movie: {str(e)}'}), 500
-        
-def update_movie_average_rating(movie_id):
-    """Update a movie's average rating based on all user ratings"""
-    # Get all ratings for the movie
-    ratings = list(ratings_collection.find({'movie_id': movie_id}))
-    
-    if not ratings:
-        return
-        
-    # Calculate average rating
-    total_rating = sum(r['rating'] for r in ratings)
-    average_rating = round(total_rating / len(ratings), 1)
-    
-    # Update movie with new average rating
-    movies_collection.update_one(
-        {'_id': ObjectId(movie_id)},
-        {'$set': {'average_rating': average_rating}}
-    )
+
+# Fields used by format_user_rating
+RATED_MOVIE_PROJECTION = {'title': 1, 'image_url': 1, 'year': 1, 'genres': 1, 'director': 1}
+
+def format_user_rating(rating, movie):
+    """A user's rating together with the rated movie's details"""
+    return {
+        'rating_id': rating['_id'],
+        'movie_id': rating['movie_id'],
+        'rating': rating['rating'],
+        'created_at': rating.get('created_at', ''),
+        'movie_title': movie['title'],
+        'movie_image': movie.get('image_url', ''),
+        'movie_year': movie.get('year', ''),
+        'genres': movie.get('genres', []),
+        'director': movie.get('director', '')
+    }
+
+# Fields used by format_movie_rating
+MOVIE_RATING_PROJECTION = {'user_id': 1, 'username': 1, 'rating': 1, 'created_at': 1}
+
+def format_movie_rating(rating, users):
+    """A movie's rating together with its author's name, stored with it or looked up in users"""
+    username = rating.get('username') or users.get(rating['user_id'], {}).get('username', 'Anonymous')
+    return {
+        'rating_id': rating['_id'],
+        'rating': rating['rating'],
+        'created_at': rating.get('created_at', ''),
+        'user_id': rating['user_id'],
+        'username': username
+    }
+
+def movie_ratings_page_query(movie_id, cursor=None):
+    """Filter for the movie's ratings after the cursor"""
+    query = {'movie_id': movie_id}
+    if cursor:
+        query.update(keyset_filter(MOVIE_RATINGS_SORT, cursor))
+    return query
+
+def missing_usernames(ratings):
+    """Authors to look up: ratings written before usernames were stored with them"""
+    return [rating['user_id'] for rating in ratings if not rating.get('username')]
 
 @ratings_bp.route('/users/ratings', methods=['GET'])
 @jwt_required()
@@ -115,27 +187,15 @@ def get_user_ratings():
         # Get user's ratings
         user_ratings = list(ratings_collection.find({'user_id': user_id}))
         
-        # Get movie details for each rating
+        # Get movie details for all rated movies at once
+        movies = find_by_ids(
+            movies_collection, [rating['movie_id'] for rating in user_ratings], RATED_MOVIE_PROJECTION
+        )
         result = []
         for rating in user_ratings:
-            movie_id = rating['movie_id']
-            try:
-                movie = movies_collection.find_one({'_id': ObjectId(movie_id)})
-                
-                if movie:
-                    result.append({
-                        'rating_id': str(rating['_id']),
-                        'movie_id': movie_id,
-                        'rating': rating['rating'],
-                        'created_at': rating.get('created_at', ''),
-                        'movie_title': movie['title'],
-                        'movie_image': movie.get('image_url', ''),
-                        'movie_year': movie.get('year', ''),
-                        'genres': movie.get('genres', []),
-                        'director': movie.get('director', '')
-                    })
-            except Exception as e:
-                print(f"Error processing rating {rating['_id']}: {str(e)}")
+            movie = movies.get(rating['movie_id'])
+            if movie:
+                result.append(format_user_rating(rating, movie))
         
         return jsonify(result), 200
         
@@ -145,32 +205,48 @@ def get_user_ratings():
 
 @ratings_bp.route('/movies/<movie_id>/ratings', methods=['GET'])
 def get_movie_ratings(movie_id):
-    """Get all ratings for a specific movie"""
+    """
+    Get a page of the ratings for a specific movie, newest first
+
+    ?limit= sets the page size; when more ratings remain, the X-Next-Cursor
+    header holds the ?cursor= value of the next page
+    """
     try:
-        ratings = list(ratings_collection.find({'movie_id': movie_id}))
-        
-        # Format ratings for response
-        formatted_ratings = []
-        for rating in ratings:
-            # Get user details
-            user_id = rating['user_id']
-            user = users_collection.find_one({'_id': ObjectId(user_id)})
-            
-            if user:
-                formatted_ratings.append({
-                    'rating_id': str(rating['_id']),
-                    'rating': rating['rating'],
-                    'created_at': rating.get('created_at', ''),
-                    'user_id': user_id,
-                    'username': user.get('username', 'Anonymous')
-                })
+        limit = clamp_page_size(request.args.get('limit', type=int), RATINGS_PAGE_SIZE, RATINGS_MAX_PAGE_SIZE)
+        try:
+            query = movie_ratings_page_query(movie_id, request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # One more than the page, to know whether there is a next one
+        ratings = list(
+            ratings_collection.find(query, MOVIE_RATING_PROJECTION).sort(MOVIE_RATINGS_SORT).limit(limit + 1)
+        )
+        ratings, next_cursor = split_keyset_page(ratings, limit, MOVIE_RATINGS_SORT)
         
-        return jsonify(formatted_ratings), 200
+        # Get the authors the page does not name in one batch
+        users = find_by_ids(users_collection, missing_usernames(ratings), {'username': 1})
+        
+        response = jsonify([format_movie_rating(rating, users) for rating in ratings])
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
         
     except Exception as e:
         print(f"Error getting movie ratings: {str(e)}")
         return jsonify({'error': f'Failed to get movie ratings: {str(e)}'}), 500
 
+@ratings_bp.route('/movies/<movie_id>/ratings/summary', methods=['GET'])
+def get_movie_rating_summary(movie_id):
+    """Star distribution of a movie's ratings, from its pre-aggregated summary"""
+    try:
+        summary = rating_summaries_collection.find_one({'_id': movie_id})
+        return jsonify(format_rating_summary(movie_id, summary)), 200
+        
+    except Exception as e:
+        print(f"Error getting rating summary: {str(e)}")
+        return jsonify({'error': f'Failed to get rating summary: {str(e)}'}), 500
+
 @ratings_bp.route('/users/ratings/<rating_id>', methods=['DELETE'])
 @jwt_required()
 def delete_rating(rating_id):
@@ -179,23 +255,26 @@ def delete_rating(rating_id):
         # Get user ID from JWT
         user_id = get_jwt_identity()
         
-        # Find the rating
-        rating = ratings_collection.find_one({
-            '_id': ObjectId(rating_id),
-            'user_id': user_id  # Ensure the rating belongs to the user
-        })
+        # Delete the rating, getting it back so the summary loses exactly what was deleted
+        rating = ratings_collection.find_one_and_delete(
+            {
+                '_id': ObjectId(rating_id),
+                'user_id': user_id  # Ensure the rating belongs to the user
+            },
+            projection={'movie_id': 1, 'rating': 1}
+        )
         
         if not rating:
             return jsonify({'error': 'Rating not found or not authorized to delete'}), 404
             
-        # Get the movie ID before deleting the rating
         movie_id = rating['movie_id']
+        update_rating_summary(movie_id, old_rating=rating['rating'])
+        rating_deletions_collection.insert_one({
+            'user_id': user_id, 'movie_id': movie_id, 'deleted_at': datetime.now()
+        })
         
-        # Delete the rating
-        ratings_collection.delete_one({'_id': ObjectId(rating_id)})
-        
-        # Update the movie's average rating
-        update_movie_average_rating(movie_id)
+        # Update the movie's average rating and the user's preferences
+        rating_events.publish(user_id=user_id, movie_id=movie_id)
         
         return jsonify({'message': 'Rating deleted successfully'}), 200
         
@@ -1,16 +1,195 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import logging
+
+from flask import Blueprint, jsonify
+from flask_jwt_extended import current_user, jwt_required, get_jwt_identity
 from bson import ObjectId
-from pymongo import MongoClient  
+from app.database import get_app_database
+from app.algorithms.pipeline import CandidateGenerator, RecommendationPipeline, scale_columns
+from app.caching import cached_response
+from app.routes.watchlist import watchlist_movie_ids
+from app.users import user_cache
+from app.config import (
+    RECOMMENDATION_CANDIDATES,
+    RECOMMENDATION_GENERATE_BUDGET_MS,
+    RECOMMENDATION_GENERATE_CONCURRENCY,
+    RECOMMENDATION_MERGE_BUDGET_MS,
+    RECOMMENDATION_FILTER_BUDGET_MS,
+    RECOMMENDATION_HYDRATE_BUDGET_MS,
+    RECOMMENDATION_RANK_BUDGET_MS,
+)
+
+logger = logging.getLogger(__name__)
 
-client = MongoClient("mongodb://localhost:27017/")
-db = client["film_recommendation"]
-users_collection = db["users"]
+db = get_app_database()
 movies_collection = db["movies"]
 ratings_collection = db["ratings"]
+recommendations_collection = db["recommendations"]
+movie_neighbours_collection = db["movie_neighbours"]
 
 recommendation_bp = Blueprint('recommendation', __name__)
 
+def build_preference_query(preferences, user_ratings):
+    """Query for movies matching user preferences that the user hasn't rated"""
+    rated_movie_ids = [ObjectId(rating['movie_id']) for rating in user_ratings]
+    
+    query = {
+        '_id': {'$nin': rated_movie_ids}
+    }
+    
+    # Add preference filters if available
+    if preferences.get('genres', []):
+        query['genres'] = {'$in': preferences['genres']}
+    
+    if preferences.get('directors', []):
+        query['director'] = {'$in': preferences['directors']}
+    
+    return query
+
+def preference_score(movie, preferences):
+    """How well a movie matches the preferences"""
+    preferred_genres = preferences.get('genres', [])
+    preferred_directors = preferences.get('directors', [])
+    preferred_actors = preferences.get('actors', [])
+    
+    score = 0
+    
+    # Add score for genre matches
+    for genre in movie.get('genres', []):
+        if genre in preferred_genres:
+            score += 1
+    
+    # Add score for director match (higher weight)
+    if movie.get('director') in preferred_directors:
+        score += 3
+    
+    # Add score for actor matches
+    for actor in movie.get('cast', []):
+        if actor in preferred_actors:
+            score += 2
+    
+    return score
+
+# Fields used by the ranker and format_recommendation
+RECOMMENDATION_PROJECTION = {
+    'title': 1, 'image_url': 1, 'year': 1, 'genres': 1, 'director': 1, 'cast': 1, 'average_rating': 1
+}
+
+def format_recommendation(movie, match_score=None):
+    return {
+        'movie_id': movie['_id'],
+        'title': movie['title'],
+        'image_url': movie.get('image_url', ''),
+        'year': movie.get('year', ''),
+        'genres': movie.get('genres', []),
+        'director': movie.get('director', ''),
+        'average_rating': movie.get('average_rating', 0),
+        'match_score': movie.get('preference_score', 0) if match_score is None else round(match_score, 3)
+    }
+
+# Candidate generators for the recommendation pipeline; each gets the
+# context built by load_recommendation_context and returns (movie_id, score) pairs
+
+def preference_candidates(context, limit):
+    """Unrated movies matching the user's preferred genres and directors"""
+    preferences = context['preferences']
+    if not preferences:
+        return []
+    query = build_preference_query(preferences, context['ratings'])
+    projection = {'genres': 1, 'director': 1, 'cast': 1}
+    return [
+        (str(movie['_id']), preference_score(movie, preferences))
+        for movie in movies_collection.find(query, projection).limit(limit)
+    ]
+
+def collaborative_candidates(context, limit):
+    """Movies precomputed for the user by app.workers.precompute"""
+    entry = recommendations_collection.find_one(
+        {'user_id': context['user_id']}, {'_id': 0, 'movies': {'$slice': limit}}
+    )
+    return [(movie['movie_id'], movie['score']) for movie in entry['movies']] if entry else []
+
+def popular_candidates(context, limit):
+    """Highest rated movies"""
+    movies = movies_collection.find({'average_rating': {'$gt': 0}}, {'average_rating': 1})
+    return [(str(movie['_id']), movie['average_rating']) for movie in movies.sort('average_rating', -1).limit(limit)]
+
+def watchlist_candidates(context, limit):
+    """Neighbours (app.workers.neighbours) of the most recently watchlisted movies"""
+    watchlist = context['watchlist'][-20:]
+    if not watchlist:
+        return []
+    scores = {}
+    for entry in movie_neighbours_collection.find({'movie_id': {'$in': watchlist}}, {'_id': 0, 'neighbours': 1}):
+        # Movies close to several watchlisted movies add up
+        for neighbour in entry.get('neighbours', []):
+            scores[neighbour['movie_id']] = scores.get(neighbour['movie_id'], 0) + neighbour['score']
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+# Weight of the user's preference match and of the average rating in the final score
+PREFERENCE_WEIGHT = 1.0
+AVERAGE_RATING_WEIGHT = 0.3
+
+def hydrate_candidates(movie_ids):
+    """Candidate documents, fetched in one query bounded by the hydrate budget"""
+    object_ids = [ObjectId(movie_id) for movie_id in movie_ids if ObjectId.is_valid(movie_id)]
+    return movies_collection.find(
+        {'_id': {'$in': object_ids}}, RECOMMENDATION_PROJECTION,
+        max_time_ms=RECOMMENDATION_HYDRATE_BUDGET_MS
+    )
+
+def rank_candidates(movie_ids, scores, movies, weights, context):
+    """Weighted generator scores plus the preference match and the average rating"""
+    import numpy as np
+
+    preferences = context['preferences']
+    features = np.array([
+        [preference_score(movie, preferences) if preferences else 0, movie.get('average_rating') or 0]
+        for movie in movies
+    ], dtype=float).reshape(len(movies), 2)
+    features = scale_columns(features)
+    return scores @ weights + features @ np.array([PREFERENCE_WEIGHT, AVERAGE_RATING_WEIGHT])
+
+recommendation_pipeline = RecommendationPipeline(
+    generators=[
+        CandidateGenerator('preferences', preference_candidates, weight=1.0, limit=RECOMMENDATION_CANDIDATES),
+        CandidateGenerator('collaborative', collaborative_candidates, weight=1.0, limit=RECOMMENDATION_CANDIDATES),
+        CandidateGenerator('watchlist', watchlist_candidates, weight=0.7, limit=RECOMMENDATION_CANDIDATES),
+        CandidateGenerator('popular', popular_candidates, weight=0.3, limit=RECOMMENDATION_CANDIDATES),
+    ],
+    hydrate=hydrate_candidates,
+    rank=rank_candidates,
+    budgets={
+        'generate': RECOMMENDATION_GENERATE_BUDGET_MS / 1000,
+        'merge': RECOMMENDATION_MERGE_BUDGET_MS / 1000,
+        'filter': RECOMMENDATION_FILTER_BUDGET_MS / 1000,
+        'hydrate': RECOMMENDATION_HYDRATE_BUDGET_MS / 1000,
+        'rank': RECOMMENDATION_RANK_BUDGET_MS / 1000,
+    },
+    concurrency=RECOMMENDATION_GENERATE_CONCURRENCY,
+)
+
+def load_recommendation_context(user_id, user=None):
+    """What the generators and the ranker need to know about the user"""
+    if user is None:
+        user = user_cache.get(user_id) or {}
+    user_ratings = list(ratings_collection.find({'user_id': user_id}, {'movie_id': 1}))
+    return {
+        'user_id': user_id,
+        'preferences': user.get('preferences') or {},
+        'watchlist': watchlist_movie_ids(user_id),
+        'ratings': user_ratings,
+    }
+
+def recommend_for_user(user_id, count=10, user=None):
+    """Formatted recommendations and the pipeline result they came from"""
+    context = load_recommendation_context(user_id, user)
+    exclude = {str(rating['movie_id']) for rating in context['ratings']} | set(context['watchlist'])
+    result = recommendation_pipeline.recommend(context, count=count, exclude=exclude)
+    if result.timed_out or result.over_budget or result.skipped:
+        logger.warning("Recommendation pipeline over budget: timed out %s, slow stages %s, skipped %s",
+                       result.timed_out, result.over_budget, result.skipped)
+    return [format_recommendation(movie, score) for movie, score in zip(result.movies, result.scores)], result
+
 @recommendation_bp.route('/recommendations', methods=['GET'])
 @jwt_required()
 def get_recommendations():
@@ -19,107 +198,8 @@ def get_recommendations():
         # Get user ID from JWT
         user_id = get_jwt_identity()
         
-        # Generate recommendations based on user preferences
-        user = users_collection.find_one({'_id': ObjectId(user_id)})
-        if not user or 'preferences' not in user:
-            # If user has no preferences, return top-rated movies
-            pipeline = [
-                {
-                    '$lookup': {
-                        'from': 'ratings',
-                        'localField': '_id',
-                        'foreignField': 'movie_id',
-                        'as': 'ratings'
-                    }
-                },
-                {
-                    '$addFields': {
-                        'ratings_count': {'$size': '$ratings'},
-                        'average_rating': {'$avg': '$ratings.rating'}
-                    }
-                },
-                {
-                    '$match': {
-                        'ratings_count': {'$gte': 3}
-                    }
-                },
-                {
-                    '$sort': {
-                        'average_rating': -1,
-                        'ratings_count': -1
-                    }
-                },
-                {
-                    '$limit': 10
-                }
-            ]
-            
-            recommended_movies = list(movies_collection.aggregate(pipeline))
-        else:
-            # Get user's already rated movies
-            user_ratings = list(ratings_collection.find({'user_id': user_id}))
-            rated_movie_ids = [ObjectId(rating['movie_id']) for rating in user_ratings]
-            
-            # Get user's preferences
-            preferred_genres = user['preferences'].get('genres', [])
-            preferred_directors = user['preferences'].get('directors', [])
-            preferred_actors = user['preferences'].get('actors', [])
-            
-            # Find movies matching user preferences that user hasn't rated
-            query = {
-                '_id': {'$nin': rated_movie_ids}
-            }
-            
-            # Add preference filters if available
-            if preferred_genres:
-                query['genres'] = {'$in': preferred_genres}
-            
-            if preferred_directors:
-                query['director'] = {'$in': preferred_directors}
-            
-            
-            
-            # Find matching movies
-            matching_movies = list(movies_collection.find(query).limit(20))
-            
-            # Score movies based on preference match
-            scored_movies = []
-            for movie in matching_movies:
-                score = 0
-                
-                # Add score for genre matches
-                for genre in movie.get('genres', []):
-                    if genre in preferred_genres:
-                        score += 1
-                
-                # Add score for director match (higher weight)
-                if movie.get('director') in preferred_directors:
-                    score += 3
-                
-                # Add score for actor matches
-                for actor in movie.get('cast', []):
-                    if actor in preferred_actors:
-                        score += 2
-                
-                movie['preference_score'] = score
-                scored_movies.append(movie)
-            
-            # Sort by preference score, descending
-            recommended_movies = sorted(scored_movies, key=lambda x: x.get('preference_score', 0), reverse=True)[:10]
-        
-        # Format response
-        result = []
-        for movie in recommended_movies:
-            result.append({
-                'movie_id': str(movie['_id']),
-                'title': movie['title'],
-                'image_url': movie.get('image_url', ''),
-                'year': movie.get('year', ''),
-                'genres': movie.get('genres', []),
-                'director': movie.get('director', ''),
-                'average_rating': movie.get('average_rating', 0),
-                'match_score': movie.get('preference_score', 0)
-            })
+        # Candidates from every generator, filtered and re-ranked
+        result, _ = recommend_for_user(user_id, user=current_user)
         
         return jsonify(result), 200
         
@@ -128,6 +208,7 @@ def get_recommendations():
         return jsonify({'error': f'Failed to generate recommendations: {str(e)}'}), 500
 
 @recommendation_bp.route('/recommendations/genre/<genre>', methods=['GET'])
+@cached_response('movies', 'ratings')
 def get_genre_recommendations(genre):
     """Get recommendations for a specific genre"""
     try:
@@ -1,108 +1,87 @@
+import datetime
 from flask import Blueprint, request, jsonify
-from app.database import get_collections
-from bson import ObjectId
+from app.config import REVIEWS_PAGE_SIZE, REVIEWS_MAX_PAGE_SIZE
+from app.database import get_app_database
+from app.models.ratings import HAS_REVIEW, REVIEW_SORTS
+from app.utils import clamp_page_size, find_by_ids, keyset_filter, split_keyset_page
 
 
+db = get_app_database()
+ratings_collection = db['ratings']
+users_collection = db['users']
+
 #blueprint for the routes
 reviews_bp = Blueprint('reviews', __name__)
 
 
+# Fields used by format_review
+REVIEW_PROJECTION = {'user_id': 1, 'username': 1, 'rating': 1, 'review': 1, 'created_at': 1, 'helpful_votes': 1}
+
+
+def review_page_query(movie_id, sort, cursor=None):
+    """Filter for the movie's reviews after the cursor"""
+    query = {'movie_id': movie_id, **HAS_REVIEW}
+    if cursor:
+        query.update(keyset_filter(REVIEW_SORTS[sort], cursor))
+    return query
+
+
+def format_review(review, username):
+    return {
+        'id': str(review['_id']),
+        'username': username,
+        'rating': review['rating'],
+        'review': review['review'],
+        'helpful_votes': review.get('helpful_votes', 0),
+        'created_at': review.get('created_at', datetime.datetime.now())
+    }
+
+
 # Get reviews for a movie
 @reviews_bp.route('/movies/<movie_id>/reviews', methods=['GET'])
 def get_movie_reviews(movie_id):
+    """
+    Get a page of a movie's reviews
+
+    ?sort=newest (default) or helpful; ?limit= sets the page size. When more
+    reviews remain, the X-Next-Cursor header holds the ?cursor= value of the
+    next page.
+    """
     try:
-        collections = get_collections()
-        ratings = collections['ratings']
-        
-        # Find all ratings for this movie that have a review
-        reviews = list(ratings.find({
-            'movie_id': movie_id,
-            'review': {'$exists': True, '$ne': ''}
-        }))
-        
-        # Format the reviews for the frontend
+        sort = request.args.get('sort', 'newest')
+        if sort not in REVIEW_SORTS:
+            return jsonify({'error': f"sort must be one of {', '.join(REVIEW_SORTS)}"}), 400
+        limit = clamp_page_size(request.args.get('limit', type=int), REVIEWS_PAGE_SIZE, REVIEWS_MAX_PAGE_SIZE)
+
+        try:
+            query = review_page_query(movie_id, sort, request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # One more than the page, to know whether there is a next one
+        reviews = list(
+            ratings_collection.find(query, REVIEW_PROJECTION).sort(REVIEW_SORTS[sort]).limit(limit + 1)
+        )
+        reviews, next_cursor = split_keyset_page(reviews, limit, REVIEW_SORTS[sort])
+
+        # Usernames are stored with the review; only reviews written before that need a lookup
+        missing = [review['user_id'] for review in reviews if not review.get('username')]
+        users = find_by_ids(users_collection, missing, {'username': 1})
+
         formatted_reviews = []
         for review in reviews:
-            # Get username from users collection
-            user = collections['users'].find_one({'_id': ObjectId(review['user_id'])})
-            username = user['username'] if user else 'Anonymous'
-            
-            formatted_reviews.append({
-                'id': str(review['_id']),
-                'username': username,
-                'rating': review['rating'],
-                'review': review['review'],
-                'created_at': review.get('created_at', datetime.datetime.now())
-            })
-            
-        return jsonify(formatted_reviews)
+            username = review.get('username') or users.get(review['user_id'], {}).get('username', 'Anonymous')
+            formatted_reviews.append(format_review(review, username))
+
+        response = jsonify(formatted_reviews)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
     except Exception as e:
         print(f"Error getting movie reviews: {e}")
         return jsonify({'error': 'Failed to load reviews'}), 500
 
 
-@reviews_bp.route('/movies/<movie_id>/rate', methods=['POST'])
-def rate_movie(movie_id):
-    try:
-        # Check if user is authenticated
-        
-        user_id = request.user_id  
-        if not user_id:
-            return jsonify({'error': 'Authentication required'}), 401
-            
-        data = request.json
-        rating = data.get('rating')
-        review = data.get('review', '')
-        
-        if not rating or not isinstance(rating, (int, float)):
-            return jsonify({'error': 'Valid rating required'}), 400
-            
-        collections = get_collections()
-        ratings = collections['ratings']
-        
-        # Check if user already rated this movie
-        existing_rating = ratings.find_one({
-            'user_id': user_id,
-            'movie_id': movie_id
-        })
-        
-        now = datetime.datetime.now()
-        
-        if existing_rating:
-            # Update existing rating
-            ratings.update_one(
-                {'_id': existing_rating['_id']},
-                {'$set': {
-                    'rating': rating,
-                    'review': review,
-                    'updated_at': now
-                }}
-            )
-        else:
-            # Create new rating
-            ratings.insert_one({
-                'user_id': user_id,
-                'movie_id': movie_id,
-                'rating': rating,
-                'review': review,
-                'created_at': now,
-                'updated_at': now
-            })
-            
-        # Update average rating in movies collection
-        all_ratings = list(ratings.find({'movie_id': movie_id}))
-        avg_rating = sum(r['rating'] for r in all_ratings) / len(all_ratings) if all_ratings else 0
-        
-        collections['movies'].update_one(
-            {'_id': ObjectId(movie_id)},
-            {'$set': {'average_rating': avg_rating}}
-        )
-        
-        return jsonify({'success': True, 'message': 'Rating submitted successfully'})
-    except Exception as e:
-        print(f"Error rating movie: {e}")
-        return jsonify({'error': 'Failed to submit rating'}), 500
-
 # Get user rating for a movie
 @reviews_bp.route('/movies/<movie_id>/user-rating', methods=['GET'])
 def get_user_movie_rating(movie_id):
@@ -112,10 +91,7 @@ def get_user_movie_rating(movie_id):
         if not user_id:
             return jsonify({'error': 'Authentication required'}), 401
             
-        collections = get_collections()
-        ratings = collections['ratings']
-        
-        user_rating = ratings.find_one({
+        user_rating = ratings_collection.find_one({
             'user_id': user_id,
             'movie_id': movie_id
         })
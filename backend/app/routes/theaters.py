@@ -1,17 +1,23 @@
 from flask import Blueprint, jsonify, request
-from pymongo import MongoClient
+from app.database import get_app_database
 from bson import ObjectId
 import math
+from app.caching import cached_response
+from app.geo import TheaterIndex
+from app.utils import find_by_ids
 
 theaters_bp = Blueprint('theaters', __name__)
 
 # Connect to MongoDB
-client = MongoClient("mongodb://localhost:27017/")
-db = client["film_recommendation"]
+db = get_app_database()
 theaters_collection = db["theaters"]
 movies_collection = db["movies"]
 
+# Radius and nearest-theater queries are answered in memory; $near is the fallback
+theater_index = TheaterIndex(lambda: theaters_collection.find())
+
 @theaters_bp.route('/theaters', methods=['GET'])
+@cached_response('theaters', 'movies')
 def get_theaters():
     """Get all theaters or theaters near a location"""
     try:
@@ -20,74 +26,17 @@ def get_theaters():
         lng = request.args.get('lng', type=float)
         
         if lat and lng:
-            # Get theaters near location
-            max_distance = request.args.get('distance', default=20, type=int) * 1000  # Convert km to meters
-            
-            # Geospatial query
-            query = {
-                "location": {
-                    "$near": {
-                        "$geometry": {
-                            "type": "Point",
-                            "coordinates": [lng, lat]
-                        },
-                        "$maxDistance": max_distance
-                    }
-                }
-            }
+            # Get theaters near location, optionally only the `limit` nearest
+            max_distance = request.args.get('distance', default=20, type=int)
+            limit = request.args.get('limit', type=int)
+            theaters = find_nearby_theaters(lat, lng, max_distance, limit=limit)
             
-            theaters = list(theaters_collection.find(query))
-            
-            # Calculate distance for each theater
-            for theater in theaters:
-                theater['_id'] = str(theater['_id'])
-                
-                # Calculate distance in kilometers
-                theater_coords = theater['location']['coordinates']
-                distance = calculate_distance(lat, lng, theater_coords[1], theater_coords[0])
-                theater['distance'] = round(distance, 1)
-                
-                # Add movie details to each theater's current movies
-                if 'current_movies' in theater:
-                    for movie_item in theater['current_movies']:
-                        movie_id = movie_item['movie_id']
-                        try:
-                            movie = movies_collection.find_one({'_id': ObjectId(movie_id)})
-                            if movie:
-                                movie_item['movie_details'] = {
-                                    '_id': str(movie['_id']),
-                                    'title': movie['title'],
-                                    'image_url': movie.get('image_url', ''),
-                                    'year': movie.get('year', ''),
-                                    'average_rating': movie.get('average_rating', 0)
-                                }
-                        except:
-                            # If unable to convert to ObjectId, skip this movie
-                            pass
-                
         else:
             # Get all theaters
             theaters = list(theaters_collection.find())
-            for theater in theaters:
-                theater['_id'] = str(theater['_id'])
-                
-                # Add movie details to each theater's current movies
-                if 'current_movies' in theater:
-                    for movie_item in theater['current_movies']:
-                        movie_id = movie_item['movie_id']
-                        try:
-                            movie = movies_collection.find_one({'_id': ObjectId(movie_id)})
-                            if movie:
-                                movie_item['movie_details'] = {
-                                    '_id': str(movie['_id']),
-                                    'title': movie['title'],
-                                    'image_url': movie.get('image_url', ''),
-                                    'year': movie.get('year', ''),
-                                    'average_rating': movie.get('average_rating', 0)
-                                }
-                        except:
-                            # If unable to convert to ObjectId, skip this movie
-                            pass
+        
+        # Add movie details to each theater's current movies
+        attach_movie_details(theaters)
         
         return jsonify(theaters), 200
         
@@ -96,33 +45,16 @@ def get_theaters():
         return jsonify({'error': f'Failed to get theaters: {str(e)}'}), 500
 
 @theaters_bp.route('/theaters/<theater_id>', methods=['GET'])
+@cached_response('theaters', 'movies')
 def get_theater(theater_id):
     """Get a specific theater by ID"""
     try:
         theater = theaters_collection.find_one({'_id': ObjectId(theater_id)})
         if not theater:
             return jsonify({'error': 'Theater not found'}), 404
-            
-        theater['_id'] = str(theater['_id'])
         
         # Get current movies with details
-        if 'current_movies' in theater:
-            for movie_item in theater['current_movies']:
-                movie_id = movie_item['movie_id']
-                try:
-                    movie = movies_collection.find_one({'_id': ObjectId(movie_id)})
-                    if movie:
-                        movie_item['movie_details'] = {
-                            '_id': str(movie['_id']),
-                            'title': movie['title'],
-                            'image_url': movie.get('image_url', ''),
-                            'year': movie.get('year', ''),
-                            'average_rating': movie.get('average_rating', 0),
-                            'genres': movie.get('genres', [])
-                        }
-                except:
-                    # If unable to convert to ObjectId, skip this movie
-                    pass
+        attach_movie_details([theater], include_genres=True)
         
         return jsonify(theater), 200
         
@@ -130,6 +62,9 @@ def get_theater(theater_id):
         print(f"Error getting theater: {str(e)}")
         return jsonify({'error': f'Failed to get theater: {str(e)}'}), 500
 
+# Fields used by get_theaters_for_movie
+THEATER_SUMMARY_PROJECTION = {'name': 1, 'address': 1, 'location': 1, 'current_movies': 1}
+
 @theaters_bp.route('/movies/<movie_id>/theaters', methods=['GET'])
 def get_theaters_for_movie(movie_id):
     """Get theaters showing a specific movie"""
@@ -138,44 +73,31 @@ def get_theaters_for_movie(movie_id):
         lat = request.args.get('lat', type=float)
         lng = request.args.get('lng', type=float)
         
-        # Base query to find theaters showing the movie
-        query = {
-            "current_movies.movie_id": str(movie_id)
-        }
-        
         if lat and lng:
-            # Get theaters near location
-            max_distance = request.args.get('distance', default=20, type=int) * 1000  # Convert km to meters
-            
-            # Add geospatial constraints to query
-            query["location"] = {
-                "$near": {
-                    "$geometry": {
-                        "type": "Point",
-                        "coordinates": [lng, lat]
-                    },
-                    "$maxDistance": max_distance
-                }
+            # Get theaters showing the movie near location
+            max_distance = request.args.get('distance', default=20, type=int)
+            theaters = find_nearby_theaters(lat, lng, max_distance, movie_id=str(movie_id))
+        else:
+            # Find all theaters showing the movie
+            query = {
+                "current_movies.movie_id": str(movie_id)
             }
-        
-        theaters = list(theaters_collection.find(query))
+            theaters = list(theaters_collection.find(query, THEATER_SUMMARY_PROJECTION))
         
         # Format response
         formatted_theaters = []
         for theater in theaters:
             # Basic theater info
             theater_data = {
-                '_id': str(theater['_id']),
+                '_id': theater['_id'],
                 'name': theater['name'],
                 'address': theater['address'],
                 'location': theater['location']
             }
             
             # Add distance if location was provided
-            if lat and lng:
-                theater_coords = theater['location']['coordinates']
-                distance = calculate_distance(lat, lng, theater_coords[1], theater_coords[0])
-                theater_data['distance'] = round(distance, 1)
+            if 'distance' in theater:
+                theater_data['distance'] = theater['distance']
             
             # Add showtimes for the requested movie
             for movie_item in theater['current_movies']:
@@ -191,6 +113,79 @@ def get_theaters_for_movie(movie_id):
         print(f"Error getting theaters for movie: {str(e)}")
         return jsonify({'error': f'Failed to get theaters for movie: {str(e)}'}), 500
 
+def find_nearby_theaters(lat, lng, max_distance, limit=None, movie_id=None):
+    """
+    Theaters within max_distance km, nearest first, each with its distance in km
+    Only theaters showing movie_id when given
+    """
+    matches = theater_index.query(lat, lng, max_distance, None if movie_id else limit)
+    if matches is not None:
+        theaters = []
+        for theater, distance in matches:
+            if movie_id and not any(item['movie_id'] == movie_id for item in theater.get('current_movies', [])):
+                continue
+            theater['distance'] = round(distance, 1)
+            theaters.append(theater)
+        return theaters[:limit] if limit else theaters
+    
+    # No index available, so fall back to a geospatial query
+    query = {
+        "location": {
+            "$near": {
+                "$geometry": {
+                    "type": "Point",
+                    "coordinates": [lng, lat]
+                },
+                "$maxDistance": max_distance * 1000  # Convert km to meters
+            }
+        }
+    }
+    if movie_id:
+        query["current_movies.movie_id"] = movie_id
+    
+    cursor = theaters_collection.find(query)
+    if limit:
+        cursor = cursor.limit(limit)
+    theaters = list(cursor)
+    
+    # Calculate distance in kilometers for each theater
+    for theater in theaters:
+        theater_coords = theater['location']['coordinates']
+        distance = calculate_distance(lat, lng, theater_coords[1], theater_coords[0])
+        theater['distance'] = round(distance, 1)
+    return theaters
+
+# Fields used by format_movie_details
+MOVIE_DETAILS_PROJECTION = {'title': 1, 'image_url': 1, 'year': 1, 'average_rating': 1, 'genres': 1}
+
+def attach_movie_details(theaters, include_genres=False):
+    """Add movie details to the theaters' current movies, with one query for all of them"""
+    movie_ids = [
+        movie_item['movie_id']
+        for theater in theaters
+        for movie_item in theater.get('current_movies', [])
+    ]
+    movies = find_by_ids(movies_collection, movie_ids, MOVIE_DETAILS_PROJECTION)
+    
+    for theater in theaters:
+        for movie_item in theater.get('current_movies', []):
+            movie = movies.get(movie_item['movie_id'])
+            if movie:
+                movie_item['movie_details'] = format_movie_details(movie, include_genres)
+
+def format_movie_details(movie, include_genres=False):
+    """Movie summary embedded in a theater's current movies"""
+    details = {
+        '_id': movie['_id'],
+        'title': movie['title'],
+        'image_url': movie.get('image_url', ''),
+        'year': movie.get('year', ''),
+        'average_rating': movie.get('average_rating', 0)
+    }
+    if include_genres:
+        details['genres'] = movie.get('genres', [])
+    return details
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two points using Haversine formula"""
     # Earth radius in kilometers
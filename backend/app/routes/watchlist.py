@@ -1,56 +1,99 @@
+from datetime import datetime
+
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
-from pymongo import MongoClient
+from app.database import get_app_database
+from app.models.user import WATCHLIST_SORT
+from pymongo.errors import DuplicateKeyError
+from app.config import WATCHLIST_PAGE_SIZE, WATCHLIST_MAX_PAGE_SIZE
+from app.utils import clamp_page_size, find_by_ids, keyset_filter, split_keyset_page
 
 # MongoDB Connection - Use the same connection as your other files
-client = MongoClient("mongodb://localhost:27017/")
-db = client["film_recommendation"]
-users_collection = db["users"]
+db = get_app_database()
 movies_collection = db["movies"]
+# One document per entry: {user_id, movie_id, added_at}
+watchlist_collection = db["watchlist"]
 
 watchlist_bp = Blueprint('watchlist', __name__)
 
+
+def watchlist_page_query(user_id, cursor=None):
+    """Filter for the user's entries after the cursor (keyset pagination)"""
+    query = {'user_id': user_id}
+    if cursor:
+        query.update(keyset_filter(WATCHLIST_SORT, cursor))
+    return query
+
+def page_size(limit):
+    """Requested page size, defaulted and capped"""
+    return clamp_page_size(limit, WATCHLIST_PAGE_SIZE, WATCHLIST_MAX_PAGE_SIZE)
+
+def split_page(entries, limit):
+    """Entries of the page and the cursor of the next one (one extra entry is fetched to know)"""
+    return split_keyset_page(entries, limit, WATCHLIST_SORT)
+
+def watchlist_movie_ids(user_id):
+    """Every movie id in the user's watchlist, oldest first"""
+    entries = watchlist_collection.find({'user_id': user_id}, {'_id': 0, 'movie_id': 1}).sort(WATCHLIST_SORT)
+    return [entry['movie_id'] for entry in entries]
+
 @watchlist_bp.route('/users/watchlist', methods=['GET'])
 @jwt_required()
 def get_user_watchlist():
-    """Get the current user's watchlist"""
+    """
+    Get a page of the current user's watchlist
+
+    ?limit= sets the page size; when more entries remain, the X-Next-Cursor
+    header holds the ?cursor= value of the next page
+    """
     try:
         # Get user ID from JWT
         user_id = get_jwt_identity()
-        
-        # Get user's document
-        user = users_collection.find_one({'_id': ObjectId(user_id)})
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-            
-        # Get watchlist movie IDs (create if doesn't exist)
-        watchlist_ids = user.get('watchlist', [])
-        
-        # Get movie details for each ID
+        limit = page_size(request.args.get('limit', type=int))
+
+        try:
+            query = watchlist_page_query(user_id, request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        entries = list(
+            watchlist_collection.find(query, {'_id': 0, 'movie_id': 1, 'added_at': 1})
+            .sort(WATCHLIST_SORT)
+            .limit(limit + 1)
+        )
+        entries, next_cursor = split_page(entries, limit)
+        watchlist_ids = [entry['movie_id'] for entry in entries]
+
+        # Get movie details for the page at once, keeping the watchlist order
+        movies = find_by_ids(movies_collection, watchlist_ids, WATCHLIST_MOVIE_PROJECTION)
         result = []
         for movie_id in watchlist_ids:
-            try:
-                movie = movies_collection.find_one({'_id': ObjectId(movie_id)})
-                
-                if movie:
-                    result.append({
-                        'movie_id': movie_id,
-                        'title': movie['title'],
-                        'image_url': movie.get('image_url', ''),
-                        'year': movie.get('year', ''),
-                        'genres': movie.get('genres', []),
-                        'director': movie.get('director', '')
-                    })
-            except Exception as e:
-                print(f"Error processing movie {movie_id}: {str(e)}")
-        
-        return jsonify(result), 200
-        
+            movie = movies.get(movie_id)
+            if movie:
+                result.append(format_watchlist_movie(movie_id, movie))
+
+        headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+        return jsonify(result), 200, headers
+
     except Exception as e:
         print(f"Error getting watchlist: {str(e)}")
         return jsonify({'error': f'Failed to get watchlist: {str(e)}'}), 500
 
+# Fields used by format_watchlist_movie
+WATCHLIST_MOVIE_PROJECTION = {'title': 1, 'image_url': 1, 'year': 1, 'genres': 1, 'director': 1}
+
+def format_watchlist_movie(movie_id, movie):
+    """Watchlist entry with the movie's details"""
+    return {
+        'movie_id': movie_id,
+        'title': movie['title'],
+        'image_url': movie.get('image_url', ''),
+        'year': movie.get('year', ''),
+        'genres': movie.get('genres', []),
+        'director': movie.get('director', '')
+    }
+
 @watchlist_bp.route('/users/watchlist/<movie_id>', methods=['POST'])
 @jwt_required()
 def add_to_watchlist(movie_id):
@@ -58,32 +101,29 @@ def add_to_watchlist(movie_id):
     try:
         # Get user ID from JWT
         user_id = get_jwt_identity()
-        
+
         # Check if movie exists
-        movie = movies_collection.find_one({'_id': ObjectId(movie_id)})
+        movie = movies_collection.find_one({'_id': ObjectId(movie_id)}, {'_id': 1})
         if not movie:
             return jsonify({'error': 'Movie not found'}), 404
-            
-        # Add to watchlist if not already in it
-        result = users_collection.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$addToSet': {'watchlist': movie_id}}
-        )
-        
-        if result.modified_count == 0:
-            
-            user = users_collection.find_one({
-                '_id': ObjectId(user_id),
-                'watchlist': movie_id
-            })
-            
-            if user:
-                return jsonify({'message': 'Movie already in watchlist'}), 200
-            else:
-                return jsonify({'error': 'Failed to update watchlist'}), 500
-            
+
+        # Insert the entry unless it is already there; the result tells which happened
+        try:
+            result = watchlist_collection.update_one(
+                {'user_id': user_id, 'movie_id': movie_id},
+                {'$setOnInsert': {'added_at': datetime.now()}},
+                upsert=True
+            )
+            added = result.upserted_id is not None
+        except DuplicateKeyError:
+            # A concurrent request inserted the same entry first
+            added = False
+
+        if not added:
+            return jsonify({'message': 'Movie already in watchlist'}), 200
+
         return jsonify({'message': 'Movie added to watchlist successfully'}), 200
-        
+
     except Exception as e:
         print(f"Error adding to watchlist: {str(e)}")
         return jsonify({'error': f'Failed to add to watchlist: {str(e)}'}), 500
@@ -95,19 +135,16 @@ def remove_from_watchlist(movie_id):
     try:
         # Get user ID from JWT
         user_id = get_jwt_identity()
-        
+
         # Remove from watchlist
-        result = users_collection.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$pull': {'watchlist': movie_id}}
-        )
-        
-        if result.modified_count == 0:
-            # Movie was not in watchlist or no update occurred
+        result = watchlist_collection.delete_one({'user_id': user_id, 'movie_id': movie_id})
+
+        if result.deleted_count == 0:
+            # Movie was not in watchlist
             return jsonify({'message': 'Movie was not in watchlist or no change made'}), 200
-            
+
         return jsonify({'message': 'Movie removed from watchlist successfully'}), 200
-        
+
     except Exception as e:
         print(f"Error removing from watchlist: {str(e)}")
-        return jsonify({'error': f'Failed to remove from watchlist: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Failed to remove from watchlist: {str(e)}'}), 500
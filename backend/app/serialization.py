@@ -0,0 +1,64 @@
+"""
+JSON providers that encode MongoDB documents directly
+
+Routes can return documents with ObjectId values as they come from the
+database; the provider encodes them as strings. orjson is used when it is
+installed, otherwise the standard library encoder with the same output.
+Dates keep Flask's default HTTP date format.
+"""
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    return DefaultJSONProvider.default(value)
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, extended to encode ObjectId"""
+
+    default = staticmethod(_default)
+
+
+class OrjsonProvider(MongoJSONProvider):
+    """orjson-backed provider, several times faster on large responses"""
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Arguments such as indent or cls are only understood by the stdlib encoder
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Skip the str round trip: orjson produces UTF-8 bytes
+        body = orjson.dumps(obj, default=_default, option=self._options())
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def init_json(app, use_orjson=True):
+    """Install the fastest available provider on app"""
+    if use_orjson and orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = MongoJSONProvider(app)
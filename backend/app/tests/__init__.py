@@ -0,0 +1,21 @@
+import os
+
+import mongomock.collection
+
+# Tests bind the route modules to their own databases; a background warm-up
+# (app.warmup) would reach for MongoDB and add commands to their counts
+os.environ.setdefault('WARMUP_MODE', 'off')
+
+
+def _ignore_sort(method):
+    # PyMongo 4.11+ passes sort= to bulk builders, which mongomock does not accept
+    def wrapper(self, *args, sort=None, **kwargs):
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+_builder = mongomock.collection.BulkOperationBuilder
+if not getattr(_builder, '_accepts_sort', False):
+    _builder.add_update = _ignore_sort(_builder.add_update)
+    _builder.add_replace = _ignore_sort(_builder.add_replace)
+    _builder._accepts_sort = True
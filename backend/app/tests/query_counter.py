@@ -0,0 +1,139 @@
+"""
+Query counting for route tests
+
+Wraps mongomock collections so every database command a request issues is
+recorded, and lets tests enforce a per-endpoint budget:
+
+    counter = QueryCounter()
+    db = counter.wrap(mongomock.MongoClient().test_database)
+    with bind_route_collections(db):
+        with counter.budget(self, 3):
+            client.get('/api/users/ratings', headers=headers)
+
+Each collection method counts as the one command it sends to MongoDB;
+getMore batches of a cursor are not counted.
+"""
+import importlib
+from contextlib import ExitStack, contextmanager
+from unittest.mock import patch
+
+from app.routes import ROUTE_COLLECTIONS
+
+# Collection method -> MongoDB command it issues
+COMMANDS = {
+    'find': 'find',
+    'find_one': 'find',
+    'aggregate': 'aggregate',
+    'count_documents': 'aggregate',
+    'estimated_document_count': 'count',
+    'distinct': 'distinct',
+    'insert_one': 'insert',
+    'insert_many': 'insert',
+    'update_one': 'update',
+    'update_many': 'update',
+    'replace_one': 'update',
+    'delete_one': 'delete',
+    'delete_many': 'delete',
+    'find_one_and_update': 'findAndModify',
+    'find_one_and_replace': 'findAndModify',
+    'find_one_and_delete': 'findAndModify',
+    'bulk_write': 'bulkWrite',
+    'create_index': 'createIndexes',
+    'create_indexes': 'createIndexes',
+}
+
+class QueryCounter:
+    def __init__(self):
+        self.commands = []
+
+    @property
+    def count(self):
+        return len(self.commands)
+
+    def reset(self):
+        self.commands = []
+
+    def wrap(self, db):
+        return CountingDatabase(db, self)
+
+    @contextmanager
+    def budget(self, test_case, limit):
+        """Fail test_case if the block issues more than limit commands"""
+        start = len(self.commands)
+        yield
+        issued = self.commands[start:]
+        test_case.assertLessEqual(
+            len(issued), limit,
+            f"{len(issued)} database commands issued, budget is {limit}: "
+            + ', '.join(f"{collection}.{command}" for collection, command in issued)
+        )
+
+
+class CountingCollection:
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    @property
+    def name(self):
+        return self._collection.name
+
+    def __getattr__(self, attribute):
+        value = getattr(self._collection, attribute)
+        command = COMMANDS.get(attribute)
+        if command is None or not callable(value):
+            return value
+
+        def counted(*args, **kwargs):
+            self._counter.commands.append((self._collection.name, command))
+            return value(*args, **kwargs)
+        return counted
+
+
+class CountingDatabase:
+    def __init__(self, db, counter):
+        self._db = db
+        self._counter = counter
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = CountingCollection(self._db[name], self._counter)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+
+@contextmanager
+def bind_route_collections(db):
+    """
+    Point the route modules and the response cache at db for the duration of the block
+    Rating events are not published, so only the request's own commands count
+    """
+    from app.caching import CollectionVersions, response_cache
+    from app.routes.theaters import theater_index
+    from app.users import user_cache
+    from app.workers.rating_events import rating_events
+
+    versions = CollectionVersions(db['cache_versions'], refresh_interval=float('inf'))
+    # Read the versions now, so the first cached request does not pay for it
+    versions.get(())
+    response_cache.clear()
+    theater_index.invalidate()
+    user_cache.clear()
+
+    with ExitStack() as stack:
+        for module_name, names in ROUTE_COLLECTIONS.items():
+            module = importlib.import_module(module_name)
+            for name in names:
+                stack.enter_context(patch.object(module, f'{name}_collection', db[name]))
+
+        stack.enter_context(patch.object(rating_events, 'publish'))
+        stack.enter_context(patch('app.caching.collection_versions', versions))
+        stack.callback(response_cache.clear)
+        stack.callback(theater_index.invalidate)
+        stack.callback(user_cache.clear)
+        yield db
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from app.algorithms.ann import create_index, load_index
+
+
+class TestNearestNeighbourIndexes(unittest.TestCase):
+    """Test cases for the brute-force and IVF indexes."""
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        centres = rng.normal(size=(20, 16))
+        self.vectors = (centres[rng.integers(0, 20, 2000)] + 0.5 * rng.normal(size=(2000, 16))).astype(np.float32)
+        self.ids = [f'm{i}' for i in range(len(self.vectors))]
+        self.queries = centres[:10] + 0.5 * rng.normal(size=(10, 16))
+
+        self.brute = create_index('brute', 16)
+        self.brute.add(self.ids, self.vectors)
+        self.ivf = create_index('ivf', 16, n_probe=8)
+        self.ivf.add(self.ids, self.vectors)
+
+    def test_brute_force_is_exact(self):
+        query = self.queries[0]
+        unit = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(unit @ (query / np.linalg.norm(query))))[:5]
+
+        self.assertEqual([id_ for id_, _ in self.brute.search(query, k=5)], [self.ids[i] for i in expected])
+
+    def test_ivf_recall_against_brute_force(self):
+        recall = np.mean([
+            len({id_ for id_, _ in self.ivf.search(query, 10)} & {id_ for id_, _ in self.brute.search(query, 10)}) / 10
+            for query in self.queries
+        ])
+        self.assertGreaterEqual(recall, 0.9)
+
+        # Probing every list is exhaustive
+        query = self.queries[3]
+        self.assertEqual([id_ for id_, _ in self.ivf.search(query, 10, n_probe=self.ivf.n_lists)],
+                         [id_ for id_, _ in self.brute.search(query, 10)])
+
+    def test_incremental_insert_and_replace(self):
+        vector = np.full(16, 3.0, dtype=np.float32)
+        self.ivf.add(['new'], vector)
+        self.assertEqual(self.ivf.search(vector, 1)[0][0], 'new')
+
+        self.ivf.add(['m0'], vector)
+        found = [id_ for id_, _ in self.ivf.search(vector, 2)]
+        self.assertEqual(sorted(found), ['m0', 'new'])
+        self.assertEqual(len(self.ivf), 2001)
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for index in (self.brute, self.ivf):
+                path = os.path.join(directory, f'{index.kind}.npz')
+                index.save(path)
+                restored = load_index(path)
+
+                self.assertEqual(len(restored), len(index))
+                for query in self.queries[:3]:
+                    self.assertEqual(restored.search(query, 10), index.search(query, 10))
+
+            # Restored indexes keep accepting inserts
+            restored.add(['late'], self.vectors[5])
+            self.assertEqual(restored.search(self.vectors[5], 2)[1][0], 'late')
+
+    def test_rejects_wrong_dimension(self):
+        with self.assertRaises(ValueError):
+            self.ivf.search(np.ones(8), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch, PropertyMock
+from bson import ObjectId
+
+import mongomock
+from flask_jwt_extended import create_access_token
+
+from app.asgi import AsyncAPI
+from app.caching import CollectionVersions, response_cache
+from app.config import APP_DB_NAME, APP_MONGO_URI
+from app.instrumentation import REQUEST_LATENCY
+from app.tests.query_counter import bind_route_collections
+from app.users import user_cache
+from main import create_asgi_app
+
+
+class AsyncCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def sort(self, keys):
+        docs = list(self.docs)
+        for key, direction in reversed(keys):
+            docs.sort(key=lambda doc: doc[key], reverse=direction < 0)
+        return AsyncCursor(docs)
+
+    def limit(self, n):
+        return AsyncCursor(self.docs[:n])
+
+    async def to_list(self, length=None):
+        return self.docs
+
+
+class AsyncCollection:
+    """Minimal async facade over a mongomock collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def find_one(self, *args, **kwargs):
+        return self.collection.find_one(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline):
+        return AsyncCursor(self.collection.aggregate(pipeline))
+
+
+class AsyncDatabase:
+    def __init__(self, db):
+        self.db = db
+
+    def __getattr__(self, name):
+        return AsyncCollection(self.db[name])
+
+
+class TestAsyncAPI(unittest.TestCase):
+    """Test cases for the ASGI serving mode."""
+
+    def setUp(self):
+        """Set up the ASGI app over a mock database."""
+        self.api = create_asgi_app()
+        self.db = mongomock.MongoClient().test_database
+        self.db_patch = patch.object(AsyncAPI, 'db', new_callable=PropertyMock,
+                                     return_value=AsyncDatabase(self.db))
+        self.db_patch.start()
+        self.versions = CollectionVersions(self.db.cache_versions)
+        self.versions_patch = patch('app.caching.collection_versions', self.versions)
+        self.versions_patch.start()
+        # Tokens are checked against the user like in the Flask routes
+        self.users_patch = patch('app.users.users_collection', self.db.users)
+        self.users_patch.start()
+        response_cache.clear()
+        user_cache.clear()
+
+        self.user_id = ObjectId()
+        self.movie_ids = [ObjectId(), ObjectId()]
+        self.db.movies.insert_many([
+            {"_id": self.movie_ids[0], "title": "Heat", "genres": ["Crime"], "director": "Michael Mann"},
+            {"_id": self.movie_ids[1], "title": "Alien", "genres": ["Sci-Fi"], "director": "Ridley Scott"},
+        ])
+        self.db.users.insert_one({
+            "_id": self.user_id,
+            "username": "tester",
+            "preferences": {"genres": ["Crime"], "directors": [], "actors": []}
+        })
+        added_at = datetime(2024, 1, 1)
+        self.db.watchlist.insert_many([
+            {"user_id": str(self.user_id), "movie_id": str(self.movie_ids[1]), "added_at": added_at},
+            {"user_id": str(self.user_id), "movie_id": str(self.movie_ids[0]),
+             "added_at": added_at + timedelta(minutes=1)},
+        ])
+        self.db.theaters.insert_one({
+            "name": "Movie House",
+            "location": {"type": "Point", "coordinates": [-5.93, 54.59]},
+            "current_movies": [{"movie_id": str(self.movie_ids[0]), "showtimes": []}]
+        })
+
+        with self.api.flask_app.app_context():
+            self.token = create_access_token(identity=str(self.user_id))
+
+    def tearDown(self):
+        self.db_patch.stop()
+        self.versions_patch.stop()
+        self.users_patch.stop()
+        response_cache.clear()
+        user_cache.clear()
+
+    def request(self, path, token=None, query=b'', headers=()):
+        headers = list(headers)
+        if token:
+            headers.append((b'authorization', f'Bearer {token}'.encode()))
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': path, 'query_string': query,
+            'headers': headers, 'http_version': '1.1', 'scheme': 'http',
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 1234), 'root_path': '',
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.api(scope, receive, send))
+        status = messages[0]['status']
+        self.response_headers = dict(messages[0]['headers'])
+        body = b''.join(m.get('body', b'') for m in messages[1:])
+        return status, json.loads(body) if body else None
+
+    def test_theaters_include_movie_details(self):
+        status, data = self.request('/api/theaters')
+        self.assertEqual(status, 200)
+        self.assertEqual(data[0]['current_movies'][0]['movie_details']['title'], 'Heat')
+
+    def test_nearby_theaters_use_index(self):
+        with bind_route_collections(self.db):
+            status, data = self.request('/api/theaters', query=b'lat=54.5973&lng=-5.9301&distance=5')
+        self.assertEqual(status, 200)
+        self.assertEqual(data[0]['name'], 'Movie House')
+        self.assertEqual(data[0]['distance'], 0.8)
+        self.assertEqual(data[0]['current_movies'][0]['movie_details']['title'], 'Heat')
+
+    def test_watchlist_keeps_order(self):
+        status, data = self.request('/api/users/watchlist', token=self.token)
+        self.assertEqual(status, 200)
+        self.assertEqual([movie['title'] for movie in data], ['Alien', 'Heat'])
+        self.assertNotIn(b'x-next-cursor', self.response_headers)
+
+    def test_watchlist_pages(self):
+        status, data = self.request('/api/users/watchlist', token=self.token, query=b'limit=1')
+        self.assertEqual([movie['title'] for movie in data], ['Alien'])
+        cursor = self.response_headers[b'x-next-cursor']
+
+        status, data = self.request('/api/users/watchlist', token=self.token, query=b'limit=1&cursor=' + cursor)
+        self.assertEqual(status, 200)
+        self.assertEqual([movie['title'] for movie in data], ['Heat'])
+        self.assertNotIn(b'x-next-cursor', self.response_headers)
+
+    def test_recommendations_use_preferences(self):
+        self.db.movies.insert_one({"title": "Collateral", "genres": ["Crime"], "director": "Michael Mann"})
+        with bind_route_collections(self.db):
+            status, data = self.request('/api/recommendations', token=self.token)
+        self.assertEqual(status, 200)
+        # Heat matches too, but it is already in the watchlist
+        self.assertEqual([movie['title'] for movie in data], ['Collateral'])
+
+    def test_theaters_use_the_response_cache(self):
+        status, data = self.request('/api/theaters')
+        etag = self.response_headers[b'etag']
+        self.assertEqual(self.response_headers[b'cache-control'], b'public, max-age=60')
+
+        # Served from the cache until the theaters change
+        self.db.theaters.update_one({}, {'$set': {'name': 'QFT'}})
+        self.assertEqual(self.request('/api/theaters')[1][0]['name'], 'Movie House')
+        status, data = self.request('/api/theaters', headers=[(b'if-none-match', etag)])
+        self.assertEqual((status, data), (304, None))
+
+        self.versions.bump('theaters')
+        status, data = self.request('/api/theaters', headers=[(b'if-none-match', etag)])
+        self.assertEqual((status, data[0]['name']), (200, 'QFT'))
+        self.assertNotEqual(self.response_headers[b'etag'], etag)
+
+    def test_native_routes_are_instrumented(self):
+        def count():
+            return sum(values[-1] for key, values in REQUEST_LATENCY._series.items()
+                       if key == ('GET', '/api/users/watchlist', '200'))
+
+        before = count()
+        self.request('/api/users/watchlist', token=self.token)
+
+        self.assertEqual(count(), before + 1)
+        self.assertIn(b'db;dur=', self.response_headers[b'server-timing'])
+
+    def test_missing_token_is_rejected(self):
+        status, data = self.request('/api/users/ratings')
+        self.assertEqual(status, 401)
+
+    def test_deleted_user_is_rejected(self):
+        self.db.users.delete_one({'_id': self.user_id})
+
+        status, data = self.request('/api/users/watchlist', token=self.token)
+
+        self.assertEqual(status, 401)
+        self.assertEqual(data['msg'], f'Error loading the user {self.user_id}')
+        # The same answer as the Flask routes
+        response = self.api.flask_app.test_client().get(
+            '/api/users/watchlist', headers={'Authorization': f'Bearer {self.token}'}
+        )
+        self.assertEqual((response.status_code, response.get_json()), (status, data))
+
+    def test_theaters_are_cached_in_both_modes(self):
+        self.request('/api/theaters')
+        with bind_route_collections(self.db):
+            response = self.api.flask_app.test_client().get('/api/theaters')
+
+        self.assertEqual(response.headers['ETag'], self.response_headers[b'etag'].decode())
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=60')
+
+    def test_database_comes_from_the_config(self):
+        self.assertEqual((self.api.mongo_uri, self.api.db_name), (APP_MONGO_URI, APP_DB_NAME))
+
+    def test_other_routes_are_served_by_flask(self):
+        status, data = self.request('/api/test')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['message'], 'Backend connection successful!')
+
+
+if __name__ == "__main__":
+    unittest.main()
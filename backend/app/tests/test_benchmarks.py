@@ -0,0 +1,61 @@
+import unittest
+from collections import Counter
+
+import mongomock
+
+from benchmarks.compare import compare
+from benchmarks.synthetic import generate_dataset, load_dataset
+
+
+class TestSyntheticData(unittest.TestCase):
+    """Test cases for the synthetic benchmark dataset."""
+
+    def test_same_seed_same_dataset(self):
+        first = generate_dataset(size='tiny', seed=7)
+        second = generate_dataset(size='tiny', seed=7)
+
+        for name in ('movies', 'ratings', 'theaters'):
+            self.assertEqual(first[name], second[name])
+        self.assertEqual([user['_id'] for user in first['users']], [user['_id'] for user in second['users']])
+        self.assertNotEqual(first['ratings'], generate_dataset(size='tiny', seed=8)['ratings'])
+
+    def test_ratings_are_unique_and_skewed(self):
+        dataset = generate_dataset(users=100, movies=200, ratings=3000, theaters=5)
+        ratings = dataset['ratings']
+
+        self.assertEqual(len(ratings), 3000)
+        self.assertEqual(len({(r['user_id'], r['movie_id']) for r in ratings}), 3000)
+        self.assertTrue(all(1 <= r['rating'] <= 5 for r in ratings))
+
+        per_movie = sorted(Counter(r['movie_id'] for r in ratings).values(), reverse=True)
+        self.assertGreater(per_movie[0], 5 * per_movie[len(per_movie) // 2])
+
+    def test_load_dataset(self):
+        dataset = generate_dataset(size='tiny')
+        db = mongomock.MongoClient().test_database
+        load_dataset(db, dataset, batch_size=300)
+
+        self.assertEqual(db.ratings.count_documents({}), dataset['sizes']['ratings'])
+        self.assertEqual(db.theaters.count_documents({}), dataset['sizes']['theaters'])
+        rated = len({rating['movie_id'] for rating in dataset['ratings']})
+        self.assertEqual(db.rating_summaries.count_documents({}), rated)
+        self.assertEqual(sum(s['count'] for s in db.rating_summaries.find()), dataset['sizes']['ratings'])
+
+
+class TestCompare(unittest.TestCase):
+
+    def test_verdicts(self):
+        base = {'endpoints': {
+            'a': {'p50_ms': 10.0}, 'b': {'p50_ms': 10.0}, 'c': {'p50_ms': 10.0}, 'd': {'skipped': 'geo'},
+        }}
+        head = {'endpoints': {
+            'a': {'p50_ms': 15.0}, 'b': {'p50_ms': 5.0}, 'c': {'p50_ms': 10.5}, 'd': {'skipped': 'geo'},
+            'e': {'p50_ms': 1.0},
+        }}
+
+        verdicts = {row[1]: row[5] for row in compare(base, head, threshold=10)}
+        self.assertEqual(verdicts, {'a': 'slower', 'b': 'faster', 'c': '', 'd': 'skipped', 'e': 'added'})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import mongomock
+
+from app import bulk_import
+from app.bulk_import import (
+    import_movies,
+    import_ratings,
+    iter_json_array,
+    movielens_object_id,
+)
+from app.workers.rating_events import RatingEventQueue
+
+
+class TestBulkImport(unittest.TestCase):
+    """Test cases for the streaming catalog and ratings importer."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db = mongomock.MongoClient().test_database
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_movielens_movies_and_ratings(self):
+        movies_path = self.write('movies.csv', (
+            'movieId,title,genres\n'
+            '1,Toy Story (1995),Adventure|Animation|Children\n'
+            '2,"American President, The (1995)",Comedy|Drama|Romance\n'
+            '3,Untitled,(no genres listed)\n'
+        ))
+        ratings_path = self.write('ratings.csv', (
+            'userId,movieId,rating,timestamp\n'
+            '1,1,4.0,964982703\n'
+            '2,1,5.0,964982224\n'
+            '1,2,0.5,964982931\n'
+        ))
+
+        movie_stats = import_movies(movies_path, self.db.movies, batch_size=2)
+        # "Untitled" has no year, so it fails validate_movie
+        self.assertEqual((movie_stats.written, movie_stats.invalid, movie_stats.batches), (2, 1, 1))
+
+        toy_story = self.db.movies.find_one({'movielens_id': 1})
+        self.assertEqual(toy_story['title'], 'Toy Story')
+        self.assertEqual(toy_story['year'], 1995)
+        self.assertEqual(toy_story['_id'], movielens_object_id('movie', '1'))
+
+        events = RatingEventQueue(
+            collections={'movies': self.db.movies, 'ratings': self.db.ratings, 'users': self.db.users},
+            mode='inline'
+        )
+        rating_stats = import_ratings(ratings_path, self.db.ratings, rating_events=events,
+                                      rating_summaries=self.db.rating_summaries, batch_size=2)
+
+        # 0.5 stars is outside the 1-5 range accepted by validate_rating
+        self.assertEqual((rating_stats.written, rating_stats.invalid), (2, 1))
+        self.assertEqual(self.db.movies.find_one({'movielens_id': 1})['average_rating'], 4.5)
+        summary = self.db.rating_summaries.find_one({'_id': str(toy_story['_id'])})
+        self.assertEqual((summary['count'], summary['counts']), (2, {'4': 1, '5': 1}))
+
+    def test_jsonl_upserts_are_idempotent(self):
+        path = self.write('movies.jsonl', '\n'.join(json.dumps(movie) for movie in [
+            {'title': 'Heat', 'year': 1995, 'genres': ['Crime']},
+            {'title': 'Alien', 'year': 1979, 'genres': 'Sci-Fi|Horror'},
+        ]))
+
+        import_movies(path, self.db.movies)
+        import_movies(path, self.db.movies)
+
+        self.assertEqual(self.db.movies.count_documents({}), 2)
+        self.assertEqual(self.db.movies.find_one({'title': 'Alien'})['genres'], ['Sci-Fi', 'Horror'])
+
+    def test_json_array_is_parsed_incrementally(self):
+        movies = [{'title': f'Movie {i}', 'year': 2000 + i % 20, 'genres': ['Drama'], 'n': i * 1.5}
+                  for i in range(200)]
+        path = self.write('movies.json', json.dumps(movies, indent=2))
+
+        with patch.object(bulk_import, 'JSON_READ_SIZE', 37):
+            self.assertEqual(list(iter_json_array(path)), movies)
+
+    def test_resume_skips_checkpointed_rows(self):
+        path = self.write('ratings.csv', 'user_id,movie_id,rating\n' + ''.join(
+            f'u{i},m{i % 7},{1 + i % 5}\n' for i in range(10)
+        ))
+        checkpoint = os.path.join(self.tmp_dir, 'ratings.checkpoint.json')
+
+        original_bulk_write = self.db.ratings.bulk_write
+        calls = []
+
+        def failing_bulk_write(operations, ordered=True):
+            calls.append(len(operations))
+            if len(calls) == 3:
+                raise RuntimeError('connection lost')
+            return original_bulk_write(operations, ordered=ordered)
+
+        with patch.object(self.db.ratings, 'bulk_write', side_effect=failing_bulk_write):
+            with self.assertRaises(RuntimeError):
+                import_ratings(path, self.db.ratings, batch_size=3, checkpoint_path=checkpoint)
+
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['rows'], 6)
+
+        stats = import_ratings(path, self.db.ratings, batch_size=3, checkpoint_path=checkpoint, resume=True)
+
+        self.assertEqual(stats.skipped, 6)
+        self.assertEqual(stats.written, 4)
+        self.assertEqual(self.db.ratings.count_documents({}), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
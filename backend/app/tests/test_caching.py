@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import patch
+
+import mongomock
+from bson import ObjectId
+
+from app.caching import CollectionVersions, ResponseCache
+from app.tests.query_counter import QueryCounter, bind_route_collections
+from app.workers.rating_events import rating_events
+from main import create_app
+
+
+class TestResponseCaching(unittest.TestCase):
+    """Test cases for ETag response caching of the catalog and theater endpoints."""
+
+    def setUp(self):
+        self.counter = QueryCounter()
+        self.raw_db = mongomock.MongoClient().test_database
+        self.db = self.counter.wrap(self.raw_db)
+
+        self.movie_id = ObjectId()
+        self.raw_db.movies.insert_one({
+            '_id': self.movie_id, 'title': 'Heat', 'year': 1995, 'genres': ['Crime'], 'average_rating': 0
+        })
+        self.raw_db.ratings.insert_one({'user_id': str(ObjectId()), 'movie_id': str(self.movie_id), 'rating': 4})
+
+        self.binding = bind_route_collections(self.db)
+        self.binding.__enter__()
+        self.client = create_app().test_client()
+
+    def tearDown(self):
+        self.binding.__exit__(None, None, None)
+
+    def test_repeat_requests_skip_the_database(self):
+        first = self.client.get(f'/api/movies/{self.movie_id}')
+        self.counter.reset()
+        second = self.client.get(f'/api/movies/{self.movie_id}')
+
+        self.assertEqual(self.counter.count, 0)
+        self.assertEqual(second.get_json()['title'], 'Heat')
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+        self.assertEqual(second.headers['Cache-Control'], 'public, max-age=60')
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/api/movies').headers['ETag']
+
+        response = self.client.get('/api/movies', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_rating_events_invalidate_movies(self):
+        before = self.client.get(f'/api/movies/{self.movie_id}')
+        self.assertEqual(before.get_json()['average_rating'], 0)
+
+        collections = {'movies': self.db.movies, 'ratings': self.db.ratings, 'users': self.db.users}
+        with patch.object(rating_events, '_collections', collections):
+            rating_events.apply({str(self.movie_id)}, set())
+
+        after = self.client.get(f'/api/movies/{self.movie_id}', headers={'If-None-Match': before.headers['ETag']})
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(after.get_json()['average_rating'], 4.0)
+
+    def test_errors_are_not_cached(self):
+        missing = ObjectId()
+        self.assertEqual(self.client.get(f'/api/movies/{missing}').status_code, 404)
+
+        self.raw_db.movies.insert_one({'_id': missing, 'title': 'Alien', 'year': 1979, 'genres': []})
+        self.assertEqual(self.client.get(f'/api/movies/{missing}').status_code, 200)
+
+
+class TestCollectionVersions(unittest.TestCase):
+
+    def test_bumps_are_seen_by_other_processes(self):
+        collection = mongomock.MongoClient().test_database.cache_versions
+        web = CollectionVersions(collection, refresh_interval=0)
+        worker = CollectionVersions(collection, refresh_interval=0)
+
+        self.assertEqual(web.get(('movies', 'theaters')), (0, 0))
+        worker.bump('movies')
+        self.assertEqual(web.get(('movies', 'theaters')), (1, 0))
+
+    def test_response_cache_evicts_least_recently_used(self):
+        cache = ResponseCache(max_entries=2, ttl=60)
+        cache.set('a', b'1', 'application/json')
+        cache.set('b', b'2', 'application/json')
+        cache.get('a')
+        cache.set('c', b'3', 'application/json')
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import random
+import unittest
+from unittest.mock import patch
+
+import mongomock
+
+from app.caching import CollectionVersions
+from app.geo import TheaterIndex
+from app.routes import theaters
+from app.routes.theaters import calculate_distance
+from app.tests.query_counter import bind_route_collections
+from main import create_app
+
+BELFAST = (54.5973, -5.9301)
+
+
+def make_theaters(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        {
+            'name': f'Cinema {i}',
+            'location': {
+                'type': 'Point',
+                'coordinates': [BELFAST[1] + rng.uniform(-1, 1), BELFAST[0] + rng.uniform(-0.6, 0.6)],
+            },
+            'address': {'city': 'Belfast'},
+            'current_movies': [{'movie_id': 'm1' if i % 2 else 'm2', 'showtimes': ['2024-01-01 18:00']}],
+        }
+        for i in range(count)
+    ]
+
+
+class TestTheaterIndex(unittest.TestCase):
+    """Test cases for the in-memory theater index."""
+
+    def setUp(self):
+        self.theaters = make_theaters(200)
+        self.versions = CollectionVersions(mongomock.MongoClient().db.cache_versions, refresh_interval=0)
+        self.loads = 0
+
+        def load():
+            self.loads += 1
+            return self.theaters
+
+        self.index = TheaterIndex(load, versions=self.versions)
+
+    def distance(self, theater):
+        lng, lat = theater['location']['coordinates']
+        return calculate_distance(BELFAST[0], BELFAST[1], lat, lng)
+
+    def test_radius_query_matches_haversine(self):
+        matches = self.index.query(*BELFAST, 20)
+
+        expected = sorted(self.distance(theater) for theater in self.theaters if self.distance(theater) <= 20)
+        self.assertEqual(len(matches), len(expected))
+        for (theater, distance), expected_distance in zip(matches, expected):
+            self.assertAlmostEqual(distance, expected_distance, places=6)
+            self.assertAlmostEqual(distance, self.distance(theater), places=6)
+
+    def test_limit_returns_nearest(self):
+        matches = self.index.query(*BELFAST, 50, limit=3)
+
+        nearest = sorted(self.distance(theater) for theater in self.theaters)[:3]
+        self.assertEqual([round(distance, 6) for _, distance in matches], [round(d, 6) for d in nearest])
+
+    def test_results_are_copies(self):
+        theater, _ = self.index.query(*BELFAST, limit=1)[0]
+        theater['distance'] = 1.0
+        theater['current_movies'][0]['movie_details'] = {}
+
+        self.assertTrue(all('distance' not in theater for theater in self.theaters))
+        self.assertTrue(all('movie_details' not in theater['current_movies'][0] for theater in self.theaters))
+
+    def test_rebuilt_when_theaters_change(self):
+        self.index.query(*BELFAST, 20)
+        self.index.query(*BELFAST, 5)
+        self.assertEqual(self.loads, 1)
+
+        self.theaters = self.theaters + [{'name': 'New', 'location': {'coordinates': [BELFAST[1], BELFAST[0]]}}]
+        self.versions.bump('theaters')
+
+        theater, distance = self.index.query(*BELFAST, limit=1)[0]
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(theater['name'], 'New')
+        self.assertAlmostEqual(distance, 0)
+
+    def test_unavailable_when_loading_fails(self):
+        def load():
+            raise RuntimeError('database unavailable')
+
+        self.assertIsNone(TheaterIndex(load, versions=self.versions).query(*BELFAST, 20))
+        self.assertIsNone(TheaterIndex(lambda: self.theaters, max_size=10, versions=self.versions).query(*BELFAST, 20))
+
+
+class TestNearbyTheaterRoutes(unittest.TestCase):
+    """Nearby theater endpoints are served from the index."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().test_database
+        self.db.theaters.insert_many(make_theaters(50))
+        self.client = create_app().test_client()
+
+    def test_theaters_near_location(self):
+        with bind_route_collections(self.db):
+            response = self.client.get(f'/api/theaters?lat={BELFAST[0]}&lng={BELFAST[1]}&distance=30&limit=4')
+
+        theaters = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(theaters), 4)
+        distances = [theater['distance'] for theater in theaters]
+        self.assertEqual(distances, sorted(distances))
+        self.assertIsInstance(theaters[0]['_id'], str)
+
+    def test_movie_theaters_near_location(self):
+        with bind_route_collections(self.db):
+            response = self.client.get(f'/api/movies/m1/theaters?lat={BELFAST[0]}&lng={BELFAST[1]}&distance=30')
+
+        theaters = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(theaters)
+        self.assertTrue(all(theater['distance'] <= 30 for theater in theaters))
+        self.assertTrue(all(theater['showtimes'] == ['2024-01-01 18:00'] for theater in theaters))
+
+    def test_falls_back_to_near_query(self):
+        with bind_route_collections(self.db), patch.object(theaters.theater_index, 'query', return_value=None), \
+                patch.object(theaters.theaters_collection, 'find', return_value=[]) as find:
+            response = self.client.get(f'/api/theaters?lat={BELFAST[0]}&lng={BELFAST[1]}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('$near', find.call_args[0][0]['location'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from app.integrations.cache import TTLCache
+from app.integrations.google_places import GooglePlacesClient
+
+
+class StubPlacesHandler(BaseHTTPRequestHandler):
+    """Answers text searches like the Places API; unknown theaters have no results."""
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)['query'][0]
+        self.server.queries.append(query)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        results = []
+        if not query.startswith('Unknown'):
+            results.append({
+                'place_id': f"place-{query.split(' cinema')[0]}",
+                'rating': 4.4,
+                'user_ratings_total': 120,
+                'formatted_address': '1 Test Street'
+            })
+
+        if self.server.status is not None:
+            body = json.dumps({'status': self.server.status, 'results': []}).encode()
+        elif self.server.invalid_json:
+            body = b'<html>Bad gateway</html>'
+        else:
+            body = json.dumps({'status': 'OK' if results else 'ZERO_RESULTS', 'results': results}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGooglePlacesClient(unittest.TestCase):
+    """Test cases for the cached, pooled Google Places client."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubPlacesHandler)
+        self.server.queries = []
+        self.server.delay = 0
+        self.server.status = None
+        self.server.invalid_json = False
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/textsearch/json"
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.cache_dir, 'places.sqlite3')
+        self.client = self.make_client()
+
+    def make_client(self, ttl=3600, **kwargs):
+        return GooglePlacesClient(
+            api_key='test-key', base_url=self.base_url, timeout=2,
+            cache=TTLCache(self.cache_path, ttl), **kwargs
+        )
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_repeat_lookups_are_served_from_cache(self):
+        first = self.client.lookup('Movie House', 'Belfast')
+        second = self.client.lookup('movie house ', 'BELFAST')
+
+        self.assertEqual(first['place_id'], 'place-Movie House')
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.queries), 1)
+
+    def test_not_found_is_cached(self):
+        self.assertIsNone(self.client.lookup('Unknown Cinema', 'Belfast'))
+        self.assertIsNone(self.client.lookup('Unknown Cinema', 'Belfast'))
+        self.assertEqual(len(self.server.queries), 1)
+
+    def test_cache_persists_across_clients(self):
+        self.client.lookup('Movie House', 'Belfast')
+        other_client = self.make_client()
+        self.assertEqual(other_client.lookup('Movie House', 'Belfast')['place_id'], 'place-Movie House')
+        self.assertEqual(len(self.server.queries), 1)
+        other_client.close()
+
+    def test_expired_entries_are_refetched(self):
+        client = self.make_client(ttl=0)
+        client.lookup('Movie House', 'Belfast')
+        time.sleep(0.01)
+        client.lookup('Movie House', 'Belfast')
+        self.assertEqual(len(self.server.queries), 2)
+        client.close()
+
+    def test_lookup_many_deduplicates_and_runs_concurrently(self):
+        self.server.delay = 0.2
+        client = self.make_client(max_workers=4)
+        pairs = [(f'Cinema {i}', 'Belfast') for i in range(4)] + [('Cinema 0', 'Belfast')]
+
+        start = time.time()
+        results = client.lookup_many(pairs)
+        elapsed = time.time() - start
+
+        self.assertEqual([r['place_id'] for r in results],
+                         ['place-Cinema 0', 'place-Cinema 1', 'place-Cinema 2', 'place-Cinema 3', 'place-Cinema 0'])
+        self.assertEqual(len(self.server.queries), 4)
+        self.assertLess(elapsed, 0.6)
+
+        # Second batch is answered without any request
+        client.lookup_many(pairs)
+        self.assertEqual(len(self.server.queries), 4)
+        client.close()
+
+    def test_error_statuses_are_not_cached(self):
+        self.server.status = 'OVER_QUERY_LIMIT'
+        with self.assertLogs('app.integrations.google_places', 'WARNING') as logs:
+            self.assertIsNone(self.client.lookup('Movie House', 'Belfast'))
+        self.assertIn('OVER_QUERY_LIMIT', logs.output[0])
+
+        self.server.status = None
+        self.assertEqual(self.client.lookup('Movie House', 'Belfast')['place_id'], 'place-Movie House')
+        self.assertEqual(len(self.server.queries), 2)
+
+    def test_error_status_serves_the_stale_result(self):
+        client = self.make_client(ttl=0)
+        client.lookup('Movie House', 'Belfast')
+        time.sleep(0.01)
+        self.server.status = 'REQUEST_DENIED'
+        with self.assertLogs('app.integrations.google_places', 'WARNING'):
+            self.assertEqual(client.lookup('Movie House', 'Belfast')['place_id'], 'place-Movie House')
+        client.close()
+
+    def test_invalid_json_is_not_cached(self):
+        self.server.invalid_json = True
+        with self.assertLogs('app.integrations.google_places', 'WARNING'):
+            self.assertIsNone(self.client.lookup('Movie House', 'Belfast'))
+        self.assertFalse(self.client.cache.contains(GooglePlacesClient.cache_key('Movie House', 'Belfast')))
+
+    def test_unreachable_server_returns_none(self):
+        client = GooglePlacesClient(
+            api_key='test-key', base_url='http://127.0.0.1:9/textsearch/json', timeout=0.5,
+            cache=TTLCache(os.path.join(self.cache_dir, 'other.sqlite3'), 3600)
+        )
+        self.assertIsNone(client.lookup('Movie House', 'Belfast'))
+        client.close()
+
+
+
+class TestTTLCache(unittest.TestCase):
+    """Test cases for the memory front of the persistent cache."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = TTLCache(os.path.join(self.cache_dir, 'cache.sqlite3'), 3600, max_entries=2)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_memory_keeps_the_most_recently_used(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        self.assertEqual(list(self.cache._memory), ['a', 'c'])
+        # Evicted entries are still read from disk
+        self.assertEqual(self.cache.get('b'), 2)
+        self.assertEqual(list(self.cache._memory), ['c', 'b'])
+
+    def test_expired_entries_leave_memory(self):
+        self.cache.set('a', 1, ttl=0)
+        time.sleep(0.01)
+
+        self.assertEqual(self.cache.get_entry('a'), (1, None, True))
+        self.assertNotIn('a', self.cache._memory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+import json
+import os
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import unittest
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import bson
+import requests
+
+from app.instrumentation import Histogram, mongo_listener
+from main import create_app
+
+
+class OkHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeMongoHandler(socketserver.BaseRequestHandler):
+    """
+    Just enough of the MongoDB wire protocol for a client to connect and run
+    commands: the handshake (OP_QUERY) and commands (OP_MSG), every query empty
+    """
+    HELLO = {'ok': 1, 'isWritablePrimary': True, 'ismaster': True, 'maxWireVersion': 21, 'minWireVersion': 0,
+             'maxBsonObjectSize': 16777216, 'maxMessageSizeBytes': 48000000, 'maxWriteBatchSize': 100000,
+             'logicalSessionTimeoutMinutes': 30, 'connectionId': 1}
+
+    def reply_to(self, command):
+        name = next(iter(command))
+        if name.lower() in ('hello', 'ismaster'):
+            return dict(self.HELLO, localTime=datetime.now())
+        if name in ('find', 'aggregate'):
+            return {'ok': 1, 'cursor': {'id': bson.Int64(0), 'ns': f"{command['$db']}.x", 'firstBatch': []}}
+        return {'ok': 1}
+
+    def read(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def handle(self):
+        try:
+            while True:
+                length, request_id, _, op_code = struct.unpack('<iiii', self.read(16))
+                body = self.read(length - 16)
+                if op_code == 2004:
+                    # OP_QUERY: flags, collection name, skip, limit, query
+                    query_start = body.index(b'\0', 4) + 1 + 8
+                    command = bson.decode(body[query_start:query_start + struct.unpack_from('<i', body, query_start)[0]])
+                    payload = struct.pack('<iqii', 0, 0, 0, 1) + bson.encode(self.reply_to(command))
+                    op_reply = 1
+                else:
+                    # OP_MSG: flags, then a section of kind 0 holding the command
+                    flags = struct.unpack_from('<I', body)[0]
+                    command = bson.decode(body[5:5 + struct.unpack_from('<i', body, 5)[0]])
+                    if flags & 2:
+                        continue
+                    payload = struct.pack('<IB', 0, 0) + bson.encode(self.reply_to(command))
+                    op_reply = 2013
+                self.request.sendall(struct.pack('<iiii', 16 + len(payload), 0, request_id, op_reply) + payload)
+        except (ConnectionError, OSError):
+            pass
+
+
+# A fresh worker against the fake server: the route's queries have to reach /metrics
+MONGO_METRICS = """
+import json, sys
+import app.database
+app.database.APP_MONGO_URI = sys.argv[1]
+from main import create_app
+client = create_app().test_client()
+status = client.get('/api/movies').status_code
+print(json.dumps({'status': status, 'metrics': client.get('/metrics').get_data(as_text=True)}))
+"""
+
+
+class TestMongoMetrics(unittest.TestCase):
+    """The shared MongoDB clients report their commands to the request metrics."""
+
+    def test_queries_are_counted(self):
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeMongoHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            uri = f"mongodb://127.0.0.1:{server.server_address[1]}/?directConnection=true&serverSelectionTimeoutMS=5000"
+            output = subprocess.run(
+                [sys.executable, '-c', MONGO_METRICS, uri], capture_output=True, text=True, check=True, timeout=60,
+                cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                env={**os.environ, 'WARMUP_MODE': 'off'},
+            ).stdout
+        finally:
+            server.shutdown()
+            server.server_close()
+        result = json.loads(output.splitlines()[-1])
+
+        self.assertEqual(result['status'], 200)
+        self.assertIn('mongo_command_duration_seconds_count{command="find"}', result['metrics'])
+        self.assertIn('mongo_commands_per_request_bucket{route="/api/movies",le="0"} 0', result['metrics'])
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Test cases for request metrics, /metrics and ?profile=1."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), OkHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_port}/"
+
+        self.app = create_app()
+
+        @self.app.route('/api/instrumented/<item_id>')
+        def instrumented(item_id):
+            # Stand-ins for the events PyMongo sends the listener
+            mongo_listener.succeeded(SimpleNamespace(command_name='find', duration_micros=1500))
+            mongo_listener.succeeded(SimpleNamespace(command_name='find', duration_micros=2500))
+            requests.get(url, timeout=2)
+            return {'id': item_id}
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_request_breakdown_in_server_timing(self):
+        response = self.client.get('/api/instrumented/1')
+
+        self.assertEqual(response.status_code, 200)
+        timing = response.headers['Server-Timing']
+        self.assertIn('db;dur=4.0;desc="2 commands"', timing)
+        self.assertIn('desc="1 calls"', timing)
+
+    def test_metrics_are_labelled_by_route(self):
+        self.client.get('/api/instrumented/1')
+        self.client.get('/api/instrumented/2')
+
+        body = self.client.get('/metrics').get_data(as_text=True)
+
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",route="/api/instrumented/<item_id>",status="200"}',
+            body
+        )
+        self.assertIn('mongo_commands_per_request_bucket{route="/api/instrumented/<item_id>",le="2"}', body)
+        self.assertIn('outbound_http_duration_seconds_sum{route="/api/instrumented/<item_id>"}', body)
+        self.assertNotIn('route="/metrics"', body)
+
+    def test_profile_requires_opt_in(self):
+        response = self.client.get('/api/instrumented/1?profile=1')
+        self.assertEqual(response.get_json(), {'id': '1'})
+
+        self.app.config['PROFILING_ENABLED'] = True
+        response = self.client.get('/api/instrumented/1?profile=1')
+
+        self.assertEqual(response.mimetype, 'text/plain')
+        self.assertIn('function calls', response.get_data(as_text=True))
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_render_is_cumulative(self):
+        histogram = Histogram('latency_seconds', 'Latency', ('route',), (0.1, 1))
+        for value in (0.05, 0.5, 0.7, 3):
+            histogram.observe(value, route='/a')
+
+        lines = histogram.render()
+
+        self.assertIn('latency_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1"} 3', lines)
+        self.assertIn('latency_seconds_bucket{route="/a",le="+Inf"} 4', lines)
+        self.assertIn('latency_seconds_count{route="/a"} 4', lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import socketserver
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import mongomock
+
+from app.workers.mail import MailQueue, SMTPSender
+from main import create_app
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        time.sleep(server.greeting_delay)
+        self.reply("220 stub ESMTP")
+        received = 0
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line.split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply("250-stub")
+                self.reply("250 OK")
+            elif command == 'RCPT':
+                self.reply(server.rcpt_replies.pop(0) if server.rcpt_replies else "250 OK")
+            elif command == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode()
+                    if data in ('.\r\n', ''):
+                        break
+                    lines.append(data)
+                server.messages.append(''.join(lines))
+                self.reply("250 OK")
+                received += 1
+                if server.close_after and received >= server.close_after:
+                    # Drop the connection without a QUIT, like a server timing it out
+                    return
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server recording what it receives"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPStubHandler)
+        self.connections = 0
+        self.messages = []
+        self.rcpt_replies = []
+        self.close_after = None
+        self.greeting_delay = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def sender(self):
+        return SMTPSender(host='127.0.0.1', port=self.server_address[1], user=None, use_tls=False, timeout=5)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestMailQueue(unittest.TestCase):
+    """Test cases for the outbound mail queue against a local SMTP stub."""
+
+    def setUp(self):
+        self.smtp = SMTPStub()
+        self.queue = MailQueue(sender=self.smtp.sender(), mode='thread', retry_base=0.01)
+
+    def tearDown(self):
+        self.queue.sender.close()
+        self.smtp.stop()
+
+    def test_sends_reuse_one_connection(self):
+        for i in range(5):
+            self.queue.send(f'user{i}@example.com', 'Hello', f'Message {i}')
+
+        self.assertTrue(wait_until(lambda: self.queue.sent == 5))
+        self.assertEqual(len(self.smtp.messages), 5)
+        self.assertEqual(self.smtp.connections, 1)
+
+    def test_temporary_failures_are_retried(self):
+        self.smtp.rcpt_replies = ["451 Try again later", "451 Try again later"]
+        self.queue.send('user@example.com', 'Hello', 'Body')
+
+        self.assertTrue(wait_until(lambda: self.queue.sent == 1))
+        self.assertEqual(self.queue.failed, 0)
+        self.assertEqual(len(self.smtp.messages), 1)
+
+    def test_permanent_failures_are_dropped(self):
+        self.smtp.rcpt_replies = ["550 No such user"]
+        self.queue.send('nobody@example.com', 'Hello', 'Body')
+
+        self.assertTrue(wait_until(lambda: self.queue.failed == 1))
+        time.sleep(0.1)
+        self.assertEqual(self.queue.pending(), 0)
+        self.assertEqual(self.smtp.messages, [])
+
+    def test_reconnects_when_the_server_drops_the_connection(self):
+        self.smtp.close_after = 1
+        queue = MailQueue(sender=self.queue.sender, mode='inline', retry_base=0.01)
+        queue.send('first@example.com', 'Hello', 'One')
+        queue.send('second@example.com', 'Hello', 'Two')
+
+        self.assertEqual((queue.sent, queue.failed), (2, 0))
+        self.assertEqual(self.smtp.connections, 2)
+
+    def test_external_mode_uses_the_outbox(self):
+        outbox = mongomock.MongoClient().test_database.mail_outbox
+        queue = MailQueue(sender=self.queue.sender, outbox=outbox, mode='external')
+        queue.send('user@example.com', 'Hello', 'Body')
+        self.assertEqual(self.smtp.messages, [])
+
+        self.assertEqual(queue.drain_outbox(), 1)
+        self.assertEqual(len(self.smtp.messages), 1)
+        self.assertEqual(outbox.count_documents({}), 0)
+
+
+class TestPasswordResetEmail(unittest.TestCase):
+    """The reset endpoint answers without waiting for the mail server."""
+
+    def test_returns_before_the_mail_is_sent(self):
+        smtp = SMTPStub()
+        smtp.greeting_delay = 1
+        queue = MailQueue(sender=smtp.sender(), mode='thread')
+        db = mongomock.MongoClient().test_database
+        db.users.insert_one({'username': 'tester', 'email': 'tester@example.com'})
+        client = create_app().test_client()
+
+        try:
+            with patch('app.routes.auth.users_collection', db.users), patch('app.utils.mail_queue', queue):
+                started = time.perf_counter()
+                response = client.post(
+                    '/api/auth/auth/reset-password', json={'email': 'tester@example.com'}
+                )
+                elapsed = time.perf_counter() - started
+
+            self.assertEqual(response.status_code, 200)
+            self.assertLess(elapsed, 0.5)
+            self.assertIn('reset_token', db.users.find_one())
+            self.assertTrue(wait_until(lambda: queue.sent == 1))
+            self.assertIn('reset-password', smtp.messages[0])
+        finally:
+            queue.sender.close()
+            smtp.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import mongomock
+
+from app.integrations.cache import TTLCache
+from app.integrations.movie_api import TMDBClient, refresh_catalog, enrich_catalog, retry_after_seconds
+from app.ratelimit import TokenBucket
+
+MOVIES = {
+    603: {'id': 603, 'title': 'The Matrix', 'release_date': '1999-03-30', 'overview': 'Neo.',
+          'genres': [{'id': 28, 'name': 'Action'}, {'id': 878, 'name': 'Science Fiction'}],
+          'poster_path': '/matrix.jpg',
+          'credits': {'cast': [{'name': 'Keanu Reeves'}, {'name': 'Carrie-Anne Moss'}],
+                      'crew': [{'job': 'Producer', 'name': 'Joel Silver'},
+                               {'job': 'Director', 'name': 'Lana Wachowski'}]}},
+    949: {'id': 949, 'title': 'Heat', 'release_date': '1995-12-15', 'overview': 'A heist.',
+          'genres': [{'id': 80, 'name': 'Crime'}], 'poster_path': '/heat.jpg',
+          'credits': {'cast': [{'name': 'Al Pacino'}], 'crew': [{'job': 'Director', 'name': 'Michael Mann'}]}},
+}
+
+
+class FakeTMDBHandler(BaseHTTPRequestHandler):
+    """TMDB-shaped API with ETags; answers If-None-Match with 304."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        self.server.requests.append(url.path)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if self.server.retry_after:
+            self.send_response(429)
+            self.send_header('Retry-After', self.server.retry_after.pop(0))
+            self.end_headers()
+            return
+
+        if url.path == '/3/movie/popular':
+            page = int(params['page'][0])
+            ids = list(MOVIES)[page - 1:page]
+            data = {'page': page, 'total_pages': len(MOVIES),
+                    'results': [{'id': i, 'title': MOVIES[i]['title']} for i in ids]}
+        elif url.path.startswith('/3/movie/') and int(url.path.rsplit('/', 1)[1]) in MOVIES:
+            data = MOVIES[int(url.path.rsplit('/', 1)[1])]
+        elif url.path == '/3/search/movie':
+            query = params['query'][0]
+            data = {'results': [{'id': m['id']} for m in MOVIES.values() if m['title'] == query]}
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestTMDBClient(unittest.TestCase):
+    """Test cases for the TMDB metadata client against a local fake server."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTMDBHandler)
+        self.server.requests = []
+        self.server.not_modified = 0
+        self.server.delay = 0
+        # Retry-After values of the next 429 responses
+        self.server.retry_after = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/3"
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.db = mongomock.MongoClient().test_database
+
+    def make_client(self, ttl=3600, **kwargs):
+        return TMDBClient(
+            api_key='test-key', base_url=self.base_url, timeout=2,
+            cache=TTLCache(os.path.join(self.cache_dir, 'tmdb.sqlite3'), ttl), **kwargs
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_refresh_catalog_imports_movies(self):
+        client = self.make_client()
+        self.assertEqual(refresh_catalog(self.db.movies, client, pages=2), 2)
+
+        matrix = self.db.movies.find_one({'tmdb_id': 603})
+        self.assertEqual(matrix['title'], 'The Matrix')
+        self.assertEqual(matrix['year'], 1999)
+        self.assertEqual(matrix['director'], 'Lana Wachowski')
+        self.assertEqual(matrix['genres'], ['Action', 'Science Fiction'])
+        self.assertTrue(matrix['image_url'].endswith('/matrix.jpg'))
+
+    def test_resync_within_ttl_costs_no_requests(self):
+        refresh_catalog(self.db.movies, self.make_client(), pages=2)
+        requests_after_first_sync = len(self.server.requests)
+
+        # A new client reads the same on-disk cache
+        client = self.make_client()
+        refresh_catalog(self.db.movies, client, pages=2)
+
+        self.assertEqual(len(self.server.requests), requests_after_first_sync)
+        self.assertEqual(client.stats['requests'], 0)
+        self.assertEqual(self.db.movies.count_documents({}), 2)
+
+    def test_stale_entries_are_revalidated_with_etags(self):
+        refresh_catalog(self.db.movies, self.make_client(ttl=0), pages=2)
+        time.sleep(0.01)
+
+        client = self.make_client(ttl=0)
+        refresh_catalog(self.db.movies, client, pages=2)
+
+        self.assertEqual(client.stats['not_modified'], 4)
+        self.assertEqual(self.server.not_modified, 4)
+
+    def test_pages_are_fetched_concurrently(self):
+        self.server.delay = 0.2
+        client = self.make_client(max_workers=4)
+
+        start = time.time()
+        movies = client.popular(pages=2)
+        elapsed = time.time() - start
+
+        self.assertEqual(sorted(movie['id'] for movie in movies), [603, 949])
+        self.assertLess(elapsed, 0.35)
+
+    def test_enrich_catalog_fills_missing_details(self):
+        self.db.movies.insert_one({'title': 'Heat', 'year': 1995, 'genres': ['Crime']})
+        self.db.movies.insert_one({'title': 'Not On TMDB', 'year': 2001, 'genres': []})
+
+        self.assertEqual(enrich_catalog(self.db.movies, self.make_client()), 1)
+
+        heat = self.db.movies.find_one({'title': 'Heat'})
+        self.assertEqual(heat['tmdb_id'], 949)
+        self.assertEqual(heat['director'], 'Michael Mann')
+        self.assertEqual(heat['cast'], ['Al Pacino'])
+        self.assertNotIn('tmdb_id', self.db.movies.find_one({'title': 'Not On TMDB'}))
+
+
+    def test_failed_items_do_not_abort_the_batch(self):
+        client = self.make_client()
+
+        details = client.movie_details_many([603, 1, 949])
+
+        self.assertEqual([item and item['id'] for item in details], [603, None, 949])
+        self.assertEqual(client.stats['errors'], 1)
+
+    def test_rate_limited_requests_wait_for_retry_after(self):
+        past = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=5), usegmt=True)
+        self.server.retry_after = ['0', past]
+        client = self.make_client()
+
+        self.assertEqual(client.movie_details(603)['title'], 'The Matrix')
+        self.assertEqual(client.stats['requests'], 3)
+
+    def test_retry_after_forms(self):
+        soon = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        self.assertEqual(retry_after_seconds('2'), 2.0)
+        self.assertTrue(25 < retry_after_seconds(soon) <= 30)
+        self.assertEqual(retry_after_seconds('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+        self.assertEqual(retry_after_seconds('soon'), 1.0)
+        self.assertEqual(retry_after_seconds(None), 1.0)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_acquire_waits_for_refill(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.time()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+    def test_try_acquire_does_not_wait(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+
+if __name__ == "__main__":
+    unittest.main()
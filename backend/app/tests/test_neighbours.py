@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import mongomock
+from bson import ObjectId
+
+from app.caching import CollectionVersions
+from app.tests.query_counter import bind_route_collections
+from app.workers.neighbours import build_movie_neighbours
+from main import create_app
+
+
+class TestMovieNeighbours(unittest.TestCase):
+    """Test cases for the precomputed similar movies table."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().test_database
+        self.ids = {name: ObjectId() for name in ('heat', 'collateral', 'thief', 'alien', 'aliens', 'up')}
+        self.db.movies.insert_many([
+            {'_id': self.ids['heat'], 'title': 'Heat', 'genres': ['Crime', 'Thriller'], 'director': 'Michael Mann',
+             'cast': ['Al Pacino', 'Robert De Niro']},
+            {'_id': self.ids['collateral'], 'title': 'Collateral', 'genres': ['Crime', 'Thriller'],
+             'director': 'Michael Mann', 'cast': ['Tom Cruise']},
+            {'_id': self.ids['thief'], 'title': 'Thief', 'genres': ['Crime'], 'director': 'Michael Mann',
+             'cast': ['James Caan']},
+            {'_id': self.ids['alien'], 'title': 'Alien', 'genres': ['Sci-Fi', 'Horror'], 'director': 'Ridley Scott',
+             'cast': ['Sigourney Weaver']},
+            {'_id': self.ids['aliens'], 'title': 'Aliens', 'genres': ['Sci-Fi', 'Action'], 'director': 'James Cameron',
+             'cast': ['Sigourney Weaver']},
+            {'_id': self.ids['up'], 'title': 'Up', 'genres': ['Animation'], 'director': 'Pete Docter', 'cast': []},
+        ])
+        # Two users who both love the Alien films
+        self.db.ratings.insert_many([
+            {'user_id': user, 'movie_id': str(self.ids[movie]), 'rating': 5, 'updated_at': datetime(2024, 1, 1)}
+            for user in ('u1', 'u2') for movie in ('alien', 'aliens')
+        ])
+        self.collections = {'movies': self.db.movies, 'ratings': self.db.ratings,
+                            'movie_neighbours': self.db.movie_neighbours}
+
+        self.versions = patch('app.caching.collection_versions',
+                              CollectionVersions(self.db.cache_versions, refresh_interval=0))
+        self.versions.start()
+
+    def tearDown(self):
+        self.versions.stop()
+
+    def neighbours(self, name):
+        entry = self.db.movie_neighbours.find_one({'movie_id': str(self.ids[name])})
+        return [neighbour['title'] for neighbour in entry['neighbours']]
+
+    def test_content_and_co_rating_neighbours(self):
+        stats = build_movie_neighbours(self.collections, count=3, block_size=2)
+
+        self.assertEqual(stats['scored'], 6)
+        self.assertEqual(self.neighbours('heat'), ['Collateral', 'Thief'])
+        self.assertEqual(self.neighbours('alien')[0], 'Aliens')
+        self.assertEqual(self.neighbours('up'), [])
+
+        entry = self.db.movie_neighbours.find_one({'movie_id': str(self.ids['heat'])})
+        scores = [neighbour['score'] for neighbour in entry['neighbours']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_incremental_build_only_rescores_changed_movies(self):
+        build_movie_neighbours(self.collections)
+        self.assertEqual(build_movie_neighbours(self.collections, incremental=True)['scored'], 0)
+
+        new_id = self.db.movies.insert_one({
+            'title': 'Manhunter', 'genres': ['Crime', 'Thriller'], 'director': 'Michael Mann', 'cast': []
+        }).inserted_id
+        self.db.ratings.insert_one({'user_id': 'u3', 'movie_id': str(self.ids['up']), 'rating': 4,
+                                    'updated_at': (datetime.now() + timedelta(seconds=1)).isoformat()})
+        self.db.movies.update_one({'_id': self.ids['thief']}, {'$set': {'title': 'Thief (1981)'}})
+
+        stats = build_movie_neighbours(self.collections, incremental=True)
+
+        self.assertEqual(stats['scored'], 3)
+        self.assertIn('Collateral', [n['title'] for n in
+                                     self.db.movie_neighbours.find_one({'movie_id': str(new_id)})['neighbours']])
+
+    def test_removed_movies_lose_their_lists(self):
+        build_movie_neighbours(self.collections)
+        self.db.movies.delete_one({'_id': self.ids['thief']})
+
+        stats = build_movie_neighbours(self.collections)
+
+        self.assertEqual(stats['removed'], 1)
+        self.assertIsNone(self.db.movie_neighbours.find_one({'movie_id': str(self.ids['thief'])}))
+        self.assertEqual(self.db.movie_neighbours.count_documents({}), 5)
+        self.assertEqual(self.neighbours('heat'), ['Collateral'])
+        self.assertEqual(self.db.cache_versions.find_one({'_id': 'movie_neighbours'})['version'], 2)
+
+    def test_similar_endpoint_is_one_read(self):
+        build_movie_neighbours(self.collections)
+        client = create_app().test_client()
+
+        with bind_route_collections(self.db):
+            response = client.get(f"/api/movies/{self.ids['heat']}/similar?limit=1")
+            missing = client.get(f'/api/movies/{ObjectId()}/similar')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([movie['title'] for movie in response.get_json()], ['Collateral'])
+        self.assertEqual(missing.get_json(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
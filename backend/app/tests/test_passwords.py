@@ -0,0 +1,138 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import mongomock
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app.passwords import PasswordHasher, PasswordHasherBusy
+from app.ratelimit import KeyedTokenBucket
+from main import create_app
+
+# Cheap parameters so the tests do not spend their time hashing
+FAST_METHOD = 'pbkdf2:sha256:1000'
+
+
+class TestPasswordHasher(unittest.TestCase):
+    """Test cases for the bounded password hashing pool."""
+
+    def setUp(self):
+        self.hasher = PasswordHasher(method=FAST_METHOD, workers=1, max_pending=2)
+
+    def tearDown(self):
+        self.hasher.shutdown()
+
+    def test_hash_and_verify(self):
+        password_hash = self.hasher.hash('secret')
+        self.assertTrue(password_hash.startswith(FAST_METHOD + '$'))
+        self.assertTrue(self.hasher.verify(password_hash, 'secret'))
+        self.assertFalse(self.hasher.verify(password_hash, 'wrong'))
+
+    def test_old_parameters_are_upgraded(self):
+        old_hash = generate_password_hash('secret', 'pbkdf2:sha256:500')
+        saved = []
+
+        matched, upgrade = self.hasher.verify_and_upgrade(old_hash, 'secret', saved.append)
+        upgrade.result()
+
+        self.assertTrue(matched)
+        self.assertTrue(saved[0].startswith(FAST_METHOD + '$'))
+        self.assertTrue(check_password_hash(saved[0], 'secret'))
+        self.assertEqual(self.hasher.verify_and_upgrade(saved[0], 'secret', saved.append), (True, None))
+
+    def test_rejects_when_saturated(self):
+        release = threading.Event()
+        for _ in range(2):
+            self.hasher._submit(release.wait)
+        try:
+            with self.assertRaises(PasswordHasherBusy):
+                self.hasher.hash('secret')
+        finally:
+            release.set()
+
+
+class TestKeyedTokenBucket(unittest.TestCase):
+    """Test cases for the per-key rate limiter."""
+
+    def test_keys_have_separate_buckets(self):
+        limiter = KeyedTokenBucket(rate=1, capacity=2)
+        self.assertEqual([limiter.try_acquire('a') for _ in range(3)], [True, True, False])
+        self.assertTrue(limiter.try_acquire('b'))
+        self.assertGreater(limiter.retry_after('a'), 0)
+
+    def test_refills(self):
+        limiter = KeyedTokenBucket(rate=100, capacity=1)
+        self.assertTrue(limiter.try_acquire('a'))
+        self.assertFalse(limiter.try_acquire('a'))
+        time.sleep(0.02)
+        self.assertTrue(limiter.try_acquire('a'))
+
+    def test_least_recently_used_keys_are_dropped(self):
+        limiter = KeyedTokenBucket(rate=1, max_keys=2)
+        for key in ('a', 'b', 'c'):
+            limiter.try_acquire(key)
+        self.assertEqual(len(limiter), 2)
+
+
+class TestLoginProtection(unittest.TestCase):
+    """Login is rate limited before hashing, and old hashes are upgraded."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().test_database
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.hasher = PasswordHasher(method=FAST_METHOD, workers=1)
+        self.db.users.insert_one({
+            'username': 'tester', 'email': 'tester@example.com',
+            'password_hash': generate_password_hash('secret', 'pbkdf2:sha256:500'),
+        })
+        self.patches = [
+            patch('app.routes.auth.users_collection', self.db.users),
+            patch('app.routes.auth.password_hasher', self.hasher),
+            patch('app.routes.auth.login_email_limiter', KeyedTokenBucket(rate=0.001, capacity=3)),
+            patch('app.routes.auth.login_ip_limiter', KeyedTokenBucket(rate=0.001, capacity=100)),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.hasher.shutdown()
+
+    def login(self, password, email='tester@example.com'):
+        return self.client.post('/api/auth/login', json={'email': email, 'password': password})
+
+    def test_login_upgrades_hash(self):
+        self.assertEqual(self.login('secret').status_code, 200)
+
+        # The new hash is saved in the background
+        deadline = time.monotonic() + 5
+        while not self.db.users.find_one()['password_hash'].startswith(FAST_METHOD) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        password_hash = self.db.users.find_one()['password_hash']
+        self.assertTrue(password_hash.startswith(FAST_METHOD + '$'))
+        self.assertEqual(self.login('secret').status_code, 200)
+
+    def test_attempts_are_limited_before_hashing(self):
+        statuses = [self.login('wrong').status_code for _ in range(3)]
+        with patch.object(self.hasher, 'verify') as verify:
+            limited = self.login('secret')
+            other_email = self.login('secret', email='Other@example.com')
+
+        self.assertEqual(statuses, [401, 401, 401])
+        self.assertEqual(limited.status_code, 429)
+        self.assertGreaterEqual(int(limited.headers['Retry-After']), 1)
+        verify.assert_not_called()
+        # Another email from the same address still gets through to the lookup
+        self.assertEqual(other_email.status_code, 401)
+
+    def test_busy_pool_returns_503(self):
+        with patch.object(self.hasher, 'verify', side_effect=PasswordHasherBusy('busy')):
+            response = self.login('secret')
+        self.assertEqual(response.status_code, 503)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import mongomock
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app.algorithms.pipeline import CandidateGenerator, RecommendationPipeline
+from app.tests.query_counter import bind_route_collections
+from main import create_app
+
+
+def weighted_sum(movie_ids, scores, movies, weights, context):
+    return scores @ weights
+
+
+class TestRecommendationPipeline(unittest.TestCase):
+    """Test cases for the staged recommendation pipeline."""
+
+    def make_pipeline(self, generators, budgets=None, concurrency=16):
+        documents = {movie_id: {'_id': movie_id} for movie_id in ('a', 'b', 'c', 'd')}
+        return RecommendationPipeline(
+            generators,
+            hydrate=lambda ids: [documents[movie_id] for movie_id in ids if movie_id in documents],
+            rank=weighted_sum,
+            budgets=budgets or {'generate': 1.0},
+            concurrency=concurrency,
+        )
+
+    def test_merges_filters_and_ranks(self):
+        pipeline = self.make_pipeline([
+            CandidateGenerator('first', lambda context, limit: [('a', 10), ('b', 5), ('x', 7)]),
+            CandidateGenerator('second', lambda context, limit: [('b', 2), ('c', 1)], weight=2.0),
+        ])
+
+        result = pipeline.recommend({}, count=3, exclude={'c'})
+
+        # b: 0.5 + 2 * 1.0, a: 1.0; c is excluded and x has no document
+        self.assertEqual([movie['_id'] for movie in result.movies], ['b', 'a'])
+        self.assertEqual(result.scores, [2.5, 1.0])
+        self.assertEqual(result.sources, [['first', 'second'], ['first']])
+        self.assertEqual(set(result.timings), {'generate', 'merge', 'filter', 'hydrate', 'rank'})
+
+    def test_slow_and_failing_generators_are_skipped(self):
+        def slow(context, limit):
+            time.sleep(0.5)
+            return [('a', 1)]
+
+        def broken(context, limit):
+            raise RuntimeError('database unavailable')
+
+        pipeline = self.make_pipeline([
+            CandidateGenerator('slow', slow),
+            CandidateGenerator('broken', broken),
+            CandidateGenerator('fast', lambda context, limit: [('d', 1)]),
+        ], budgets={'generate': 0.1})
+
+        started = time.perf_counter()
+        result = pipeline.recommend({})
+
+        self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertEqual([movie['_id'] for movie in result.movies], ['d'])
+        self.assertEqual(result.timed_out, ['slow'])
+
+    def test_concurrent_requests_do_not_queue(self):
+        def slow(context, limit):
+            time.sleep(0.05)
+            return [('a', 1)]
+
+        pipeline = self.make_pipeline(
+            [CandidateGenerator(name, slow) for name in ('first', 'second', 'third', 'fourth')],
+            budgets={'generate': 0.5}, concurrency=32
+        )
+
+        # Run one after another, 32 requests' generators would take 32 x 50ms
+        with ThreadPoolExecutor(max_workers=32) as requests:
+            results = list(requests.map(lambda _: pipeline.recommend({}), range(32)))
+
+        self.assertEqual([result.timed_out for result in results], [[]] * 32)
+        self.assertTrue(all(result.movies for result in results))
+
+    def test_saturated_pool_skips_generators(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def stuck(context, limit):
+            release.wait(5)
+            return [('a', 1)]
+
+        pipeline = self.make_pipeline([
+            CandidateGenerator('stuck', stuck),
+            CandidateGenerator('fast', lambda context, limit: [('d', 1)]),
+        ], budgets={'generate': 0.05}, concurrency=1)
+
+        first, second, third = (pipeline.recommend({}) for _ in range(3))
+
+        # Each timed out generator keeps its thread, until none of the two is left
+        self.assertEqual((first.timed_out, first.skipped), (['stuck'], []))
+        self.assertEqual((second.timed_out, second.skipped), (['stuck'], ['fast']))
+        self.assertEqual((third.timed_out, third.skipped, third.movies), ([], ['stuck', 'fast'], []))
+
+        release.set()
+        time.sleep(0.1)
+        self.assertEqual(pipeline.recommend({}).skipped, [])
+
+    def test_generators_get_their_limit(self):
+        pipeline = self.make_pipeline([
+            CandidateGenerator('limited', lambda context, limit: [(movie_id, 1) for movie_id in 'abcd'[:limit]], limit=2)
+        ])
+        self.assertEqual(len(pipeline.recommend({}).movies), 2)
+
+
+class TestRecommendationRoute(unittest.TestCase):
+    """The recommendations endpoint combines every candidate generator."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().test_database
+        self.app = create_app()
+        ids = {name: ObjectId() for name in ('heat', 'thief', 'alien', 'up', 'rated', 'watched')}
+        self.db.movies.insert_many([
+            {'_id': ids['heat'], 'title': 'Heat', 'genres': ['Crime'], 'average_rating': 4.5},
+            {'_id': ids['thief'], 'title': 'Thief', 'genres': ['Crime'], 'average_rating': 3.0},
+            {'_id': ids['alien'], 'title': 'Alien', 'genres': ['Sci-Fi'], 'average_rating': 4.0},
+            {'_id': ids['up'], 'title': 'Up', 'genres': ['Animation'], 'average_rating': 4.8},
+            {'_id': ids['rated'], 'title': 'Rated', 'genres': ['Crime'], 'average_rating': 5.0},
+            {'_id': ids['watched'], 'title': 'Watched', 'genres': ['Crime'], 'average_rating': 5.0},
+        ])
+        user_id = self.db.users.insert_one({
+            'username': 'tester',
+            'preferences': {'genres': ['Crime'], 'directors': [], 'actors': []},
+        }).inserted_id
+        self.db.watchlist.insert_one({'user_id': str(user_id), 'movie_id': str(ids['watched']), 'added_at': datetime.now()})
+        self.db.ratings.insert_one({'user_id': str(user_id), 'movie_id': str(ids['rated']), 'rating': 5})
+        self.db.recommendations.insert_one({
+            'user_id': str(user_id), 'movies': [{'movie_id': str(ids['alien']), 'score': 4.9}]
+        })
+        self.db.movie_neighbours.insert_one({
+            'movie_id': str(ids['watched']), 'neighbours': [{'movie_id': str(ids['thief']), 'score': 0.9}]
+        })
+
+        with self.app.app_context():
+            self.token = create_access_token(identity=str(user_id))
+
+    def test_candidates_from_every_generator(self):
+        with bind_route_collections(self.db):
+            response = self.app.test_client().get(
+                '/api/recommendations', headers={'Authorization': f'Bearer {self.token}'}
+            )
+
+        titles = [movie['title'] for movie in response.get_json()]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(titles), {'Heat', 'Thief', 'Alien', 'Up'})
+        # Matching the preferences and neighbouring the watchlist beats either alone
+        self.assertEqual(titles[0], 'Thief')
+        self.assertIn('rec-generate', response.headers['Server-Timing'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import random
+import unittest
+
+import mongomock
+import numpy as np
+
+from app.algorithms.collaborative_filtering import CollaborativeFiltering
+from app.workers.precompute import load_ratings, normalize_rows, precompute_recommendations, score_block
+
+
+def make_ratings(users=30, movies=40, per_user=8, seed=3):
+    rng = random.Random(seed)
+    return [
+        {'user_id': f'u{user}', 'movie_id': f'm{movie}', 'rating': float(rng.randint(1, 5))}
+        for user in range(users)
+        for movie in rng.sample(range(movies), per_user)
+    ]
+
+
+class TestPrecomputeRecommendations(unittest.TestCase):
+    """Test cases for the recommendation precompute job."""
+
+    def setUp(self):
+        db = mongomock.MongoClient().test_database
+        self.ratings = make_ratings()
+        db.ratings.insert_many([dict(rating) for rating in self.ratings])
+        self.collections = {'ratings': db.ratings, 'recommendations': db.recommendations}
+
+    def stored(self):
+        return {
+            doc['user_id']: [(movie['movie_id'], movie['score']) for movie in doc['movies']]
+            for doc in self.collections['recommendations'].find()
+        }
+
+    def test_matches_collaborative_filtering(self):
+        precompute_recommendations(self.collections, workers=1, block_size=7, count=10)
+        stored = self.stored()
+
+        cf = CollaborativeFiltering(self.ratings)
+        cf.build_matrix()
+        for user_id in ('u0', 'u7', 'u29'):
+            expected = cf.get_recommendations(user_id, n_recommendations=10)
+            self.assertEqual(len(stored[user_id]), len(expected))
+            expected_scores = dict(expected)
+            for (movie_id, score), (_, expected_score) in zip(stored[user_id], expected):
+                # Movies may swap places on tied scores, but the scores are the same
+                self.assertAlmostEqual(score, expected_score, places=3)
+                if movie_id in expected_scores:
+                    self.assertAlmostEqual(score, expected_scores[movie_id], places=3)
+
+    def test_rated_movies_are_excluded(self):
+        precompute_recommendations(self.collections, workers=1, count=50)
+
+        rated = {(rating['user_id'], rating['movie_id']) for rating in self.ratings}
+        for user_id, movies in self.stored().items():
+            self.assertTrue(movies)
+            self.assertFalse(any((user_id, movie_id) in rated for movie_id, _ in movies))
+
+    def test_worker_processes_give_the_same_result(self):
+        precompute_recommendations(self.collections, workers=1, block_size=8, count=10)
+        sequential = self.stored()
+
+        stats = precompute_recommendations(self.collections, workers=2, block_size=8, count=10)
+
+        self.assertEqual(self.stored(), sequential)
+        self.assertEqual(stats['users'], 30)
+        self.assertEqual(self.collections['recommendations'].count_documents({}), 30)
+        self.assertGreater(stats['users_per_second'], 0)
+        self.assertGreater(stats['peak_rss_mb'], 0)
+
+    def test_chunks_keep_only_the_top_scores(self):
+        _, _, matrix = load_ratings(self.collections['ratings'])
+        rated = matrix.copy()
+        rated.data[:] = 1
+        args = (matrix, normalize_rows(matrix), rated, 3, 25, 5)
+
+        top, scores = score_block(*args, chunk_rows=4)
+        whole_top, whole_scores = score_block(*args, chunk_rows=22)
+
+        self.assertEqual((top.shape, top.dtype, scores.dtype), ((22, 5), np.int32, np.float32))
+        np.testing.assert_array_equal(scores, whole_scores)
+        np.testing.assert_array_equal(top, whole_top)
+
+
+if __name__ == "__main__":
+    unittest.main()
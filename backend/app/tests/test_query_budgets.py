@@ -0,0 +1,115 @@
+import unittest
+from datetime import datetime
+
+import mongomock
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app.tests.query_counter import QueryCounter, bind_route_collections
+from main import create_app
+
+# Endpoint -> most database commands it may issue, whatever the data size.
+# Budgets live here rather than in test_routes.py, which no longer imports.
+# JWT routes share the cached current user (app.users): /me, the first of them,
+# reads it and the later ones do not.
+BUDGETS = [
+    ('GET', '/api/movies', 1),
+    ('GET', '/api/movies/{movie}', 1),
+    # Usernames are stored with the ratings, so lists and reviews need no user lookups
+    ('GET', '/api/movies/{movie}/ratings', 1),
+    ('GET', '/api/movies/{movie}/ratings/summary', 1),
+    ('GET', '/api/movies/{movie}/reviews', 1),
+    ('GET', '/api/movies/{movie}/theaters', 1),
+    ('GET', '/api/movies/{movie}/similar', 1),
+    ('GET', '/api/theaters', 2),
+    ('GET', '/api/theaters/{theater}', 2),
+    ('GET', '/api/auth/me', 1),
+    ('GET', '/api/users/ratings', 2),
+    ('GET', '/api/users/watchlist', 2),
+    # Ratings, watchlist, four candidate generators (run in parallel) and one hydrate query
+    ('GET', '/api/recommendations', 7),
+    ('GET', '/api/recommendations/genre/Drama', 1),
+    # Movie, the write (returning the rating it replaced) and the star counts
+    ('POST', '/api/movies/{movie}/rate', 3),
+    ('POST', '/api/users/watchlist/{other_movie}', 2),
+    ('DELETE', '/api/users/watchlist/{other_movie}', 1),
+]
+
+
+class TestQueryBudgets(unittest.TestCase):
+    """Each endpoint issues a bounded number of database commands, independent of data size."""
+
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client()
+
+    def create_test_data(self, db, scale):
+        """A user who rated, reviewed and watchlisted `scale` movies, each rated by `scale` users"""
+        movie_ids = [ObjectId() for _ in range(scale + 1)]
+        user_ids = [ObjectId() for _ in range(scale)]
+
+        db.movies.insert_many([
+            {'_id': movie_id, 'title': f'Movie {i}', 'year': 2000 + i, 'genres': ['Drama'],
+             'director': f'Director {i}', 'cast': [f'Actor {i}'], 'average_rating': 4.0}
+            for i, movie_id in enumerate(movie_ids)
+        ])
+        db.users.insert_many([
+            {'_id': user_id, 'username': f'user{i}', 'email': f'user{i}@example.com',
+             'preferences': {'genres': ['Drama'], 'directors': [], 'actors': []},
+             'preferences_updated_at': datetime.now().isoformat()}
+            for i, user_id in enumerate(user_ids)
+        ])
+        db.watchlist.insert_many([
+            {'user_id': str(user_id), 'movie_id': str(movie_id), 'added_at': datetime.now()}
+            for user_id in user_ids for movie_id in movie_ids[:scale]
+        ])
+        db.ratings.insert_many([
+            {'user_id': str(user_id), 'username': f'user{i}', 'movie_id': str(movie_id), 'rating': 5,
+             'review': 'Great', 'helpful_votes': 0, 'created_at': datetime.now().isoformat()}
+            for i, user_id in enumerate(user_ids) for movie_id in movie_ids[:scale]
+        ])
+        db.theaters.insert_many([
+            {'name': f'Theater {i}', 'address': {'city': 'Belfast'},
+             'location': {'type': 'Point', 'coordinates': [-5.93, 54.59]},
+             'current_movies': [{'movie_id': str(movie_id), 'showtimes': ['18:00']}
+                                for movie_id in movie_ids[:scale]]}
+            for i in range(scale)
+        ])
+
+        with self.app.app_context():
+            token = create_access_token(identity=str(user_ids[0]))
+        return {
+            'movie': str(movie_ids[0]),
+            'other_movie': str(movie_ids[-1]),
+            'theater': str(db.theaters.find_one()['_id']),
+            'headers': {'Authorization': f'Bearer {token}'},
+        }
+
+    def count_commands(self, scale):
+        """Commands issued by every budgeted endpoint against a dataset of the given scale"""
+        counter = QueryCounter()
+        db = counter.wrap(mongomock.MongoClient().test_database)
+        fixtures = self.create_test_data(db, scale)
+
+        counts = {}
+        with bind_route_collections(db):
+            counter.reset()
+            for method, path, limit in BUDGETS:
+                url = path.format(**fixtures)
+                with counter.budget(self, limit):
+                    start = counter.count
+                    body = {'rating': 4} if url.endswith('/rate') else None
+                    response = self.client.open(url, method=method, headers=fixtures['headers'], json=body)
+                    self.assertLess(response.status_code, 400, f"{method} {path}: {response.get_json()}")
+                    counts[(method, path)] = counter.count - start
+        return counts
+
+    def test_endpoints_stay_within_budget(self):
+        self.count_commands(scale=3)
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.assertEqual(self.count_commands(scale=2), self.count_commands(scale=12))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+import unittest
+from unittest.mock import patch
+from bson import ObjectId
+
+import mongomock
+from flask_jwt_extended import create_access_token
+
+from app.workers.rating_events import RatingEventQueue, derive_preferences
+from main import create_app
+
+
+class TestRatingEventQueue(unittest.TestCase):
+    """Test cases for the write-behind queue of rating side effects."""
+
+    def setUp(self):
+        """Set up a mock database with two movies and two users."""
+        self.client = mongomock.MongoClient()
+        self.db = self.client.test_database
+        self.collections = {
+            'users': self.db.users,
+            'movies': self.db.movies,
+            'ratings': self.db.ratings,
+            'rating_events': self.db.rating_events,
+        }
+
+        self.movie_ids = [ObjectId(), ObjectId()]
+        self.db.movies.insert_many([
+            {"_id": self.movie_ids[0], "title": "Heat", "genres": ["Crime"],
+             "director": "Michael Mann", "cast": ["Al Pacino", "Robert De Niro"]},
+            {"_id": self.movie_ids[1], "title": "Alien", "genres": ["Sci-Fi", "Horror"],
+             "director": "Ridley Scott", "cast": ["Sigourney Weaver"]},
+        ])
+        self.user_ids = [ObjectId(), ObjectId()]
+        self.db.users.insert_many([
+            {"_id": user_id, "username": f"user{i}"} for i, user_id in enumerate(self.user_ids)
+        ])
+
+        self.queue = RatingEventQueue(collections=self.collections, mode='thread', window=0)
+
+    def rate(self, user_index, movie_index, rating):
+        user_id = str(self.user_ids[user_index])
+        movie_id = str(self.movie_ids[movie_index])
+        self.db.ratings.update_one(
+            {"user_id": user_id, "movie_id": movie_id},
+            {"$set": {"rating": rating}},
+            upsert=True
+        )
+        return user_id, movie_id
+
+    def test_events_are_coalesced_per_movie_and_user(self):
+        """Several events for the same movie and user are applied once."""
+        with patch.object(self.queue, '_ensure_thread'):
+            for rating in (2.0, 4.0, 5.0):
+                self.queue.publish(*self.rate(0, 0, rating))
+            self.queue.publish(*self.rate(1, 0, 3.0))
+
+        self.assertEqual(self.queue.pending(), (1, 2))
+
+        self.queue.flush()
+
+        self.assertEqual(self.queue.pending(), (0, 0))
+        movie = self.db.movies.find_one({"_id": self.movie_ids[0]})
+        self.assertEqual(movie["average_rating"], 4.0)
+
+    def test_unrated_movies_are_reset(self):
+        """A movie whose last rating was deleted loses its average."""
+        with patch.object(self.queue, '_ensure_thread'):
+            user_id, movie_id = self.rate(0, 0, 4.0)
+            self.queue.publish(user_id, movie_id)
+            self.queue.flush()
+            self.db.ratings.delete_one({"user_id": user_id, "movie_id": movie_id})
+            self.queue.publish(user_id, movie_id)
+            self.queue.flush()
+
+        self.assertEqual(self.db.movies.find_one({"_id": self.movie_ids[0]})["average_rating"], 0)
+
+    def test_flush_updates_user_preferences(self):
+        """Preferences are derived from highly rated movies only."""
+        with patch.object(self.queue, '_ensure_thread'):
+            self.queue.publish(*self.rate(0, 0, 5.0))
+            self.queue.publish(*self.rate(0, 1, 2.0))
+        self.queue.flush()
+
+        user = self.db.users.find_one({"_id": self.user_ids[0]})
+        self.assertEqual(user["preferences"]["genres"], ["Crime"])
+        self.assertEqual(user["preferences"]["directors"], ["Michael Mann"])
+        self.assertIn("preferences_updated_at", user)
+
+    def test_flush_hooks_receive_applied_ids(self):
+        """Hooks see every movie and user of the applied batch."""
+        seen = []
+        self.queue.add_flush_hook(lambda movie_ids, user_ids: seen.append((movie_ids, user_ids)))
+        with patch.object(self.queue, '_ensure_thread'):
+            user_id, movie_id = self.rate(1, 1, 4.0)
+            self.queue.publish(user_id, movie_id)
+        self.queue.flush()
+
+        self.assertEqual(seen, [({movie_id}, {user_id})])
+
+    def test_external_mode_stores_and_drains_events(self):
+        """In external mode the worker applies stored events in batches."""
+        queue = RatingEventQueue(collections=self.collections, mode='external', batch_size=10)
+        queue.publish(*self.rate(0, 1, 4.0))
+        queue.publish(*self.rate(1, 1, 2.0))
+        self.assertEqual(self.db.rating_events.count_documents({}), 2)
+
+        self.assertEqual(queue.drain_stored_events(), 2)
+
+        self.assertEqual(self.db.rating_events.count_documents({}), 0)
+        movie = self.db.movies.find_one({"_id": self.movie_ids[1]})
+        self.assertEqual(movie["average_rating"], 3.0)
+
+    def test_external_worker_runs_the_cache_hooks(self):
+        """The worker process invalidates the caches like the in-process queue does."""
+        from app.caching import CollectionVersions
+        from app.users import user_cache
+        from app.workers import rating_events as module
+
+        queue = module.rating_events
+        versions = CollectionVersions(self.db.cache_versions)
+        user_id, movie_id = self.rate(0, 0, 4.0)
+        RatingEventQueue(collections=self.collections, mode='external').publish(user_id, movie_id)
+
+        with patch.object(queue, '_collections', self.collections), patch.object(queue, 'mode', 'thread'), \
+                patch.object(queue, 'run_worker', side_effect=queue.drain_stored_events), \
+                patch('app.caching.collection_versions', versions), \
+                patch.object(user_cache, 'invalidate') as invalidate:
+            module.run_external_worker()
+
+        self.assertEqual(self.db.cache_versions.find_one({'_id': 'movies'})['version'], 1)
+        invalidate.assert_called_once_with(user_id)
+
+    def test_derive_preferences_uses_top_three_actors(self):
+        """Only the first three cast members of each movie are counted."""
+        movies_by_id = {"m1": {"genres": [], "cast": ["A", "B", "C", "D"]}}
+        preferences = derive_preferences([{"movie_id": "m1", "rating": 4.5}], movies_by_id)
+        self.assertEqual(sorted(preferences["actors"]), ["A", "B", "C"])
+
+    def tearDown(self):
+        """Clean up after each test."""
+        self.client.drop_database("test_database")
+
+
+class TestRatingRoutesPublishEvents(unittest.TestCase):
+    """Rating routes only do the primary write and publish an event."""
+
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.db = mongomock.MongoClient().test_database
+
+        self.movie_id = ObjectId()
+        self.user_id = ObjectId()
+        self.db.movies.insert_one({"_id": self.movie_id, "title": "Heat", "average_rating": 3.0})
+        self.db.users.insert_one({"_id": self.user_id, "username": "tester"})
+
+        self.patches = [
+            patch('app.routes.ratings.movies_collection', self.db.movies),
+            patch('app.routes.ratings.users_collection', self.db.users),
+            patch('app.users.users_collection', self.db.users),
+            patch('app.routes.ratings.ratings_collection', self.db.ratings),
+            patch('app.routes.ratings.rating_summaries_collection', self.db.rating_summaries),
+            patch('app.routes.ratings.rating_deletions_collection', self.db.rating_deletions),
+            patch('app.routes.ratings.rating_events'),
+        ]
+        for p in self.patches:
+            p.start()
+
+        with self.app.app_context():
+            token = create_access_token(identity=str(self.user_id))
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_rate_movie_publishes_event(self):
+        from app.routes import ratings
+
+        response = self.client.post(
+            f'/api/movies/{self.movie_id}/rate', json={'rating': 5}, headers=self.headers
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.db.ratings.count_documents({}), 1)
+        ratings.rating_events.publish.assert_called_once_with(
+            user_id=str(self.user_id), movie_id=str(self.movie_id)
+        )
+        # The average is left to the queue
+        self.assertEqual(self.db.movies.find_one({"_id": self.movie_id})["average_rating"], 3.0)
+
+    def test_delete_rating_publishes_event(self):
+        from app.routes import ratings
+
+        rating_id = self.db.ratings.insert_one({
+            "user_id": str(self.user_id), "movie_id": str(self.movie_id), "rating": 4.0
+        }).inserted_id
+
+        response = self.client.delete(f'/api/users/ratings/{rating_id}', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        ratings.rating_events.publish.assert_called_once_with(
+            user_id=str(self.user_id), movie_id=str(self.movie_id)
+        )
+        # The snapshot export reads the tombstone
+        tombstone = self.db.rating_deletions.find_one({}, {'_id': 0, 'deleted_at': 0})
+        self.assertEqual(tombstone, {'user_id': str(self.user_id), 'movie_id': str(self.movie_id)})
+
+
+if __name__ == "__main__":
+    unittest.main()
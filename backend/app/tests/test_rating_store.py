@@ -0,0 +1,111 @@
+import unittest
+
+import mongomock
+import numpy as np
+
+from app.algorithms.rating_store import RatingStore
+from app.tests.test_precompute import make_ratings
+from app.workers.precompute import load_ratings
+
+
+class TestRatingStore(unittest.TestCase):
+    """Test cases for the columnar rating store."""
+
+    def setUp(self):
+        self.store = RatingStore()
+        for user_id, movie_id, rating in (('u1', 'm1', 4), ('u1', 'm2', 2.5), ('u2', 'm1', 5)):
+            self.store.append(user_id, movie_id, rating)
+
+    def test_ids_are_interned(self):
+        self.assertEqual(self.store.user_ids, ['u1', 'u2'])
+        self.assertEqual(self.store.movie_ids, ['m1', 'm2'])
+        users, movies, ratings = self.store.columns()
+        self.assertEqual((users.dtype, movies.dtype, ratings.dtype), (np.int32, np.int32, np.float16))
+        self.assertEqual(users.tolist(), [0, 0, 1])
+        self.assertFalse(users.flags.writeable)
+
+    def test_update_and_upsert(self):
+        self.assertTrue(self.store.update('u1', 'm2', 3.5))
+        self.assertFalse(self.store.update('u2', 'm2', 1))
+        self.store.upsert('u2', 'm2', 1)
+        self.store.upsert('u1', 'm1', 1.5)
+
+        self.assertEqual(len(self.store), 4)
+        self.assertEqual([self.store.get('u1', 'm2'), self.store.get('u2', 'm2'), self.store.get('u1', 'm1')],
+                         [3.5, 1.0, 1.5])
+        self.assertIsNone(self.store.get('u3', 'm1'))
+
+    def test_delete_moves_the_last_row(self):
+        self.assertTrue(self.store.delete('u1', 'm1'))
+        self.assertFalse(self.store.delete('u1', 'm1'))
+
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual((self.store.get('u2', 'm1'), self.store.get('u1', 'm2')), (5.0, 2.5))
+
+    def test_matrices_follow_writes(self):
+        csr = self.store.csr()
+        self.assertIs(self.store.csr(), csr)
+        self.assertEqual(csr.toarray().tolist(), [[4, 2.5], [5, 0]])
+
+        self.store.delete('u2', 'm1')
+        self.store.append('u3', 'm2', 3)
+        self.assertEqual(self.store.csr().toarray().tolist(), [[4, 2.5], [0, 0], [0, 3]])
+        self.assertEqual(self.store.csc().format, 'csc')
+        self.assertEqual(self.store.csc().toarray().tolist(), self.store.csr().toarray().tolist())
+
+    def test_matrices_are_sorted_copies(self):
+        self.store.append('u0', 'm0', 1)
+        csr = self.store.csr()
+
+        self.assertEqual((csr.dtype, csr.indptr.tolist()), (np.float32, [0, 2, 3, 4]))
+        self.assertTrue(csr.has_canonical_format)
+        self.assertFalse(np.shares_memory(csr.indices, self.store.columns()[1]))
+        self.assertEqual(self.store.csc().indptr.tolist(), [0, 2, 3, 4])
+        self.assertEqual((csr - self.store.coo().tocsr()).nnz, 0)
+
+    def test_memory_usage(self):
+        usage = self.store.memory_usage()
+        self.assertEqual((usage['ratings'], usage['users'], usage['movies']), (3, 2, 2))
+        self.assertGreater(usage['bytes_per_rating'], 0)
+        # 3 rows used of the 1024 reserved by the first append
+        self.assertEqual((usage['column_bytes'], usage['reserved_bytes']), (30, 1021 * 10))
+        self.assertEqual(usage['matrix_bytes'], 0)
+        self.store.csr()
+        self.assertGreater(self.store.memory_usage()['matrix_bytes'], 0)
+
+
+class TestLoadingFromCursor(unittest.TestCase):
+    """Ratings load from MongoDB in batches into the same matrix as before."""
+
+    def setUp(self):
+        self.ratings = make_ratings()
+        self.db = mongomock.MongoClient().test_database
+        self.db.ratings.insert_many([dict(rating) for rating in self.ratings])
+
+    def test_batches(self):
+        store = RatingStore.from_cursor(self.db.ratings.find({}, RatingStore.PROJECTION), batch_size=7)
+
+        self.assertEqual(len(store), len(self.ratings))
+        for rating in self.ratings[::17]:
+            self.assertEqual(store.get(rating['user_id'], rating['movie_id']), rating['rating'])
+        # 10 bytes per rating in the columns, plus the ids
+        self.assertLess(store.memory_usage()['bytes_per_rating'], 100)
+
+    def test_fixed_movies(self):
+        store = RatingStore.from_cursor(self.ratings, movie_ids=['m3', 'm1'])
+
+        self.assertEqual(store.movie_ids, ['m3', 'm1'])
+        self.assertEqual(len(store), sum(1 for rating in self.ratings if rating['movie_id'] in ('m1', 'm3')))
+
+    def test_load_ratings_matrix(self):
+        user_ids, movie_ids, matrix = load_ratings(self.db.ratings, batch_size=10)
+
+        self.assertEqual(matrix.shape, (len(user_ids), len(movie_ids)))
+        self.assertEqual(matrix.dtype, np.float32)
+        for rating in self.ratings[::11]:
+            row, column = user_ids.index(rating['user_id']), movie_ids.index(rating['movie_id'])
+            self.assertEqual(matrix[row, column], rating['rating'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import mongomock
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app.routes.ratings import rating_bucket, summary_increments
+from app.tests.query_counter import QueryCounter, bind_route_collections
+from app.workers.rating_summaries import rebuild_rating_summaries, remove_stale_summaries
+from main import create_app
+
+
+class AtomicCollection:
+    """Runs each command of a collection under a lock"""
+
+    def __init__(self, collection, lock):
+        self.collection = collection
+        self.lock = lock
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        def locked(*args, **kwargs):
+            with self.lock:
+                return method(*args, **kwargs)
+        return locked
+
+
+class TestSummaryIncrements(unittest.TestCase):
+    """Test cases for the star bucket arithmetic."""
+
+    def test_buckets(self):
+        self.assertEqual([rating_bucket(r) for r in (1, 1.5, 2.4, 4.5, 5)], ['1', '2', '2', '5', '5'])
+
+    def test_changes(self):
+        self.assertEqual(summary_increments(new_rating=4), {'counts.4': 1, 'count': 1, 'total': 4})
+        self.assertEqual(summary_increments(2, 4), {'counts.2': -1, 'counts.4': 1, 'total': 2})
+        self.assertEqual(summary_increments(4, 4), {})
+        self.assertEqual(summary_increments(old_rating=3), {'counts.3': -1, 'count': -1, 'total': -3})
+
+
+class TestRatingSummaryRoutes(unittest.TestCase):
+    """Rating writes keep the star counts that the summary endpoint serves."""
+
+    def setUp(self):
+        self.counter = QueryCounter()
+        self.db = self.counter.wrap(mongomock.MongoClient().test_database)
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.movie_id = str(self.db.movies.insert_one({'title': 'Heat'}).inserted_id)
+        self.user_ids = [
+            str(user_id) for user_id in self.db.users.insert_many(
+                [{'username': f'user{i}'} for i in range(3)]
+            ).inserted_ids
+        ]
+        self.bound = bind_route_collections(self.db)
+        self.bound.__enter__()
+
+    def tearDown(self):
+        self.bound.__exit__(None, None, None)
+
+    def headers(self, user_id):
+        with self.app.app_context():
+            return {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+
+    def rate(self, user_id, rating):
+        response = self.client.post(
+            f'/api/movies/{self.movie_id}/rate', headers=self.headers(user_id), json={'rating': rating}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def summary(self):
+        return self.client.get(f'/api/movies/{self.movie_id}/ratings/summary').get_json()
+
+    def test_writes_and_deletes_update_the_counts(self):
+        self.rate(self.user_ids[0], 5)
+        self.rate(self.user_ids[1], 4)
+        self.rate(self.user_ids[2], 4)
+        self.rate(self.user_ids[2], 2)
+        rating_id = str(self.db.ratings.find_one({'user_id': self.user_ids[0]})['_id'])
+        self.client.delete(f'/api/users/ratings/{rating_id}', headers=self.headers(self.user_ids[0]))
+
+        summary = self.summary()
+        self.assertEqual(summary['counts'], {'1': 0, '2': 1, '3': 0, '4': 1, '5': 0})
+        self.assertEqual((summary['count'], summary['average_rating']), (2, 3.0))
+
+    def test_rate_returns_the_average_with_the_rating(self):
+        self.assertEqual(self.rate(self.user_ids[0], 5)['new_average_rating'], 5.0)
+        self.assertEqual(self.rate(self.user_ids[1], 4)['new_average_rating'], 4.5)
+        self.assertEqual(self.rate(self.user_ids[1], 4)['new_average_rating'], 4.5)
+        self.assertEqual(self.rate(self.user_ids[0], 2)['new_average_rating'], 3.0)
+
+    def test_concurrent_rerates_count_once(self):
+        self.rate(self.user_ids[0], 1)
+        headers = self.headers(self.user_ids[0])
+        # Each command is atomic in MongoDB, not in mongomock
+        lock = threading.Lock()
+        for name in ('ratings', 'rating_summaries'):
+            patcher = patch(f'app.routes.ratings.{name}_collection', AtomicCollection(self.db[name], lock))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        def rerate(rating):
+            client = self.app.test_client()
+            return client.post(f'/api/movies/{self.movie_id}/rate', headers=headers, json={'rating': rating})
+
+        ratings = [1 + i % 5 for i in range(40)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            self.assertTrue(all(response.status_code == 200 for response in executor.map(rerate, ratings)))
+
+        summary = self.summary()
+        final = self.db.ratings.find_one({'user_id': self.user_ids[0]})['rating']
+        self.assertEqual(summary['count'], 1)
+        self.assertEqual(summary['counts'][str(int(final))], 1)
+        self.assertEqual(summary['average_rating'], final)
+
+    def test_summary_is_one_read(self):
+        self.rate(self.user_ids[0], 3)
+        self.counter.reset()
+        summary = self.summary()
+        self.assertEqual(self.counter.count, 1)
+        self.assertEqual(summary['counts']['3'], 1)
+
+    def test_unrated_movie(self):
+        self.assertEqual(self.summary()['count'], 0)
+
+    def test_matches_a_rebuild(self):
+        for user_id, rating in zip(self.user_ids, (5, 3.5, 1)):
+            self.rate(user_id, rating)
+        incremental = self.db.rating_summaries.find_one()
+
+        self.db.rating_summaries.delete_many({})
+        stats = rebuild_rating_summaries({'ratings': self.db.ratings, 'rating_summaries': self.db.rating_summaries})
+
+        self.assertEqual(stats['movies'], 1)
+        self.assertEqual(self.db.rating_summaries.find_one(), incremental)
+
+    def test_rebuild_removes_stale_summaries_in_batches(self):
+        self.rate(self.user_ids[0], 4)
+        self.db.rating_summaries.insert_many(
+            [{'_id': f'gone{i}', 'counts': {'3': 1}, 'count': 1, 'total': 3} for i in range(5)]
+            + [{'_id': 'emptied', 'counts': {'3': 0}, 'count': 0, 'total': 0}]
+        )
+
+        stats = rebuild_rating_summaries({'ratings': self.db.ratings, 'rating_summaries': self.db.rating_summaries},
+                                         batch_size=2)
+
+        self.assertEqual(stats['removed'], 6)
+        self.assertEqual([s['_id'] for s in self.db.rating_summaries.find()], [self.movie_id])
+
+    def test_stale_removal_keeps_movies_rated_since(self):
+        self.rate(self.user_ids[0], 4)
+        # As if the first rating landed after the aggregation ran
+        removed = remove_stale_summaries(self.db.ratings, self.db.rating_summaries, rebuilt={})
+
+        self.assertEqual(removed, 0)
+        self.assertEqual(self.summary()['count'], 1)
+
+
+class TestMovieRatingsPages(unittest.TestCase):
+    """Test cases for the paginated ratings list."""
+
+    def setUp(self):
+        self.counter = QueryCounter()
+        self.db = self.counter.wrap(mongomock.MongoClient().test_database)
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.movie_id = str(ObjectId())
+        old_author = str(self.db.users.insert_one({'username': 'old'}).inserted_id)
+        started = datetime(2024, 1, 1)
+        self.db.ratings.insert_many([
+            {'user_id': str(ObjectId()), 'username': f'user{i}', 'movie_id': self.movie_id, 'rating': 4,
+             'created_at': (started + timedelta(days=i)).isoformat()}
+            for i in range(4)
+        ] + [
+            # Written before usernames were stored with the rating
+            {'user_id': old_author, 'movie_id': self.movie_id, 'rating': 2,
+             'created_at': (started - timedelta(days=1)).isoformat()},
+        ])
+
+    def test_pages_follow_the_cursor(self):
+        names, cursor, pages = [], None, 0
+        with bind_route_collections(self.db):
+            self.counter.reset()
+            while True:
+                query = '?limit=2' + (f'&cursor={cursor}' if cursor else '')
+                response = self.client.get(f'/api/movies/{self.movie_id}/ratings{query}')
+                self.assertEqual(response.status_code, 200)
+                names += [rating['username'] for rating in response.get_json()]
+                pages += 1
+                cursor = response.headers.get('X-Next-Cursor')
+                if not cursor:
+                    break
+
+        self.assertEqual(names, ['user3', 'user2', 'user1', 'user0', 'old'])
+        # Only the last page has an author to look up
+        self.assertEqual(self.counter.count, pages + 1)
+
+    def test_invalid_cursor(self):
+        with bind_route_collections(self.db):
+            response = self.client.get(f'/api/movies/{self.movie_id}/ratings?cursor=nonsense')
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import mongomock
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app.models.theater import create_indexes
+from app.models.ratings import create_review_indexes
+from app.tests.query_counter import QueryCounter, bind_route_collections
+from app.workers.backfill_reviews import backfill_reviews
+from main import create_app
+
+
+class TestReviewsFeed(unittest.TestCase):
+    """Test cases for the paginated reviews feed."""
+
+    def setUp(self):
+        self.counter = QueryCounter()
+        self.db = self.counter.wrap(mongomock.MongoClient().test_database)
+        create_review_indexes(self.db.ratings)
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.movie_id = str(ObjectId())
+        self.user_id = str(self.db.users.insert_one({'username': 'tester'}).inserted_id)
+
+        started = datetime(2024, 1, 1)
+        self.db.ratings.insert_many([
+            {'user_id': str(ObjectId()), 'username': f'user{i}', 'movie_id': self.movie_id, 'rating': 4,
+             'review': f'Review {i}', 'helpful_votes': [3, 9, 0, 9, 5][i],
+             'created_at': (started + timedelta(days=i)).isoformat()}
+            for i in range(5)
+        ] + [
+            # Ratings without a review are not in the feed
+            {'user_id': str(ObjectId()), 'username': 'quiet', 'movie_id': self.movie_id, 'rating': 2,
+             'review': '', 'helpful_votes': 0, 'created_at': started.isoformat()},
+            {'user_id': str(ObjectId()), 'username': 'quieter', 'movie_id': self.movie_id, 'rating': 2,
+             'helpful_votes': 0, 'created_at': started.isoformat()},
+        ])
+
+    def read_all(self, sort):
+        reviews, cursor, pages = [], None, 0
+        while True:
+            query = f'?sort={sort}&limit=2' + (f'&cursor={cursor}' if cursor else '')
+            response = self.client.get(f'/api/movies/{self.movie_id}/reviews{query}')
+            self.assertEqual(response.status_code, 200)
+            reviews += response.get_json()
+            pages += 1
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                return reviews, pages
+
+    def test_newest_first(self):
+        with bind_route_collections(self.db):
+            reviews, pages = self.read_all('newest')
+
+        self.assertEqual(pages, 3)
+        self.assertEqual([review['review'] for review in reviews], [f'Review {i}' for i in range(4, -1, -1)])
+
+    def test_most_helpful_first(self):
+        with bind_route_collections(self.db):
+            reviews, _ = self.read_all('helpful')
+
+        self.assertEqual([review['helpful_votes'] for review in reviews], [9, 9, 5, 3, 0])
+        self.assertEqual(len({review['id'] for review in reviews}), 5)
+
+    def test_page_is_one_query(self):
+        with bind_route_collections(self.db):
+            self.counter.reset()
+            response = self.client.get(f'/api/movies/{self.movie_id}/reviews')
+
+        self.assertEqual(response.get_json()[0]['username'], 'user4')
+        self.assertEqual(self.counter.count, 1)
+
+    def test_older_reviews_look_up_the_author(self):
+        self.db.ratings.insert_one({
+            'user_id': self.user_id, 'movie_id': self.movie_id, 'rating': 5, 'review': 'Old',
+            'helpful_votes': 0, 'created_at': datetime(2025, 1, 1).isoformat()
+        })
+        with bind_route_collections(self.db):
+            response = self.client.get(f'/api/movies/{self.movie_id}/reviews?limit=1')
+
+        self.assertEqual(response.get_json()[0]['username'], 'tester')
+
+    def test_bad_parameters(self):
+        with bind_route_collections(self.db):
+            bad_sort = self.client.get(f'/api/movies/{self.movie_id}/reviews?sort=random')
+            bad_cursor = self.client.get(f'/api/movies/{self.movie_id}/reviews?cursor=nonsense')
+        self.assertEqual(bad_sort.status_code, 400)
+        self.assertEqual(bad_cursor.status_code, 400)
+
+    def test_indexes_only_cover_reviews(self):
+        indexes = self.db.ratings.index_information()
+        self.assertEqual(indexes['reviews_newest']['partialFilterExpression'], {'review': {'$gt': ''}})
+        self.assertIn('reviews_helpful', indexes)
+
+    def test_indexes_are_created_on_the_app_database(self):
+        app_db = mongomock.MongoClient().app_database
+        with patch('app.models.theater.get_app_database', return_value=app_db):
+            create_indexes()
+
+        self.assertIn('reviews_newest', app_db.ratings.index_information())
+        self.assertIn('user_id_1_added_at_1_movie_id_1', app_db.watchlist.index_information())
+
+
+class TestReviewAuthors(unittest.TestCase):
+    """The author's name is written with the review and follows renames."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().test_database
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.movie_id = str(self.db.movies.insert_one({'title': 'Heat'}).inserted_id)
+        self.user_id = str(self.db.users.insert_one({
+            'username': 'tester', 'email': 'tester@example.com'
+        }).inserted_id)
+        with self.app.app_context():
+            self.headers = {'Authorization': f'Bearer {create_access_token(identity=self.user_id)}'}
+
+    def test_rating_stores_the_username(self):
+        with bind_route_collections(self.db):
+            response = self.client.post(
+                f'/api/movies/{self.movie_id}/rate', headers=self.headers, json={'rating': 4, 'review': ' Tense '}
+            )
+        self.assertEqual(response.status_code, 200)
+
+        rating = self.db.ratings.find_one()
+        self.assertEqual((rating['username'], rating['review'], rating['helpful_votes']), ('tester', 'Tense', 0))
+
+    def test_one_rate_route(self):
+        rules = [rule for rule in self.app.url_map.iter_rules() if rule.rule == '/api/movies/<movie_id>/rate']
+        self.assertEqual([rule.endpoint for rule in rules], ['ratings.rate_movie'])
+
+    def test_rename_updates_reviews(self):
+        with bind_route_collections(self.db):
+            self.client.post(f'/api/movies/{self.movie_id}/rate', headers=self.headers, json={'rating': 4})
+            response = self.client.put(
+                '/api/auth/users/profile', headers=self.headers,
+                json={'username': 'renamed', 'email': 'tester@example.com'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.db.ratings.find_one()['username'], 'renamed')
+
+
+class TestReviewBackfill(unittest.TestCase):
+    """Test cases for filling in the feed fields of older ratings."""
+
+    def test_backfill(self):
+        db = mongomock.MongoClient().test_database
+        user_id = str(db.users.insert_one({'username': 'tester'}).inserted_id)
+        created = datetime(2024, 1, 1)
+        db.ratings.insert_many([
+            {'user_id': user_id, 'movie_id': 'm1', 'rating': 4, 'review': 'Good', 'created_at': created},
+            {'user_id': 'gone', 'movie_id': 'm2', 'rating': 3, 'created_at': created.isoformat()},
+            {'user_id': user_id, 'username': 'tester', 'movie_id': 'm3', 'rating': 5,
+             'helpful_votes': 2, 'created_at': created.isoformat()},
+        ])
+        collections = {'users': db.users, 'ratings': db.ratings}
+
+        stats = backfill_reviews(collections, batch_size=1)
+
+        self.assertEqual((stats['ratings'], stats['updated']), (2, 2))
+        first = db.ratings.find_one({'movie_id': 'm1'})
+        self.assertEqual((first['username'], first['helpful_votes'], first['created_at']),
+                         ('tester', 0, created.isoformat()))
+        self.assertEqual(db.ratings.find_one({'movie_id': 'm2'})['username'], '')
+        self.assertEqual(backfill_reviews(collections)['ratings'], 0)
+
+    def test_missing_created_at(self):
+        db = mongomock.MongoClient().test_database
+        rating_id = ObjectId.from_datetime(datetime(2023, 5, 1, 12, 30))
+        db.ratings.insert_many([
+            {'user_id': 'u1', 'username': 'a', 'helpful_votes': 0, 'movie_id': 'm1', 'rating': 4,
+             'updated_at': '2024-02-01T10:00:00'},
+            {'_id': rating_id, 'user_id': 'u1', 'username': 'a', 'helpful_votes': 0, 'movie_id': 'm2', 'rating': 4},
+        ])
+
+        stats = backfill_reviews({'users': db.users, 'ratings': db.ratings})
+
+        self.assertEqual(stats['updated'], 2)
+        self.assertEqual(db.ratings.find_one({'movie_id': 'm1'})['created_at'], '2024-02-01T10:00:00')
+        self.assertEqual(db.ratings.find_one({'movie_id': 'm2'})['created_at'], '2023-05-01T12:30:00')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from datetime import datetime
+
+import mongomock
+from bson import ObjectId
+from flask import Flask
+from flask_jwt_extended import create_access_token
+
+from app.serialization import MongoJSONProvider, OrjsonProvider, orjson
+from app.tests.query_counter import bind_route_collections
+from main import create_app
+
+
+class TestJSONProviders(unittest.TestCase):
+    """Test cases for the Mongo-aware JSON providers."""
+
+    document = {
+        '_id': ObjectId('0123456789ab0123456789ab'),
+        'title': 'Amélie',
+        'created_at': datetime(2024, 1, 2, 3, 4, 5),
+        'genres': ['Comedy', 'Romance'],
+        'average_rating': 4.5,
+    }
+
+    def encode(self, provider_class):
+        app = Flask(__name__)
+        app.json = provider_class(app)
+        with app.app_context():
+            return app.json.loads(app.json.response([self.document]).get_data())
+
+    def test_object_ids_and_dates(self):
+        decoded = self.encode(MongoJSONProvider)[0]
+        self.assertEqual(decoded['_id'], '0123456789ab0123456789ab')
+        self.assertEqual(decoded['created_at'], 'Tue, 02 Jan 2024 03:04:05 GMT')
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_matches_stdlib(self):
+        self.assertEqual(self.encode(OrjsonProvider), self.encode(MongoJSONProvider))
+        self.assertIsInstance(create_app().json, OrjsonProvider)
+
+
+class TestRouteDocuments(unittest.TestCase):
+    """Routes return documents as they come from the database."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().test_database
+        self.app = create_app()
+        self.client = self.app.test_client()
+
+    def test_theaters_have_string_ids(self):
+        movie_id = self.db.movies.insert_one({'title': 'Heat', 'year': 1995, 'cast': ['Al Pacino']}).inserted_id
+        theater_id = self.db.theaters.insert_one({
+            'name': 'QFT', 'current_movies': [{'movie_id': str(movie_id), 'showtimes': []}]
+        }).inserted_id
+
+        with bind_route_collections(self.db):
+            theaters = self.client.get('/api/theaters').get_json()
+
+        self.assertEqual(theaters[0]['_id'], str(theater_id))
+        details = theaters[0]['current_movies'][0]['movie_details']
+        self.assertEqual(details['_id'], str(movie_id))
+        self.assertEqual(details['title'], 'Heat')
+
+    def test_profile_update_does_not_return_password_hash(self):
+        user_id = self.db.users.insert_one({
+            'username': 'old', 'email': 'old@example.com', 'password_hash': 'secret-hash'
+        }).inserted_id
+        with self.app.app_context():
+            token = create_access_token(identity=str(user_id))
+
+        with bind_route_collections(self.db):
+            response = self.client.put(
+                '/api/auth/users/profile', json={'username': 'new', 'email': 'new@example.com'},
+                headers={'Authorization': f'Bearer {token}'}
+            )
+
+        user = response.get_json()
+        self.assertEqual(user['_id'], str(user_id))
+        self.assertEqual(user['username'], 'new')
+        self.assertNotIn('password_hash', user)
+
+
+if __name__ == "__main__":
+    unittest.main()
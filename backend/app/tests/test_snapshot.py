@@ -0,0 +1,185 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import mongomock
+import numpy as np
+
+from app.algorithms.snapshot import RatingSnapshot, open_snapshot
+from app.caching import CollectionVersions
+from app.tests.test_precompute import make_ratings
+from app.workers.export_snapshot import export_snapshot
+from app.workers.neighbours import build_movie_neighbours
+from app.workers.precompute import load_ratings, precompute_recommendations
+
+
+class TestSnapshotExport(unittest.TestCase):
+    """Test cases for the columnar ratings snapshot."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='snapshot-test-')
+        self.db = mongomock.MongoClient().test_database
+        written = (datetime.now() - timedelta(days=1)).isoformat()
+        self.db.ratings.insert_many([dict(rating, updated_at=written) for rating in make_ratings()])
+        self.db.movies.insert_many([
+            {'_id': f'm{i}', 'title': f'Movie {i}', 'genres': ['Drama', 'Comedy'][i % 2:], 'director': f'D{i % 3}'}
+            for i in range(40)
+        ])
+        self.collections = {'movies': self.db.movies, 'ratings': self.db.ratings,
+                            'recommendations': self.db.recommendations, 'movie_neighbours': self.db.movie_neighbours,
+                            'rating_deletions': self.db.rating_deletions}
+        self.versions = patch('app.caching.collection_versions', CollectionVersions(self.db.cache_versions))
+        self.versions.start()
+
+    def tearDown(self):
+        self.versions.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def export(self, **kwargs):
+        return export_snapshot(self.collections, self.directory, batch_size=16, **kwargs)
+
+    def assertMatchesCollection(self):
+        snapshot_users, snapshot_movies, snapshot_matrix = open_snapshot(self.directory).load_ratings()
+        user_ids, movie_ids, matrix = load_ratings(self.db.ratings)
+        rows = [snapshot_users.index(user_id) for user_id in user_ids]
+        columns = [snapshot_movies.index(movie_id) for movie_id in movie_ids]
+        self.assertEqual(snapshot_matrix[rows][:, columns].toarray().tolist(), matrix.toarray().tolist())
+
+    def test_full_export_is_memory_mapped(self):
+        stats = self.export()
+
+        self.assertEqual((stats['mode'], stats['ratings'], stats['shards']), ('full', 240, 1))
+        users, movies, ratings = open_snapshot(self.directory).columns()
+        self.assertIsInstance(users, np.memmap)
+        self.assertEqual((users.dtype, movies.dtype, ratings.dtype), (np.int32, np.int32, np.float16))
+        self.assertMatchesCollection()
+
+    def test_incremental_export_appends_changes(self):
+        self.export()
+        now = datetime.now().isoformat()
+        self.db.ratings.update_one({'user_id': 'u0'}, {'$set': {'rating': 1.5, 'updated_at': now}})
+        self.db.ratings.insert_one({'user_id': 'new', 'movie_id': 'm1', 'rating': 4.0, 'updated_at': now})
+
+        stats = self.export()
+
+        self.assertEqual((stats['mode'], stats['exported'], stats['ratings'], stats['shards']),
+                         ('incremental', 2, 241, 2))
+        self.assertMatchesCollection()
+        self.assertEqual(self.export()['exported'], 0)
+
+    def delete_rating(self, user_id, movie_id):
+        # What the ratings route does
+        self.db.ratings.delete_one({'user_id': user_id, 'movie_id': movie_id})
+        self.db.rating_deletions.insert_one({'user_id': user_id, 'movie_id': movie_id, 'deleted_at': datetime.now()})
+
+    def test_deletes_are_exported_from_tombstones(self):
+        self.export()
+        rating = self.db.ratings.find_one({'user_id': 'u3'})
+        self.delete_rating(rating['user_id'], rating['movie_id'])
+
+        stats = self.export()
+
+        self.assertEqual((stats['mode'], stats['deleted'], stats['ratings']), ('incremental', 1, 239))
+        self.assertMatchesCollection()
+
+    def test_delete_then_insert_keeps_both_changes(self):
+        self.export()
+        first, second = self.db.ratings.find({'user_id': 'u3'}).limit(2)
+        self.delete_rating(first['user_id'], first['movie_id'])
+        self.db.ratings.insert_one({'user_id': 'new', 'movie_id': 'm1', 'rating': 4.0,
+                                    'updated_at': datetime.now().isoformat()})
+        # Deleted and rated again before the export: the rating wins over its tombstone
+        self.delete_rating(second['user_id'], second['movie_id'])
+        self.db.ratings.insert_one(dict(second, rating=1.0, updated_at=datetime.now().isoformat()))
+
+        stats = self.export()
+
+        self.assertEqual((stats['mode'], stats['deleted'], stats['ratings']), ('incremental', 1, 240))
+        self.assertMatchesCollection()
+
+    def test_writes_after_the_watermark_wait_for_the_next_export(self):
+        self.export()
+        later = (datetime.now() + timedelta(minutes=5)).isoformat()
+        self.db.ratings.insert_one({'user_id': 'new', 'movie_id': 'm1', 'rating': 4.0, 'updated_at': later})
+
+        stats = self.export()
+
+        self.assertEqual((stats['mode'], stats['exported'], stats['ratings']), ('incremental', 0, 240))
+
+    def test_expired_tombstones_start_a_full_export(self):
+        self.export()
+        with patch('app.workers.export_snapshot.RATING_DELETIONS_TTL', 0):
+            stats = self.export()
+
+        self.assertEqual((stats['mode'], stats['reason']), ('full', 'deletions since the last export have expired'))
+
+    def test_shards_are_merged(self):
+        self.export()
+        for rating in (2.0, 3.0):
+            self.db.ratings.update_one({'user_id': 'u5'}, {'$set': {'rating': rating,
+                                                                    'updated_at': datetime.now().isoformat()}})
+            stats = self.export(max_shards=2)
+
+        self.assertTrue(stats['compacted'])
+        self.assertEqual(stats['shards'], 1)
+        self.assertEqual(sorted(name for name in os.listdir(self.directory) if name.startswith('ratings-')),
+                         [open_snapshot(self.directory).manifest['shards'][0]['name']])
+        self.assertMatchesCollection()
+
+    def test_incremental_exports_stream_the_shards(self):
+        self.export()
+        # Counting and merging never concatenate the shards in memory
+        with patch.object(RatingSnapshot, 'columns', side_effect=AssertionError('columns() loads every shard')):
+            for rating in (2.0, 3.0):
+                self.db.ratings.update_one({'user_id': 'u5'}, {'$set': {'rating': rating,
+                                                                        'updated_at': datetime.now().isoformat()}})
+                self.db.ratings.insert_one({'user_id': f'new{rating}', 'movie_id': 'm2', 'rating': rating,
+                                            'updated_at': datetime.now().isoformat()})
+                stats = self.export(max_shards=2)
+            self.assertEqual((stats['ratings'], stats['compacted']), (242, True))
+            self.assertMatchesCollection()
+
+    def test_live_chunks_match_the_merged_columns(self):
+        self.export()
+        now = datetime.now().isoformat()
+        self.db.ratings.update_many({'user_id': {'$in': ['u1', 'u2']}}, {'$set': {'rating': 0.5, 'updated_at': now}})
+        self.export()
+        snapshot = open_snapshot(self.directory)
+
+        chunks = list(snapshot.live_chunks(chunk_rows=50))
+        streamed = set(zip(*(np.concatenate(column).tolist() for column in zip(*chunks))))
+
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(streamed, set(zip(*(column.tolist() for column in snapshot.columns()))))
+
+    def test_movie_features(self):
+        self.export()
+        snapshot = open_snapshot(self.directory)
+        names, features = snapshot.movie_features()
+
+        self.assertEqual(features.shape, (len(snapshot.movie_ids), len(names)))
+        row = features[snapshot.movie_ids.index('m1')].toarray()[0]
+        self.assertEqual({names[i] for i in np.flatnonzero(row)}, {'genre:Comedy', 'director:D1'})
+
+    def test_training_jobs_read_the_snapshot(self):
+        self.export()
+        precompute_recommendations(self.collections, workers=1, count=5)
+        from_mongo = {doc['user_id']: doc['movies'] for doc in self.db.recommendations.find()}
+        build_movie_neighbours(self.collections, count=5)
+        neighbours_from_mongo = {doc['movie_id']: doc['neighbours'] for doc in self.db.movie_neighbours.find()}
+        self.db.recommendations.delete_many({})
+        self.db.movie_neighbours.delete_many({})
+
+        precompute_recommendations(self.collections, workers=1, count=5, snapshot=self.directory)
+        build_movie_neighbours(self.collections, count=5, snapshot=self.directory)
+
+        self.assertEqual({doc['user_id']: doc['movies'] for doc in self.db.recommendations.find()}, from_mongo)
+        self.assertEqual({doc['movie_id']: doc['neighbours'] for doc in self.db.movie_neighbours.find()},
+                         neighbours_from_mongo)
+
+
+if __name__ == "__main__":
+    unittest.main()
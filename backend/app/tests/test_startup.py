@@ -0,0 +1,40 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# What a fresh worker has loaded and started once it answered its first request
+CHECK = """
+import json, sys, threading
+from main import create_app
+app = create_app()
+status = app.test_client().get('/api/test').status_code
+print(json.dumps({
+    'status': status,
+    'modules': [name for name in ('numpy', 'scipy', 'pandas', 'sklearn', 'requests') if name in sys.modules],
+    'threads': [thread.name for thread in threading.enumerate() if thread is not threading.main_thread()],
+}))
+"""
+
+
+class TestStartup(unittest.TestCase):
+    """Creating the app loads no scientific stack and does no I/O."""
+
+    def test_create_app_is_light(self):
+        output = subprocess.run(
+            [sys.executable, '-c', CHECK], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+            env={**os.environ, 'WARMUP_MODE': 'off'},
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+
+        self.assertEqual(result['status'], 200)
+        self.assertEqual(result['modules'], [])
+        # MongoDB clients connect (and start their monitor threads) on first use
+        self.assertEqual(result['threads'], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
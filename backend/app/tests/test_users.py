@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import patch
+
+import mongomock
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app.tests.query_counter import QueryCounter, bind_route_collections
+from app.users import UserCache, invalidate_rated_users, user_cache
+from main import create_app
+
+
+class TestUserCache(unittest.TestCase):
+    """Test cases for the process-level user cache."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().test_database
+        self.user_id = str(self.db.users.insert_one({
+            'username': 'tester', 'email': 'tester@example.com', 'password_hash': 'secret'
+        }).inserted_id)
+        self.patch = patch('app.users.users_collection', self.db.users)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_projects_out_credentials(self):
+        user = UserCache().get(self.user_id)
+        self.assertEqual(user['username'], 'tester')
+        self.assertNotIn('password_hash', user)
+
+    def test_missing_and_invalid_users_are_not_cached(self):
+        cache = UserCache()
+        user_id = ObjectId()
+        self.assertIsNone(cache.get(user_id))
+        self.assertIsNone(cache.get('not-an-id'))
+
+        self.db.users.insert_one({'_id': user_id, 'username': 'late'})
+        self.assertEqual(cache.get(user_id)['username'], 'late')
+
+    def test_entries_expire(self):
+        cache = UserCache(ttl=0)
+        cache.get(self.user_id)
+        self.db.users.update_one({}, {'$set': {'username': 'renamed'}})
+        self.assertEqual(cache.get(self.user_id)['username'], 'renamed')
+
+    def test_least_recently_used_entries_are_dropped(self):
+        cache = UserCache(max_entries=1)
+        other_id = str(self.db.users.insert_one({'username': 'other'}).inserted_id)
+        cache.get(self.user_id)
+        cache.get(other_id)
+        self.assertEqual(len(cache._entries), 1)
+
+
+class TestCurrentUser(unittest.TestCase):
+    """JWT routes share one user read, and updates are seen straight away."""
+
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.counter = QueryCounter()
+        self.db = self.counter.wrap(mongomock.MongoClient().test_database)
+        self.user_id = str(self.db.users.insert_one({
+            'username': 'tester', 'email': 'tester@example.com',
+            'preferences': {'genres': ['Drama'], 'directors': [], 'actors': []}
+        }).inserted_id)
+        self.bound = bind_route_collections(self.db)
+        self.bound.__enter__()
+
+    def tearDown(self):
+        self.bound.__exit__(None, None, None)
+
+    def headers(self, user_id=None):
+        with self.app.app_context():
+            token = create_access_token(identity=user_id or self.user_id)
+        return {'Authorization': f'Bearer {token}'}
+
+    def user_reads(self):
+        return sum(1 for command in self.counter.commands if command[0] == 'users')
+
+    def test_user_is_read_once_across_requests(self):
+        self.counter.reset()
+        for path in ('/api/auth/me', '/api/users/ratings', '/api/recommendations', '/api/auth/me'):
+            response = self.client.get(path, headers=self.headers())
+            self.assertEqual(response.status_code, 200, path)
+        self.assertEqual(self.user_reads(), 1)
+
+    def test_unknown_user_is_rejected(self):
+        response = self.client.get('/api/auth/me', headers=self.headers(str(ObjectId())))
+        self.assertEqual(response.status_code, 401)
+
+    def test_profile_update_invalidates(self):
+        self.client.get('/api/auth/me', headers=self.headers())
+        response = self.client.put(
+            '/api/auth/users/profile', headers=self.headers(), json={'username': 'renamed', 'email': 'tester@example.com'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        me = self.client.get('/api/auth/me', headers=self.headers()).get_json()
+        self.assertEqual(me['username'], 'renamed')
+
+    def test_rating_events_invalidate(self):
+        self.client.get('/api/auth/me', headers=self.headers())
+        self.db.users.update_one({}, {'$set': {'preferences.genres': ['Comedy']}})
+
+        invalidate_rated_users([], [self.user_id])
+        self.assertEqual(user_cache.get(self.user_id)['preferences']['genres'], ['Comedy'])
+
+
+if __name__ == "__main__":
+    unittest.main()
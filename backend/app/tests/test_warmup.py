@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import patch
+
+import mongomock
+
+from app.tests.query_counter import QueryCounter, bind_route_collections
+from app.warmup import Warmup
+from main import create_app
+
+
+class TestWarmup(unittest.TestCase):
+    """A worker reports ready once its pool, caches and models are warm."""
+
+    def setUp(self):
+        self.counter = QueryCounter()
+        self.db = self.counter.wrap(mongomock.MongoClient().test_database)
+        self.db.movies.insert_many([
+            {'title': f'Movie {i}', 'genres': ['Drama'], 'rating': 5 + i / 10, 'popularity': i} for i in range(5)
+        ])
+        self.db.theaters.insert_one({
+            'name': 'Odeon', 'location': {'type': 'Point', 'coordinates': [-0.12, 51.5]}
+        })
+        self.bound = bind_route_collections(self.db)
+        self.bound.__enter__()
+        self.ping = patch('app.warmup.ping_database')
+        self.ping.start()
+        self.app = create_app()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.ping.stop()
+        self.bound.__exit__(None, None, None)
+
+    def test_off_is_ready_at_once(self):
+        ready = self.client.get('/health/ready')
+        self.assertEqual(ready.status_code, 200)
+        self.assertEqual(ready.get_json()['steps'], {})
+
+    def test_not_ready_until_warm(self):
+        with patch('app.warmup.WARMUP_MODE', 'background'), patch('app.warmup.Warmup.start'):
+            app = create_app()
+        client = app.test_client()
+
+        self.assertEqual(client.get('/health/ready').status_code, 503)
+        self.assertEqual(client.get('/health/live').status_code, 200)
+
+        app.extensions['warmup'].run(max_attempts=1)
+        ready = client.get('/health/ready')
+        self.assertEqual(ready.status_code, 200)
+        self.assertEqual(set(ready.get_json()['steps']),
+                         {'mongo', 'recommendations', 'precomputed', 'theaters', 'paths'})
+
+    def test_paths_are_cached(self):
+        Warmup(self.app, paths=['/api/movies']).run(max_attempts=1)
+
+        self.counter.reset()
+        self.assertEqual(self.client.get('/api/movies').status_code, 200)
+        self.assertEqual(self.counter.count, 0)
+
+    def test_background_warmup(self):
+        with patch('app.warmup.WARMUP_MODE', 'background'):
+            app = create_app()
+        warmup = app.extensions['warmup']
+        warmup._thread.join(timeout=30)
+
+        self.assertTrue(warmup.ready)
+        self.assertEqual(app.test_client().get('/health/ready').status_code, 200)
+
+    def test_precomputed_tables_are_read(self):
+        from app.routes import recommendation
+
+        self.db.recommendations.insert_one({'user_id': 'u1', 'movies': [{'movie_id': 'm1', 'score': 1.0}]})
+        self.db.movie_neighbours.insert_one({'movie_id': 'm1', 'neighbours': [{'movie_id': 'm2', 'score': 0.5}]})
+        with patch.object(recommendation, 'collaborative_candidates', wraps=recommendation.collaborative_candidates) \
+                as collaborative, \
+                patch.object(recommendation, 'watchlist_candidates', wraps=recommendation.watchlist_candidates) \
+                as neighbours:
+            self.assertTrue(Warmup(self.app, paths=[]).run(max_attempts=1))
+
+        collaborative.assert_called_once_with({'user_id': 'u1'}, 1)
+        neighbours.assert_called_once_with({'watchlist': ['m1']}, 1)
+
+    def test_blocking_mode_gives_up(self):
+        with patch('app.warmup.WARMUP_MODE', 'blocking'), patch('app.warmup.WARMUP_BLOCKING_ATTEMPTS', 2), \
+                patch('app.warmup.time.sleep'), \
+                patch('app.warmup.ping_database', side_effect=RuntimeError('no servers')) as ping:
+            with self.assertRaisesRegex(RuntimeError, 'after 2 attempts: mongo: no servers'):
+                create_app()
+        self.assertEqual(ping.call_count, 2)
+
+    def test_failures_are_retried(self):
+        warmup = Warmup(self.app, paths=[], retry_seconds=0)
+        with patch('app.warmup.ping_database', side_effect=[RuntimeError('no servers'), None]):
+            self.assertFalse(warmup.run(max_attempts=1))
+            report = warmup.report()
+            self.assertEqual((report['status'], report['error']), ('failed', 'mongo: no servers'))
+
+            self.assertTrue(warmup.run())
+        self.assertEqual(warmup.attempts, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+
+import mongomock
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app.models.user import create_watchlist_indexes
+from app.tests.query_counter import bind_route_collections
+from app.workers.migrate_watchlist import migrate_watchlists
+from main import create_app
+
+
+class TestWatchlistRoutes(unittest.TestCase):
+    """Test cases for the watchlist collection endpoints."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().test_database
+        create_watchlist_indexes(self.db.watchlist)
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.movie_ids = [str(movie_id) for movie_id in self.db.movies.insert_many([
+            {'title': f'Movie {i}', 'year': 2000 + i, 'genres': ['Drama']} for i in range(5)
+        ]).inserted_ids]
+        self.user_id = str(self.db.users.insert_one({'username': 'tester'}).inserted_id)
+        with self.app.app_context():
+            self.headers = {'Authorization': f'Bearer {create_access_token(identity=self.user_id)}'}
+
+    def add(self, movie_id):
+        return self.client.post(f'/api/users/watchlist/{movie_id}', headers=self.headers)
+
+    def test_add_is_idempotent(self):
+        with bind_route_collections(self.db):
+            first = self.add(self.movie_ids[0])
+            second = self.add(self.movie_ids[0])
+            missing = self.add(str(ObjectId()))
+
+        self.assertEqual(first.get_json()['message'], 'Movie added to watchlist successfully')
+        self.assertEqual(second.get_json()['message'], 'Movie already in watchlist')
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(self.db.watchlist.count_documents({'user_id': self.user_id}), 1)
+
+    def test_pages_follow_the_cursor(self):
+        with bind_route_collections(self.db):
+            for movie_id in self.movie_ids:
+                self.add(movie_id)
+
+            titles, cursor, pages = [], None, 0
+            while True:
+                query = f'?limit=2&cursor={cursor}' if cursor else '?limit=2'
+                response = self.client.get(f'/api/users/watchlist{query}', headers=self.headers)
+                self.assertEqual(response.status_code, 200)
+                titles += [movie['title'] for movie in response.get_json()]
+                pages += 1
+                cursor = response.headers.get('X-Next-Cursor')
+                if not cursor:
+                    break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(titles, [f'Movie {i}' for i in range(5)])
+
+    def test_remove(self):
+        with bind_route_collections(self.db):
+            self.add(self.movie_ids[0])
+            removed = self.client.delete(f'/api/users/watchlist/{self.movie_ids[0]}', headers=self.headers)
+            listed = self.client.get('/api/users/watchlist', headers=self.headers)
+
+        self.assertEqual(removed.get_json()['message'], 'Movie removed from watchlist successfully')
+        self.assertEqual(listed.get_json(), [])
+
+    def test_invalid_cursor(self):
+        with bind_route_collections(self.db):
+            response = self.client.get('/api/users/watchlist?cursor=nonsense', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+
+class TestWatchlistMigration(unittest.TestCase):
+    """Test cases for moving embedded watchlist arrays into their own collection."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().test_database
+        self.collections = {'users': self.db.users, 'watchlist': self.db.watchlist}
+
+    def test_migration_keeps_order_and_removes_arrays(self):
+        user_ids = self.db.users.insert_many([
+            {'username': 'first', 'watchlist': ['c', 'a', 'b', 'a']},
+            {'username': 'second', 'watchlist': []},
+            {'username': 'third'},
+        ]).inserted_ids
+
+        stats = migrate_watchlists(self.collections, batch_size=2)
+
+        self.assertEqual((stats['users'], stats['entries'], stats['inserted']), (2, 3, 3))
+        entries = self.db.watchlist.find({'user_id': str(user_ids[0])}).sort([('added_at', 1)])
+        self.assertEqual([entry['movie_id'] for entry in entries], ['c', 'a', 'b'])
+        self.assertEqual(self.db.users.count_documents({'watchlist': {'$exists': True}}), 0)
+
+    def test_rerun_does_not_duplicate(self):
+        self.db.users.insert_one({'username': 'first', 'watchlist': ['a', 'b']})
+
+        migrate_watchlists(self.collections, keep_arrays=True)
+        stats = migrate_watchlists(self.collections)
+
+        self.assertEqual(stats['inserted'], 0)
+        self.assertEqual(self.db.watchlist.count_documents({}), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
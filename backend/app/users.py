@@ -0,0 +1,90 @@
+"""
+Current user of JWT-protected requests
+
+create_app() registers load_jwt_user as the JWTManager's user_lookup_loader,
+so flask_jwt_extended.current_user is the token's user: loaded once per
+request (Flask-JWT-Extended keeps it for the request) and shared by every
+route that needs it. Tokens of users that no longer exist get a 401.
+
+Between requests users are kept in a process-level cache for USER_CACHE_TTL
+seconds. Writes in this process invalidate their entries; writes made by
+other processes show up within the TTL. Cached users are shared between
+threads, so treat them as read-only.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from bson import ObjectId
+from flask import current_app
+from app.database import get_app_database
+
+from app.config import USER_CACHE_TTL, USER_CACHE_MAX_ENTRIES
+from app.workers.rating_events import rating_events
+
+db = get_app_database()
+users_collection = db["users"]
+
+# Everything routes read about the current user; never the password hash or reset tokens
+USER_PROJECTION = {'username': 1, 'email': 1, 'preferences': 1, 'preferences_updated_at': 1, 'created_at': 1}
+
+
+class UserCache:
+    """Thread-safe LRU of projected user documents with a TTL"""
+
+    def __init__(self, max_entries=USER_CACHE_MAX_ENTRIES, ttl=USER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """The user with this id, or None if there is none"""
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return entry[0]
+
+        try:
+            user = users_collection.find_one({'_id': ObjectId(user_id)}, USER_PROJECTION)
+        except Exception as e:
+            print(f"Error loading user {user_id}: {str(e)}")
+            return None
+        if user is None:
+            # Not cached, so a user registered a moment later is found
+            return None
+
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def load_jwt_user(_jwt_header, jwt_data):
+    """user_lookup_loader: the token's user, or None to reject the request"""
+    return user_cache.get(jwt_data[current_app.config.get('JWT_IDENTITY_CLAIM', 'sub')])
+
+
+def invalidate_rated_users(movie_ids, user_ids):
+    """Rating events hook: the users' preferences were recomputed"""
+    if user_ids:
+        user_cache.invalidate(*user_ids)
+
+
+rating_events.add_flush_hook(invalidate_rated_users)
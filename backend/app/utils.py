@@ -1,22 +1,67 @@
+import base64
 import secrets
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from app.config import EMAIL_USER, EMAIL_PASSWORD, EMAIL_SERVER
+from bson import ObjectId, json_util
+from app.workers.mail import mail_queue
+
+def find_by_ids(collection, ids, projection=None):
+    """Fetch documents by string ids in one $in query, returned as {str(_id): document}"""
+    object_ids = []
+    for value in dict.fromkeys(ids):
+        try:
+            object_ids.append(ObjectId(value))
+        except Exception:
+            # If unable to convert to ObjectId, skip this id
+            pass
+    if not object_ids:
+        return {}
+    return {str(doc['_id']): doc for doc in collection.find({'_id': {'$in': object_ids}}, projection)}
+
+def clamp_page_size(limit, default, maximum):
+    """Requested page size, defaulted and capped"""
+    if limit is None or limit <= 0:
+        return default
+    return min(limit, maximum)
+
+def encode_cursor(doc, sort):
+    """Opaque cursor pointing just after doc in the order of sort, a [(field, direction)] list"""
+    position = [doc.get(field) for field, _ in sort]
+    return base64.urlsafe_b64encode(json_util.dumps(position).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, sort):
+    """Sort key values from encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        position = json_util.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(position, list) or len(position) != len(sort):
+        raise ValueError('Invalid cursor')
+    return position
+
+def keyset_filter(sort, cursor):
+    """Filter for the documents after the cursor in the order of sort (keyset pagination)"""
+    position = decode_cursor(cursor, sort)
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        # Equal on the earlier keys, past the cursor on this one
+        clause = {earlier: value for (earlier, _), value in zip(sort[:i], position[:i])}
+        clause[field] = {'$lt' if direction < 0 else '$gt': position[i]}
+        clauses.append(clause)
+    return {'$or': clauses}
+
+def split_keyset_page(docs, limit, sort):
+    """Documents of the page and the cursor of the next one (one extra document is fetched to know)"""
+    if len(docs) > limit:
+        return docs[:limit], encode_cursor(docs[limit - 1], sort)
+    return docs, None
 
 def generate_reset_token():
     """Generate a secure random token for password reset."""
     return secrets.token_urlsafe(32)
 
 def send_reset_email(email, token):
-    """Send password reset email."""
+    """Queue the password reset email; it is sent in the background"""
     reset_link = f"http://localhost:3000/reset-password/{token}"
     
-    message = MIMEMultipart()
-    message["From"] = EMAIL_USER
-    message["To"] = email
-    message["Subject"] = "Password Reset - Film Finder"
-    
     body = f"""
     Hello,
     
@@ -33,15 +78,9 @@ def send_reset_email(email, token):
     The Film Finder Team
     """
     
-    message.attach(MIMEText(body, "plain"))
-    
     try:
-        server = smtplib.SMTP(EMAIL_SERVER, 587)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        server.send_message(message)
-        server.quit()
+        mail_queue.send(email, "Password Reset - Film Finder", body)
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        print(f"Error queueing email: {e}")
         return False
\ No newline at end of file
@@ -1,17 +1,11 @@
 from app.database import get_collections
-import json
+from app.bulk_import import import_movies
 from pathlib import Path
 
 def load_sample_data():
     collections = get_collections()
     
-    # Load sample movies
+    # Stream sample movies into the collection; movies are upserted on title and year
     sample_path = Path(__file__).parent.parent / "data" / "sample_movies.json"
-    with open(sample_path, 'r') as f:
-        movies = json.load(f)
-        # Clear existing data
-        collections['movies'].delete_many({})
-        # Insert sample data if collection is empty
-        if collections['movies'].count_documents({}) == 0:
-            collections['movies'].insert_many(movies)
-            print(f"Inserted {len(movies)} sample movies") 
\ No newline at end of file
+    stats = import_movies(str(sample_path), collections['movies'])
+    print(f"Imported {stats.written} sample movies ({stats.invalid} invalid)") 
@@ -0,0 +1,165 @@
+"""
+Warm-up and health checks
+
+A new worker answers its first requests slowly: the MongoDB pool is not
+connected, numpy and scipy are not imported (app.geo, app.algorithms.pipeline),
+the response cache and the theater index are empty, and MongoDB has no
+plans cached for the queries. init_warmup(app) runs these steps once after
+create_app():
+
+    mongo            connect the route modules' MongoDB pool (app.database)
+    recommendations  run the recommendation pipeline once for an anonymous
+                     user: imports numpy and runs the candidate generators'
+                     queries
+    precomputed      look up one user's precomputed recommendations and one
+                     movie's neighbours (app.workers.precompute and
+                     app.workers.neighbours) the way the generators do, so
+                     those collections' indexes and plans are warm too
+    theaters         build the theater spatial index (imports scipy)
+    paths            GET each of WARMUP_PATHS, filling the response cache and
+                     MongoDB's plan cache
+
+and adds two endpoints for the load balancer:
+
+    /health/live     200 while the process can serve requests
+    /health/ready    200 once warm-up finished, 503 until then
+
+A failed step (e.g. MongoDB not reachable yet) stops the attempt; the whole
+warm-up is retried every WARMUP_RETRY_SECONDS until it succeeds. In
+'blocking' mode create_app() gives up after WARMUP_BLOCKING_ATTEMPTS and
+raises, so a worker that cannot reach MongoDB fails to start instead of
+hanging.
+"""
+import threading
+import time
+
+from flask import jsonify
+
+from app.config import WARMUP_BLOCKING_ATTEMPTS, WARMUP_MODE, WARMUP_PATHS, WARMUP_RETRY_SECONDS
+from app.database import get_app_client
+
+
+def ping_database():
+    get_app_client().admin.command('ping')
+
+
+def warm_recommendations():
+    from app.routes.recommendation import recommendation_pipeline
+
+    context = {'user_id': None, 'preferences': {}, 'watchlist': [], 'ratings': []}
+    recommendation_pipeline.recommend(context, count=1)
+
+
+def warm_precomputed():
+    from app.routes.recommendation import (
+        collaborative_candidates,
+        movie_neighbours_collection,
+        recommendations_collection,
+        watchlist_candidates,
+    )
+
+    # Either table is empty until its job has run once
+    entry = recommendations_collection.find_one({}, {'_id': 0, 'user_id': 1})
+    if entry:
+        collaborative_candidates({'user_id': entry['user_id']}, 1)
+    entry = movie_neighbours_collection.find_one({}, {'_id': 0, 'movie_id': 1})
+    if entry:
+        watchlist_candidates({'watchlist': [entry['movie_id']]}, 1)
+
+
+def warm_theaters():
+    from app.routes.theaters import theater_index
+
+    theater_index.query(0.0, 0.0, limit=1)
+
+
+class Warmup:
+    """Warm-up steps for one app, and whether they have all succeeded"""
+
+    def __init__(self, app, paths=WARMUP_PATHS, retry_seconds=WARMUP_RETRY_SECONDS):
+        self.app = app
+        self.paths = paths
+        self.retry_seconds = retry_seconds
+        self.status = 'pending'
+        self.attempts = 0
+        self.steps = {}
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.status == 'ready'
+
+    def request_paths(self):
+        with self.app.test_client() as client:
+            for path in self.paths:
+                status = client.get(path).status_code
+                if status >= 500:
+                    raise RuntimeError(f"GET {path} returned {status}")
+
+    def run_once(self):
+        """One attempt at every step, stopping at the first failure; returns whether all succeeded"""
+        with self._lock:
+            self.status = 'warming'
+            self.attempts += 1
+            steps = {}
+            for name, step in (
+                ('mongo', ping_database),
+                ('recommendations', warm_recommendations),
+                ('precomputed', warm_precomputed),
+                ('theaters', warm_theaters),
+                ('paths', self.request_paths),
+            ):
+                start = time.perf_counter()
+                try:
+                    step()
+                except Exception as e:
+                    print(f"Error warming up ({name}): {str(e)}")
+                    steps[name] = {'ms': round((time.perf_counter() - start) * 1000, 1), 'error': str(e)}
+                    self.steps, self.error, self.status = steps, f"{name}: {str(e)}", 'failed'
+                    return False
+                steps[name] = {'ms': round((time.perf_counter() - start) * 1000, 1)}
+            self.steps, self.error, self.status = steps, None, 'ready'
+            return True
+
+    def run(self, max_attempts=None):
+        """Warm up, retrying every retry_seconds until it succeeds or max_attempts were made"""
+        while not self.run_once():
+            if max_attempts is not None and self.attempts >= max_attempts:
+                return False
+            time.sleep(self.retry_seconds)
+        return True
+
+    def start(self):
+        """Warm up in a background thread"""
+        self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+        self._thread.start()
+
+    def report(self):
+        return {'status': self.status, 'attempts': self.attempts, 'steps': self.steps, 'error': self.error}
+
+
+def init_warmup(app):
+    """Add /health/live and /health/ready to app and start its warm-up; call once the routes are registered"""
+    app.config.setdefault('WARMUP_MODE', WARMUP_MODE)
+    warmup = Warmup(app)
+    app.extensions['warmup'] = warmup
+
+    @app.route('/health/live')
+    def health_live():
+        return jsonify({'status': 'alive'}), 200
+
+    @app.route('/health/ready')
+    def health_ready():
+        return jsonify(warmup.report()), 200 if warmup.ready else 503
+
+    mode = app.config['WARMUP_MODE']
+    if mode == 'off':
+        warmup.status = 'ready'
+    elif mode == 'blocking':
+        if not warmup.run(max_attempts=WARMUP_BLOCKING_ATTEMPTS):
+            raise RuntimeError(f"Warm-up failed after {warmup.attempts} attempts: {warmup.error}")
+    else:
+        warmup.start()
+    return warmup
@@ -0,0 +1,2 @@
+# This file marks app/workers as a Python package
+# Background work that should not run on the request thread lives here
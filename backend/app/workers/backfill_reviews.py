@@ -0,0 +1,103 @@
+"""
+Backfill the fields the reviews feed relies on
+
+The feed (GET /api/movies/<id>/reviews) reads the author's name from the
+rating itself and pages on helpful_votes and created_at. Ratings written
+before that get:
+    username      - copied from the user document
+    helpful_votes - 0
+    created_at    - ISO string, like the ratings route writes (some older
+                    ratings stored a date, which does not order with strings);
+                    ratings without one get their updated_at, or else the
+                    time their ObjectId was generated
+
+The backfill can be stopped and rerun: only ratings still missing a field are read.
+
+    python -m app.workers.backfill_reviews
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.database import get_app_database
+from app.models.ratings import create_review_indexes
+from app.utils import find_by_ids
+
+BATCH_SIZE = 500
+
+NEEDS_BACKFILL = {'$or': [
+    {'username': {'$exists': False}},
+    {'helpful_votes': {'$exists': False}},
+    {'created_at': {'$type': 'date'}},
+    {'created_at': {'$exists': False}},
+]}
+
+
+def default_collections():
+    db = get_app_database()
+    return {'users': db["users"], 'ratings': db["ratings"]}
+
+
+def created_at(rating):
+    """ISO creation time of a rating, from the best field it has"""
+    value = rating.get('created_at') or rating.get('updated_at')
+    if value is None and isinstance(rating['_id'], ObjectId):
+        # UTC, without the offset, like the naive times the route writes
+        value = rating['_id'].generation_time.replace(tzinfo=None)
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def backfill_operations(ratings, users):
+    """Updates setting the missing fields of a batch of ratings"""
+    operations = []
+    for rating in ratings:
+        changes = {}
+        if 'username' not in rating:
+            changes['username'] = users.get(rating['user_id'], {}).get('username', '')
+        if 'helpful_votes' not in rating:
+            changes['helpful_votes'] = 0
+        if not isinstance(rating.get('created_at'), str):
+            changes['created_at'] = created_at(rating)
+        operations.append(UpdateOne({'_id': rating['_id']}, {'$set': changes}))
+    return operations
+
+
+def backfill_reviews(collections=None, batch_size=BATCH_SIZE):
+    """Fill in the feed fields of every rating missing one; returns counts"""
+    collections = collections or default_collections()
+    users, ratings = collections['users'], collections['ratings']
+    create_review_indexes(ratings)
+
+    started = time.perf_counter()
+    stats = {'ratings': 0, 'updated': 0}
+    projection = {'user_id': 1, 'username': 1, 'helpful_votes': 1, 'created_at': 1, 'updated_at': 1}
+
+    def flush(batch):
+        authors = find_by_ids(users, [rating['user_id'] for rating in batch], {'username': 1})
+        result = ratings.bulk_write(backfill_operations(batch, authors), ordered=False)
+        stats['ratings'] += len(batch)
+        stats['updated'] += result.modified_count
+
+    batch = []
+    for rating in ratings.find(NEEDS_BACKFILL, projection, batch_size=batch_size):
+        batch.append(rating)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Ratings updated per bulk write')
+    args = parser.parse_args()
+
+    print(json.dumps(backfill_reviews(batch_size=args.batch_size)))
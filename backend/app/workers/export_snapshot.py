@@ -0,0 +1,248 @@
+"""
+Columnar snapshot of the ratings and movie features for the training jobs
+
+Streams the ratings out of MongoDB once and writes them as .npy columns
+(layout in app.algorithms.snapshot). Later runs only append the ratings
+written since the previous export (their `updated_at`), so a model build
+memory-maps the snapshot instead of reading every rating document:
+
+    python -m app.workers.export_snapshot              # incremental once a snapshot exists
+    python -m app.workers.export_snapshot --full
+    python -m app.workers.precompute --snapshot snapshots
+
+Each export reads the ratings written between the previous export's
+`exported_at` and its own, so a rating written during an export is picked
+up by the next one. Deleted ratings come from the tombstones the ratings
+routes write to `rating_deletions`, which expire after
+RATING_DELETIONS_TTL; a snapshot older than that is re-exported in full.
+Once there are more than SNAPSHOT_MAX_SHARDS shards they are merged into one.
+Counting and merging stream the memory-mapped shards a chunk at a time
+(RatingSnapshot.live_chunks), so neither loads the whole snapshot.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app.algorithms.rating_store import INDEX_DTYPE, RATING_DTYPE, RatingStore
+from app.algorithms.snapshot import COLUMNS, MANIFEST, RatingSnapshot, read_manifest
+from app.config import RATING_DELETIONS_TTL, SNAPSHOT_DIR, SNAPSHOT_MAX_SHARDS
+from app.database import get_app_database
+from app.workers.neighbours import MOVIE_PROJECTION, content_matrix
+from app.workers.precompute import LOAD_BATCH_SIZE
+
+SNAPSHOT_VERSION = 1
+
+
+def default_collections():
+    db = get_app_database()
+    return {'movies': db["movies"], 'ratings': db["ratings"], 'rating_deletions': db["rating_deletions"]}
+
+
+def written_between(field, since, until):
+    """Filter for documents whose field (datetime or ISO string) is in (since, until]"""
+    return {'$or': [{field: {'$gt': since, '$lte': until}},
+                    {field: {'$gt': since.isoformat(), '$lte': until.isoformat()}}]}
+
+
+def add_tombstones(store, deletions):
+    """Append a NaN row for each deleted (user, movie) the snapshot knows and the store does not hold; returns how many"""
+    users, movies, _ = store.columns()
+    # A rating in the store was written again after the delete
+    held = set(zip(users.tolist(), movies.tolist()))
+    users, movies = [], []
+    for deletion in deletions:
+        user, movie = store.user_index(deletion['user_id']), store.movie_index(deletion['movie_id'])
+        # Unknown ids were never exported
+        if user is None or movie is None or (user, movie) in held:
+            continue
+        held.add((user, movie))
+        users.append(user)
+        movies.append(movie)
+    store.extend(users, movies, np.full(len(users), np.nan))
+    return len(users)
+
+
+def replace_directory(directory, name, fill):
+    """Replace directory/name whole with what fill(path) writes into a new directory"""
+    path = os.path.join(directory, name)
+    tmp_path, old_path = f"{path}.tmp", f"{path}.old"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    fill(tmp_path)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def write_arrays(directory, name, arrays):
+    """Write {file name: array} as .npy files into directory/name, replacing it whole"""
+    def fill(path):
+        for file_name, array in arrays.items():
+            np.save(os.path.join(path, f'{file_name}.npy'), np.ascontiguousarray(array))
+
+    replace_directory(directory, name, fill)
+
+
+def write_shard(directory, number, users, movies, ratings):
+    name = f'ratings-{number:06d}'
+    write_arrays(directory, name, dict(zip(COLUMNS, (users, movies, ratings))))
+    return {'name': name, 'rows': len(users)}
+
+
+def write_merged_shard(directory, number, snapshot, rows):
+    """One shard with the live rows of every shard of snapshot, written a chunk at a time"""
+    name = f'ratings-{number:06d}'
+
+    def fill(path):
+        outputs = [
+            np.lib.format.open_memmap(os.path.join(path, f'{column}.npy'), mode='w+', dtype=dtype, shape=(rows,))
+            for column, dtype in zip(COLUMNS, (INDEX_DTYPE, INDEX_DTYPE, RATING_DTYPE))
+        ]
+        position = 0
+        for chunk in snapshot.live_chunks():
+            end = position + len(chunk[0])
+            for output, column in zip(outputs, chunk):
+                output[position:end] = column
+            position = end
+        for output in outputs:
+            output.flush()
+
+    replace_directory(directory, name, fill)
+    return {'name': name, 'rows': rows}
+
+
+def write_export(directory, number, store, movies):
+    """The interned ids and the content features (app.workers.neighbours) of every movie, rows in movie_ids order"""
+    by_id = {str(movie['_id']): movie for movie in movies}
+    feature_index = {}
+    matrix = content_matrix([by_id.get(movie_id, {}) for movie_id in store.movie_ids], feature_index)
+    name = f'export-{number:06d}'
+    write_arrays(directory, name, {
+        'user_ids': np.array(store.user_ids, dtype=str),
+        'movie_ids': np.array(store.movie_ids, dtype=str),
+        'features_data': matrix.data,
+        'features_indices': matrix.indices,
+        'features_indptr': matrix.indptr,
+        'features_shape': np.array(matrix.shape, dtype=np.int64),
+        'features_names': np.array(list(feature_index), dtype=str),
+    })
+    return name
+
+
+def write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def remove_stale_files(directory, manifest):
+    """Shards and exports the manifest no longer refers to"""
+    names = {shard['name'] for shard in manifest['shards']} | {manifest['export']}
+    for name in os.listdir(directory):
+        if name.startswith(('ratings-', 'export-')) and name not in names:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def export_snapshot(collections=None, directory=SNAPSHOT_DIR, full=False, batch_size=LOAD_BATCH_SIZE,
+                    max_shards=SNAPSHOT_MAX_SHARDS):
+    """Write a full snapshot, or append the ratings written since the last one; returns stats"""
+    collections = collections or default_collections()
+    os.makedirs(directory, exist_ok=True)
+
+    started = time.perf_counter()
+    # Ratings written after this are picked up by the next export
+    exported_at = datetime.now()
+    previous = read_manifest(directory)
+    incremental = previous is not None and not full
+    reason = None
+    if incremental:
+        since = datetime.fromisoformat(previous['exported_at'])
+        if (exported_at - since).total_seconds() > RATING_DELETIONS_TTL:
+            incremental, reason = False, 'deletions since the last export have expired'
+
+    store = RatingStore()
+    query = {}
+    if incremental:
+        snapshot = RatingSnapshot(directory, previous)
+        for user_id in snapshot.user_ids:
+            store.user_index(user_id, add=True)
+        for movie_id in snapshot.movie_ids:
+            store.movie_index(movie_id, add=True)
+        query = written_between('updated_at', since, exported_at)
+
+    movies = list(collections['movies'].find({}, MOVIE_PROJECTION))
+    for movie in movies:
+        store.movie_index(movie['_id'], add=True)
+    store.load(collections['ratings'].find(query, RatingStore.PROJECTION, batch_size=batch_size), batch_size)
+    exported = len(store)
+    deleted = 0
+    if incremental:
+        deletions = collections['rating_deletions'].find(
+            written_between('deleted_at', since, exported_at), {'_id': 0, 'user_id': 1, 'movie_id': 1}
+        )
+        deleted = add_tombstones(store, deletions)
+
+    # Numbers keep counting up, so the files of the previous manifest stay readable until it is replaced
+    sequence = previous['sequence'] if previous else 0
+    shards = list(previous['shards']) if incremental else []
+    if len(store) or not shards:
+        shards.append(write_shard(directory, sequence, *store.columns()))
+        sequence += 1
+    export = write_export(directory, sequence, store, movies)
+    sequence += 1
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'exported_at': exported_at.isoformat(),
+        'shards': shards,
+        'export': export,
+        'sequence': sequence,
+        'users': len(store.user_ids),
+        'movies': len(store.movie_ids),
+        'ratings': len(store),
+    }
+    compacted = False
+    if incremental:
+        written = RatingSnapshot(directory, manifest)
+        manifest['ratings'] = sum(len(users) for users, _, _ in written.live_chunks())
+        if len(shards) > max_shards:
+            manifest['shards'] = [write_merged_shard(directory, sequence, written, manifest['ratings'])]
+            manifest['sequence'] = sequence + 1
+            compacted = True
+
+    write_manifest(directory, manifest)
+    remove_stale_files(directory, manifest)
+
+    stats = {
+        'mode': 'incremental' if incremental else 'full',
+        'exported': exported,
+        'deleted': deleted,
+        'ratings': manifest['ratings'],
+        'users': manifest['users'],
+        'movies': manifest['movies'],
+        'shards': len(manifest['shards']),
+        'compacted': compacted,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+    if reason:
+        stats['reason'] = reason
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--directory', default=SNAPSHOT_DIR, help='Snapshot directory')
+    parser.add_argument('--full', action='store_true', help='Export every rating instead of appending')
+    parser.add_argument('--max-shards', type=int, default=SNAPSHOT_MAX_SHARDS,
+                        help='Incremental shards kept before they are merged')
+    args = parser.parse_args()
+
+    stats = export_snapshot(directory=args.directory, full=args.full, max_shards=args.max_shards)
+    print(json.dumps(stats))
@@ -0,0 +1,286 @@
+"""
+Outbound mail queue
+
+Routes hand messages to mail_queue.send() and return straight away. A
+background worker delivers them over one SMTP connection that is kept open
+between sends (STARTTLS and login happen once per connection, not once per
+message) and closed after MAIL_IDLE_TIMEOUT seconds without mail.
+
+Failed sends are retried with exponential backoff, up to MAIL_MAX_ATTEMPTS;
+permanent (5xx) rejections are dropped at once.
+
+MAIL_QUEUE_MODE:
+    'thread'   - in-process queue drained by a daemon thread
+    'external' - messages are stored in the mail_outbox collection and sent by
+                 the worker process (python -m app.workers.mail)
+    'inline'   - sent (with retries) before send() returns
+"""
+import atexit
+import random
+import smtplib
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from app.config import (
+    EMAIL_USER,
+    EMAIL_PASSWORD,
+    EMAIL_SERVER,
+    EMAIL_PORT,
+    EMAIL_USE_TLS,
+    EMAIL_TIMEOUT,
+    MAIL_QUEUE_MODE,
+    MAIL_BATCH_SIZE,
+    MAIL_MAX_ATTEMPTS,
+    MAIL_RETRY_BASE_SECONDS,
+    MAIL_IDLE_TIMEOUT,
+)
+from app.database import get_app_database
+
+
+def default_outbox():
+    return get_app_database()["mail_outbox"]
+
+
+def build_message(to, subject, body, sender=EMAIL_USER):
+    message = MIMEMultipart()
+    message["From"] = sender
+    message["To"] = to
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "plain"))
+    return message
+
+
+def is_permanent(error):
+    """Whether retrying cannot help: the server rejected the message with a 5xx code"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+def retry_delay(attempts, base=MAIL_RETRY_BASE_SECONDS):
+    """Exponential backoff with jitter before attempt number attempts + 1"""
+    delay = base * 2 ** (attempts - 1)
+    return delay + random.uniform(0, delay / 2)
+
+
+class SMTPSender:
+    """An SMTP connection opened on first use and reused for later messages"""
+
+    def __init__(self, host=EMAIL_SERVER, port=EMAIL_PORT, user=EMAIL_USER, password=EMAIL_PASSWORD,
+                 use_tls=EMAIL_USE_TLS, timeout=EMAIL_TIMEOUT, idle_timeout=MAIL_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self._server = None
+        self._last_used = None
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.user:
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self._last_used = time.monotonic()
+        self.connections += 1
+
+    def send(self, message):
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            # The server has probably dropped it by now
+            self.close()
+        if self._server is None:
+            self._connect()
+        try:
+            self._server.send_message(message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The kept connection went away; retry once on a new one
+            self.close()
+            self._connect()
+            self._server.send_message(message)
+        self._last_used = time.monotonic()
+
+    def close_if_idle(self):
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+
+
+class MailQueue:
+    def __init__(self, sender=None, outbox=None, mode=MAIL_QUEUE_MODE, batch_size=MAIL_BATCH_SIZE,
+                 max_attempts=MAIL_MAX_ATTEMPTS, retry_base=MAIL_RETRY_BASE_SECONDS):
+        self.sender = sender or SMTPSender()
+        self._outbox = outbox
+        self.mode = mode
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.sent = 0
+        self.failed = 0
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def outbox(self):
+        if self._outbox is None:
+            self._outbox = default_outbox()
+        return self._outbox
+
+    def send(self, to, subject, body):
+        """Queue a plain text message"""
+        entry = {'to': to, 'subject': subject, 'body': body, 'attempts': 0, 'next_attempt': time.time()}
+
+        if self.mode == 'external':
+            self.outbox.insert_one({**entry, 'next_attempt': datetime.now(), 'created_at': datetime.now()})
+            return
+
+        with self._lock:
+            self._pending.append(entry)
+
+        if self.mode == 'inline':
+            while self.pending():
+                self.flush()
+                self._sleep_until_due()
+            return
+
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _take_due(self):
+        """Up to batch_size messages whose next attempt is due"""
+        now = time.time()
+        with self._lock:
+            due = [entry for entry in self._pending if entry['next_attempt'] <= now][:self.batch_size]
+            for entry in due:
+                self._pending.remove(entry)
+        return due
+
+    def _deliver(self, entry):
+        """Send one message; returns False if it should be tried again"""
+        entry['attempts'] += 1
+        try:
+            self.sender.send(build_message(entry['to'], entry['subject'], entry['body']))
+            self.sent += 1
+            return True
+        except Exception as e:
+            if is_permanent(e) or entry['attempts'] >= self.max_attempts:
+                self.failed += 1
+                print(f"Error sending email to {entry['to']}, giving up after {entry['attempts']} attempts: {str(e)}")
+                return True
+            print(f"Error sending email to {entry['to']} (attempt {entry['attempts']}): {str(e)}")
+            self.sender.close()
+            return False
+
+    def flush(self):
+        """Send every message that is due now, in batches over the kept connection"""
+        with self._send_lock:
+            while True:
+                batch = self._take_due()
+                if not batch:
+                    return
+                for entry in batch:
+                    if not self._deliver(entry):
+                        entry['next_attempt'] = time.time() + retry_delay(entry['attempts'], self.retry_base)
+                        with self._lock:
+                            self._pending.append(entry)
+
+    def _next_due(self):
+        with self._lock:
+            return min((entry['next_attempt'] for entry in self._pending), default=None)
+
+    def _sleep_until_due(self):
+        next_due = self._next_due()
+        if next_due is not None:
+            time.sleep(max(0.0, next_due - time.time()))
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='mail-queue', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            next_due = self._next_due()
+            # Wake for new mail, the next retry, or to close an idle connection
+            timeout = self.sender.idle_timeout if next_due is None else max(0.0, next_due - time.time())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                with self._send_lock:
+                    self.sender.close_if_idle()
+            except Exception as e:
+                print(f"Error sending queued email: {str(e)}")
+
+    def drain_outbox(self):
+        """Send one batch of due messages from the outbox ('external' mode); returns how many were tried"""
+        entries = list(
+            self.outbox.find({'next_attempt': {'$lte': datetime.now()}}).sort('next_attempt', 1).limit(self.batch_size)
+        )
+        for entry in entries:
+            if self._deliver(entry):
+                self.outbox.delete_one({'_id': entry['_id']})
+            else:
+                retry_at = datetime.fromtimestamp(time.time() + retry_delay(entry['attempts'], self.retry_base))
+                self.outbox.update_one(
+                    {'_id': entry['_id']},
+                    {'$set': {'attempts': entry['attempts'], 'next_attempt': retry_at}}
+                )
+        return len(entries)
+
+    def run_worker(self, poll_interval=1.0):
+        """Out-of-process worker loop for 'external' mode"""
+        self.outbox.create_index('next_attempt')
+        while True:
+            if self.drain_outbox() == 0:
+                self.sender.close_if_idle()
+                time.sleep(poll_interval)
+
+
+# Shared queue used by the routes
+mail_queue = MailQueue()
+
+
+@atexit.register
+def _send_on_exit():
+    # Do not drop queued messages that are already due when the process stops
+    if mail_queue.mode == 'thread' and mail_queue.pending():
+        mail_queue.flush()
+        mail_queue.sender.close()
+
+
+if __name__ == '__main__':
+    print("Starting mail worker")
+    MailQueue(mode='external').run_worker()
@@ -0,0 +1,93 @@
+"""
+Move embedded watchlists into the `watchlist` collection
+
+Users used to keep their watchlist as an unbounded `watchlist` array of
+movie ids in the user document. Each id becomes a {user_id, movie_id,
+added_at} document; the array has no timestamps, so added_at counts back
+from the migration time in milliseconds to keep the array's order. The
+array is removed from a user once their entries are written.
+
+The migration can be stopped and rerun: entries are upserted, and only
+users that still have the array are read.
+
+    python -m app.workers.migrate_watchlist
+    python -m app.workers.migrate_watchlist --keep-arrays
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from app.database import get_app_database
+from app.models.user import create_watchlist_indexes
+
+BATCH_SIZE = 500
+
+
+def default_collections():
+    db = get_app_database()
+    return {'users': db["users"], 'watchlist': db["watchlist"]}
+
+
+def entry_operations(user, migrated_at):
+    """Upserts for one user's watchlist array, oldest first"""
+    user_id = str(user['_id'])
+    movie_ids = list(dict.fromkeys(str(movie_id) for movie_id in user.get('watchlist') or []))
+    return [
+        UpdateOne(
+            {'user_id': user_id, 'movie_id': movie_id},
+            {'$setOnInsert': {'added_at': migrated_at - timedelta(milliseconds=len(movie_ids) - position)}},
+            upsert=True,
+        )
+        for position, movie_id in enumerate(movie_ids)
+    ]
+
+
+def migrate_watchlists(collections=None, batch_size=BATCH_SIZE, keep_arrays=False):
+    """Copy every remaining watchlist array into the watchlist collection; returns counts"""
+    collections = collections or default_collections()
+    users, watchlist = collections['users'], collections['watchlist']
+    create_watchlist_indexes(watchlist)
+
+    started = time.perf_counter()
+    # Whole milliseconds, which is what MongoDB stores
+    migrated_at = datetime.now().replace(microsecond=0)
+    stats = {'users': 0, 'entries': 0, 'inserted': 0}
+    operations, user_ids = [], []
+
+    def flush():
+        if operations:
+            result = watchlist.bulk_write(operations, ordered=False)
+            stats['inserted'] += result.upserted_count
+        if user_ids and not keep_arrays:
+            # Only after the user's entries are written, so a failed batch is retried on the next run
+            users.update_many({'_id': {'$in': user_ids}}, {'$unset': {'watchlist': ''}})
+        operations.clear()
+        user_ids.clear()
+
+    cursor = users.find({'watchlist': {'$exists': True}}, {'watchlist': 1}, batch_size=batch_size)
+    for user in cursor:
+        user_operations = entry_operations(user, migrated_at)
+        operations.extend(user_operations)
+        user_ids.append(user['_id'])
+        stats['users'] += 1
+        stats['entries'] += len(user_operations)
+        if len(operations) >= batch_size:
+            flush()
+    flush()
+
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Entries written per bulk write')
+    parser.add_argument('--keep-arrays', action='store_true',
+                        help='Leave the arrays in the user documents (they are read again on the next run)')
+    args = parser.parse_args()
+
+    stats = migrate_watchlists(batch_size=args.batch_size, keep_arrays=args.keep_arrays)
+    print(json.dumps(stats))
@@ -0,0 +1,207 @@
+"""
+Precomputed "similar movies" table
+
+Each movie's top neighbours are stored in the `movie_neighbours`
+collection, so /api/movies/<id>/similar is a single keyed read. Similarity
+combines two cosine similarities, computed in blocks of movies as sparse
+matrix products:
+
+    content   - genres, director and leading cast
+    co-rating - the movies' rating columns (users who rated both alike)
+
+A full build scores every movie. --incremental only rescores movies that
+are new, whose details changed, or that were rated since the last run;
+the nightly full build also refreshes the lists those movies appear in.
+Both remove the lists of movies that are no longer in the catalogue.
+
+    python -m app.workers.neighbours
+    python -m app.workers.neighbours --incremental
+"""
+import argparse
+import hashlib
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+from pymongo import UpdateOne
+from scipy.sparse import csr_matrix
+
+from app import caching
+from app.algorithms.snapshot import open_snapshot
+from app.config import (
+    MOVIE_NEIGHBOURS_COUNT,
+    MOVIE_NEIGHBOURS_CONTENT_WEIGHT,
+    MOVIE_NEIGHBOURS_BLOCK_SIZE,
+)
+from app.database import get_app_database
+from app.workers.precompute import load_ratings, normalize_rows, top_k
+
+WRITE_BATCH_SIZE = 1000
+
+# Leading cast members used as content features, and each feature's weight
+CAST_FEATURES = 5
+FEATURE_WEIGHTS = {'genre': 1.0, 'director': 1.0, 'cast': 0.5}
+
+# Fields read from movies; the summary fields are stored with each neighbour
+MOVIE_PROJECTION = {'title': 1, 'image_url': 1, 'year': 1, 'genres': 1, 'director': 1, 'cast': 1}
+SUMMARY_FIELDS = ('title', 'image_url', 'year', 'genres')
+
+
+def default_collections():
+    db = get_app_database()
+    return {'movies': db["movies"], 'ratings': db["ratings"], 'movie_neighbours': db["movie_neighbours"]}
+
+
+def movie_features(movie):
+    """(feature, weight) pairs describing a movie's content"""
+    features = [(f"genre:{genre}", FEATURE_WEIGHTS['genre']) for genre in movie.get('genres') or []]
+    if movie.get('director'):
+        features.append((f"director:{movie['director']}", FEATURE_WEIGHTS['director']))
+    features += [(f"cast:{actor}", FEATURE_WEIGHTS['cast']) for actor in (movie.get('cast') or [])[:CAST_FEATURES]]
+    return features
+
+
+def features_hash(movie):
+    """Changes whenever the movie's features or stored summary change"""
+    fields = {name: movie.get(name) for name in MOVIE_PROJECTION}
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def content_matrix(movies, feature_index=None):
+    """movies x features matrix (CSR) of weighted content features; feature_index collects {feature: column}"""
+    feature_index = {} if feature_index is None else feature_index
+    rows, cols, values = [], [], []
+    for row, movie in enumerate(movies):
+        for feature, weight in dict(movie_features(movie)).items():
+            rows.append(row)
+            cols.append(feature_index.setdefault(feature, len(feature_index)))
+            values.append(weight)
+    return csr_matrix(
+        (np.array(values, dtype=np.float32), (np.array(rows, dtype=np.int32), np.array(cols, dtype=np.int32))),
+        shape=(len(movies), len(feature_index)), dtype=np.float32
+    )
+
+
+def score_neighbours(content, corating, rows, count, content_weight):
+    """Top `count` neighbours of the movies at `rows`; see top_k for the result format"""
+    scores = content_weight * (content[rows] @ content.T).toarray()
+    scores += (1 - content_weight) * (corating[rows] @ corating.T).toarray()
+    scores[scores <= 0] = -np.inf
+    # A movie is not its own neighbour
+    scores[np.arange(len(rows)), rows] = -np.inf
+    return top_k(scores, count)
+
+
+def rated_since(ratings_collection, since):
+    """Ids of movies with ratings written after since (datetime or ISO string timestamps)"""
+    query = {'$or': [{'updated_at': {'$gt': since}}, {'updated_at': {'$gt': since.isoformat()}}]}
+    return {str(movie_id) for movie_id in ratings_collection.distinct('movie_id', query)}
+
+
+def remove_stale_neighbours(neighbours, stored_ids, movie_ids, batch_size=WRITE_BATCH_SIZE):
+    """Delete the lists of stored_ids that are not in movie_ids (removed movies); returns how many"""
+    current = set(movie_ids)
+    stale = [movie_id for movie_id in stored_ids if movie_id not in current]
+    removed = 0
+    for start in range(0, len(stale), batch_size):
+        removed += neighbours.delete_many({'movie_id': {'$in': stale[start:start + batch_size]}}).deleted_count
+    return removed
+
+
+def build_movie_neighbours(collections=None, incremental=False, count=MOVIE_NEIGHBOURS_COUNT,
+                           content_weight=MOVIE_NEIGHBOURS_CONTENT_WEIGHT,
+                           block_size=MOVIE_NEIGHBOURS_BLOCK_SIZE, write_batch_size=WRITE_BATCH_SIZE, snapshot=None):
+    """
+    Score movies and upsert their neighbour lists; returns stats
+    With snapshot (a directory written by app.workers.export_snapshot) the ratings are read from it
+    """
+    collections = collections or default_collections()
+    neighbours = collections['movie_neighbours']
+    neighbours.create_index('movie_id', unique=True)
+
+    started = time.perf_counter()
+    # Ratings written while the build runs are picked up by the next incremental run
+    computed_at = datetime.now()
+
+    movies = list(collections['movies'].find({}, MOVIE_PROJECTION))
+    movie_ids = [str(movie['_id']) for movie in movies]
+    hashes = [features_hash(movie) for movie in movies]
+    content = normalize_rows(content_matrix(movies))
+    if snapshot:
+        _, _, ratings = open_snapshot(snapshot).load_ratings(movie_ids)
+    else:
+        _, _, ratings = load_ratings(collections['ratings'], movie_index={movie_id: i for i, movie_id in enumerate(movie_ids)})
+    corating = normalize_rows(ratings.T.tocsr())
+    del ratings
+
+    rows = np.arange(len(movies))
+    existing = {
+        doc['movie_id']: doc
+        for doc in neighbours.find({}, {'_id': 0, 'movie_id': 1, 'features_hash': 1, 'computed_at': 1})
+    }
+    if incremental:
+        last_run = max((doc['computed_at'] for doc in existing.values() if doc.get('computed_at')), default=None)
+        rated = rated_since(collections['ratings'], last_run) if last_run else set(movie_ids)
+        rows = np.array([
+            i for i, movie_id in enumerate(movie_ids)
+            if movie_id in rated or existing.get(movie_id, {}).get('features_hash') != hashes[i]
+        ], dtype=np.int64)
+    loaded = time.perf_counter()
+
+    written = 0
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        top, scores = score_neighbours(content, corating, block, count, content_weight)
+
+        operations = []
+        for row, neighbour_rows, neighbour_scores in zip(block, top, scores):
+            entries = []
+            for index, score in zip(neighbour_rows, neighbour_scores):
+                if index < 0:
+                    continue
+                entry = {'movie_id': movie_ids[index]}
+                entry.update({name: movies[index].get(name) for name in SUMMARY_FIELDS})
+                entry['score'] = round(float(score), 4)
+                entries.append(entry)
+            operations.append(UpdateOne(
+                {'movie_id': movie_ids[row]},
+                {'$set': {'neighbours': entries, 'features_hash': hashes[row], 'computed_at': computed_at}},
+                upsert=True
+            ))
+
+        for batch_start in range(0, len(operations), write_batch_size):
+            result = neighbours.bulk_write(operations[batch_start:batch_start + write_batch_size], ordered=False)
+            written += result.upserted_count + result.modified_count
+
+    removed = remove_stale_neighbours(neighbours, list(existing), movie_ids, write_batch_size)
+
+    if len(rows) or removed:
+        # Drop cached /similar responses
+        caching.collection_versions.bump('movie_neighbours')
+
+    finished = time.perf_counter()
+    return {
+        'movies': len(movies),
+        'scored': len(rows),
+        'written': written,
+        'removed': removed,
+        'incremental': incremental,
+        'load_seconds': round(loaded - started, 2),
+        'score_seconds': round(finished - loaded, 2),
+        'movies_per_second': round(len(rows) / max(finished - loaded, 1e-9), 1),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only rescore new, changed and recently rated movies')
+    parser.add_argument('--count', type=int, default=MOVIE_NEIGHBOURS_COUNT, help='Neighbours stored per movie')
+    parser.add_argument('--block-size', type=int, default=MOVIE_NEIGHBOURS_BLOCK_SIZE)
+    parser.add_argument('--snapshot', help='Read the ratings from this snapshot directory (app.workers.export_snapshot)')
+    args = parser.parse_args()
+
+    stats = build_movie_neighbours(incremental=args.incremental, count=args.count, block_size=args.block_size,
+                                   snapshot=args.snapshot)
+    print(json.dumps(stats))
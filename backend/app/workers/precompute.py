@@ -0,0 +1,274 @@
+"""
+Nightly recommendation precompute
+
+Scores every user with the same user-based collaborative filtering as
+app.algorithms.collaborative_filtering.CollaborativeFiltering, but in
+blocks of users as sparse matrix products instead of per-user loops:
+
+    similarity = normalized(R[chunk]) @ normalized(R).T
+    score      = (similarity @ R) / (similarity @ (R > 0))
+
+Only the scores are dense (float32, SCORE_CHUNK_ROWS users x movies), and
+only the top movies of each user are kept from them.
+
+The ratings matrix is loaded from MongoDB once and written to .npy files
+that the worker processes memory-map, so every worker shares the same
+pages instead of holding its own copy. The parent writes the top movies of
+each user to the `recommendations` collection with unordered bulk upserts.
+
+    python -m app.workers.precompute --workers 8 --block-size 256
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from pymongo import UpdateOne
+from scipy.sparse import csr_matrix
+
+from app.algorithms.rating_store import RatingStore
+from app.algorithms.snapshot import open_snapshot
+from app.config import (
+    RECOMMENDATION_PRECOMPUTE_WORKERS,
+    RECOMMENDATION_PRECOMPUTE_BLOCK_SIZE,
+    RECOMMENDATION_PRECOMPUTE_COUNT,
+)
+from app.database import get_app_database
+
+LOAD_BATCH_SIZE = 50_000
+WRITE_BATCH_SIZE = 1000
+# Users scored per matrix product; bounds the dense users x movies scores a worker holds
+SCORE_CHUNK_ROWS = 64
+
+ALGORITHM = 'user_cf'
+
+
+def default_collections():
+    db = get_app_database()
+    return {'ratings': db["ratings"], 'recommendations': db["recommendations"]}
+
+
+def load_ratings(ratings_collection, batch_size=LOAD_BATCH_SIZE, movie_index=None):
+    """
+    User ids, movie ids and the users x movies rating matrix (CSR, float32)
+    The cursor is read into a RatingStore, so no document is kept.
+    With movie_index ({movie id: column}) the columns are fixed and ratings
+    of other movies are skipped.
+    """
+    movie_ids = sorted(movie_index, key=movie_index.get) if movie_index is not None else None
+    cursor = ratings_collection.find({}, RatingStore.PROJECTION, batch_size=batch_size)
+    store = RatingStore.from_cursor(cursor, batch_size=batch_size, movie_ids=movie_ids)
+    # A user has at most one rating per movie (unique index); duplicates would be summed
+    return store.user_ids, store.movie_ids, store.csr()
+
+
+def normalize_rows(matrix):
+    """Copy of a CSR matrix with unit-length rows, so row products are cosine similarities"""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    row_norms = np.repeat(norms, np.diff(matrix.indptr))
+    data = np.divide(matrix.data, row_norms, out=np.zeros_like(matrix.data), where=row_norms > 0)
+    return csr_matrix((data, matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def share_matrix(matrix, directory):
+    """
+    Write what the workers need as .npy files: the matrix, its row-normalized
+    copy and its rated/unrated mask share one indices/indptr pair
+    """
+    arrays = {
+        'data': matrix.data,
+        'normalized': normalize_rows(matrix).data,
+        'rated': np.ones_like(matrix.data),
+        'indices': matrix.indices,
+        'indptr': matrix.indptr,
+        'shape': np.array(matrix.shape, dtype=np.int64),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), array)
+
+
+def open_shared(directory):
+    """(ratings, normalized, rated) CSR matrices over the memory-mapped arrays"""
+    def load(name):
+        return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+
+    indices, indptr, shape = load('indices'), load('indptr'), tuple(load('shape'))
+    return tuple(
+        csr_matrix((load(name), indices, indptr), shape=shape, copy=False)
+        for name in ('data', 'normalized', 'rated')
+    )
+
+
+def score_chunk(ratings, normalized, rated, start, stop):
+    """Scores (float32, users x movies) for users start..stop-1; -inf for movies that are not candidates"""
+    # Kept sparse: only users who share a movie with the chunk have a similarity. The sums are
+    # accumulated in float64, so the result does not depend on the order of users and movies
+    similarity = normalized[start:stop].astype(np.float64) @ normalized.T
+    weighted = (similarity @ ratings).astype(np.float32).toarray()
+    weights = (similarity @ rated).astype(np.float32).toarray()
+
+    scores = np.full(weighted.shape, -np.inf, dtype=np.float32)
+    np.divide(weighted, weights, out=scores, where=weights > 0)
+    # Movies the user has already rated are never recommended
+    block = ratings[start:stop]
+    scores[np.repeat(np.arange(stop - start), np.diff(block.indptr)), block.indices] = -np.inf
+    return scores
+
+
+def score_block(ratings, normalized, rated, start, stop, count, chunk_rows=SCORE_CHUNK_ROWS):
+    """
+    Top `count` unrated movies for users start..stop-1
+    Returns (movie indexes, scores), each (users x count); -1 pads users with fewer candidates.
+    Users are scored chunk_rows at a time and only their top `count` are kept, so a
+    worker holds one chunk_rows x movies array of scores at a time
+    """
+    tops, top_scores = [], []
+    for chunk_start in range(start, stop, chunk_rows):
+        chunk_stop = min(chunk_start + chunk_rows, stop)
+        top, scores = top_k(score_chunk(ratings, normalized, rated, chunk_start, chunk_stop), count)
+        tops.append(top)
+        top_scores.append(scores)
+    return np.concatenate(tops), np.concatenate(top_scores)
+
+
+def top_k(scores, count):
+    """
+    Column indexes and values of the `count` highest scores of each row, best first
+    -1 marks entries that were -inf (not candidates)
+    """
+    count = min(count, scores.shape[1])
+    if count == 0:
+        return np.empty((len(scores), 0), dtype=np.int32), np.empty((len(scores), 0), dtype=np.float32)
+    top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1).astype(np.int32)
+    top_scores = np.take_along_axis(top_scores, order, axis=1).astype(np.float32)
+    top[~np.isfinite(top_scores)] = -1
+    return top, top_scores
+
+
+# Worker process state, set once by _init_worker
+_shared = None
+
+
+def _init_worker(directory):
+    global _shared
+    _shared = open_shared(directory)
+
+
+def _score_range(task):
+    start, stop, count = task
+    ratings, normalized, rated = _shared
+    top, scores = score_block(ratings, normalized, rated, start, stop, count)
+    return start, top, scores
+
+
+def build_operations(user_ids, movie_ids, start, top, scores, computed_at):
+    operations = []
+    for offset, (movie_indexes, movie_scores) in enumerate(zip(top, scores)):
+        movies = [
+            {'movie_id': movie_ids[index], 'score': round(float(score), 4)}
+            for index, score in zip(movie_indexes, movie_scores) if index >= 0
+        ]
+        operations.append(UpdateOne(
+            {'user_id': user_ids[start + offset]},
+            {'$set': {'movies': movies, 'algorithm': ALGORITHM, 'computed_at': computed_at}},
+            upsert=True
+        ))
+    return operations
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux; for RUSAGE_CHILDREN it is the largest finished child
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def precompute_recommendations(collections=None, workers=RECOMMENDATION_PRECOMPUTE_WORKERS,
+                               block_size=RECOMMENDATION_PRECOMPUTE_BLOCK_SIZE,
+                               count=RECOMMENDATION_PRECOMPUTE_COUNT, write_batch_size=WRITE_BATCH_SIZE,
+                               snapshot=None):
+    """
+    Score every user who has rated something and upsert their recommendations; returns stats
+    With snapshot (a directory written by app.workers.export_snapshot) the ratings are read from it
+    """
+    collections = collections or default_collections()
+    recommendations = collections['recommendations']
+    recommendations.create_index('user_id', unique=True)
+
+    started = time.perf_counter()
+    if snapshot:
+        user_ids, movie_ids, matrix = open_snapshot(snapshot).load_ratings()
+    else:
+        user_ids, movie_ids, matrix = load_ratings(collections['ratings'])
+    loaded = time.perf_counter()
+
+    tasks = [(start, min(start + block_size, len(user_ids)), count) for start in range(0, len(user_ids), block_size)]
+    computed_at = datetime.now()
+    written = 0
+    pending = []
+
+    def flush():
+        nonlocal written
+        if pending:
+            result = recommendations.bulk_write(pending, ordered=False)
+            written += result.upserted_count + result.modified_count
+            pending.clear()
+
+    directory = tempfile.mkdtemp(prefix='precompute-')
+    try:
+        share_matrix(matrix, directory)
+        del matrix
+
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(directory,)) as pool:
+                for start, top, scores in pool.map(_score_range, tasks):
+                    pending.extend(build_operations(user_ids, movie_ids, start, top, scores, computed_at))
+                    if len(pending) >= write_batch_size:
+                        flush()
+        else:
+            _init_worker(directory)
+            for task in tasks:
+                start, top, scores = _score_range(task)
+                pending.extend(build_operations(user_ids, movie_ids, start, top, scores, computed_at))
+                if len(pending) >= write_batch_size:
+                    flush()
+        flush()
+    finally:
+        global _shared
+        _shared = None
+        shutil.rmtree(directory, ignore_errors=True)
+
+    finished = time.perf_counter()
+    return {
+        'users': len(user_ids),
+        'movies': len(movie_ids),
+        'written': written,
+        'workers': workers,
+        'block_size': block_size,
+        'load_seconds': round(loaded - started, 2),
+        'score_seconds': round(finished - loaded, 2),
+        'users_per_second': round(len(user_ids) / max(finished - loaded, 1e-9), 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'peak_worker_rss_mb': round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=RECOMMENDATION_PRECOMPUTE_WORKERS)
+    parser.add_argument('--block-size', type=int, default=RECOMMENDATION_PRECOMPUTE_BLOCK_SIZE)
+    parser.add_argument('--count', type=int, default=RECOMMENDATION_PRECOMPUTE_COUNT,
+                        help='Recommendations stored per user')
+    parser.add_argument('--snapshot', help='Read the ratings from this snapshot directory (app.workers.export_snapshot)')
+    args = parser.parse_args()
+
+    stats = precompute_recommendations(workers=args.workers, block_size=args.block_size, count=args.count,
+                                       snapshot=args.snapshot)
+    print(json.dumps(stats))
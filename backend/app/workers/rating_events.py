@@ -0,0 +1,321 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.config import (
+    RATING_EVENTS_MODE,
+    RATING_EVENTS_WINDOW_SECONDS,
+    RATING_EVENTS_BATCH_SIZE,
+)
+from app.database import get_app_database
+
+
+def default_collections():
+    """Collections used by the rating routes"""
+    db = get_app_database()
+    return {
+        'users': db["users"],
+        'movies': db["movies"],
+        'ratings': db["ratings"],
+        'rating_events': db["rating_events"],
+    }
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _object_ids(ids):
+    result = []
+    for value in ids:
+        try:
+            result.append(ObjectId(value))
+        except Exception:
+            # Skip ids that are not valid ObjectIds
+            pass
+    return result
+
+
+def derive_preferences(ratings, movies_by_id):
+    """
+    Build a user's preferences from their ratings
+    Only movies rated 4+ stars count, using the top 3 actors of each movie
+    """
+    genre_counts = {}
+    director_counts = {}
+    actor_counts = {}
+
+    for rating in ratings:
+        if rating['rating'] < 4:
+            continue
+        movie = movies_by_id.get(rating['movie_id'])
+        if not movie:
+            continue
+
+        for genre in movie.get('genres', []):
+            genre_counts[genre] = genre_counts.get(genre, 0) + 1
+
+        director = movie.get('director')
+        if director:
+            director_counts[director] = director_counts.get(director, 0) + 1
+
+        for actor in movie.get('cast', [])[:3]:
+            actor_counts[actor] = actor_counts.get(actor, 0) + 1
+
+    sorted_genres = sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)
+    sorted_directors = sorted(director_counts.items(), key=lambda x: x[1], reverse=True)
+    sorted_actors = sorted(actor_counts.items(), key=lambda x: x[1], reverse=True)
+
+    return {
+        'genres': [genre for genre, _ in sorted_genres[:5]],
+        'directors': [director for director, _ in sorted_directors[:5]],
+        'actors': [actor for actor, _ in sorted_actors[:5]],
+        'genre_counts': genre_counts,
+        'director_counts': director_counts,
+        'actor_counts': actor_counts,
+    }
+
+
+def update_movie_averages(collections, movie_ids):
+    """Recalculate the average rating of several movies with one aggregation"""
+    if not movie_ids:
+        return 0
+
+    pipeline = [
+        {'$match': {'movie_id': {'$in': list(movie_ids)}}},
+        {'$group': {'_id': '$movie_id', 'average_rating': {'$avg': '$rating'}}}
+    ]
+
+    averages = {row['_id']: round(row['average_rating'], 1) for row in collections['ratings'].aggregate(pipeline)}
+
+    updates = []
+    for movie_id in movie_ids:
+        try:
+            movie_oid = ObjectId(movie_id)
+        except Exception:
+            continue
+        # No row: the movie's last rating was deleted, so it is unrated again
+        updates.append(UpdateOne(
+            {'_id': movie_oid},
+            {'$set': {'average_rating': averages.get(movie_id, 0)}}
+        ))
+
+    if updates:
+        collections['movies'].bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def update_user_preferences(collections, user_ids):
+    """Recalculate the preferences of several users from their ratings"""
+    if not user_ids:
+        return 0
+
+    user_ids = list(user_ids)
+    ratings_by_user = {user_id: [] for user_id in user_ids}
+    for rating in collections['ratings'].find(
+        {'user_id': {'$in': user_ids}},
+        {'user_id': 1, 'movie_id': 1, 'rating': 1}
+    ):
+        ratings_by_user[rating['user_id']].append(rating)
+
+    # Fetch every highly rated movie in a single query
+    movie_ids = {
+        rating['movie_id']
+        for ratings in ratings_by_user.values()
+        for rating in ratings
+        if rating['rating'] >= 4
+    }
+    movies_by_id = {}
+    if movie_ids:
+        for movie in collections['movies'].find(
+            {'_id': {'$in': _object_ids(movie_ids)}},
+            {'genres': 1, 'director': 1, 'cast': 1}
+        ):
+            movies_by_id[str(movie['_id'])] = movie
+
+    now = datetime.now().isoformat()
+    updates = []
+    for user_id, ratings in ratings_by_user.items():
+        try:
+            user_oid = ObjectId(user_id)
+        except Exception:
+            continue
+        updates.append(UpdateOne(
+            {'_id': user_oid},
+            {'$set': {
+                'preferences': derive_preferences(ratings, movies_by_id),
+                'preferences_updated_at': now
+            }}
+        ))
+
+    if updates:
+        collections['users'].bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+class RatingEventQueue:
+    """
+    Write-behind queue for the work that follows a rating write
+
+    Events are coalesced per movie and per user during a short window, then
+    the derived data (movie averages, user preferences) is updated in batches
+    """
+
+    def __init__(self, collections=None, mode=RATING_EVENTS_MODE,
+                 window=RATING_EVENTS_WINDOW_SECONDS, batch_size=RATING_EVENTS_BATCH_SIZE):
+        self._collections = collections
+        self.mode = mode
+        self.window = window
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._movie_ids = set()
+        self._user_ids = set()
+        self._thread = None
+        self._flush_hooks = []
+
+    @property
+    def collections(self):
+        if self._collections is None:
+            self._collections = default_collections()
+        return self._collections
+
+    def add_flush_hook(self, hook):
+        """Register hook(movie_ids, user_ids), called after every applied batch"""
+        self._flush_hooks.append(hook)
+
+    def publish(self, user_id=None, movie_id=None):
+        """Record that a rating by user_id for movie_id was written or deleted"""
+        if self.mode == 'external':
+            self.collections['rating_events'].insert_one({
+                'user_id': user_id,
+                'movie_id': movie_id,
+                'created_at': datetime.now().isoformat()
+            })
+            return
+
+        with self._lock:
+            if movie_id:
+                self._movie_ids.add(movie_id)
+            if user_id:
+                self._user_ids.add(user_id)
+
+        if self.mode == 'inline':
+            self.flush()
+            return
+
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._movie_ids), len(self._user_ids)
+
+    def flush(self):
+        """Apply every pending event now"""
+        with self._flush_lock:
+            with self._lock:
+                movie_ids, self._movie_ids = self._movie_ids, set()
+                user_ids, self._user_ids = self._user_ids, set()
+            self.apply(movie_ids, user_ids)
+
+    def apply(self, movie_ids, user_ids):
+        if not movie_ids and not user_ids:
+            return
+        for batch in _chunks(movie_ids, self.batch_size):
+            update_movie_averages(self.collections, batch)
+        for batch in _chunks(user_ids, self.batch_size):
+            update_user_preferences(self.collections, batch)
+        for hook in self._flush_hooks:
+            try:
+                hook(movie_ids, user_ids)
+            except Exception as e:
+                print(f"Error in rating event hook: {str(e)}")
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='rating-events', daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # Let more events for the same movies/users arrive before applying
+            time.sleep(self.window)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error applying rating events: {str(e)}")
+
+    def run_worker(self, poll_interval=None):
+        """
+        Out-of-process worker loop for 'external' mode
+        Drains stored events in batches, coalescing them per movie and user
+        """
+        poll_interval = poll_interval or self.window
+        events_collection = self.collections['rating_events']
+        while True:
+            processed = self.drain_stored_events(events_collection)
+            if processed == 0:
+                time.sleep(poll_interval)
+
+    def drain_stored_events(self, events_collection=None):
+        """Apply one batch of stored events, returning how many were consumed"""
+        events_collection = events_collection or self.collections['rating_events']
+        events = list(events_collection.find().sort('_id', 1).limit(self.batch_size))
+        if not events:
+            return 0
+
+        movie_ids = {event['movie_id'] for event in events if event.get('movie_id')}
+        user_ids = {event['user_id'] for event in events if event.get('user_id')}
+        self.apply(movie_ids, user_ids)
+
+        events_collection.delete_many({'_id': {'$in': [event['_id'] for event in events]}})
+        return len(events)
+
+
+# Shared queue used by the routes
+rating_events = RatingEventQueue()
+
+
+def run_external_worker():
+    """
+    Worker process for 'external' mode. It runs the flush hooks the web
+    processes register: the response cache versions are shared in MongoDB, so
+    their bump reaches every process; the per-process user cache is left to
+    expire (USER_CACHE_TTL)
+    """
+    # Importing them registers their hooks on rating_events
+    import app.caching  # noqa: F401
+    import app.users  # noqa: F401
+
+    rating_events.mode = 'external'
+    rating_events.run_worker()
+
+
+@atexit.register
+def _flush_on_exit():
+    # Do not lose coalesced events when the process stops
+    if rating_events.mode == 'thread':
+        rating_events.flush()
+
+
+if __name__ == '__main__':
+    # Through the imported module, whose rating_events is the queue the hooks are registered on
+    from app.workers.rating_events import run_external_worker
+
+    print("Starting rating events worker")
+    run_external_worker()
@@ -0,0 +1,96 @@
+"""
+Rebuild the per-movie star counts served by /api/movies/<id>/ratings/summary
+
+The rating routes keep the summaries up to date with $inc on every write and
+delete. This job recomputes them from the ratings, to fill them in for
+existing data or to correct drift (e.g. a write that failed half way).
+
+    python -m app.workers.rating_summaries
+    python -m app.workers.rating_summaries --movie <movie_id> --movie <movie_id>
+"""
+import argparse
+import json
+import time
+
+from pymongo import ReplaceOne
+
+from app.database import get_app_database
+from app.routes.ratings import rating_bucket
+
+BATCH_SIZE = 500
+
+
+def default_collections():
+    db = get_app_database()
+    return {'ratings': db["ratings"], 'rating_summaries': db["rating_summaries"]}
+
+
+def remove_stale_summaries(ratings, summaries, rebuilt, movie_ids=None, batch_size=BATCH_SIZE):
+    """
+    Delete the summaries of movies whose last rating was deleted, batch_size
+    ids at a time; returns how many
+    """
+    scope = {} if movie_ids is None else {'_id': {'$in': list(movie_ids)}}
+    removed = summaries.delete_many({**scope, 'count': {'$lte': 0}}).deleted_count
+
+    def flush(candidates):
+        # A movie rated since the aggregation keeps the summary the routes are incrementing
+        rated = set(ratings.distinct('movie_id', {'movie_id': {'$in': candidates}}))
+        stale = [movie_id for movie_id in candidates if movie_id not in rated]
+        return summaries.delete_many({'_id': {'$in': stale}}).deleted_count if stale else 0
+
+    candidates = []
+    for summary in summaries.find(scope, {'_id': 1}, batch_size=batch_size):
+        if summary['_id'] in rebuilt:
+            continue
+        candidates.append(summary['_id'])
+        if len(candidates) == batch_size:
+            removed += flush(candidates)
+            candidates = []
+    if candidates:
+        removed += flush(candidates)
+    return removed
+
+
+def rebuild_rating_summaries(collections=None, movie_ids=None, batch_size=BATCH_SIZE):
+    """Recompute the summaries of movie_ids (every rated movie if None); returns counts"""
+    collections = collections or default_collections()
+    ratings, summaries = collections['ratings'], collections['rating_summaries']
+
+    started = time.perf_counter()
+    pipeline = [
+        {'$group': {'_id': {'movie_id': '$movie_id', 'rating': '$rating'}, 'count': {'$sum': 1}}},
+    ]
+    if movie_ids is not None:
+        pipeline.insert(0, {'$match': {'movie_id': {'$in': list(movie_ids)}}})
+
+    # One row per (movie, distinct rating value), so this stays small
+    rebuilt = {}
+    for row in ratings.aggregate(pipeline):
+        movie_id, rating = row['_id']['movie_id'], row['_id']['rating']
+        summary = rebuilt.setdefault(movie_id, {'_id': movie_id, 'counts': {}, 'count': 0, 'total': 0})
+        bucket = rating_bucket(rating)
+        summary['counts'][bucket] = summary['counts'].get(bucket, 0) + row['count']
+        summary['count'] += row['count']
+        summary['total'] += rating * row['count']
+
+    operations = [ReplaceOne({'_id': movie_id}, summary, upsert=True) for movie_id, summary in rebuilt.items()]
+    for start in range(0, len(operations), batch_size):
+        summaries.bulk_write(operations[start:start + batch_size], ordered=False)
+
+    removed = remove_stale_summaries(ratings, summaries, rebuilt, movie_ids, batch_size)
+
+    return {
+        'movies': len(rebuilt),
+        'removed': removed,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movie', action='append', dest='movie_ids', help='Only rebuild this movie (repeatable)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Summaries written per bulk write')
+    args = parser.parse_args()
+
+    print(json.dumps(rebuild_rating_summaries(movie_ids=args.movie_ids, batch_size=args.batch_size)))
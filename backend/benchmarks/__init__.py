@@ -0,0 +1,2 @@
+# This file marks benchmarks as a Python package
+# Run benchmarks from the backend directory, e.g. python -m benchmarks.load_test
@@ -0,0 +1,132 @@
+"""
+Recall and latency of the nearest neighbour indexes (app.algorithms.ann)
+
+Builds synthetic catalogs of clustered vectors, like latent factors or
+content embeddings, and compares IVF search at several n_probe settings
+with exact brute-force search: recall@k, per-query latency, build time,
+insertion throughput and snapshot save/load time.
+
+    python -m benchmarks.ann --catalog 10000 100000 --dim 64
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.algorithms.ann import create_index, load_index
+
+# Spread of the vectors around their cluster centres, which have unit variance per dimension
+NOISE = 1.0
+
+
+def synthetic_catalog(size, dim, clusters=None, seed=42):
+    """Vectors drawn around random cluster centres, plus queries from the same distribution"""
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(8, int(np.sqrt(size) / 2))
+    centres = rng.normal(size=(clusters, dim))
+    vectors = centres[rng.integers(0, clusters, size)] + NOISE * rng.normal(size=(size, dim))
+    return [f'item-{i}' for i in range(size)], vectors.astype(np.float32), centres, rng
+
+
+def latency(search, queries):
+    timings = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return results, {
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p99_ms': round(float(np.percentile(timings, 99)), 3),
+        'queries_per_second': round(len(queries) / (timings.sum() / 1000)),
+    }
+
+
+def recall(results, expected):
+    return float(np.mean([
+        len({id_ for id_, _ in found} & {id_ for id_, _ in exact}) / max(len(exact), 1)
+        for found, exact in zip(results, expected)
+    ]))
+
+
+def bench_catalog(size, dim, k, queries, probes, seed):
+    ids, vectors, centres, rng = synthetic_catalog(size, dim, seed=seed)
+    query_vectors = centres[rng.integers(0, len(centres), queries)] + NOISE * rng.normal(size=(queries, dim))
+
+    brute = create_index('brute', dim)
+    brute.add(ids, vectors)
+    expected, brute_latency = latency(lambda query: brute.search(query, k), query_vectors)
+
+    start = time.perf_counter()
+    ivf = create_index('ivf', dim, seed=seed)
+    # Train on the first 90%, then insert the rest one at a time like new catalog items
+    initial = int(size * 0.9)
+    ivf.add(ids[:initial], vectors[:initial])
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for id_, vector in zip(ids[initial:], vectors[initial:]):
+        ivf.add([id_], vector)
+    insert_seconds = time.perf_counter() - start
+
+    report = {
+        'size': size,
+        'dim': dim,
+        'k': k,
+        'lists': ivf.n_lists,
+        'ivf_build_seconds': round(build_seconds, 3),
+        'ivf_inserts_per_second': round((size - initial) / max(insert_seconds, 1e-9)),
+        'brute': brute_latency,
+        'ivf': {},
+    }
+    for n_probe in probes:
+        results, stats = latency(lambda query: ivf.search(query, k, n_probe=n_probe), query_vectors)
+        stats['recall'] = round(recall(results, expected), 4)
+        report['ivf'][n_probe] = stats
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'index.npz')
+        start = time.perf_counter()
+        ivf.save(path)
+        report['snapshot_save_seconds'] = round(time.perf_counter() - start, 3)
+        report['snapshot_mb'] = round(os.path.getsize(path) / 1e6, 1)
+        start = time.perf_counter()
+        load_index(path)
+        report['snapshot_load_seconds'] = round(time.perf_counter() - start, 3)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--catalog', type=int, nargs='+', default=[10_000, 100_000], help='Catalog sizes')
+    parser.add_argument('--dim', type=int, default=64)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args(argv)
+
+    reports = []
+    for size in args.catalog:
+        report = bench_catalog(size, args.dim, args.k, args.queries, args.probes, args.seed)
+        reports.append(report)
+        print(f"{size} vectors, dim {args.dim}, {report['lists']} lists: built in {report['ivf_build_seconds']} s, "
+              f"{report['ivf_inserts_per_second']} inserts/s, snapshot {report['snapshot_mb']} MB "
+              f"(save {report['snapshot_save_seconds']} s, load {report['snapshot_load_seconds']} s)")
+        print(f"  brute force          p50 {report['brute']['p50_ms']:>8.3f} ms  p99 {report['brute']['p99_ms']:>8.3f} ms")
+        for n_probe, stats in report['ivf'].items():
+            print(f"  ivf n_probe={n_probe:<4}     p50 {stats['p50_ms']:>8.3f} ms  p99 {stats['p99_ms']:>8.3f} ms  "
+                  f"recall@{args.k} {stats['recall']:.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Compare two benchmark result files written by benchmarks.run
+
+    python -m benchmarks.compare results/base.json results/head.json --threshold 10
+
+Exits with status 1 when --fail-on-regression is given and any benchmark
+got slower than the threshold.
+"""
+import argparse
+import json
+import sys
+
+SECTIONS = ('endpoints', 'algorithms', 'startup')
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base, head, metric='p50_ms', threshold=10.0):
+    """Rows of (section, name, base ms, head ms, change %, verdict) for benchmarks present in both"""
+    rows = []
+    for section in SECTIONS:
+        base_results = base.get(section, {})
+        head_results = head.get(section, {})
+        for name in sorted(set(base_results) | set(head_results)):
+            old, new = base_results.get(name), head_results.get(name)
+            if old is None or new is None:
+                rows.append((section, name, None, None, None, 'added' if old is None else 'removed'))
+                continue
+            if metric not in old or metric not in new:
+                rows.append((section, name, None, None, None, 'skipped'))
+                continue
+
+            change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            if new.get('error') and not old.get('error'):
+                verdict = 'now failing'
+            elif change > threshold:
+                verdict = 'slower'
+            elif change < -threshold:
+                verdict = 'faster'
+            else:
+                verdict = ''
+            rows.append((section, name, old[metric], new[metric], change, verdict))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--metric', default='p50_ms', choices=['mean_ms', 'p50_ms', 'p95_ms', 'min_ms'])
+    parser.add_argument('--threshold', type=float, default=10.0, help='Percent change reported as a difference')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    base, head = load(args.base), load(args.head)
+    for label, results in (('base', base), ('head', head)):
+        meta = results.get('meta', {})
+        print(f"{label}: commit {meta.get('commit')}, {meta.get('backend')}, "
+              f"size {meta.get('size')}, seed {meta.get('seed')}")
+    if base.get('meta', {}).get('sizes') != head.get('meta', {}).get('sizes'):
+        print("Warning: the runs used different dataset sizes")
+    print()
+
+    regressions = 0
+    for section, name, old, new, change, verdict in compare(base, head, args.metric, args.threshold):
+        if change is None:
+            print(f"{name:<48} {verdict}")
+            continue
+        print(f"{name:<48} {old:>10.2f} -> {new:>10.2f} ms  {change:>+7.1f}%  {verdict}")
+        if verdict in ('slower', 'now failing'):
+            regressions += 1
+
+    if args.fail_on_regression and regressions:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
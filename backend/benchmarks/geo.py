@@ -0,0 +1,153 @@
+"""
+City-wide load test for nearby theater queries
+
+Worker threads issue radius and nearest-theater queries for random points
+around the synthetic cities, as users browsing "cinemas near me" would.
+The in-memory index (app.geo) is always measured; $near is measured as
+well when --mongo-uri is given.
+
+    python -m benchmarks.geo --theaters 5000 --queries 20000 --threads 8
+    python -m benchmarks.geo --mongo-uri mongodb://localhost:27017/
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.synthetic import CITIES, generate_dataset
+
+
+def random_points(count, seed):
+    """Query points around the cities, weighted like the theaters"""
+    rng = random.Random(seed)
+    weights = [city[4] for city in CITIES]
+    points = []
+    for _ in range(count):
+        _, lng, lat, spread, _ = rng.choices(CITIES, weights)[0]
+        points.append((lat + rng.gauss(0, spread / 1.6), lng + rng.gauss(0, spread)))
+    return points
+
+
+def random_queries(count, seed, radius_km, limit):
+    """(lat, lng, radius in km, limit) - a quarter of them ask for the nearest few only"""
+    rng = random.Random(seed + 1)
+    return [
+        (lat, lng, radius_km, limit if rng.random() < 0.25 else None)
+        for lat, lng in random_points(count, seed)
+    ]
+
+
+def load_test(query, queries, threads):
+    """Run query(*args) for every entry across threads; latency percentiles and throughput"""
+    latencies = []
+    results = []
+    lock = threading.Lock()
+
+    def worker(chunk):
+        local, found = [], 0
+        for args in chunk:
+            start = time.perf_counter()
+            matches = query(*args)
+            local.append(time.perf_counter() - start)
+            found += len(matches)
+        with lock:
+            latencies.extend(local)
+            results.append(found)
+
+    chunks = [queries[i::threads] for i in range(threads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, chunks))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'queries': len(queries),
+        'threads': threads,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'max_ms': round(float(latencies.max()), 3),
+        'queries_per_second': round(len(queries) / elapsed),
+        'mean_results': round(sum(results) / len(queries), 1),
+    }
+
+
+def run(theaters=5_000, queries=20_000, threads=8, radius_km=20, limit=5, seed=42, mongo_uri=None, db_name='film_bench'):
+    from app.caching import CollectionVersions
+    from app.geo import TheaterIndex
+
+    dataset = generate_dataset(size='tiny', theaters=theaters, movies=200, seed=seed)
+    theater_docs = dataset['theaters']
+    workload = random_queries(queries, seed, radius_km, limit)
+
+    if mongo_uri:
+        from pymongo import MongoClient
+        db = MongoClient(mongo_uri)[db_name]
+    else:
+        import mongomock
+        db = mongomock.MongoClient()[db_name]
+
+    # The index only needs the versions collection; the theaters come from memory
+    index = TheaterIndex(lambda: theater_docs, versions=CollectionVersions(db['cache_versions']))
+    start = time.perf_counter()
+    index.query(0, 0, 0)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    report = {
+        'theaters': len(theater_docs),
+        'radius_km': radius_km,
+        'limit': limit,
+        'index_build_ms': round(build_ms, 2),
+        'results': {'index': load_test(index.query, workload, threads)},
+    }
+
+    if mongo_uri:
+        collection = db['theaters']
+        collection.delete_many({})
+        collection.insert_many(theater_docs, ordered=False)
+        collection.create_index([('location', '2dsphere')])
+
+        def near(lat, lng, max_distance_km, limit=None):
+            cursor = collection.find({'location': {'$near': {
+                '$geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+                '$maxDistance': max_distance_km * 1000,
+            }}})
+            if limit:
+                cursor = cursor.limit(limit)
+            return list(cursor)
+
+        report['results']['$near'] = load_test(near, workload, threads)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--theaters', type=int, default=5_000)
+    parser.add_argument('--queries', type=int, default=20_000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--radius', type=float, default=20, help='Radius in km')
+    parser.add_argument('--limit', type=int, default=5, help='Theaters returned by nearest-only queries')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mongo-uri')
+    parser.add_argument('--db', default='film_bench')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args(argv)
+
+    report = run(args.theaters, args.queries, args.threads, args.radius, args.limit,
+                 args.seed, args.mongo_uri, args.db)
+    print(f"{report['theaters']} theaters, index built in {report['index_build_ms']} ms")
+    for name, result in report['results'].items():
+        print(f"{name:<8} p50 {result['p50_ms']:>8.3f} ms  p99 {result['p99_ms']:>8.3f} ms  "
+              f"{result['queries_per_second']:>8} queries/s  {result['mean_results']} results/query")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
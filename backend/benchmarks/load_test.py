@@ -0,0 +1,154 @@
+"""
+Load test comparing requests per second of the sync (Flask) and ASGI apps
+
+Against running servers:
+    python -m benchmarks.load_test --sync http://localhost:5000 --asgi http://localhost:8000
+
+Or let the harness start both servers locally:
+    python -m benchmarks.load_test --serve --token <JWT>
+
+Endpoints needing a user are only included when --token is given.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+PUBLIC_PATHS = ['/api/theaters', '/api/theaters?lat=54.597&lng=-5.930&distance=20']
+AUTH_PATHS = ['/api/recommendations', '/api/users/watchlist', '/api/users/ratings']
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load(base_url, path, concurrency, duration, token=None):
+    """Hit base_url + path from `concurrency` keep-alive clients for `duration` seconds"""
+    url = urlsplit(base_url)
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        local_latencies = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    local_errors += 1
+            except (http.client.HTTPException, OSError):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+                continue
+            local_latencies.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'path': path,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def start_servers(sync_port, asgi_port):
+    """Start the threaded Flask server and uvicorn for the ASGI app"""
+    sync_server = subprocess.Popen(
+        [sys.executable, '-c',
+         'from main import create_app; '
+         f'create_app().run(host="127.0.0.1", port={sync_port}, threaded=True)'],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    asgi_server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:create_asgi_app', '--factory',
+         '--host', '127.0.0.1', '--port', str(asgi_port), '--log-level', 'warning'],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_for_port(sync_port)
+    wait_for_port(asgi_port)
+    return [sync_server, asgi_server]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sync', default='http://127.0.0.1:5000', help='Base URL of the sync app')
+    parser.add_argument('--asgi', default='http://127.0.0.1:8000', help='Base URL of the ASGI app')
+    parser.add_argument('--serve', action='store_true', help='Start both servers locally')
+    parser.add_argument('--path', action='append', help='Path to test (repeatable)')
+    parser.add_argument('--token', help='JWT for the endpoints that need a user')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per path and app')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    paths = args.path or PUBLIC_PATHS + (AUTH_PATHS if args.token else [])
+
+    servers = []
+    if args.serve:
+        servers = start_servers(urlsplit(args.sync).port, urlsplit(args.asgi).port)
+
+    results = []
+    try:
+        for path in paths:
+            for mode, base_url in (('sync', args.sync), ('asgi', args.asgi)):
+                result = run_load(base_url, path, args.concurrency, args.duration, args.token)
+                result['mode'] = mode
+                results.append(result)
+                print(f"{mode:5} {path:55} {result['requests_per_second']:>9} req/s  "
+                      f"p50 {result['p50_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  "
+                      f"errors {result['errors']}")
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'concurrency': args.concurrency, 'duration': args.duration, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
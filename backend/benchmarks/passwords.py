@@ -0,0 +1,152 @@
+"""
+Password hashing throughput and login storm behaviour
+
+    hashing      hashes per second of the configured method, on the request
+                 threads (inline) and through the bounded pool (app.passwords)
+    storm        while a login storm hashes, a thread doing light request
+                 work back to back reports its latency and throughput:
+                 inline, every storm thread competes with it for the CPU;
+                 through the pool, at most --workers do
+    limiter      attempts against one email: how many are shed by the
+                 token buckets and what a rejection costs
+
+    python -m benchmarks.passwords --threads 16 --workers 2
+    python -m benchmarks.passwords --method pbkdf2:sha256:600000
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app.config import PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS
+from app.passwords import PasswordHasher, PasswordHasherBusy
+from app.ratelimit import KeyedTokenBucket
+
+PASSWORD = 'correct horse battery staple'
+
+
+def percentiles(timings):
+    timings = np.array(timings) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(timings, 50)), 2),
+        'p99_ms': round(float(np.percentile(timings, 99)), 2),
+    }
+
+
+def hash_throughput(verify, threads, count):
+    """Verifications per second from `threads` concurrent callers"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: verify(), range(count)))
+    return round(count / (time.perf_counter() - start), 1)
+
+
+def light_request():
+    # Roughly the Python work of a cached JSON endpoint
+    return sum(i * i for i in range(2000))
+
+
+def light_requests(duration):
+    """Light requests back to back for `duration` seconds: latency and how many got through"""
+    timings = []
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        start = time.perf_counter()
+        light_request()
+        timings.append(time.perf_counter() - start)
+    return {**percentiles(timings), 'requests_per_second': round(len(timings) / duration)}
+
+
+def storm(verify, threads, duration):
+    """Latency of light requests while `threads` callers verify passwords in a loop"""
+    stop = threading.Event()
+    rejected = []
+
+    def attacker():
+        while not stop.is_set():
+            try:
+                verify()
+            except PasswordHasherBusy:
+                rejected.append(1)
+                time.sleep(0.001)
+
+    attackers = [threading.Thread(target=attacker, daemon=True) for _ in range(threads)]
+    for thread in attackers:
+        thread.start()
+
+    timings = light_requests(duration)
+    stop.set()
+    for thread in attackers:
+        thread.join()
+    return {**timings, 'rejected': len(rejected)}
+
+
+def limiter_storm(attempts, rate, burst):
+    """One email hammered `attempts` times in a row"""
+    limiter = KeyedTokenBucket(rate / 60, burst)
+    start = time.perf_counter()
+    allowed = sum(limiter.try_acquire('victim@example.com') for _ in range(attempts))
+    elapsed = time.perf_counter() - start
+    return {
+        'attempts': attempts,
+        'allowed': allowed,
+        'shed': attempts - allowed,
+        'us_per_check': round(elapsed / attempts * 1e6, 2),
+    }
+
+
+def run(method, threads, workers, count, duration):
+    password_hash = generate_password_hash(PASSWORD, method)
+    hasher = PasswordHasher(method=method, workers=workers, max_pending=threads * 4)
+    report = {'method': method, 'threads': threads, 'workers': workers}
+
+    def inline():
+        return check_password_hash(password_hash, PASSWORD)
+
+    def pooled():
+        return hasher.verify(password_hash, PASSWORD)
+
+    report['inline_hashes_per_second'] = hash_throughput(inline, threads, count)
+    report['pool_hashes_per_second'] = hash_throughput(pooled, threads, count)
+
+    report['light_request_idle'] = light_requests(duration)
+    report['light_request_inline_storm'] = storm(inline, threads, duration)
+    report['light_request_pool_storm'] = storm(pooled, threads, duration)
+    report['limiter'] = limiter_storm(10_000, rate=5, burst=10)
+
+    hasher.shutdown()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', default=PASSWORD_HASH_METHOD, help='werkzeug hash method')
+    parser.add_argument('--threads', type=int, default=16, help='Concurrent login attempts')
+    parser.add_argument('--workers', type=int, default=PASSWORD_HASH_WORKERS, help='Hashing pool size')
+    parser.add_argument('--count', type=int, default=64, help='Hashes per throughput measurement')
+    parser.add_argument('--duration', type=float, default=3, help='Seconds per storm')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args(argv)
+
+    report = run(args.method, args.threads, args.workers, args.count, args.duration)
+    print(f"{report['method']}, {args.threads} callers, {args.workers} workers")
+    print(f"  hashes/s  inline {report['inline_hashes_per_second']:>8}  pool {report['pool_hashes_per_second']:>8}")
+    for name in ('idle', 'inline_storm', 'pool_storm'):
+        stats = report[f'light_request_{name}']
+        print(f"  light request {name:<13} p50 {stats['p50_ms']:>8.2f} ms  p99 {stats['p99_ms']:>8.2f} ms  "
+              f"{stats['requests_per_second']:>7} req/s")
+    limiter = report['limiter']
+    print(f"  limiter: {limiter['allowed']} of {limiter['attempts']} attempts allowed, "
+          f"{limiter['us_per_check']} us per check")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+"""
+End-to-end benchmark suite
+
+Generates a synthetic dataset (benchmarks.synthetic), binds every route
+module to it and times each endpoint through the Flask test client, then
+times the recommendation algorithms, the theater geo queries and a cold
+start (benchmarks.startup). Results are written as JSON; compare two runs
+with benchmarks.compare.
+
+    python -m benchmarks.run --size small --output results/base.json
+    python -m benchmarks.run --size medium --mongo-uri mongodb://localhost:27017/ --output results/head.json
+
+mongomock is used unless --mongo-uri is given. Nearby theater requests are
+served by the in-memory index (app.geo) on both; mongomock has no geo
+operators, so the raw $near timings only run against MongoDB.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from app.routes import ROUTE_COLLECTIONS
+from benchmarks.synthetic import SIZES, PASSWORD, generate_dataset, load_dataset
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A point in central Belfast, where seed_theaters.py puts its theaters
+GEO_POINT = {'lat': 54.5973, 'lng': -5.9301}
+
+
+def timed(func, repeat, warmup=1):
+    """Run func warmup + repeat times and summarise the timed runs in milliseconds"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'runs': repeat,
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p50_ms': round(samples[len(samples) // 2], 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'min_ms': round(samples[0], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bind_collections(stack, db):
+    """Point every route module, the rating events queue and the response cache at db"""
+    import importlib
+    from app.caching import CollectionVersions, response_cache
+    from app.ratelimit import KeyedTokenBucket
+    from app.routes.theaters import theater_index
+    from app.users import user_cache
+    from app.workers.rating_events import rating_events
+
+    for module_name, names in ROUTE_COLLECTIONS.items():
+        module = importlib.import_module(module_name)
+        for name in names:
+            stack.enter_context(patch.object(module, f'{name}_collection', db[name]))
+
+    collections = {
+        'users': db['users'],
+        'movies': db['movies'],
+        'ratings': db['ratings'],
+        'theaters': db['theaters'],
+        'reviews': db['ratings'],
+        'rating_events': db['rating_events'],
+    }
+    stack.enter_context(patch.object(rating_events, '_collections', collections))
+    # Apply side effects inside the request, so their cost is part of the timing
+    stack.enter_context(patch.object(rating_events, 'mode', 'inline'))
+    stack.enter_context(patch('app.caching.collection_versions', CollectionVersions(db['cache_versions'])))
+    # The login case repeats one user's login far faster than the limiters allow
+    stack.enter_context(patch('app.routes.auth.login_email_limiter', KeyedTokenBucket(1e9)))
+    stack.enter_context(patch('app.routes.auth.login_ip_limiter', KeyedTokenBucket(1e9)))
+    # The endpoint timings include the cold first requests; no warm-up against the real MongoDB
+    stack.enter_context(patch('app.warmup.WARMUP_MODE', 'off'))
+    response_cache.clear()
+    theater_index.invalidate()
+    user_cache.clear()
+    stack.callback(response_cache.clear)
+    stack.callback(theater_index.invalidate)
+    stack.callback(user_cache.clear)
+
+
+def pick_samples(dataset):
+    """Ids used by the endpoint benchmarks: a head and a tail of each power law"""
+    users, movies = dataset['users'], dataset['movies']
+    return {
+        'active_user': str(users[0]['_id']),
+        'active_user_email': users[0]['email'],
+        'casual_user': str(users[len(users) // 2]['_id']),
+        'popular_movie': str(movies[0]['_id']),
+        'niche_movie': str(movies[-1]['_id']),
+        'theater': str(dataset['theaters'][0]['_id']),
+    }
+
+
+def endpoint_cases(samples):
+    """(name, method, path, user key or None, json body or None)"""
+    popular, niche = samples['popular_movie'], samples['niche_movie']
+    near = f"lat={GEO_POINT['lat']}&lng={GEO_POINT['lng']}&distance=20"
+    return [
+        ('GET /api/movies', 'GET', '/api/movies', None, None),
+        ('GET /api/movies/<id>', 'GET', f'/api/movies/{popular}', None, None),
+        ('GET /api/movies/<id>/ratings popular', 'GET', f'/api/movies/{popular}/ratings', None, None),
+        ('GET /api/movies/<id>/ratings niche', 'GET', f'/api/movies/{niche}/ratings', None, None),
+        ('GET /api/movies/<id>/ratings/summary', 'GET', f'/api/movies/{popular}/ratings/summary', None, None),
+        ('GET /api/movies/<id>/reviews', 'GET', f'/api/movies/{popular}/reviews', None, None),
+        ('GET /api/movies/<id>/theaters', 'GET', f'/api/movies/{popular}/theaters', None, None),
+        ('GET /api/movies/<id>/similar', 'GET', f'/api/movies/{popular}/similar', None, None),
+        ('GET /api/theaters', 'GET', '/api/theaters', None, None),
+        ('GET /api/theaters/<id>', 'GET', f"/api/theaters/{samples['theater']}", None, None),
+        ('GET /api/auth/me', 'GET', '/api/auth/me', 'active_user', None),
+        ('GET /api/users/ratings active', 'GET', '/api/users/ratings', 'active_user', None),
+        ('GET /api/users/ratings casual', 'GET', '/api/users/ratings', 'casual_user', None),
+        ('GET /api/users/watchlist', 'GET', '/api/users/watchlist', 'active_user', None),
+        ('GET /api/recommendations active', 'GET', '/api/recommendations', 'active_user', None),
+        ('GET /api/recommendations casual', 'GET', '/api/recommendations', 'casual_user', None),
+        ('GET /api/recommendations/genre/<genre>', 'GET', '/api/recommendations/genre/Drama', None, None),
+        ('POST /api/movies/<id>/rate', 'POST', f'/api/movies/{popular}/rate', 'casual_user', {'rating': 4}),
+        ('POST /api/users/watchlist/<id>', 'POST', f'/api/users/watchlist/{niche}', 'casual_user', None),
+        ('DELETE /api/users/watchlist/<id>', 'DELETE', f'/api/users/watchlist/{niche}', 'casual_user', None),
+        ('POST /api/auth/login', 'POST', '/api/auth/login', None,
+         {'email': samples['active_user_email'], 'password': PASSWORD}),
+        ('GET /api/theaters near', 'GET', f'/api/theaters?{near}', None, None),
+        ('GET /api/theaters nearest 5', 'GET', f'/api/theaters?{near}&limit=5', None, None),
+        ('GET /api/movies/<id>/theaters near', 'GET', f'/api/movies/{popular}/theaters?{near}', None, None),
+    ]
+
+
+def bench_endpoints(app, samples, repeat):
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        tokens = {key: create_access_token(identity=samples[key]) for key in ('active_user', 'casual_user')}
+
+    client = app.test_client()
+    results = {}
+    for name, method, path, user, body in endpoint_cases(samples):
+        headers = {'Authorization': f'Bearer {tokens[user]}'} if user else {}
+        statuses = set()
+
+        def call():
+            response = client.open(path, method=method, headers=headers, json=body)
+            statuses.add(response.status_code)
+
+        result = timed(call, repeat)
+        result['status'] = sorted(statuses)
+        if any(status >= 400 for status in statuses):
+            result['error'] = True
+        results[name] = result
+    return results
+
+
+def bench_algorithms(dataset, samples, repeat, cf_users, versions):
+    from app.algorithms.collaborative_filtering import CollaborativeFiltering
+    from app.geo import TheaterIndex
+    from app.routes.theaters import calculate_distance
+
+    # get_recommendations is quadratic, so collaborative filtering runs on the most active users only
+    user_ids = {str(user['_id']) for user in dataset['users'][:cf_users]}
+    ratings = [
+        {'user_id': rating['user_id'], 'movie_id': rating['movie_id'], 'rating': rating['rating']}
+        for rating in dataset['ratings'] if rating['user_id'] in user_ids
+    ]
+    results = {}
+
+    cf = CollaborativeFiltering(ratings)
+    results['CollaborativeFiltering.build_matrix'] = timed(cf.build_matrix, repeat, warmup=0)
+    results['CollaborativeFiltering.get_recommendations'] = timed(
+        lambda: cf.get_recommendations(samples['casual_user'] if samples['casual_user'] in user_ids
+                                       else samples['active_user']),
+        repeat, warmup=0
+    )
+    results['CollaborativeFiltering.build_matrix']['ratings'] = len(ratings)
+    results['CollaborativeFiltering.build_matrix']['users'] = len(user_ids)
+
+    # The same ratings as a DataFrame (what CollaborativeFiltering holds) and as a RatingStore
+    import pandas as pd
+    from app.algorithms.rating_store import RatingStore
+
+    all_ratings = [
+        {'user_id': rating['user_id'], 'movie_id': rating['movie_id'], 'rating': rating['rating']}
+        for rating in dataset['ratings']
+    ]
+    results['RatingStore.from_cursor'] = timed(lambda: RatingStore.from_cursor(all_ratings), repeat, warmup=0)
+    results['RatingStore.from_cursor'].update(RatingStore.from_cursor(all_ratings).memory_usage())
+    results['RatingStore.from_cursor']['dataframe_bytes_per_rating'] = round(
+        int(pd.DataFrame(all_ratings).memory_usage(deep=True).sum()) / max(len(all_ratings), 1), 1
+    )
+
+    theaters = dataset['theaters']
+
+    def nearby_theaters():
+        return [
+            theater for theater in theaters
+            if calculate_distance(GEO_POINT['lat'], GEO_POINT['lng'],
+                                  theater['location']['coordinates'][1],
+                                  theater['location']['coordinates'][0]) <= 20
+        ]
+
+    results['theaters.distance_scan'] = timed(nearby_theaters, repeat)
+
+    index = TheaterIndex(lambda: theaters, versions=versions)
+
+    def build_index():
+        index.invalidate()
+        return index.query(GEO_POINT['lat'], GEO_POINT['lng'], 0)
+
+    results['TheaterIndex.build'] = timed(build_index, repeat, warmup=0)
+    for km in (5, 20, 100):
+        results[f'TheaterIndex.radius {km}km'] = timed(
+            lambda: index.query(GEO_POINT['lat'], GEO_POINT['lng'], km), repeat
+        )
+    results['TheaterIndex.nearest 10'] = timed(
+        lambda: index.query(GEO_POINT['lat'], GEO_POINT['lng'], limit=10), repeat
+    )
+    return results
+
+
+def bench_geo_queries(db, repeat):
+    """$near queries straight against MongoDB, without the route's per-movie lookups"""
+    db['theaters'].create_index([('location', '2dsphere')])
+    results = {}
+    for km in (5, 20, 100):
+        query = {'location': {'$near': {
+            '$geometry': {'type': 'Point', 'coordinates': [GEO_POINT['lng'], GEO_POINT['lat']]},
+            '$maxDistance': km * 1000,
+        }}}
+        results[f'theaters.$near {km}km'] = timed(lambda: list(db['theaters'].find(query)), repeat)
+    return results
+
+
+def run(size='small', seed=42, repeat=20, mongo_uri=None, db_name='film_bench', cf_users=100):
+    dataset = generate_dataset(size=size, seed=seed)
+
+    if mongo_uri:
+        from pymongo import MongoClient
+        db = MongoClient(mongo_uri)[db_name]
+    else:
+        import mongomock
+        # Same bulk_write(sort=) compatibility shim the tests use
+        import app.tests  # noqa: F401
+        db = mongomock.MongoClient()[db_name]
+
+    start = time.perf_counter()
+    load_dataset(db, dataset)
+    load_seconds = time.perf_counter() - start
+
+    from app.workers.rating_summaries import rebuild_rating_summaries
+    rebuild_rating_summaries({'ratings': db['ratings'], 'rating_summaries': db['rating_summaries']})
+
+    samples = pick_samples(dataset)
+
+    from app.caching import CollectionVersions
+    from app.workers.neighbours import build_movie_neighbours
+    from main import create_app
+
+    with ExitStack() as stack:
+        bind_collections(stack, db)
+        # The similar movies endpoint reads the precomputed table
+        neighbour_collections = {name: db[name] for name in ('movies', 'ratings', 'movie_neighbours')}
+        neighbours_build = timed(lambda: build_movie_neighbours(neighbour_collections), 1, warmup=0)
+        app = create_app()
+        endpoints = bench_endpoints(app, samples, repeat)
+
+    algorithms = bench_algorithms(dataset, samples, max(1, repeat // 5), cf_users,
+                                  CollectionVersions(db['cache_versions']))
+    algorithms['movie_neighbours.build'] = neighbours_build
+    if mongo_uri:
+        algorithms.update(bench_geo_queries(db, repeat))
+
+    from benchmarks.startup import bench_startup
+    startup = bench_startup(max(3, repeat // 4))
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'backend': 'mongodb' if mongo_uri else 'mongomock',
+            'size': size,
+            'sizes': dataset['sizes'],
+            'seed': seed,
+            'repeat': repeat,
+            'load_seconds': round(load_seconds, 2),
+        },
+        'endpoints': endpoints,
+        'algorithms': algorithms,
+        'startup': startup,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=list(SIZES), default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per endpoint')
+    parser.add_argument('--mongo-uri', help='Benchmark against MongoDB instead of mongomock')
+    parser.add_argument('--db', default='film_bench', help='Database to load the dataset into')
+    parser.add_argument('--cf-users', type=int, default=100, help='Users in the collaborative filtering benchmark')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args(argv)
+
+    results = run(args.size, args.seed, args.repeat, args.mongo_uri, args.db, args.cf_users)
+
+    for section in ('endpoints', 'algorithms', 'startup'):
+        for name, result in results[section].items():
+            if 'skipped' in result:
+                print(f"{name:<48} skipped")
+            else:
+                flag = '  ERROR' if result.get('error') else ''
+                print(f"{name:<48} p50 {result['p50_ms']:>10.2f} ms  p95 {result['p95_ms']:>10.2f} ms{flag}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
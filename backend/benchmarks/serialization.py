@@ -0,0 +1,118 @@
+"""
+Serialization throughput of the /api/movies and /api/theaters payloads
+
+Compares the old path (converting ObjectId to str in Python, then Flask's
+default provider) with the Mongo-aware stdlib and orjson providers.
+
+    python -m benchmarks.serialization --size medium
+"""
+import argparse
+import copy
+import json
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.serialization import MongoJSONProvider, OrjsonProvider, orjson
+from benchmarks.synthetic import SIZES, generate_dataset
+
+
+def movies_payload(dataset):
+    return dataset['movies']
+
+
+def theaters_payload(dataset):
+    """Theaters with their current movies' details embedded, as get_theaters returns them"""
+    from app.routes.theaters import format_movie_details
+
+    movies = {str(movie['_id']): movie for movie in dataset['movies']}
+    theaters = copy.deepcopy(dataset['theaters'])
+    for theater in theaters:
+        for movie_item in theater['current_movies']:
+            movie_item['movie_details'] = format_movie_details(movies[movie_item['movie_id']])
+    return theaters
+
+
+def stringify_ids(documents):
+    """What the routes did before the provider understood ObjectId"""
+    for document in documents:
+        document['_id'] = str(document['_id'])
+        for movie_item in document.get('current_movies', []):
+            if 'movie_details' in movie_item:
+                movie_item['movie_details']['_id'] = str(movie_item['movie_details']['_id'])
+    return documents
+
+
+def make_app(provider_class):
+    app = Flask(__name__)
+    app.json = provider_class(app)
+    return app
+
+
+def measure(app, payloads, prepare=None):
+    """Median seconds and response size for preparing and encoding each payload"""
+    timings = []
+    size = 0
+    with app.app_context():
+        for payload in payloads:
+            start = time.perf_counter()
+            response = app.json.response(prepare(payload) if prepare else payload)
+            timings.append(time.perf_counter() - start)
+            size = len(response.get_data())
+    timings.sort()
+    return timings[len(timings) // 2], size
+
+
+def run(size='small', repeat=10, seed=42):
+    dataset = generate_dataset(size=size, seed=seed)
+    payloads = {'/api/movies': movies_payload(dataset), '/api/theaters': theaters_payload(dataset)}
+
+    # (name, provider, converts ids in Python first)
+    variants = [('str ids + default', DefaultJSONProvider, True), ('stdlib provider', MongoJSONProvider, False)]
+    if orjson is not None:
+        variants.append(('orjson provider', OrjsonProvider, False))
+
+    results = {}
+    for endpoint, payload in payloads.items():
+        results[endpoint] = {}
+        for name, provider_class, converts_ids in variants:
+            if converts_ids:
+                # The conversion mutates documents, so each run gets its own copy
+                copies = [copy.deepcopy(payload) for _ in range(repeat)]
+                seconds, response_size = measure(make_app(provider_class), copies, stringify_ids)
+            else:
+                seconds, response_size = measure(make_app(provider_class), [payload] * repeat)
+
+            results[endpoint][name] = {
+                'documents': len(payload),
+                'ms': round(seconds * 1000, 3),
+                'documents_per_second': round(len(payload) / seconds),
+                'mb_per_second': round(response_size / seconds / 1e6, 1),
+                'response_bytes': response_size,
+            }
+    return {'size': size, 'sizes': dataset['sizes'], 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=list(SIZES), default='small')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args(argv)
+
+    report = run(args.size, args.repeat)
+    for endpoint, variants in report['results'].items():
+        baseline = next(iter(variants.values()))['ms']
+        for name, result in variants.items():
+            print(f"{endpoint:<15} {name:<20} {result['ms']:>9.2f} ms  "
+                  f"{result['documents_per_second']:>10} docs/s  {result['mb_per_second']:>7} MB/s  "
+                  f"x{baseline / result['ms']:.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
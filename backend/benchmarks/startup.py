@@ -0,0 +1,127 @@
+"""
+Cold start: how long a new worker takes to answer its first request
+
+Each run starts a fresh interpreter that imports main, calls create_app()
+and answers GET /api/test through the test client. It reports:
+
+    time to first response   process start to the response, as seen by the parent
+    import main              importing main (Flask, the extensions)
+    create_app               importing and registering the route modules
+    first request            the first request itself
+
+and the heavy modules (numpy, scipy, pandas, scikit-learn, requests) loaded
+by then, which should be none: they are imported on first use.
+
+--importtime prints the modules that cost the most, from python -X importtime.
+
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --importtime --top 15
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.run import BACKEND_DIR
+
+HEAVY_MODULES = ('numpy', 'scipy', 'pandas', 'sklearn', 'requests')
+
+CHILD = f"""
+import json, sys, time
+started = time.perf_counter()
+from main import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+status = app.test_client().get('/api/test').status_code
+answered = time.perf_counter()
+print(json.dumps({{
+    'status': status,
+    'import main': (imported - started) * 1000,
+    'create_app': (created - imported) * 1000,
+    'first request': (answered - created) * 1000,
+    'heavy_modules': [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}), flush=True)
+"""
+
+
+def summarise(samples):
+    """Same fields as benchmarks.run.timed, for samples in milliseconds"""
+    samples = sorted(samples)
+    return {
+        'runs': len(samples),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'p50_ms': round(samples[len(samples) // 2], 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'min_ms': round(samples[0], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def cold_start():
+    """One fresh worker: the wall time to its first response and its own breakdown"""
+    start = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, '-c', CHILD], cwd=BACKEND_DIR, stdout=subprocess.PIPE, text=True,
+        # Time to first response of a worker with warm-up off; /health/ready covers the warm-up
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1', 'WARMUP_MODE': 'off'},
+    )
+    line = child.stdout.readline()
+    elapsed = (time.perf_counter() - start) * 1000
+    child.wait()
+    if child.returncode or not line:
+        raise RuntimeError(f"Startup run failed with exit code {child.returncode}")
+    result = json.loads(line)
+    result['time to first response'] = elapsed
+    return result
+
+
+def bench_startup(runs):
+    """Cold start timings over `runs` fresh processes, named like the other benchmark results"""
+    # One run first, so the bytecode cache is written and every timed run reads it
+    cold_start()
+    results = [cold_start() for _ in range(runs)]
+
+    timings = {}
+    for name in ('time to first response', 'import main', 'create_app', 'first request'):
+        timings[f'startup {name}'] = summarise([result[name] for result in results])
+    heavy = sorted({name for result in results for name in result['heavy_modules']})
+    if heavy or any(result['status'] != 200 for result in results):
+        timings['startup time to first response']['error'] = (
+            f"heavy modules loaded: {', '.join(heavy)}" if heavy else 'first request failed'
+        )
+    return timings
+
+
+def import_profile(top=20):
+    """(cumulative ms, self ms, module) of the slowest imports on the way to create_app()"""
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'from main import create_app; create_app()'],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True, env={**os.environ, 'WARMUP_MODE': 'off'},
+    ).stderr
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us) / 1000, int(self_us) / 1000, module.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Fresh processes to time')
+    parser.add_argument('--importtime', action='store_true', help='Show the slowest imports instead')
+    parser.add_argument('--top', type=int, default=20, help='Imports listed with --importtime')
+    args = parser.parse_args()
+
+    if args.importtime:
+        for cumulative, own, module in import_profile(args.top):
+            print(f"{cumulative:>9.1f} ms {own:>8.1f} ms  {module}")
+    else:
+        for name, result in bench_startup(args.runs).items():
+            flag = f"  ERROR {result['error']}" if result.get('error') else ''
+            print(f"{name:<48} p50 {result['p50_ms']:>10.2f} ms  p95 {result['p95_ms']:>10.2f} ms{flag}")
@@ -0,0 +1,247 @@
+"""
+Deterministic synthetic data for benchmarks
+
+The same seed and sizes always produce the same users, movies, ratings,
+theaters and watchlists, so benchmark results can be compared between
+commits. Movie popularity and user activity follow power laws, like real
+rating data.
+
+    python -m benchmarks.synthetic --size small --mongo-uri mongodb://localhost:27017/ --db film_bench
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+from werkzeug.security import generate_password_hash
+
+from app.workers.rating_summaries import rebuild_rating_summaries
+
+SIZES = {
+    'tiny': {'users': 50, 'movies': 100, 'ratings': 1_000, 'theaters': 10},
+    'small': {'users': 500, 'movies': 1_000, 'ratings': 20_000, 'theaters': 50},
+    'medium': {'users': 5_000, 'movies': 10_000, 'ratings': 500_000, 'theaters': 300},
+    'large': {'users': 50_000, 'movies': 50_000, 'ratings': 5_000_000, 'theaters': 1_000},
+}
+
+GENRES = [
+    'Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family',
+    'Fantasy', 'History', 'Horror', 'Music', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western',
+]
+
+# (name, longitude, latitude, spread in degrees, weight)
+CITIES = [
+    ('Belfast', -5.9301, 54.5973, 0.08, 3),
+    ('Dublin', -6.2603, 53.3498, 0.10, 4),
+    ('London', -0.1276, 51.5072, 0.25, 10),
+    ('Manchester', -2.2426, 53.4808, 0.12, 4),
+    ('Glasgow', -4.2518, 55.8642, 0.10, 3),
+    ('Cardiff', -3.1791, 51.4816, 0.07, 2),
+]
+
+BASE_TIME = datetime(2024, 1, 1)
+
+# Every synthetic user has this password
+PASSWORD = 'benchmark-password'
+
+
+def object_id(rng):
+    return ObjectId(bytes(rng.getrandbits(8) for _ in range(12)))
+
+
+def zipf_weights(n, exponent):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def generate_movies(count, rng, np_rng):
+    director_weights = zipf_weights(max(count // 5, 1), 1.1)
+    actor_weights = zipf_weights(max(count // 2, 1), 1.0)
+    directors = np_rng.choice(len(director_weights), size=count, p=director_weights)
+    cast = np_rng.choice(len(actor_weights), size=(count, 5), p=actor_weights)
+
+    movies = []
+    for i in range(count):
+        movies.append({
+            '_id': object_id(rng),
+            'title': f'Synthetic Movie {i}',
+            'description': f'Generated movie number {i}',
+            'genres': rng.sample(GENRES, rng.choice((1, 1, 2, 2, 3))),
+            'year': rng.randint(1950, 2024),
+            'director': f'Director {directors[i]}',
+            'cast': [f'Actor {actor}' for actor in dict.fromkeys(cast[i])],
+            'image_url': f'https://images.example.com/{i}.jpg',
+            'streaming_platforms': rng.sample(['Netflix', 'Amazon Prime', 'Disney+', 'Apple TV+'], 2),
+            'average_rating': 0,
+        })
+    return movies
+
+
+def generate_users(count, movies, rng):
+    """Users and their watchlist entries"""
+    # Hashed once and shared, so generating users does not pay for hashing
+    password_hash = generate_password_hash(PASSWORD)
+    users = []
+    entries = []
+    for i in range(count):
+        watchlist = rng.sample(movies, min(len(movies), rng.randint(0, 10)))
+        created = BASE_TIME + timedelta(minutes=i)
+        users.append({
+            '_id': object_id(rng),
+            'username': f'user{i}',
+            'email': f'user{i}@example.com',
+            'password_hash': password_hash,
+            'preferences': {'genres': [], 'directors': [], 'actors': []},
+            'watch_history': [],
+            'created_at': created.isoformat(),
+        })
+        entries.extend(
+            {'user_id': str(users[-1]['_id']), 'movie_id': str(movie['_id']),
+             'added_at': created + timedelta(seconds=position)}
+            for position, movie in enumerate(watchlist)
+        )
+    return users, entries
+
+
+def generate_ratings(count, users, movies, rng, np_rng):
+    """Ratings with power-law user activity and movie popularity, one per (user, movie)"""
+    user_weights = zipf_weights(len(users), 0.9)
+    movie_weights = zipf_weights(len(movies), 1.05)
+    # Movie quality shifts each movie's ratings up or down
+    quality = np_rng.normal(0, 0.8, size=len(movies))
+
+    count = min(count, len(users) * len(movies))
+
+    # Sample in rounds, dropping duplicate (user, movie) pairs, until there are enough
+    keys = np.empty(0, dtype=np.int64)
+    for _ in range(50):
+        missing = count - len(keys)
+        if missing <= 0:
+            break
+        sample_size = missing * 2 + 10
+        user_idx = np_rng.choice(len(users), size=sample_size, p=user_weights)
+        movie_idx = np_rng.choice(len(movies), size=sample_size, p=movie_weights)
+        keys = np.concatenate([keys, user_idx.astype(np.int64) * len(movies) + movie_idx])
+        first = np.unique(keys, return_index=True)[1]
+        keys = keys[np.sort(first)]
+    keys = keys[:count]
+    user_idx, movie_idx = np.divmod(keys, len(movies))
+
+    values = np.clip(np.rint(3.4 + quality[movie_idx] + np_rng.normal(0, 1, size=len(keys))), 1, 5)
+    offsets = np_rng.integers(0, 365 * 24 * 60, size=len(keys))
+
+    ratings = []
+    for position in range(len(keys)):
+        created = (BASE_TIME + timedelta(minutes=int(offsets[position]))).isoformat()
+        user = users[user_idx[position]]
+        rating = {
+            '_id': object_id(rng),
+            'user_id': str(user['_id']),
+            'username': user['username'],
+            'movie_id': str(movies[movie_idx[position]]['_id']),
+            'rating': float(values[position]),
+            'helpful_votes': 0,
+            'created_at': created,
+            'updated_at': created,
+        }
+        # One rating in five has a review; derived from the offset so no extra random draws are made
+        if position % 5 == 0:
+            rating['review'] = f'Review {position}'
+            rating['helpful_votes'] = int(offsets[position] % 50)
+        ratings.append(rating)
+    return ratings
+
+
+def generate_theaters(count, movies, rng, np_rng):
+    city_weights = np.array([city[4] for city in CITIES], dtype=float)
+    city_idx = np_rng.choice(len(CITIES), size=count, p=city_weights / city_weights.sum())
+    popular_movies = movies[:max(1, min(len(movies), 200))]
+
+    theaters = []
+    for i in range(count):
+        name, lng, lat, spread, _ = CITIES[city_idx[i]]
+        showing = rng.sample(popular_movies, min(len(popular_movies), rng.randint(4, 12)))
+        theaters.append({
+            '_id': object_id(rng),
+            'name': f'{name} Cinema {i}',
+            'location': {
+                'type': 'Point',
+                'coordinates': [round(lng + rng.gauss(0, spread), 6), round(lat + rng.gauss(0, spread / 1.6), 6)],
+            },
+            'address': {
+                'street': f'{i} Synthetic Street',
+                'city': name,
+                'state': '',
+                'postal_code': '',
+                'country': 'UK',
+            },
+            'current_movies': [
+                {
+                    'movie_id': str(movie['_id']),
+                    'showtimes': [
+                        (BASE_TIME + timedelta(days=day, hours=hour)).strftime('%Y-%m-%d %H:%M')
+                        for day in range(2) for hour in (14, 18, 21)
+                    ],
+                }
+                for movie in showing
+            ],
+            'amenities': rng.sample(['IMAX', '3D', 'Parking', 'Bar', 'Wheelchair Access'], 2),
+            'rating': round(rng.uniform(3, 5), 1),
+        })
+    return theaters
+
+
+def generate_dataset(users=None, movies=None, ratings=None, theaters=None, size='small', seed=42):
+    """Generate a full dataset; explicit counts override the preset size"""
+    sizes = dict(SIZES[size])
+    for name, value in (('users', users), ('movies', movies), ('ratings', ratings), ('theaters', theaters)):
+        if value is not None:
+            sizes[name] = value
+
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+
+    movie_docs = generate_movies(sizes['movies'], rng, np_rng)
+    user_docs, watchlist_docs = generate_users(sizes['users'], movie_docs, rng)
+    rating_docs = generate_ratings(sizes['ratings'], user_docs, movie_docs, rng, np_rng)
+    theater_docs = generate_theaters(sizes['theaters'], movie_docs, rng, np_rng)
+
+    return {
+        'sizes': sizes,
+        'seed': seed,
+        'users': user_docs,
+        'movies': movie_docs,
+        'ratings': rating_docs,
+        'theaters': theater_docs,
+        'watchlist': watchlist_docs,
+    }
+
+
+def load_dataset(db, dataset, batch_size=10_000):
+    """
+    Replace the users, movies, ratings, theaters and watchlist collections of
+    db with the dataset, and rebuild the rating summaries from its ratings
+    """
+    for name in ('users', 'movies', 'ratings', 'theaters', 'watchlist'):
+        collection = db[name]
+        collection.delete_many({})
+        docs = dataset[name]
+        for start in range(0, len(docs), batch_size):
+            collection.insert_many(docs[start:start + batch_size], ordered=False)
+    rebuild_rating_summaries({'ratings': db['ratings'], 'rating_summaries': db['rating_summaries']})
+
+
+if __name__ == '__main__':
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', choices=list(SIZES), default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--db', default='film_bench')
+    args = parser.parse_args()
+
+    dataset = generate_dataset(size=args.size, seed=args.seed)
+    load_dataset(MongoClient(args.mongo_uri)[args.db], dataset)
+    print(f"Loaded {dataset['sizes']} into {args.db}")
@@ -12,11 +12,21 @@ def create_app():
     app.config['JWT_SECRET_KEY'] = 'secret-key'
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=7)
 
-    # Initialize JWT
+    # Initialize JWT; current_user is the token's user, cached between requests
     jwt = JWTManager(app)
+    from app.users import load_jwt_user
+    jwt.user_lookup_loader(load_jwt_user)
+
+    # JSON provider that encodes ObjectId, backed by orjson when installed
+    from app.serialization import init_json
+    init_json(app)
     
-    # Enable CORS for all routes with all origins
-    CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+    # Enable CORS for all routes with all origins; paginated responses carry the next page's cursor in a header
+    CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True, expose_headers=['X-Next-Cursor'])
+
+    # /metrics, Server-Timing and ?profile=1; the shared MongoDB clients report to its listener (app.database)
+    from app.instrumentation import init_instrumentation
+    init_instrumentation(app)
 
     # Properly scoped imports
     from app.routes.auth import auth_bp
@@ -59,8 +69,18 @@ def create_app():
     def server_error(error):
         return jsonify({'error': 'Internal server error'}), 500
 
+    # /health/live and /health/ready; ready once the pool, caches and models are warm
+    from app.warmup import init_warmup
+    init_warmup(app)
+
     return app
 
+def create_asgi_app():
+    """ASGI version of the app, serving the I/O-bound endpoints asynchronously"""
+    from app.asgi import AsyncAPI
+
+    return AsyncAPI(create_app())
+
 if __name__ == '__main__':
     app = create_app()
     app.run(debug=True, host='0.0.0.0', port=5000)